@@ -1,109 +1,122 @@
-from django.db import transaction
+from collections import defaultdict
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 from analytics.models import JobAnalyticsSummary
 from jobs.models import Job
 from shuttle.models import Shuttle
 from hotels.models import HotelBooking
+from common.commit_batch import defer_to_commit
 
 
 def ensure_summary_row():
     JobAnalyticsSummary.objects.get_or_create(pk=1)
 
 
+def _flush_deltas(batches):
+    """Apply queued counter deltas in a single UPDATE (counters never drop below zero)."""
+    totals = defaultdict(int)
+    for deltas in batches:
+        for field, delta in deltas.items():
+            totals[field] += delta
+    updates = {
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in totals.items()
+        if delta
+    }
+    if not updates:
+        return
+    if not JobAnalyticsSummary.objects.filter(pk=1).update(updated_at=timezone.now(), **updates):
+        ensure_summary_row()
+        JobAnalyticsSummary.objects.filter(pk=1).update(updated_at=timezone.now(), **updates)
+
+
+def _queue_delta(prefix, total=0, paid=0, unpaid=0):
+    # Written once per transaction on commit (common.commit_batch), not per save.
+    defer_to_commit(
+        'analytics-deltas',
+        {f'{prefix}_total': total, f'{prefix}_paid': paid, f'{prefix}_unpaid': unpaid},
+        _flush_deltas,
+    )
+
+
 def _delta_driving(total=0, paid=0, unpaid=0):
-    ensure_summary_row()
-    with transaction.atomic():
-        s = JobAnalyticsSummary.objects.select_for_update().get(pk=1)
-        s.driving_total = max(0, s.driving_total + total)
-        s.driving_paid = max(0, s.driving_paid + paid)
-        s.driving_unpaid = max(0, s.driving_unpaid + unpaid)
-        s.save(
-            update_fields=['driving_total', 'driving_paid', 'driving_unpaid', 'updated_at'],
-        )
+    _queue_delta('driving', total, paid, unpaid)
 
 
 def _delta_shuttle(total=0, paid=0, unpaid=0):
-    ensure_summary_row()
-    with transaction.atomic():
-        s = JobAnalyticsSummary.objects.select_for_update().get(pk=1)
-        s.shuttle_total = max(0, s.shuttle_total + total)
-        s.shuttle_paid = max(0, s.shuttle_paid + paid)
-        s.shuttle_unpaid = max(0, s.shuttle_unpaid + unpaid)
-        s.save(
-            update_fields=['shuttle_total', 'shuttle_paid', 'shuttle_unpaid', 'updated_at'],
-        )
+    _queue_delta('shuttle', total, paid, unpaid)
 
 
 def _delta_hotel(total=0, paid=0, unpaid=0):
-    ensure_summary_row()
-    with transaction.atomic():
-        s = JobAnalyticsSummary.objects.select_for_update().get(pk=1)
-        s.hotel_total = max(0, s.hotel_total + total)
-        s.hotel_paid = max(0, s.hotel_paid + paid)
-        s.hotel_unpaid = max(0, s.hotel_unpaid + unpaid)
-        s.save(
-            update_fields=['hotel_total', 'hotel_paid', 'hotel_unpaid', 'updated_at'],
-        )
+    _queue_delta('hotel', total, paid, unpaid)
 
 
 def driving_row_created(is_paid):
-    with transaction.atomic():
-        _delta_driving(total=1, paid=1 if is_paid else 0, unpaid=0 if is_paid else 1)
+    _delta_driving(total=1, paid=1 if is_paid else 0, unpaid=0 if is_paid else 1)
 
 
 def driving_row_deleted(is_paid):
-    with transaction.atomic():
-        _delta_driving(total=-1, paid=-1 if is_paid else 0, unpaid=0 if is_paid else -1)
+    _delta_driving(total=-1, paid=-1 if is_paid else 0, unpaid=0 if is_paid else -1)
 
 
 def driving_paid_toggled(was_paid, now_paid):
     if was_paid == now_paid:
         return
-    with transaction.atomic():
-        if now_paid:
-            _delta_driving(paid=1, unpaid=-1)
-        else:
-            _delta_driving(paid=-1, unpaid=1)
+    if now_paid:
+        _delta_driving(paid=1, unpaid=-1)
+    else:
+        _delta_driving(paid=-1, unpaid=1)
 
 
 def shuttle_row_created(is_paid):
-    with transaction.atomic():
-        _delta_shuttle(total=1, paid=1 if is_paid else 0, unpaid=0 if is_paid else 1)
+    _delta_shuttle(total=1, paid=1 if is_paid else 0, unpaid=0 if is_paid else 1)
 
 
 def shuttle_row_deleted(is_paid):
-    with transaction.atomic():
-        _delta_shuttle(total=-1, paid=-1 if is_paid else 0, unpaid=0 if is_paid else -1)
+    _delta_shuttle(total=-1, paid=-1 if is_paid else 0, unpaid=0 if is_paid else -1)
 
 
 def shuttle_paid_toggled(was_paid, now_paid):
     if was_paid == now_paid:
         return
-    with transaction.atomic():
-        if now_paid:
-            _delta_shuttle(paid=1, unpaid=-1)
-        else:
-            _delta_shuttle(paid=-1, unpaid=1)
+    if now_paid:
+        _delta_shuttle(paid=1, unpaid=-1)
+    else:
+        _delta_shuttle(paid=-1, unpaid=1)
 
 
 def hotel_row_created(is_paid):
-    with transaction.atomic():
-        _delta_hotel(total=1, paid=1 if is_paid else 0, unpaid=0 if is_paid else 1)
+    _delta_hotel(total=1, paid=1 if is_paid else 0, unpaid=0 if is_paid else 1)
 
 
 def hotel_row_deleted(is_paid):
-    with transaction.atomic():
-        _delta_hotel(total=-1, paid=-1 if is_paid else 0, unpaid=0 if is_paid else -1)
+    _delta_hotel(total=-1, paid=-1 if is_paid else 0, unpaid=0 if is_paid else -1)
 
 
 def hotel_paid_toggled(was_paid, now_paid):
     if was_paid == now_paid:
         return
-    with transaction.atomic():
-        if now_paid:
-            _delta_hotel(paid=1, unpaid=-1)
-        else:
-            _delta_hotel(paid=-1, unpaid=1)
+    if now_paid:
+        _delta_hotel(paid=1, unpaid=-1)
+    else:
+        _delta_hotel(paid=-1, unpaid=1)
+
+
+_DELTAS_BY_MODEL = {
+    'jobs.job': _delta_driving,
+    'shuttle.shuttle': _delta_shuttle,
+    'hotels.hotelbooking': _delta_hotel,
+}
+
+
+def bulk_paid_toggled(model, became_paid, became_unpaid):
+    """Counter update for ``is_paid`` flips written with ``QuerySet.update()``."""
+    shift = became_paid - became_unpaid
+    if shift:
+        _DELTAS_BY_MODEL[model._meta.label_lower](paid=shift, unpaid=-shift)
 
 
 def apply_job_analytics_after_save(was_adding, instance):
@@ -2,6 +2,7 @@ from django.db.models.signals import post_delete, post_save, pre_delete, pre_sav
 from django.dispatch import receiver
 
 from analytics import services
+from common.save_state import previous_instance
 from jobs.models import Job
 from shuttle.models import Shuttle
 from hotels.models import HotelBooking
@@ -20,14 +21,8 @@ def _capture_is_paid_for_delete(sender, instance, **kwargs):
 
 
 def _capture_old_is_paid(sender, instance, **kwargs):
-    if not instance.pk:
-        instance._analytics_prev_is_paid = None
-        return
-    try:
-        prev = sender.objects.only('is_paid').get(pk=instance.pk)
-        instance._analytics_prev_is_paid = prev.is_paid
-    except sender.DoesNotExist:
-        instance._analytics_prev_is_paid = None
+    prev = previous_instance(instance)
+    instance._analytics_prev_is_paid = prev.is_paid if prev is not None else None
 
 
 @receiver(pre_save, sender=Job)
@@ -2,14 +2,20 @@
 Lightweight regression checks for analytics counters + paid-sync ordering.
 Keeps coverage small; detailed behaviour lives in app-specific test modules.
 """
+import time
 from decimal import Decimal
 from unittest.mock import patch
 
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from analytics.models import JobAnalyticsSummary
 from analytics import services
+from common.exchange_rate_models import ExchangeRate
+from common.exchange_rates import RATES_VERSION_CACHE_SECONDS, store_rates
 from common.models import Payment
 from common.utils import get_home_exchange_rate_banner_context
 from hotels.models import HotelBooking
@@ -28,6 +34,16 @@ class AnalyticsPaidSyncIntegrityTests(TestCase):
 
     @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
     def test_job_marked_unpaid_when_sync_clears_flag_without_payments(self, _mock):
+        # Counter deltas are applied when the transaction commits (common.commit_batch)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_unpaid_flagged_job()
+        job = Job.objects.get(customer_name='X')
+        self.assertFalse(job.is_paid)
+        summary = JobAnalyticsSummary.objects.get(pk=1)
+        self.assertEqual(summary.driving_unpaid, 1)
+        self.assertEqual(summary.driving_paid, 0)
+
+    def _create_unpaid_flagged_job(self):
         Job.objects.create(
             customer_name='X',
             customer_number='1',
@@ -42,16 +58,28 @@ class AnalyticsPaidSyncIntegrityTests(TestCase):
             driver=self.driver,
             is_paid=True,
         )
-        job = Job.objects.get(customer_name='X')
-        self.assertFalse(job.is_paid)
-        summary = JobAnalyticsSummary.objects.get(pk=1)
-        self.assertEqual(summary.driving_unpaid, 1)
-        self.assertEqual(summary.driving_paid, 0)
 
     @patch('hotels.models.get_exchange_rate', return_value=Decimal('1'))
     @patch('common.models.get_exchange_rate', return_value=Decimal('1'))
     def test_hotel_delete_with_payment_does_not_corrupt_counters(self, _m1, _m2):
         t0 = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = self._create_paid_hotel_booking(t0)
+        before = JobAnalyticsSummary.objects.get(pk=1)
+        self.assertGreaterEqual(before.hotel_total, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+
+        after = JobAnalyticsSummary.objects.get(pk=1)
+        for name in (
+            'hotel_total',
+            'hotel_paid',
+            'hotel_unpaid',
+        ):
+            self.assertGreaterEqual(getattr(after, name), 0, msg=name)
+
+    def _create_paid_hotel_booking(self, t0):
         booking = HotelBooking.objects.create(
             customer_name='DelMe',
             customer_number='1',
@@ -76,18 +104,7 @@ class AnalyticsPaidSyncIntegrityTests(TestCase):
             payment_type='Cash',
             paid_to_staff=self.staff,
         )
-        before = JobAnalyticsSummary.objects.get(pk=1)
-        self.assertGreaterEqual(before.hotel_total, 1)
-
-        booking.delete()
-
-        after = JobAnalyticsSummary.objects.get(pk=1)
-        for name in (
-            'hotel_total',
-            'hotel_paid',
-            'hotel_unpaid',
-        ):
-            self.assertGreaterEqual(getattr(after, name), 0, msg=name)
+        return booking
 
     def test_rebuild_analytics_sanity_after_noise(self):
         services.rebuild_analytics()
@@ -107,6 +124,9 @@ class AnalyticsPaidSyncIntegrityTests(TestCase):
 
 
 class HomeFxBannerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
     def test_banner_lists_three_non_eur_codes(self):
         ctx = get_home_exchange_rate_banner_context()
         self.assertEqual(len(ctx['fx_items']), 3)
@@ -115,3 +135,28 @@ class HomeFxBannerTests(TestCase):
         for item in ctx['fx_items']:
             self.assertIn('foreign_to_eur', item)
             self.assertIn('eur_to_foreign', item)
+
+    def test_banner_is_served_from_cache_until_rates_change(self):
+        ExchangeRate.objects.create(currency='USD', rate=Decimal('0.9000'))
+        first = get_home_exchange_rate_banner_context()
+        self.assertEqual(first['fx_items'][0]['foreign_to_eur'], Decimal('0.90'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            again = get_home_exchange_rate_banner_context()
+        self.assertEqual(len(ctx), 0)
+        self.assertEqual(again, first)
+
+        store_rates({'USD': Decimal('0.9500')})
+        refreshed = get_home_exchange_rate_banner_context()
+        self.assertEqual(refreshed['fx_items'][0]['foreign_to_eur'], Decimal('0.95'))
+
+    def test_rates_stored_by_another_process_show_up_after_the_ttl(self):
+        ExchangeRate.objects.create(currency='USD', rate=Decimal('0.9000'))
+        get_home_exchange_rate_banner_context()
+        # A queryset update skips store_rates, like a refresh in another worker
+        ExchangeRate.objects.filter(currency='USD').update(rate=Decimal('0.9500'), last_updated=timezone.now())
+        self.assertEqual(get_home_exchange_rate_banner_context()['fx_items'][0]['foreign_to_eur'], Decimal('0.90'))
+
+        with patch('time.time', return_value=time.time() + RATES_VERSION_CACHE_SECONDS + 1):
+            banner = get_home_exchange_rate_banner_context()
+        self.assertEqual(banner['fx_items'][0]['foreign_to_eur'], Decimal('0.95'))
@@ -0,0 +1,24 @@
+from django.contrib import admin
+
+from billing.models import MonthlyLedger
+
+
+@admin.register(MonthlyLedger)
+class MonthlyLedgerAdmin(admin.ModelAdmin):
+    list_display = (
+        'year',
+        'month',
+        'service',
+        'agent',
+        'bookings',
+        'gmv',
+        'kt_margin',
+        'paid',
+        'expenses',
+        'updated_at',
+    )
+    list_filter = ('service', 'year')
+    readonly_fields = [f.name for f in MonthlyLedger._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,372 @@
+"""
+Maintenance and reads for ``billing.MonthlyLedger``.
+
+Each booking save / delete, payment change and expense save re-derives only the
+(year, month, service) bucket it touches — plus the previous bucket when a date moves —
+with one grouped query built from ``billing.totals_aggregation``. Totals cards then sum
+a few dozen ledger rows instead of every confirmed booking and its payments.
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from billing.models import MonthlyLedger, MonthlyLedgerLock
+from billing.totals_aggregation import (
+    MONEY,
+    SERVICES,
+    WINDOWS,
+    ZERO,
+    confirmed_bookings,
+    money_expressions,
+    service_agent_field,
+    service_date_field,
+)
+from expenses.models import Expense
+
+logger = logging.getLogger('kt')
+
+_MONEYQ = Decimal('0.01')
+
+_SERVICE_BY_MODEL = {
+    'jobs.job': MonthlyLedger.SERVICE_DRIVING,
+    'shuttle.shuttle': MonthlyLedger.SERVICE_SHUTTLE,
+    'hotels.hotelbooking': MonthlyLedger.SERVICE_HOTEL,
+    'expenses.expense': MonthlyLedger.SERVICE_EXPENSES,
+}
+
+# ledger column -> metric in ``money_expressions``
+_LEDGER_COLUMNS = {
+    'gmv': 'gmv',
+    'kt_margin': 'margin',
+    'open_gmv': 'open_gmv',
+    'open_margin': 'open_margin',
+    'paid': 'paid',
+    'driver_fees': 'driver_fees',
+    'agent_fees': 'agent_fees',
+}
+
+
+def ledger_service_for(instance) -> str | None:
+    return _SERVICE_BY_MODEL.get(instance._meta.label_lower)
+
+
+def ledger_date_field(service) -> str:
+    if service == MonthlyLedger.SERVICE_EXPENSES:
+        return 'expense_date'
+    return service_date_field(service)
+
+
+def period_of(value) -> tuple[int, int] | None:
+    """(year, month) of a date / datetime, matching ``__year`` / ``__month`` lookups."""
+    if value is None:
+        return None
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.year, value.month
+
+
+def ledger_period(instance) -> tuple[int, int] | None:
+    """(year, month) bucket a booking or expense belongs to."""
+    service = ledger_service_for(instance)
+    if service is None:
+        return None
+    return period_of(getattr(instance, ledger_date_field(service), None))
+
+
+def _money_sum(expr, **kwargs):
+    return Coalesce(Sum(expr, **kwargs), ZERO, output_field=MONEY)
+
+
+def _booking_aggregates(service):
+    exprs = money_expressions(service)
+    aggregates = {'bookings': Count('pk')}
+    for column, metric in _LEDGER_COLUMNS.items():
+        aggregates[column] = _money_sum(exprs[metric])
+    return aggregates
+
+
+def _ledger_row(service, year, month, agent_id, values):
+    row = MonthlyLedger(year=year, month=month, service=service, agent_id=agent_id)
+    row.bookings = values['bookings']
+    for column in _LEDGER_COLUMNS:
+        setattr(row, column, values[column].quantize(_MONEYQ))
+    return row
+
+
+def _booking_rows_for_month(service, year, month):
+    date_field = service_date_field(service)
+    qs = confirmed_bookings(service).filter(**{
+        f'{date_field}__year': year,
+        f'{date_field}__month': month,
+    }).order_by()
+    agent_field = service_agent_field(service)
+    if agent_field is None:
+        values = qs.aggregate(**_booking_aggregates(service))
+        if not values['bookings']:
+            return []
+        return [_ledger_row(service, year, month, None, values)]
+    return [
+        _ledger_row(service, year, month, values[agent_field], values)
+        for values in qs.values(agent_field).annotate(**_booking_aggregates(service))
+    ]
+
+
+def _expense_rows_for_month(year, month):
+    total = Expense.objects.filter(
+        expense_date__year=year, expense_date__month=month
+    ).aggregate(total=_money_sum('expense_amount_in_euros'), rows=Count('pk'))
+    if not total['rows']:
+        return []
+    return [MonthlyLedger(
+        year=year,
+        month=month,
+        service=MonthlyLedger.SERVICE_EXPENSES,
+        bookings=total['rows'],
+        expenses=total['total'].quantize(_MONEYQ),
+    )]
+
+
+def refresh_ledger_month(service, year, month):
+    """Recompute every ledger row of one (year, month, service) bucket."""
+    with transaction.atomic():
+        # Serialise refreshes of the bucket: two saves in the same month would otherwise
+        # both delete and then both insert, and the second insert breaks the unique
+        # constraints. The figures are read after the lock, so they include the other save.
+        # The UPDATE takes the row lock and bumps the version exports are keyed on.
+        bucket = MonthlyLedgerLock.objects.filter(year=year, month=month, service=service)
+        if not bucket.update(version=F('version') + 1):
+            _lock, created = MonthlyLedgerLock.objects.select_for_update().get_or_create(
+                year=year, month=month, service=service, defaults={'version': 1}
+            )
+            if not created:
+                # Created by a concurrent refresh since the UPDATE
+                bucket.update(version=F('version') + 1)
+        if service == MonthlyLedger.SERVICE_EXPENSES:
+            rows = _expense_rows_for_month(year, month)
+        else:
+            rows = _booking_rows_for_month(service, year, month)
+        MonthlyLedger.objects.filter(year=year, month=month, service=service).delete()
+        MonthlyLedger.objects.bulk_create(rows)
+
+
+def bucket_versions(service, year, months):
+    """``{month: version}`` of the *service* buckets of *year*; 0 for a bucket never refreshed."""
+    stored = dict(
+        MonthlyLedgerLock.objects.filter(service=service, year=year, month__in=months)
+        .values_list('month', 'version')
+    )
+    return {month: stored.get(month, 0) for month in months}
+
+
+def refresh_ledger_for(instance, previous_period=None):
+    """
+    Refresh the bucket *instance* falls in now, and *previous_period* when the date moved
+    (captured by ``billing.signals`` before the save).
+    """
+    service = ledger_service_for(instance)
+    if service is None:
+        return
+    periods = {ledger_period(instance), previous_period}
+    periods.discard(None)
+    for year, month in sorted(periods):
+        refresh_ledger_month(service, year, month)
+
+
+def refresh_ledger_after_save(instance):
+    refresh_ledger_for(instance, getattr(instance, '_ledger_prev_period', None))
+    instance._ledger_prev_period = ledger_period(instance)
+
+
+def _payment_parents(payment):
+    """``(service, parent model, parent pk)`` of the booking *payment* belongs to."""
+    for parent_attr in ('job', 'shuttle', 'hotel_booking'):
+        parent_id = getattr(payment, f'{parent_attr}_id', None)
+        if parent_id:
+            parent = type(payment)._meta.get_field(parent_attr).related_model
+            yield _SERVICE_BY_MODEL[parent._meta.label_lower], parent, parent_id
+
+
+def refresh_ledger_for_payment(payment, previous=None):
+    """
+    A payment moves ``paid`` / open figures of its parent booking's bucket. *previous* is
+    the stored payment before a save; when the payment moved to another booking, the
+    bucket it left is refreshed as well.
+    """
+    parents = set(_payment_parents(payment))
+    if previous is not None:
+        parents.update(_payment_parents(previous))
+    buckets = set()
+    for service, parent, parent_id in parents:
+        booked_on = parent.objects.filter(pk=parent_id).values_list(
+            service_date_field(service), flat=True
+        ).first()
+        period = period_of(booked_on)
+        if period is not None:
+            buckets.add((service, *period))
+    for service, year, month in sorted(buckets):
+        refresh_ledger_month(service, year, month)
+
+
+def refresh_ledger_for_rows(model, pks, batch_size=500):
+    """Refresh every bucket holding one of *pks* — for bulk ``update()`` calls that skip saves."""
+    service = _SERVICE_BY_MODEL[model._meta.label_lower]
+    date_field = ledger_date_field(service)
+    periods = set()
+    pks = list(pks)
+    for start in range(0, len(pks), batch_size):
+        dates = model.objects.filter(pk__in=pks[start:start + batch_size]).values_list(date_field, flat=True)
+        periods.update(period_of(value) for value in dates)
+    periods.discard(None)
+    for year, month in sorted(periods):
+        refresh_ledger_month(service, year, month)
+
+
+def rebuild_ledger() -> int:
+    """Drop and re-derive the whole ledger; returns the number of rows written."""
+    rows = []
+    for service in SERVICES:
+        date_field = service_date_field(service)
+        agent_field = service_agent_field(service)
+        group_by = ['ledger_year', 'ledger_month'] + ([agent_field] if agent_field else [])
+        grouped = (
+            confirmed_bookings(service)
+            .order_by()
+            .annotate(ledger_year=ExtractYear(date_field), ledger_month=ExtractMonth(date_field))
+            .values(*group_by)
+            .annotate(**_booking_aggregates(service))
+        )
+        for values in grouped:
+            rows.append(_ledger_row(
+                service,
+                values['ledger_year'],
+                values['ledger_month'],
+                values[agent_field] if agent_field else None,
+                values,
+            ))
+    expense_months = (
+        Expense.objects.order_by()
+        .annotate(ledger_year=ExtractYear('expense_date'), ledger_month=ExtractMonth('expense_date'))
+        .values('ledger_year', 'ledger_month')
+        .annotate(total=_money_sum('expense_amount_in_euros'), rows=Count('pk'))
+    )
+    for values in expense_months:
+        rows.append(MonthlyLedger(
+            year=values['ledger_year'],
+            month=values['ledger_month'],
+            service=MonthlyLedger.SERVICE_EXPENSES,
+            bookings=values['rows'],
+            expenses=values['total'].quantize(_MONEYQ),
+        ))
+    with transaction.atomic():
+        MonthlyLedger.objects.all().delete()
+        MonthlyLedger.objects.bulk_create(rows, batch_size=500)
+    logger.info(f"Monthly ledger rebuilt: {len(rows)} rows")
+    return len(rows)
+
+
+def _window_filters(year, month):
+    return {
+        'overall': None,
+        'yearly': Q(year=year),
+        'monthly': Q(year=year, month=month),
+    }
+
+
+def ledger_totals(year, month):
+    """
+    ``{window: {service: {metric: Decimal}, 'expenses': Decimal}}`` for the ``overall``,
+    ``yearly`` (calendar *year*) and ``monthly`` (*year* / *month*) windows, read from
+    the ledger in one grouped query.
+    """
+    windows = _window_filters(year, month)
+    aggregates = {}
+    for window, window_q in windows.items():
+        for column in list(_LEDGER_COLUMNS) + ['expenses']:
+            aggregates[f'{window}__{column}'] = _money_sum(column, filter=window_q)
+    by_service = {
+        row['service']: row
+        for row in MonthlyLedger.objects.order_by().values('service').annotate(**aggregates)
+    }
+
+    def figure(service, window, column):
+        row = by_service.get(service)
+        if row is None:
+            return Decimal('0.00')
+        return row[f'{window}__{column}'].quantize(_MONEYQ)
+
+    totals = {}
+    for window in WINDOWS:
+        totals[window] = {
+            service: {
+                metric: figure(service, window, column)
+                for column, metric in _LEDGER_COLUMNS.items()
+            }
+            for service in SERVICES
+        }
+        totals[window]['expenses'] = figure(MonthlyLedger.SERVICE_EXPENSES, window, 'expenses')
+    return totals
+
+
+def ledger_agent_totals(year, month):
+    """Agent fees per agent name for the three windows, from ledger rows."""
+    windows = _window_filters(year, month)
+    rows = (
+        MonthlyLedger.objects.order_by()
+        .filter(service__in=[MonthlyLedger.SERVICE_DRIVING, MonthlyLedger.SERVICE_HOTEL])
+        .values('agent__name')
+        .annotate(**{
+            window: _money_sum('agent_fees', filter=window_q)
+            for window, window_q in windows.items()
+        })
+    )
+    agent_totals = {}
+    for row in rows:
+        name = row['agent__name'] or 'None'
+        entry = agent_totals.setdefault(name, {
+            window: {'agent_fees': Decimal('0.00')} for window in WINDOWS
+        })
+        for window in WINDOWS:
+            entry[window]['agent_fees'] += row[window].quantize(_MONEYQ)
+    return agent_totals
+
+
+def _period_rows(qs, period_field):
+    columns = list(_LEDGER_COLUMNS) + ['expenses']
+    grouped = (
+        qs.order_by()
+        .values(period_field)
+        .annotate(**{f'sum_{column}': _money_sum(column) for column in columns})
+    )
+    rows = {}
+    for values in grouped:
+        row = {column: values[f'sum_{column}'].quantize(_MONEYQ) for column in columns}
+        row[period_field] = values[period_field]
+        row['profit'] = row['kt_margin'] - row['expenses']
+        rows[values[period_field]] = row
+    return rows
+
+
+def _empty_period_row(period_field, period):
+    row = {column: Decimal('0.00') for column in list(_LEDGER_COLUMNS) + ['expenses', 'profit']}
+    row[period_field] = period
+    return row
+
+
+def ledger_month_rows(year):
+    """Twelve month rows (all services combined) for *year*, from the ledger."""
+    rows = _period_rows(MonthlyLedger.objects.filter(year=year), 'month')
+    return [rows.get(month) or _empty_period_row('month', month) for month in range(1, 13)]
+
+
+def ledger_year_rows():
+    """One row per year with ledger data, newest first."""
+    rows = _period_rows(MonthlyLedger.objects.all(), 'year')
+    return [rows[year] for year in sorted(rows, reverse=True)]
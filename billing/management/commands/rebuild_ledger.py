@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from billing.ledger import rebuild_ledger
+
+
+class Command(BaseCommand):
+    help = 'Recompute the monthly billing ledger from bookings, payments, and expenses.'
+
+    def handle(self, *args, **options):
+        rows = rebuild_ledger()
+        self.stdout.write(self.style.SUCCESS(f'Monthly ledger rebuilt: {rows} rows.'))
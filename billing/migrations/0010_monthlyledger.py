@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-18 15:12
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('billing', '0009_delete_financialsummary'),
+        ('people', '0009_delete_freelancer_delete_freelanceragent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('service', models.CharField(choices=[('driving', 'Driving'), ('shuttle', 'Shuttle'), ('hotel', 'Hotel'), ('expenses', 'Expenses')], max_length=16)),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('gmv', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('kt_margin', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('open_gmv', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('open_margin', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('paid', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('driver_fees', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('agent_fees', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('expenses', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_rows', to='people.agent')),
+            ],
+            options={
+                'ordering': ['-year', '-month', 'service'],
+                'indexes': [models.Index(fields=['year', 'month'], name='billing_ledger_year_month')],
+                'constraints': [models.UniqueConstraint(fields=('year', 'month', 'service', 'agent'), name='billing_ledger_unique_bucket_agent'), models.UniqueConstraint(condition=models.Q(('agent__isnull', True)), fields=('year', 'month', 'service'), name='billing_ledger_unique_bucket_no_agent')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0010_monthlyledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyLedgerLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('service', models.CharField(choices=[('driving', 'Driving'), ('shuttle', 'Shuttle'), ('hotel', 'Hotel'), ('expenses', 'Expenses')], max_length=16)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('year', 'month', 'service'), name='billing_ledger_lock_bucket')],
+            },
+        ),
+    ]
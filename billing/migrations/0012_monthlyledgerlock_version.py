@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0011_monthlyledgerlock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlyledgerlock',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
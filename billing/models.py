@@ -0,0 +1,87 @@
+from decimal import Decimal
+
+from django.db import models
+
+from people.models import Agent
+
+
+class MonthlyLedger(models.Model):
+    """
+    Pre-computed money totals per (year, month, service, agent), maintained by
+    ``billing.ledger`` from booking / payment / expense saves and ``rebuild_ledger``.
+
+    Figures follow ``billing.totals_reporting``: GMV, KT margin, open (unpaid) GMV and
+    margin, complete payments in EUR and fees. Expense rows use ``service='expenses'``
+    with no agent and only ``expenses`` filled in.
+    """
+
+    SERVICE_DRIVING = 'driving'
+    SERVICE_SHUTTLE = 'shuttle'
+    SERVICE_HOTEL = 'hotel'
+    SERVICE_EXPENSES = 'expenses'
+    SERVICE_CHOICES = [
+        (SERVICE_DRIVING, 'Driving'),
+        (SERVICE_SHUTTLE, 'Shuttle'),
+        (SERVICE_HOTEL, 'Hotel'),
+        (SERVICE_EXPENSES, 'Expenses'),
+    ]
+
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    service = models.CharField(max_length=16, choices=SERVICE_CHOICES)
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, null=True, blank=True, related_name='ledger_rows')
+
+    bookings = models.PositiveIntegerField(default=0)
+    gmv = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    kt_margin = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    open_gmv = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    open_margin = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    paid = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    driver_fees = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    agent_fees = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    expenses = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-year', '-month', 'service']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['year', 'month', 'service', 'agent'],
+                name='billing_ledger_unique_bucket_agent',
+            ),
+            models.UniqueConstraint(
+                fields=['year', 'month', 'service'],
+                condition=models.Q(agent__isnull=True),
+                name='billing_ledger_unique_bucket_no_agent',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['year', 'month'], name='billing_ledger_year_month'),
+        ]
+
+    def __str__(self):
+        agent = self.agent.name if self.agent_id else '—'
+        return f'{self.year}-{self.month:02d} {self.get_service_display()} ({agent})'
+
+
+class MonthlyLedgerLock(models.Model):
+    """
+    One row per (year, month, service) bucket. ``billing.ledger.refresh_ledger_month``
+    locks it, by bumping ``version``, before replacing the bucket's ledger rows, so two
+    saves in the same month refresh it one after the other. ``version`` therefore moves
+    with every change to the bucket's bookings and payments; stored exports are keyed on it.
+    """
+
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    service = models.CharField(max_length=16, choices=MonthlyLedger.SERVICE_CHOICES)
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'month', 'service'], name='billing_ledger_lock_bucket'),
+        ]
+
+    def __str__(self):
+        return f'{self.year}-{self.month:02d} {self.get_service_display()}'
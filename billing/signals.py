@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, pre_save
+from django.dispatch import receiver
+
+from billing.ledger import ledger_date_field, ledger_service_for, period_of, refresh_ledger_for
+from common.save_state import previous_instance
+from expenses.models import Expense
+from hotels.models import HotelBooking
+from jobs.models import Job
+from shuttle.models import Shuttle
+
+_LEDGER_SENDERS = (Job, Shuttle, HotelBooking, Expense)
+
+
+def _capture_previous_period(sender, instance, **kwargs):
+    """
+    Remember the stored (year, month) so a save that moves the booking date refreshes
+    the bucket it left as well as the one it lands in.
+    """
+    instance._ledger_prev_period = None
+    prev = previous_instance(instance)
+    if prev is None:
+        return
+    date_field = ledger_date_field(ledger_service_for(instance))
+    instance._ledger_prev_period = period_of(getattr(prev, date_field))
+
+
+def _refresh_after_delete(sender, instance, **kwargs):
+    if ledger_service_for(instance) is not None:
+        refresh_ledger_for(instance)
+
+
+for _sender in _LEDGER_SENDERS:
+    receiver(pre_save, sender=_sender, dispatch_uid=f'billing_ledger_pre_save_{_sender.__name__}')(
+        _capture_previous_period
+    )
+    receiver(post_delete, sender=_sender, dispatch_uid=f'billing_ledger_post_delete_{_sender.__name__}')(
+        _refresh_after_delete
+    )
@@ -1,4 +1,10 @@
-from django.test import TestCase
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from jobs.models import Job, Agent
 from shuttle.models import Shuttle, ShuttleConfig
@@ -6,17 +12,32 @@ from hotels.models import HotelBooking
 from decimal import Decimal
 from unittest.mock import patch
 from django.utils import timezone
-from datetime import time, datetime
+from datetime import time, datetime, timedelta
 import pytz
 from django.contrib.auth.models import User
 from expenses.models import Expense
 from common.models import Payment
 from people.models import Staff
+from billing import totals_reporting
+from billing.ledger import ledger_totals, refresh_ledger_month
+from common.payment_paid_sync import annotate_complete_payments_eur, sum_complete_payments_eur
+from billing.models import MonthlyLedger, MonthlyLedgerLock
+from billing.views import TOTALS_CACHE_TTL_SECONDS, TOTALS_LOCAL_CACHE_TTL_SECONDS, totals_cache_ttl
+from billing.totals_aggregation import (
+    SERVICE_DRIVING,
+    SERVICE_HOTEL,
+    hotel_agent_fee_expression,
+    hotel_margin_expression,
+    job_agent_fee_expression,
+    job_margin_expression,
+    sum_margin_and_agent_fees,
+)
 
 budapest_tz = pytz.timezone('Europe/Budapest')
 
 class TotalsViewTests(TestCase):
     def setUp(self):
+        cache.clear()
         # Create a superuser and a regular user
         self.superuser = User.objects.create_superuser(username='admin', password='12345')
         self.user = User.objects.create_user(username='testuser', password='12345')
@@ -385,6 +406,461 @@ class TotalsViewTests(TestCase):
         self.assertEqual(response.context['overall_driving_margin_segment']['unpaid'], Decimal('850.00'))
 
 
+    @patch('jobs.models.get_exchange_rate')
+    @patch('hotels.models.get_exchange_rate')
+    def test_totals_query_count_does_not_grow_with_bookings(self, mock_hotel_rate, mock_job_rate):
+        """Summary figures come from grouped aggregates, so more bookings ≠ more queries."""
+        mock_job_rate.return_value = Decimal('1.00')
+        mock_hotel_rate.return_value = Decimal('1.00')
+        self.client.login(username='admin', password='12345')
+        payee = Staff.objects.create(name='Query Staff')
+        today = timezone.now().astimezone(budapest_tz).date()
+
+        def mk_bookings(idx):
+            job = Job.objects.create(
+                customer_name=f"Query Customer {idx}",
+                customer_number=f"+36780000{idx:02d}",
+                job_date=today,
+                job_time=time(10, 0),
+                no_of_passengers=1,
+                job_price=Decimal('100.00'),
+                job_currency='EUR',
+                driver_fee=Decimal('20.00'),
+                driver_currency='EUR',
+                agent_name=self.agent1,
+                agent_percentage='10',
+                is_confirmed=True,
+            )
+            Payment.objects.create(
+                job=job,
+                payment_amount=Decimal('30.00'),
+                payment_currency='EUR',
+                payment_type='Cash',
+                paid_to_staff=payee,
+            )
+            HotelBooking.objects.create(
+                customer_name=f"Query Hotel {idx}",
+                customer_number=f"+36790000{idx:02d}",
+                hotel_name="Hotel Test",
+                check_in=timezone.make_aware(datetime.combine(today, time(15, 0))),
+                check_out=timezone.make_aware(datetime.combine(today, time(18, 0))),
+                no_of_people=2,
+                rooms=1,
+                hotel_price=Decimal('150.00'),
+                hotel_price_currency='EUR',
+                customer_pays=Decimal('200.00'),
+                customer_pays_currency='EUR',
+                agent=self.agent1,
+                agent_percentage='5',
+                is_confirmed=True,
+            )
+
+        mk_bookings(1)
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(reverse('billing:totals'))
+        self.assertEqual(response.status_code, 200)
+
+        for idx in range(2, 8):
+            mk_bookings(idx)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('billing:totals'))
+
+        def data_queries(ctx):
+            # Ignore cache round-trips (and their savepoints) when CACHE_BACKEND=db.
+            return [
+                q for q in ctx.captured_queries
+                if 'kt_cache_table' not in q['sql'] and 'SAVEPOINT' not in q['sql']
+            ]
+
+        self.assertEqual(len(data_queries(many)), len(data_queries(few)))
+
+        # 7 jobs: 100 GMV - 20 driver - 10 agent = 70 margin; 7 hotels: 200 - 10 agent = 190
+        self.assertEqual(response.context['overall_driving_income'], Decimal('700.00'))
+        self.assertEqual(response.context['overall_driving_profit'], Decimal('490.00'))
+        self.assertEqual(response.context['overall_hotel_profit'], Decimal('1330.00'))
+        self.assertEqual(response.context['overall_total_agent_fees'], Decimal('140.00'))
+        self.assertEqual(response.context['overall_total_driver_fees'], Decimal('140.00'))
+        self.assertEqual(response.context['overall_unpaid_driving'], Decimal('490.00'))
+        self.assertEqual(response.context['overall_driving_margin_segment']['paid'], Decimal('210.00'))
+
+        bookings = self.client.get(
+            reverse('billing:totals_bookings'), {'service': 'driving', 'status': 'outstanding'}
+        )
+        self.assertEqual(len(bookings.context['breakdowns']), 7)
+        agents = self.client.get(reverse('billing:totals_agents'))
+        self.assertEqual(agents.context['agent_rows'][0]['monthly']['agent_fees'], Decimal('140.00'))
+
+
+
+    @patch('jobs.models.get_exchange_rate')
+    def test_cached_totals_follow_edits_without_counting_rows(self, mock_get_exchange_rate):
+        mock_get_exchange_rate.return_value = Decimal('1.00')
+        self.client.login(username='admin', password='12345')
+        job = Job.objects.create(
+            customer_name="Cache Customer",
+            job_date=timezone.now().astimezone(budapest_tz).date(),
+            job_time=time(12, 30),
+            no_of_passengers=1,
+            job_price=Decimal('100.00'),
+            job_currency='EUR',
+            driver_fee=Decimal('0.00'),
+            is_confirmed=True,
+        )
+        response = self.client.get(reverse('billing:totals'))
+        self.assertEqual(response.context['overall_driving_income'], Decimal('100.00'))
+
+        # Cache hit: no booking/payment tables touched.
+        with CaptureQueriesContext(connection) as hit:
+            response = self.client.get(reverse('billing:totals'))
+        self.assertEqual(response.context['overall_driving_income'], Decimal('100.00'))
+        self.assertFalse(any('jobs_job' in q['sql'] for q in hit.captured_queries))
+
+        # Price edit keeps row counts identical but must show up on the next request.
+        job.job_price = Decimal('150.00')
+        job.save()
+        response = self.client.get(reverse('billing:totals'))
+        self.assertEqual(response.context['overall_driving_income'], Decimal('150.00'))
+
+    def test_cache_ttl_is_short_unless_the_cache_is_shared(self):
+        # Writes from other workers only bump a shared cache's counters
+        for backend, ttl in (
+            ('django.core.cache.backends.locmem.LocMemCache', TOTALS_LOCAL_CACHE_TTL_SECONDS),
+            ('django.core.cache.backends.db.DatabaseCache', TOTALS_CACHE_TTL_SECONDS),
+        ):
+            with self.subTest(backend=backend), override_settings(CACHES={'default': {'BACKEND': backend}}):
+                self.assertEqual(totals_cache_ttl(), ttl)
+
+
+class TotalsSectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_superuser(username='admin', password='12345')
+        self.agent1 = Agent.objects.create(name="Gilli")
+        self.today = timezone.now().astimezone(budapest_tz).date()
+
+    def mk_job(self, idx, **kwargs):
+        return Job.objects.create(
+            customer_name=f"Section Customer {idx}",
+            customer_number=f"+36750000{idx:02d}",
+            job_date=kwargs.pop('job_date', self.today),
+            job_time=time(9, 0),
+            no_of_passengers=1,
+            job_price=kwargs.pop('job_price', Decimal('100.00')),
+            job_currency='EUR',
+            driver_fee=Decimal('0.00'),
+            driver_currency='EUR',
+            is_confirmed=True,
+            **kwargs,
+        )
+
+    def test_sections_require_login(self):
+        for name in ('totals_summary', 'totals_monthly', 'totals_yearly', 'totals_agents', 'totals_bookings'):
+            response = self.client.get(reverse(f'billing:{name}'))
+            self.assertEqual(response.status_code, 302, name)
+
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    def test_page_renders_summary_without_scanning_bookings(self, _mock_rate):
+        self.mk_job(1)
+        self.client.login(username='admin', password='12345')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('billing:totals'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('billing:totals_bookings'))
+        self.assertFalse(any('jobs_job' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(response.context['overall_driving_income'], Decimal('100.00'))
+
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    def test_monthly_yearly_and_agent_sections(self, _mock_rate):
+        self.mk_job(1, agent_name=self.agent1, agent_percentage='10')
+        self.mk_job(2, job_date=self.today.replace(year=self.today.year - 1))
+        self.client.login(username='admin', password='12345')
+
+        monthly = self.client.get(reverse('billing:totals_monthly'))
+        self.assertEqual(monthly.status_code, 200)
+        rows = monthly.context['rows']
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[self.today.month - 1]['gmv'], Decimal('100.00'))
+        self.assertEqual(rows[self.today.month - 1]['kt_margin'], Decimal('90.00'))
+
+        yearly = self.client.get(reverse('billing:totals_yearly'))
+        self.assertEqual([row['year'] for row in yearly.context['rows']], [self.today.year, self.today.year - 1])
+
+        agents = self.client.get(reverse('billing:totals_agents'))
+        self.assertEqual(agents.context['agent_rows'][0]['name'], 'Gilli')
+        self.assertEqual(agents.context['agent_rows'][0]['overall']['agent_fees'], Decimal('10.00'))
+
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    @patch('billing.totals_breakdowns.BREAKDOWN_PAGE_SIZE', 2)
+    def test_bookings_section_keyset_pages_and_is_cached_per_generation(self, _mock_rate):
+        for idx in range(1, 6):
+            self.mk_job(idx, job_date=self.today - timedelta(days=idx))
+        self.client.login(username='admin', password='12345')
+        url = reverse('billing:totals_bookings')
+
+        seen = []
+        response = self.client.get(url, {'service': 'driving'})
+        self.assertIsNone(response.context['prev_cursor'])
+        while True:
+            seen.extend(row['customer_name'] for row in response.context['breakdowns'])
+            if not response.context['next_cursor']:
+                break
+            last_page = response
+            response = self.client.get(url, {'service': 'driving', 'after': response.context['next_cursor']})
+        self.assertEqual(seen, [f"Section Customer {idx}" for idx in range(1, 6)])
+
+        back = self.client.get(url, {'service': 'driving', 'before': response.context['prev_cursor']})
+        self.assertEqual(back.context['breakdowns'], last_page.context['breakdowns'])
+        self.assertEqual(back.context['next_cursor'], last_page.context['next_cursor'])
+
+        params = {'service': 'driving', 'after': last_page.context['next_cursor']}
+        with CaptureQueriesContext(connection) as ctx:
+            cached = self.client.get(url, params)
+        self.assertEqual(cached.content, response.content)
+        self.assertFalse(any('jobs_job' in q['sql'] for q in ctx.captured_queries))
+
+        self.mk_job(6, job_date=self.today - timedelta(days=10))
+        response = self.client.get(url, params)
+        self.assertEqual(len(response.context['breakdowns']), 2)
+
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    def test_bookings_section_filters_and_sorts(self, _mock_rate):
+        self.mk_job(1, job_price=Decimal('300.00'), agent_name=self.agent1, agent_percentage='10')
+        self.mk_job(2, job_price=Decimal('100.00'), job_date=self.today - timedelta(days=40))
+        paid = self.mk_job(3, job_price=Decimal('200.00'), job_date=self.today - timedelta(days=5))
+        Job.objects.filter(pk=paid.pk).update(is_paid=True)
+        self.client.login(username='admin', password='12345')
+        url = reverse('billing:totals_bookings')
+
+        def names(params):
+            response = self.client.get(url, {'service': 'driving', **params})
+            self.assertEqual(response.status_code, 200)
+            return [row['customer_name'] for row in response.context['breakdowns']]
+
+        self.assertEqual(names({'sort': 'gmv_asc'}), ["Section Customer 2", "Section Customer 3", "Section Customer 1"])
+        self.assertEqual(names({'agent': self.agent1.pk}), ["Section Customer 1"])
+        self.assertEqual(names({'status': 'paid'}), ["Section Customer 3"])
+        self.assertEqual(names({'status': 'unpaid', 'sort': 'date_asc'}), ["Section Customer 2", "Section Customer 1"])
+        self.assertEqual(
+            names({'date_from': (self.today - timedelta(days=10)).isoformat(), 'date_to': self.today.isoformat()}),
+            ["Section Customer 1", "Section Customer 3"],
+        )
+        # Malformed cursors and dates fall back to the unfiltered first page
+        self.assertEqual(len(names({'after': 'nonsense', 'date_from': '2024-02-30'})), 3)
+
+
+    @patch('billing.totals_breakdowns.BREAKDOWN_PAGE_SIZE', 1)
+    def test_hotel_bookings_page_on_datetime_cursor(self):
+        for idx in range(1, 4):
+            check_in = timezone.make_aware(datetime.combine(self.today - timedelta(days=idx), time(15, 0)))
+            HotelBooking.objects.create(
+                customer_name=f"Section Hotel {idx}",
+                customer_number=f"+36760000{idx:02d}",
+                hotel_name="Hotel Test",
+                check_in=check_in,
+                check_out=check_in + timedelta(hours=3),
+                no_of_people=2,
+                rooms=1,
+                hotel_price=Decimal('150.00'),
+                hotel_price_currency='EUR',
+                customer_pays=Decimal('200.00'),
+                customer_pays_currency='EUR',
+                is_confirmed=True,
+            )
+        self.client.login(username='admin', password='12345')
+        url = reverse('billing:totals_bookings')
+
+        first = self.client.get(url, {'service': 'hotel'})
+        second = self.client.get(url, {'service': 'hotel', 'after': first.context['next_cursor']})
+        self.assertEqual(second.context['breakdowns'][0]['customer_name'], "Section Hotel 2")
+        self.assertContains(first, 'after=' + first.context['next_cursor'].replace('+', '%2B').replace(':', '%3A'))
+        back = self.client.get(url, {'service': 'hotel', 'before': second.context['prev_cursor']})
+        self.assertEqual(back.context['breakdowns'][0]['customer_name'], "Section Hotel 1")
+        self.assertIsNone(back.context['prev_cursor'])
+
+
+class CompletePaymentsAnnotationTests(TestCase):
+    def setUp(self):
+        self.staff = Staff.objects.create(name="Desk")
+        self.today = timezone.now().astimezone(budapest_tz).date()
+
+    def mk_job(self, idx, payments=()):
+        job = Job.objects.create(
+            customer_name=f"Annotated Customer {idx}",
+            customer_number=f"+36770000{idx:02d}",
+            job_date=self.today,
+            job_time=time(9, 0),
+            no_of_passengers=1,
+            job_price=Decimal('100.00'),
+            job_currency='EUR',
+            driver_fee=Decimal('20.00'),
+            driver_currency='EUR',
+            is_confirmed=True,
+        )
+        for amount in payments:
+            Payment.objects.create(
+                job=job,
+                payment_amount=amount,
+                payment_currency='EUR',
+                payment_type='Cash',
+                paid_to_staff=self.staff,
+            )
+        # Incomplete row (no payee): never counted
+        Payment.objects.create(job=job, payment_amount=Decimal('999.00'), payment_currency='EUR', payment_type='Cash')
+        return job
+
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    def test_annotation_matches_per_booking_aggregate(self, _mock_rate):
+        self.mk_job(1)
+        self.mk_job(2, payments=[Decimal('30.00')])
+        self.mk_job(3, payments=[Decimal('40.00'), Decimal('60.00')])
+
+        with self.assertNumQueries(1):
+            jobs = list(annotate_complete_payments_eur(Job.objects.order_by('pk')))
+        self.assertEqual([job.complete_payments_count for job in jobs], [0, 1, 2])
+        self.assertEqual(
+            [job.complete_payments_eur for job in jobs],
+            [sum_complete_payments_eur(Job.objects.get(pk=job.pk).payments) for job in jobs],
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(sum_complete_payments_eur(jobs[2].payments), Decimal('100.00'))
+
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    def test_reporting_sums_do_not_query_per_booking(self, _mock_rate):
+        self.mk_job(1, payments=[Decimal('30.00')])
+        with CaptureQueriesContext(connection) as one_job:
+            totals_reporting.sum_jobs_recorded_eur(Job.objects.all())
+            totals_reporting.sum_jobs_gmv_unpaid_by_payments(Job.objects.all())
+
+        self.mk_job(2)
+        self.mk_job(3, payments=[Decimal('100.00')])
+        with CaptureQueriesContext(connection) as three_jobs:
+            recorded = totals_reporting.sum_jobs_recorded_eur(Job.objects.all())
+            unpaid = totals_reporting.sum_jobs_gmv_unpaid_by_payments(Job.objects.all())
+
+        self.assertEqual(len(three_jobs), len(one_job))
+        self.assertEqual(recorded, Decimal('130.00'))
+        self.assertEqual(unpaid, Decimal('170.00'))
+        # Unannotated instances still fall back to a per-booking aggregate
+        self.assertEqual(
+            totals_reporting.sum_jobs_recorded_eur(list(Job.objects.all())), Decimal('130.00')
+        )
+
+
+class MonthlyLedgerTests(TestCase):
+    def setUp(self):
+        self.agent1 = Agent.objects.create(name="Gilli")
+        self.payee = Staff.objects.create(name='Ledger Staff')
+        self.today = timezone.now().astimezone(budapest_tz).date()
+
+    def mk_job(self, idx, job_date, **kwargs):
+        return Job.objects.create(
+            customer_name=f"Ledger Customer {idx}",
+            customer_number=f"+36760000{idx:02d}",
+            job_date=job_date,
+            job_time=time(9, 0),
+            no_of_passengers=1,
+            job_price=Decimal('200.00'),
+            job_currency='EUR',
+            driver_fee=Decimal('50.00'),
+            driver_currency='EUR',
+            is_confirmed=True,
+            **kwargs,
+        )
+
+    def monthly_totals(self):
+        return ledger_totals(self.today.year, self.today.month)['monthly']
+
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    def test_incremental_updates_keep_the_buckets_current(self, _mock_rate):
+        job = self.mk_job(1, self.today, agent_name=self.agent1, agent_percentage='10')
+        old_job = self.mk_job(2, self.today.replace(year=self.today.year - 1))
+        payment = Payment.objects.create(
+            job=job,
+            payment_amount=Decimal('120.00'),
+            payment_currency='EUR',
+            payment_type='Cash',
+            paid_to_staff=self.payee,
+        )
+        Expense.objects.create(
+            expense_type='fuel',
+            expense_amount=Decimal('30.00'),
+            expense_currency='EUR',
+            expense_date=self.today,
+            expense_time=time(8, 0),
+        )
+
+        monthly = self.monthly_totals()
+        self.assertEqual(monthly['driving']['gmv'], Decimal('200.00'))
+        self.assertEqual(monthly['driving']['paid'], Decimal('120.00'))
+        self.assertEqual(monthly['driving']['agent_fees'], Decimal('20.00'))
+        self.assertEqual(monthly['expenses'], Decimal('30.00'))
+
+        # Moving a booking between months refreshes both buckets.
+        old_job.job_date = self.today
+        old_job.save()
+        self.assertEqual(self.monthly_totals()['driving']['gmv'], Decimal('400.00'))
+        self.assertEqual(
+            ledger_totals(self.today.year, self.today.month)['yearly']['driving']['gmv'],
+            ledger_totals(self.today.year, self.today.month)['overall']['driving']['gmv'],
+        )
+
+        payment.delete()
+        job.delete()
+        monthly = self.monthly_totals()
+        self.assertEqual(
+            (monthly['driving']['gmv'], monthly['driving']['paid'], monthly['driving']['agent_fees']),
+            (Decimal('200.00'), Decimal('0.00'), Decimal('0.00')),
+        )
+
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    def test_payment_moved_to_another_booking_refreshes_both_buckets(self, _mock_rate):
+        last_year = self.today.replace(year=self.today.year - 1)
+        old_job = self.mk_job(1, last_year)
+        job = self.mk_job(2, self.today)
+        payment = Payment.objects.create(
+            job=old_job,
+            payment_amount=Decimal('120.00'),
+            payment_currency='EUR',
+            payment_type='Cash',
+            paid_to_staff=self.payee,
+        )
+        payment = Payment.objects.get(pk=payment.pk)
+        payment.job = job
+        payment.save()
+
+        self.assertEqual(self.monthly_totals()['driving']['paid'], Decimal('120.00'))
+        left = MonthlyLedger.objects.get(year=last_year.year, month=last_year.month, service='driving')
+        self.assertEqual(left.paid, Decimal('0.00'))
+        self.assertEqual(left.open_gmv, Decimal('200.00'))
+
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    def test_refresh_locks_one_row_per_bucket(self, _mock_rate):
+        self.mk_job(1, self.today)
+        refresh_ledger_month('driving', self.today.year, self.today.month)
+        refresh_ledger_month('driving', self.today.year, self.today.month)
+        self.assertEqual(
+            MonthlyLedgerLock.objects.filter(year=self.today.year, month=self.today.month, service='driving').count(),
+            1,
+        )
+        self.assertEqual(
+            MonthlyLedger.objects.filter(year=self.today.year, month=self.today.month, service='driving').count(),
+            1,
+        )
+
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    def test_rebuild_ledger_command_restores_rows(self, _mock_rate):
+        self.mk_job(1, self.today, agent_name=self.agent1, agent_percentage='5')
+        self.mk_job(2, self.today)
+        MonthlyLedger.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_ledger', stdout=out)
+
+        self.assertIn('Monthly ledger rebuilt: 2 rows.', out.getvalue())
+        driving = self.monthly_totals()['driving']
+        self.assertEqual((driving['gmv'], driving['agent_fees']), (Decimal('400.00'), Decimal('10.00')))
+
+
 class BillingTotalsTests(TestCase):
     def setUp(self):
         # Create a superuser and a regular user
@@ -574,6 +1050,117 @@ class AgentFeeCalculationTests(TestCase):
         return agent_fee_amount, profit
 
 
+class MoneyExpressionParityTests(TestCase):
+    """SQL margin / agent-fee expressions against the per-instance Python fallbacks."""
+
+    KEEP = object()  # leave the subtotal computed on save
+
+    # (price, driver fee, agent percentage, subtotal)
+    JOB_CASES = [
+        (Decimal('1000.00'), Decimal('50.00'), '5', KEEP),
+        (Decimal('2000.00'), Decimal('100.00'), '10', None),
+        (Decimal('3000.00'), Decimal('150.00'), '50', None),
+        (Decimal('3000.00'), Decimal('150.00'), '50', KEEP),
+        (Decimal('120.40'), Decimal('200.00'), '50', None),  # driver costs more than the price
+        (Decimal('0.00'), Decimal('40.00'), '50', None),
+        (Decimal('500.00'), Decimal('80.00'), None, None),
+        (Decimal('500.00'), Decimal('80.00'), '10', Decimal('300.00')),
+        (Decimal('500.00'), Decimal('80.00'), '10', Decimal('450.00')),  # implied fee below zero
+        (Decimal('64.20'), Decimal('0.00'), '5', None),
+    ]
+    # (customer pays, agent percentage, subtotal)
+    HOTEL_CASES = [
+        (Decimal('200.00'), '5', KEEP),
+        (Decimal('200.00'), '10', None),
+        (Decimal('348.60'), '50', None),
+        (Decimal('0.00'), '50', None),
+        (Decimal('150.00'), None, None),
+        (Decimal('150.00'), '5', Decimal('100.00')),
+        (Decimal('150.00'), '5', Decimal('180.00')),
+    ]
+
+    @patch('hotels.models.get_exchange_rate', return_value=Decimal('1'))
+    @patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+    def setUp(self, _job_rate, _hotel_rate):
+        agent = Agent.objects.create(name="Parity Agent")
+        today = timezone.now().astimezone(budapest_tz).date()
+        for idx, (price, driver_fee, pct, subtotal) in enumerate(self.JOB_CASES):
+            job = Job.objects.create(
+                customer_name=f"Parity Customer {idx}",
+                job_date=today,
+                job_time=time(9, 0),
+                no_of_passengers=1,
+                job_price=price,
+                job_currency='EUR',
+                driver_fee=driver_fee,
+                driver_currency='EUR',
+                agent_name=agent if pct else None,
+                agent_percentage=pct,
+                is_confirmed=True,
+            )
+            if subtotal is not self.KEEP:
+                Job.objects.filter(pk=job.pk).update(subtotal=subtotal)
+        for idx, (customer_pays, pct, subtotal) in enumerate(self.HOTEL_CASES):
+            hotel = HotelBooking.objects.create(
+                customer_name=f"Parity Hotel {idx}",
+                hotel_name="Hotel Test",
+                check_in=timezone.make_aware(datetime.combine(today, time(15, 0))),
+                check_out=timezone.make_aware(datetime.combine(today, time(18, 0))),
+                no_of_people=2,
+                rooms=1,
+                hotel_price=Decimal('100.00'),
+                hotel_price_currency='EUR',
+                customer_pays=customer_pays,
+                customer_pays_currency='EUR',
+                agent=agent if pct else None,
+                agent_percentage=pct,
+                is_confirmed=True,
+            )
+            if subtotal is not self.KEEP:
+                HotelBooking.objects.filter(pk=hotel.pk).update(subtotal=subtotal)
+
+    def test_job_expressions_match_python_per_row(self):
+        rows = Job.objects.annotate(
+            sql_margin=job_margin_expression(), sql_agent_fee=job_agent_fee_expression()
+        )
+        for job in rows:
+            with self.subTest(job=job.customer_name):
+                self.assertEqual(job.sql_margin, totals_reporting.job_kt_margin_eur(job).quantize(Decimal('0.01')))
+                self.assertEqual(
+                    job.sql_agent_fee,
+                    totals_reporting._job_agent_fee_from_subtotal_or_fallback(job).quantize(Decimal('0.01')),
+                )
+
+    def test_hotel_expressions_match_python_per_row(self):
+        rows = HotelBooking.objects.annotate(
+            sql_margin=hotel_margin_expression(), sql_agent_fee=hotel_agent_fee_expression()
+        )
+        for hotel in rows:
+            with self.subTest(hotel=hotel.customer_name):
+                self.assertEqual(hotel.sql_margin, totals_reporting.hotel_kt_margin_eur(hotel).quantize(Decimal('0.01')))
+                self.assertEqual(
+                    hotel.sql_agent_fee,
+                    totals_reporting._hotel_agent_fee_from_subtotal_or_fallback(hotel).quantize(Decimal('0.01')),
+                )
+
+    def test_sums_run_as_one_query_and_match_python(self):
+        jobs, hotels = list(Job.objects.all()), list(HotelBooking.objects.all())
+        with self.assertNumQueries(1):
+            job_sums = sum_margin_and_agent_fees(Job.objects.all(), SERVICE_DRIVING)
+        with self.assertNumQueries(1):
+            hotel_sums = sum_margin_and_agent_fees(HotelBooking.objects.all(), SERVICE_HOTEL)
+
+        self.assertEqual(job_sums['margin'], totals_reporting.sum_jobs_margin(jobs).quantize(Decimal('0.01')))
+        self.assertEqual(job_sums['agent_fees'], totals_reporting.sum_jobs_agent_fees(jobs).quantize(Decimal('0.01')))
+        self.assertEqual(hotel_sums['margin'], totals_reporting.sum_hotels_margin(hotels).quantize(Decimal('0.01')))
+        self.assertEqual(
+            hotel_sums['agent_fees'], totals_reporting.sum_hotels_agent_fees(hotels).quantize(Decimal('0.01'))
+        )
+        # Querysets go through the SQL path.
+        self.assertEqual(totals_reporting.sum_jobs_margin(Job.objects.all()), job_sums['margin'])
+        self.assertEqual(totals_reporting.sum_hotels_agent_fees(HotelBooking.objects.all()), hotel_sums['agent_fees'])
+
+
 class TimezoneConversionTests(TestCase):
     @patch('jobs.models.get_exchange_rate')
     def test_timezone_conversion(self, mock_get_exchange_rate):
@@ -0,0 +1,255 @@
+"""
+Grouped SQL aggregation for the Totals page.
+
+Same money definitions as ``billing.totals_reporting`` (GMV, KT margin, open unpaid
+GMV / margin, recorded payments, agent and driver fees), but evaluated inside the
+database. ``billing.ledger`` aggregates them per month into ``MonthlyLedger``, and the
+breakdowns annotate them per booking. Complete payments are summed per booking with a
+correlated ``Subquery`` — so the query count no longer grows with history.
+
+Money expressions mirror the Python fallbacks in ``common.money``; the per-row margin and
+agent-fee ones are public (``job_margin_expression`` etc.) for use in ``annotate`` /
+``aggregate`` elsewhere:
+
+- **Driving** margin is ``subtotal`` when stored, else ``price − driver fee − agent fee``
+  (5% / 10% of price, or 50% of ``price − driver fee`` when price > 0). Agent fee is
+  ``max(price − driver fee − subtotal, 0)`` when a subtotal exists.
+- **Hotel** margin is ``subtotal`` when stored, else ``customer pays − agent fee``
+  (5% / 10% of customer pays, or 50% when customer pays > 0).
+- **Shuttle** margin equals price (GMV); no agent or driver fees.
+- **Open** GMV / margin is ``max(target − paid, 0)`` for bookings still marked unpaid.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from common.payment_paid_sync import complete_payments_eur_subquery
+from hotels.models import HotelBooking
+from jobs.models import Job
+from shuttle.models import Shuttle
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+ZERO = Value(Decimal('0.00'), output_field=MONEY)
+_MONEYQ = Decimal('0.01')
+
+SERVICE_DRIVING = 'driving'
+SERVICE_SHUTTLE = 'shuttle'
+SERVICE_HOTEL = 'hotel'
+SERVICES = (SERVICE_DRIVING, SERVICE_SHUTTLE, SERVICE_HOTEL)
+
+METRICS = ('gmv', 'margin', 'open_gmv', 'open_margin', 'paid', 'agent_fees', 'driver_fees')
+WINDOWS = ('overall', 'yearly', 'monthly')
+
+
+def _money(expr):
+    return Coalesce(expr, ZERO, output_field=MONEY)
+
+
+def _pct(expr, pct):
+    return expr * Value(Decimal(pct), output_field=MONEY)
+
+
+def _paid_expr(parent_field):
+    return _money(complete_payments_eur_subquery(parent_field))
+
+
+def _open_expr(target, paid):
+    return Case(
+        When(is_paid=False, then=Greatest(target - paid, ZERO, output_field=MONEY)),
+        default=ZERO,
+        output_field=MONEY,
+    )
+
+
+def _job_fallback_fee():
+    gmv = _money(F('job_price_in_euros'))
+    return Case(
+        When(agent_percentage='5', then=_pct(gmv, '0.05')),
+        When(agent_percentage='10', then=_pct(gmv, '0.10')),
+        When(
+            agent_percentage='50',
+            job_price_in_euros__gt=0,
+            then=_pct(gmv - _money(F('driver_fee_in_euros')), '0.50'),
+        ),
+        default=ZERO,
+        output_field=MONEY,
+    )
+
+
+def job_margin_expression():
+    """SQL form of ``totals_reporting.job_kt_margin_eur`` (stored subtotal, else the save formula)."""
+    gmv = _money(F('job_price_in_euros'))
+    driver_fee = _money(F('driver_fee_in_euros'))
+    return Case(
+        When(subtotal__isnull=False, then=F('subtotal')),
+        default=gmv - driver_fee - _job_fallback_fee(),
+        output_field=MONEY,
+    )
+
+
+def job_agent_fee_expression():
+    """SQL form of ``totals_reporting._job_agent_fee_from_subtotal_or_fallback``."""
+    gmv = _money(F('job_price_in_euros'))
+    driver_fee = _money(F('driver_fee_in_euros'))
+    return Case(
+        When(
+            subtotal__isnull=False,
+            then=Greatest(gmv - driver_fee - F('subtotal'), ZERO, output_field=MONEY),
+        ),
+        default=_job_fallback_fee(),
+        output_field=MONEY,
+    )
+
+
+def _job_expressions():
+    gmv = _money(F('job_price_in_euros'))
+    margin = job_margin_expression()
+    paid = _paid_expr('job')
+    return {
+        'gmv': gmv,
+        'margin': margin,
+        'open_gmv': _open_expr(gmv, paid),
+        'open_margin': _open_expr(margin, paid),
+        'paid': paid,
+        'agent_fees': job_agent_fee_expression(),
+        'driver_fees': _money(F('driver_fee_in_euros')),
+    }
+
+
+def _shuttle_expressions():
+    gmv = _money(F('price'))
+    paid = _paid_expr('shuttle')
+    return {
+        'gmv': gmv,
+        'margin': gmv,
+        'open_gmv': _open_expr(gmv, paid),
+        'open_margin': _open_expr(gmv, paid),
+        'paid': paid,
+        'agent_fees': ZERO,
+        'driver_fees': ZERO,
+    }
+
+
+def _hotel_fallback_fee():
+    gmv = _money(F('customer_pays_in_euros'))
+    return Case(
+        When(agent_percentage='5', then=_pct(gmv, '0.05')),
+        When(agent_percentage='10', then=_pct(gmv, '0.10')),
+        When(agent_percentage='50', customer_pays_in_euros__gt=0, then=_pct(gmv, '0.50')),
+        default=ZERO,
+        output_field=MONEY,
+    )
+
+
+def hotel_margin_expression():
+    """SQL form of ``totals_reporting.hotel_kt_margin_eur``."""
+    return Case(
+        When(subtotal__isnull=False, then=F('subtotal')),
+        default=_money(F('customer_pays_in_euros')) - _hotel_fallback_fee(),
+        output_field=MONEY,
+    )
+
+
+def hotel_agent_fee_expression():
+    """SQL form of ``totals_reporting._hotel_agent_fee_from_subtotal_or_fallback``."""
+    gmv = _money(F('customer_pays_in_euros'))
+    return Case(
+        When(subtotal__isnull=False, then=Greatest(gmv - F('subtotal'), ZERO, output_field=MONEY)),
+        default=_hotel_fallback_fee(),
+        output_field=MONEY,
+    )
+
+
+def _hotel_expressions():
+    gmv = _money(F('customer_pays_in_euros'))
+    margin = hotel_margin_expression()
+    paid = _paid_expr('hotel_booking')
+    return {
+        'gmv': gmv,
+        'margin': margin,
+        'open_gmv': _open_expr(gmv, paid),
+        'open_margin': _open_expr(margin, paid),
+        'paid': paid,
+        'agent_fees': hotel_agent_fee_expression(),
+        'driver_fees': ZERO,
+    }
+
+
+# service -> (model, date field used for windows, agent FK or None, expression builder)
+_SERVICE_SPECS = {
+    SERVICE_DRIVING: (Job, 'job_date', 'agent_name', _job_expressions),
+    SERVICE_SHUTTLE: (Shuttle, 'shuttle_date', None, _shuttle_expressions),
+    SERVICE_HOTEL: (HotelBooking, 'check_in', 'agent', _hotel_expressions),
+}
+
+
+def service_model(service):
+    return _SERVICE_SPECS[service][0]
+
+
+def service_date_field(service):
+    return _SERVICE_SPECS[service][1]
+
+
+def service_agent_field(service):
+    return _SERVICE_SPECS[service][2]
+
+
+def money_expressions(service):
+    """Fresh ``{metric: expression}`` for one booking type (see ``METRICS``)."""
+    return _SERVICE_SPECS[service][3]()
+
+
+def confirmed_bookings(service):
+    return service_model(service).objects.filter(is_confirmed=True)
+
+
+def annotate_money(qs, service):
+    """
+    Attach per-row ``gmv_eur``, ``margin_eur``, ``agent_fee_eur`` and ``paid_eur``
+    (complete payments) so breakdown rows come out of one query without touching
+    ``payments``.
+    """
+    exprs = money_expressions(service)
+    return qs.annotate(
+        gmv_eur=exprs['gmv'],
+        margin_eur=exprs['margin'],
+        agent_fee_eur=exprs['agent_fees'],
+        paid_eur=exprs['paid'],
+    )
+
+
+def sum_margin_and_agent_fees(qs, service):
+    """``{'margin': Decimal, 'agent_fees': Decimal}`` over *qs* in one aggregate query."""
+    exprs = money_expressions(service)
+    row = qs.order_by().aggregate(
+        margin=_money(Sum(exprs['margin'])),
+        agent_fees=_money(Sum(exprs['agent_fees'])),
+    )
+    return {key: value.quantize(_MONEYQ) for key, value in row.items()}
+
+
+def filter_outstanding(qs):
+    """
+    Keep ``annotate_money`` rows with money still owed — the SQL form of
+    ``totals_reporting.has_outstanding_from_paid_eur``: more than a cent of GMV open, or
+    more than a cent of margin not yet covered by the paid share of GMV.
+    """
+    cent = Value(Decimal('0.01'), output_field=MONEY)
+    margin_open = Case(
+        When(
+            gmv_eur__gt=0,
+            paid_eur__lt=F('gmv_eur'),
+            then=F('margin_eur') * (F('gmv_eur') - F('paid_eur')) / F('gmv_eur'),
+        ),
+        When(gmv_eur__lte=0, then=F('margin_eur')),
+        default=ZERO,
+        output_field=MONEY,
+    )
+    return qs.alias(margin_open_eur=margin_open).filter(
+        Q(gmv_eur__gt=F('paid_eur') + cent) | Q(margin_open_eur__gt=cent)
+    )
@@ -0,0 +1,232 @@
+"""
+Per-booking breakdown rows for the Totals page, keyset-paginated.
+
+Rows are ``values()`` projections carrying the money columns from
+``totals_aggregation.annotate_money`` — no model instances, no payment prefetch. A page
+is addressed by a cursor holding the sort key and pk of the row it continues from, so
+every page is one bounded range read and nothing counts or offsets through history.
+"""
+
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+from billing.totals_aggregation import (
+    SERVICE_DRIVING,
+    SERVICE_HOTEL,
+    SERVICE_SHUTTLE,
+    annotate_money,
+    confirmed_bookings,
+    filter_outstanding,
+    service_agent_field,
+    service_date_field,
+    service_model,
+)
+
+BREAKDOWN_PAGE_SIZE = 50
+
+# status filter -> what it keeps ('' keeps everything)
+STATUSES = ('', 'paid', 'unpaid', 'outstanding')
+
+# sort option -> (sort key, descending); the key is 'date' or a money annotation
+SORTS = {
+    'date_desc': ('date', True),
+    'date_asc': ('date', False),
+    'gmv_desc': ('gmv_eur', True),
+    'gmv_asc': ('gmv_eur', False),
+    'margin_desc': ('margin_eur', True),
+    'margin_asc': ('margin_eur', False),
+}
+DEFAULT_SORT = 'date_desc'
+
+_MONEY_COLUMNS = ('gmv_eur', 'margin_eur', 'agent_fee_eur', 'paid_eur')
+
+_PROJECTIONS = {
+    SERVICE_DRIVING: (
+        'customer_name', 'job_date', 'driver_fee_in_euros', 'agent_percentage',
+    ),
+    SERVICE_SHUTTLE: (
+        'customer_name', 'shuttle_date', 'no_of_passengers', 'shuttle_direction',
+    ),
+    SERVICE_HOTEL: (
+        'customer_name', 'check_in', 'check_out', 'hotel_price_in_euros', 'agent_percentage',
+    ),
+}
+
+
+def _driving_row(values):
+    return {
+        'customer_name': values['customer_name'],
+        'job_date': values['job_date'],
+        'job_price': values['gmv_eur'],
+        'driver_fee': values['driver_fee_in_euros'] or Decimal('0.00'),
+        'agent_name': values['agent_label'] or '',
+        'agent_fee': values['agent_percentage'] or '0',
+        'agent_fee_amount': values['agent_fee_eur'],
+        'profit': values['margin_eur'],
+        'paid': values['paid_eur'],
+        'is_paid': values['is_paid'],
+    }
+
+
+def _shuttle_row(values):
+    directions = dict(service_model(SERVICE_SHUTTLE)._meta.get_field('shuttle_direction').choices)
+    return {
+        'customer_name': values['customer_name'],
+        'shuttle_date': values['shuttle_date'],
+        'passengers': values['no_of_passengers'],
+        'direction': directions.get(values['shuttle_direction'], values['shuttle_direction']),
+        'price': values['gmv_eur'],
+        'profit': values['margin_eur'],
+        'paid': values['paid_eur'],
+        'is_paid': values['is_paid'],
+    }
+
+
+def _hotel_row(values):
+    return {
+        'customer_name': values['customer_name'],
+        'check_in_date': values['check_in'].date(),
+        'checkout_date': values['check_out'].date(),
+        'customer_pays': values['gmv_eur'],
+        'hotel_price': values['hotel_price_in_euros'],
+        'agent_name': values['agent_label'] or '',
+        'agent_fee': values['agent_percentage'],
+        'agent_fee_amount': values['agent_fee_eur'],
+        'profit': values['margin_eur'],
+        'paid': values['paid_eur'],
+        'is_paid': values['is_paid'],
+    }
+
+
+_ROW_BUILDERS = {
+    SERVICE_DRIVING: _driving_row,
+    SERVICE_SHUTTLE: _shuttle_row,
+    SERVICE_HOTEL: _hotel_row,
+}
+
+
+def _sort_field(service, sort):
+    key, descending = SORTS[sort]
+    return (service_date_field(service) if key == 'date' else key), descending
+
+
+def encode_cursor(value, pk) -> str:
+    """``<sort key>_<pk>``; dates and datetimes in ISO form."""
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return f'{value}_{pk}'
+
+
+def decode_cursor(service, sort, cursor):
+    """``(sort value, pk)`` from :func:`encode_cursor`, or ``None`` when malformed."""
+    if not cursor or '_' not in cursor:
+        return None
+    raw_value, _, raw_pk = cursor.rpartition('_')
+    field, _ = _sort_field(service, sort)
+    try:
+        pk = int(raw_pk)
+        if field == service_date_field(service):
+            value = service_model(service)._meta.get_field(field).to_python(raw_value)
+        else:
+            value = Decimal(raw_value)
+    except (ValueError, InvalidOperation, ValidationError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+def _date_lookup(service, op):
+    # Hotel stays are keyed on a datetime; compare on its date part like the other services.
+    date_field = service_date_field(service)
+    if service == SERVICE_HOTEL:
+        return f'{date_field}__date__{op}'
+    return f'{date_field}__{op}'
+
+
+def breakdown_queryset(service, *, date_from: date | None = None, date_to: date | None = None,
+                       agent_id: int | None = None, status: str = ''):
+    """Confirmed bookings of *service* with money annotations and the given filters applied."""
+    qs = annotate_money(confirmed_bookings(service), service)
+    if date_from:
+        qs = qs.filter(**{_date_lookup(service, 'gte'): date_from})
+    if date_to:
+        qs = qs.filter(**{_date_lookup(service, 'lte'): date_to})
+    agent_field = service_agent_field(service)
+    if agent_id and agent_field:
+        qs = qs.filter(**{f'{agent_field}_id': agent_id})
+    if status == 'paid':
+        qs = qs.filter(is_paid=True)
+    elif status == 'unpaid':
+        qs = qs.filter(is_paid=False)
+    elif status == 'outstanding':
+        qs = filter_outstanding(qs)
+    return qs
+
+
+def _projection(qs, service):
+    fields = ['pk', 'is_paid', *_PROJECTIONS[service], *_MONEY_COLUMNS]
+    agent_field = service_agent_field(service)
+    if agent_field:
+        return qs.values(*fields, agent_label=F(f'{agent_field}__name'))
+    return qs.values(*fields)
+
+
+def _keyset_q(field, descending, value, pk):
+    op = 'lt' if descending else 'gt'
+    return Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk})
+
+
+def breakdown_page(service, *, sort: str = DEFAULT_SORT, after: str | None = None,
+                   before: str | None = None, page_size: int | None = None, **filters):
+    """
+    One page of breakdown rows for *service*.
+
+    *after* continues past the row a cursor names; *before* walks back to the rows
+    preceding it. Returns ``{'rows', 'next_cursor', 'prev_cursor'}``; a cursor is
+    ``None`` when there is nothing further in that direction. *filters* are passed to
+    :func:`breakdown_queryset`.
+    """
+    page_size = page_size or BREAKDOWN_PAGE_SIZE
+    if sort not in SORTS:
+        sort = DEFAULT_SORT
+    field, descending = _sort_field(service, sort)
+    qs = breakdown_queryset(service, **filters)
+
+    backwards = False
+    anchor = decode_cursor(service, sort, after)
+    if anchor is None:
+        anchor = decode_cursor(service, sort, before)
+        backwards = anchor is not None
+    scan_descending = descending != backwards
+    if anchor is not None:
+        qs = qs.filter(_keyset_q(field, scan_descending, *anchor))
+    prefix = '-' if scan_descending else ''
+    qs = qs.order_by(f'{prefix}{field}', f'{prefix}pk')
+
+    values = list(_projection(qs, service)[:page_size + 1])
+    has_more = len(values) > page_size
+    values = values[:page_size]
+    if backwards and not values:
+        # Nothing precedes the cursor any more (rows were deleted): start from the top.
+        return breakdown_page(service, sort=sort, page_size=page_size, **filters)
+    if backwards:
+        values.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, anchor is not None
+
+    def cursor_of(row):
+        return encode_cursor(row[field], row['pk'])
+
+    to_row = _ROW_BUILDERS[service]
+    return {
+        'rows': [to_row(row) for row in values],
+        'next_cursor': cursor_of(values[-1]) if values and has_next else None,
+        'prev_cursor': cursor_of(values[0]) if values and has_prev else None,
+    }
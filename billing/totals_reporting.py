@@ -3,11 +3,13 @@ Single place for Totals (and related) money definitions.
 
 - **GMV (customer gross)** — what the customer is charged / pays, in EUR equivalents.
 - **KT margin** — KT’s slice on the booking: stored `subtotal` when present, else the
-  same formula as on save (driving/hotel). Shuttle has no separate subtotal field yet,
+  same formula as on save (driving/hotel, ``common.money``). Shuttle has no separate subtotal field yet,
   so KT margin equals shuttle `price` (same as GMV) until the model adds costs/splits.
 
 Paid / unpaid splits on the totals page use **`sum_complete_payments_eur`** (complete
-payment rows aligned with the rest of the app). GMV **unpaid** is ``max(owed − paid, 0)``
+payment rows aligned with the rest of the app). The ``sum_*`` helpers below load their
+queryset through ``annotate_complete_payments_eur`` so each booking's paid amount comes
+from the same query instead of one aggregate per booking. GMV **unpaid** is ``max(owed − paid, 0)``
 per booking; **paid** in the donut is total GMV minus that sum (i.e. obligation covered,
 capped at each booking’s GMV). KT margin **paid** is the same coverage ratio applied to
 margin: ``margin × min(1, paid/gmv)`` when GMV > 0.
@@ -17,7 +19,11 @@ from __future__ import annotations
 
 from decimal import Decimal
 
-from common.payment_paid_sync import sum_complete_payments_eur
+from django.db.models import QuerySet
+
+from billing.totals_aggregation import SERVICE_DRIVING, SERVICE_HOTEL, sum_margin_and_agent_fees
+from common import money
+from common.payment_paid_sync import annotate_complete_payments_eur, sum_complete_payments_eur
 from jobs.models import Job
 from hotels.models import HotelBooking
 from shuttle.models import Shuttle
@@ -29,13 +35,46 @@ def _quantize_money(d: Decimal) -> Decimal:
     return d.quantize(_MONEYQ)
 
 
-def booking_gmv_unpaid_eur(owed: Decimal, payments_related_manager) -> Decimal:
-    """Remaining customer GMV after summing complete payment rows (EUR)."""
+def _with_payments(qs):
+    """Querysets get the complete-payment annotation; plain iterables pass through."""
+    if isinstance(qs, QuerySet):
+        return annotate_complete_payments_eur(qs)
+    return qs
+
+
+def gmv_unpaid_from_paid_eur(owed: Decimal, paid: Decimal) -> Decimal:
+    """Remaining customer GMV once *paid* (complete payments, EUR) is known."""
     owed = owed or Decimal('0.00')
-    paid = sum_complete_payments_eur(payments_related_manager)
+    paid = paid or Decimal('0.00')
     return _quantize_money(max(owed - paid, Decimal('0.00')))
 
 
+def kt_margin_allocated_from_paid_eur(owed_margin: Decimal, gmv: Decimal, paid: Decimal) -> Decimal:
+    """KT margin treated as collected in proportion to GMV covered by *paid*."""
+    owed_margin = owed_margin or Decimal('0.00')
+    gmv = gmv or Decimal('0.00')
+    paid = paid or Decimal('0.00')
+    if owed_margin <= 0 or gmv <= 0:
+        return Decimal('0.00')
+    frac = min(paid / gmv, Decimal('1'))
+    return _quantize_money(owed_margin * frac)
+
+
+def has_outstanding_from_paid_eur(gmv: Decimal, margin: Decimal, paid: Decimal) -> bool:
+    """Same rule as ``*_has_outstanding_by_payments`` for an already-summed *paid*."""
+    margin = margin or Decimal('0.00')
+    gmv_unpaid = gmv_unpaid_from_paid_eur(gmv, paid)
+    margin_unpaid = _quantize_money(
+        max(margin - kt_margin_allocated_from_paid_eur(margin, gmv, paid), Decimal('0.00'))
+    )
+    return gmv_unpaid > Decimal('0.01') or margin_unpaid > Decimal('0.01')
+
+
+def booking_gmv_unpaid_eur(owed: Decimal, payments_related_manager) -> Decimal:
+    """Remaining customer GMV after summing complete payment rows (EUR)."""
+    return gmv_unpaid_from_paid_eur(owed, sum_complete_payments_eur(payments_related_manager))
+
+
 def _kt_margin_allocated_from_payments_eur(
     owed_margin: Decimal,
     gmv: Decimal,
@@ -46,78 +85,37 @@ def _kt_margin_allocated_from_payments_eur(
     gmv = gmv or Decimal('0.00')
     if owed_margin <= 0 or gmv <= 0:
         return Decimal('0.00')
-    paid = sum_complete_payments_eur(payments_related_manager)
-    frac = min(paid / gmv, Decimal('1'))
-    return _quantize_money(owed_margin * frac)
+    return kt_margin_allocated_from_paid_eur(
+        owed_margin, gmv, sum_complete_payments_eur(payments_related_manager)
+    )
 
 
 def calculate_agent_fee_and_profit(job):
-    job_price = job.job_price_in_euros or Decimal('0.00')
-    driver_fee = job.driver_fee_in_euros or Decimal('0.00')
-
-    if job.agent_percentage == '5':
-        agent_fee_amount = job_price * Decimal('0.05')
-    elif job.agent_percentage == '10':
-        agent_fee_amount = job_price * Decimal('0.10')
-    elif job.agent_percentage == '50':
-        if job_price > Decimal('0.00'):
-            agent_fee_amount = (job_price - driver_fee) * Decimal('0.50')
-        else:
-            agent_fee_amount = Decimal('0.00')
-    else:
-        agent_fee_amount = Decimal('0.00')
-
-    profit = job_price - driver_fee - agent_fee_amount
-    return agent_fee_amount, profit
+    args = (job.job_price_in_euros, job.driver_fee_in_euros, job.agent_percentage)
+    return money.job_agent_fee(*args), money.job_profit(*args)
 
 
 def calculate_hotel_agent_fee_and_profit(hotel):
-    customer_pays = hotel.customer_pays_in_euros or Decimal('0.00')
-    agent_percentage = hotel.agent_percentage or '0'
-
-    agent_fee_amount = Decimal('0.00')
-    if agent_percentage == '5':
-        agent_fee_amount = customer_pays * Decimal('0.05')
-    elif agent_percentage == '10':
-        agent_fee_amount = customer_pays * Decimal('0.10')
-    elif agent_percentage == '50':
-        agent_fee_amount = customer_pays * Decimal('0.50')
-
-    profit = customer_pays - agent_fee_amount
-    return agent_fee_amount, profit
+    args = (hotel.customer_pays_in_euros, hotel.agent_percentage)
+    return money.hotel_agent_fee(*args), money.hotel_profit(*args)
 
 
 def _job_subtotal_or_fallback(job):
-    if job.subtotal is not None:
-        return job.subtotal
-    _agent_fee_amount, profit = calculate_agent_fee_and_profit(job)
-    return profit
+    return money.job_margin(job.job_price_in_euros, job.driver_fee_in_euros, job.agent_percentage, job.subtotal)
 
 
 def _hotel_subtotal_or_fallback(hotel):
-    if hotel.subtotal is not None:
-        return hotel.subtotal
-    _agent_fee_amount, profit = calculate_hotel_agent_fee_and_profit(hotel)
-    return profit
+    return money.hotel_margin(hotel.customer_pays_in_euros, hotel.agent_percentage, hotel.subtotal)
 
 
 def _job_agent_fee_from_subtotal_or_fallback(job):
-    if job.subtotal is not None:
-        jp = job.job_price_in_euros or Decimal('0.00')
-        df = job.driver_fee_in_euros or Decimal('0.00')
-        fee = jp - df - job.subtotal
-        return fee if fee > Decimal('0.00') else Decimal('0.00')
-    fee, _profit = calculate_agent_fee_and_profit(job)
-    return fee
+    return money.job_agent_fee_or_fallback(
+        job.job_price_in_euros, job.driver_fee_in_euros, job.agent_percentage, job.subtotal
+    )
 
 
 def _hotel_agent_fee_from_subtotal_or_fallback(hotel):
-    if hotel.subtotal is not None:
-        customer = hotel.customer_pays_in_euros or Decimal('0.00')
-        fee = customer - hotel.subtotal
-        return fee if fee > Decimal('0.00') else Decimal('0.00')
-    fee, _profit = calculate_hotel_agent_fee_and_profit(hotel)
-    return fee
+    return money.hotel_agent_fee_or_fallback(hotel.customer_pays_in_euros, hotel.agent_percentage, hotel.subtotal)
 
 
 def job_gmv_eur(job: Job) -> Decimal:
@@ -222,42 +220,42 @@ def hotel_has_outstanding_by_payments(hotel: HotelBooking) -> bool:
 
 def sum_jobs_gmv_unpaid_by_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for job in qs:
+    for job in _with_payments(qs):
         total += job_gmv_unpaid_eur(job)
     return _quantize_money(total)
 
 
 def sum_jobs_kt_margin_unpaid_by_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for job in qs:
+    for job in _with_payments(qs):
         total += job_kt_margin_unpaid_eur(job)
     return _quantize_money(total)
 
 
 def sum_shuttles_gmv_unpaid_by_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for s in qs:
+    for s in _with_payments(qs):
         total += shuttle_gmv_unpaid_eur(s)
     return _quantize_money(total)
 
 
 def sum_shuttles_kt_margin_unpaid_by_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for s in qs:
+    for s in _with_payments(qs):
         total += shuttle_kt_margin_unpaid_eur(s)
     return _quantize_money(total)
 
 
 def sum_hotels_gmv_unpaid_by_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for h in qs:
+    for h in _with_payments(qs):
         total += hotel_gmv_unpaid_eur(h)
     return _quantize_money(total)
 
 
 def sum_hotels_kt_margin_unpaid_by_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for h in qs:
+    for h in _with_payments(qs):
         total += hotel_kt_margin_unpaid_eur(h)
     return _quantize_money(total)
 
@@ -278,42 +276,42 @@ def _remaining_open_booking_balance(target: Decimal, payments_related_manager, i
 
 def sum_jobs_open_gmv_unpaid_minus_own_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for job in qs:
+    for job in _with_payments(qs):
         total += _remaining_open_booking_balance(job_gmv_eur(job), job.payments, bool(job.is_paid))
     return _quantize_money(total)
 
 
 def sum_jobs_open_margin_unpaid_minus_own_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for job in qs:
+    for job in _with_payments(qs):
         total += _remaining_open_booking_balance(job_kt_margin_eur(job), job.payments, bool(job.is_paid))
     return _quantize_money(total)
 
 
 def sum_shuttles_open_gmv_unpaid_minus_own_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for shuttle in qs:
+    for shuttle in _with_payments(qs):
         total += _remaining_open_booking_balance(shuttle_gmv_eur(shuttle), shuttle.payments, bool(shuttle.is_paid))
     return _quantize_money(total)
 
 
 def sum_shuttles_open_margin_unpaid_minus_own_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for shuttle in qs:
+    for shuttle in _with_payments(qs):
         total += _remaining_open_booking_balance(shuttle_kt_margin_eur(shuttle), shuttle.payments, bool(shuttle.is_paid))
     return _quantize_money(total)
 
 
 def sum_hotels_open_gmv_unpaid_minus_own_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for hotel in qs:
+    for hotel in _with_payments(qs):
         total += _remaining_open_booking_balance(hotel_gmv_eur(hotel), hotel.payments, bool(hotel.is_paid))
     return _quantize_money(total)
 
 
 def sum_hotels_open_margin_unpaid_minus_own_payments(qs) -> Decimal:
     total = Decimal('0.00')
-    for hotel in qs:
+    for hotel in _with_payments(qs):
         total += _remaining_open_booking_balance(hotel_kt_margin_eur(hotel), hotel.payments, bool(hotel.is_paid))
     return _quantize_money(total)
 
@@ -321,21 +319,21 @@ def sum_hotels_open_margin_unpaid_minus_own_payments(qs) -> Decimal:
 def sum_jobs_recorded_eur(qs) -> Decimal:
     """Sum of complete customer payment rows (EUR), per booking."""
     total = Decimal('0.00')
-    for job in qs:
+    for job in _with_payments(qs):
         total += sum_complete_payments_eur(job.payments)
     return _quantize_money(total)
 
 
 def sum_shuttles_recorded_eur(qs) -> Decimal:
     total = Decimal('0.00')
-    for s in qs:
+    for s in _with_payments(qs):
         total += sum_complete_payments_eur(s.payments)
     return _quantize_money(total)
 
 
 def sum_hotels_recorded_eur(qs) -> Decimal:
     total = Decimal('0.00')
-    for h in qs:
+    for h in _with_payments(qs):
         total += sum_complete_payments_eur(h.payments)
     return _quantize_money(total)
 
@@ -348,12 +346,24 @@ def sum_jobs_gmv(qs) -> Decimal:
 
 
 def sum_jobs_margin(qs) -> Decimal:
+    """Querysets are summed in SQL (``totals_aggregation.job_margin_expression``)."""
+    if isinstance(qs, QuerySet):
+        return sum_margin_and_agent_fees(qs, SERVICE_DRIVING)['margin']
     total = Decimal('0.00')
-    for job in qs.iterator(chunk_size=500):
+    for job in qs:
         total += job_kt_margin_eur(job)
     return total
 
 
+def sum_jobs_agent_fees(qs) -> Decimal:
+    if isinstance(qs, QuerySet):
+        return sum_margin_and_agent_fees(qs, SERVICE_DRIVING)['agent_fees']
+    total = Decimal('0.00')
+    for job in qs:
+        total += _job_agent_fee_from_subtotal_or_fallback(job)
+    return total
+
+
 def sum_shuttles_gmv(qs) -> Decimal:
     total = Decimal('0.00')
     for s in qs.iterator(chunk_size=500):
@@ -376,12 +386,23 @@ def sum_hotels_gmv(qs) -> Decimal:
 
 
 def sum_hotels_margin(qs) -> Decimal:
+    if isinstance(qs, QuerySet):
+        return sum_margin_and_agent_fees(qs, SERVICE_HOTEL)['margin']
     total = Decimal('0.00')
-    for h in qs.iterator(chunk_size=500):
+    for h in qs:
         total += hotel_kt_margin_eur(h)
     return total
 
 
+def sum_hotels_agent_fees(qs) -> Decimal:
+    if isinstance(qs, QuerySet):
+        return sum_margin_and_agent_fees(qs, SERVICE_HOTEL)['agent_fees']
+    total = Decimal('0.00')
+    for h in qs:
+        total += _hotel_agent_fee_from_subtotal_or_fallback(h)
+    return total
+
+
 def paid_unpaid_segment(
     total: Decimal,
     unpaid: Decimal,
@@ -6,5 +6,10 @@ app_name = 'billing'
 urlpatterns = [
     # path('all_totals/', views.all_totals, name='all_totals'),
     path('totals/', views.totals, name='totals'),
+    path('totals/sections/summary/', views.totals_summary, name='totals_summary'),
+    path('totals/sections/monthly/', views.totals_monthly, name='totals_monthly'),
+    path('totals/sections/yearly/', views.totals_yearly, name='totals_yearly'),
+    path('totals/sections/agents/', views.totals_agents, name='totals_agents'),
+    path('totals/sections/bookings/', views.totals_bookings, name='totals_bookings'),
     path('balances/', views.balances, name='balances'),
 ]
\ No newline at end of file
@@ -1,664 +1,387 @@
 from django.shortcuts import render
-from django.db.models import Count, Max, Sum
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden
 from django.core.cache import cache
 from people.models import Agent, Driver, Staff
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from urllib.parse import urlencode
 from jobs.models import Job
-from shuttle.models import Shuttle
-from hotels.models import HotelBooking
-from expenses.models import Expense
 from decimal import Decimal
+from common.cache_versions import cache_is_shared, data_version
 from common.models import Payment
 import pytz
 import json
 import logging
 
+from billing.ledger import ledger_agent_totals, ledger_month_rows, ledger_totals, ledger_year_rows
+from billing.totals_aggregation import (
+    SERVICE_DRIVING,
+    SERVICE_HOTEL,
+    SERVICE_SHUTTLE,
+    SERVICES,
+    service_agent_field,
+)
+from billing.totals_breakdowns import (
+    DEFAULT_SORT,
+    SORTS as BREAKDOWN_SORTS,
+    STATUSES as BREAKDOWN_STATUSES,
+    breakdown_page,
+)
 from billing.totals_reporting import (
     calculate_agent_fee_and_profit,
-    hotel_has_outstanding_by_payments,
-    job_has_outstanding_by_payments,
     paid_unpaid_segment,
-    shuttle_has_outstanding_by_payments,
-    sum_hotels_margin,
-    sum_hotels_open_gmv_unpaid_minus_own_payments,
-    sum_hotels_open_margin_unpaid_minus_own_payments,
-    sum_hotels_recorded_eur,
-    sum_jobs_margin,
-    sum_jobs_open_gmv_unpaid_minus_own_payments,
-    sum_jobs_open_margin_unpaid_minus_own_payments,
-    sum_jobs_recorded_eur,
-    sum_shuttles_margin,
-    sum_shuttles_open_gmv_unpaid_minus_own_payments,
-    sum_shuttles_open_margin_unpaid_minus_own_payments,
-    sum_shuttles_recorded_eur,
-    _hotel_agent_fee_from_subtotal_or_fallback,
-    _hotel_subtotal_or_fallback,
-    _job_agent_fee_from_subtotal_or_fallback,
-    _job_subtotal_or_fallback,
 )
 
 logger = logging.getLogger('kt')
 
 # Set the timezone to Hungary (Budapest)
 budapest_tz = pytz.timezone('Europe/Budapest')
-TOTALS_CACHE_TTL_SECONDS = 30
+# Entries are keyed on data generations (common.cache_versions). With a shared cache any
+# write invalidates them immediately and the TTL only bounds how long unreachable
+# generations linger. A per-process cache misses writes from other workers and commands,
+# so there entries expire after the short TTL the database fingerprint used to have.
+TOTALS_CACHE_TTL_SECONDS = 600
+TOTALS_LOCAL_CACHE_TTL_SECONDS = 30
 
 
-def _totals_data_fingerprint() -> str:
-    """
-    Build a lightweight cache-busting fingerprint from row counts/max IDs.
-    This keeps totals cache small-lived while avoiding stale responses after writes.
-    """
-    model_stats = []
-    for model in (Job, Shuttle, HotelBooking, Payment, Expense):
-        agg = model.objects.aggregate(row_count=Count('id'), max_id=Max('id'))
-        model_stats.append(f"{agg['row_count'] or 0}:{agg['max_id'] or 0}")
-    return "|".join(model_stats)
+def totals_cache_ttl():
+    return TOTALS_CACHE_TTL_SECONDS if cache_is_shared() else TOTALS_LOCAL_CACHE_TTL_SECONDS
 
 
-def get_agent_totals(jobs, hotels):
+def get_agent_totals(year=None, month=None):
     """
-    Calculate agent totals from jobs, shuttles, and hotel bookings.
+    Agent fee totals from jobs and hotel bookings, read from the monthly ledger.
     Totals are split into monthly, yearly, and overall categories.
     """
-    agent_totals = {}
-    now = timezone.now().astimezone(budapest_tz)
-    current_year = now.year
-    current_month = now.month
-
-    # Function to add fees to agent totals
-    def add_to_totals(agent, fee_amount, month, year):
-        if agent not in agent_totals:
-            agent_totals[agent] = {
-                'monthly': {'agent_fees': Decimal('0.00')},
-                'yearly': {'agent_fees': Decimal('0.00')},
-                'overall': {'agent_fees': Decimal('0.00')}
-            }
-
-        # Monthly total
-        if month == current_month and year == current_year:
-            agent_totals[agent]['monthly']['agent_fees'] += fee_amount
-
-        # Yearly total (current year only)
-        if year == current_year:
-            agent_totals[agent]['yearly']['agent_fees'] += fee_amount
-
-        # Overall total (all years)
-        agent_totals[agent]['overall']['agent_fees'] += fee_amount
-
-
-    # Calculate totals for Jobs
-    for job in jobs:
-        agent_fee_amount = _job_agent_fee_from_subtotal_or_fallback(job)
-        agent_name = job.agent_name.name if job.agent_name else "None"
-        job_month = job.job_date.month
-        job_year = job.job_date.year
-        add_to_totals(agent_name, agent_fee_amount, job_month, job_year)
-
-    # Calculate totals for Hotels
-    for hotel in hotels:
-        agent_fee_amount = _hotel_agent_fee_from_subtotal_or_fallback(hotel)
-        agent_name = hotel.agent.name if hotel.agent else "None"
-        check_in_month = hotel.check_in.month
-        check_in_year = hotel.check_in.year
-        add_to_totals(agent_name, agent_fee_amount, check_in_month, check_in_year)
-
-    return agent_totals
+    if year is None or month is None:
+        now = timezone.now().astimezone(budapest_tz)
+        year, month = now.year, now.month
+    return ledger_agent_totals(year, month)
+
+
+def _service_segments(window_totals, paid_key='paid'):
+    """Margin and GMV donut payloads for each service plus the combined total."""
+    segments = {}
+    combined = {metric: Decimal('0.00') for metric in ('gmv', 'margin', 'open_gmv', 'open_margin', 'paid')}
+    for service in (SERVICE_DRIVING, SERVICE_SHUTTLE, SERVICE_HOTEL):
+        figures = window_totals[service]
+        for metric in combined:
+            combined[metric] += figures[metric]
+        segments[service] = {
+            'margin': paid_unpaid_segment(figures['margin'], figures['open_margin'], paid_override=figures[paid_key]),
+            'gmv': paid_unpaid_segment(figures['gmv'], figures['open_gmv'], paid_override=figures[paid_key]),
+        }
+    segments['total'] = {
+        'margin': paid_unpaid_segment(combined['margin'], combined['open_margin'], paid_override=combined[paid_key]),
+        'gmv': paid_unpaid_segment(combined['gmv'], combined['open_gmv'], paid_override=combined[paid_key]),
+    }
+    return segments
 
 
-@login_required
-def totals(request):
+def _totals_now():
+    return timezone.now().astimezone(budapest_tz)
 
-    show_totals = True  # Set to True when ready to show totals
-    if not show_totals:
-        return render(request, 'billing/totals.html', {'show_totals': show_totals})
 
-    now = timezone.now().astimezone(budapest_tz)
+def _totals_summary_context(now):
+    """Summary cards (KT margin donuts, profit snapshots, GMV cards) from the ledger."""
     current_year = now.year
     current_month = now.month
-    totals_cache_key = (
-        f"billing:totals:v2:{current_year}:{current_month}:{_totals_data_fingerprint()}"
-    )
-    cached_context = cache.get(totals_cache_key)
-    if cached_context is not None:
-        return render(request, 'billing/totals.html', cached_context)
-
-    # Fetch all expense types dynamically from the Expense model
-    expense_types = [expense_type[0] for expense_type in Expense.EXPENSE_TYPES]
-
-    
-
-    """All jobs totals"""
-    all_driving = Job.objects.filter(is_confirmed=True).prefetch_related('payments').order_by('-job_date')
-    all_shuttle = Shuttle.objects.filter(is_confirmed=True).prefetch_related('payments')
-    all_hotels = HotelBooking.objects.filter(is_confirmed=True).prefetch_related('payments')
-    all_expenses = Expense.objects.all()
-
-    # Customer gross (GMV), EUR — job amounts customers pay
-    overall_driving_income = all_driving.aggregate(Sum('job_price_in_euros'))['job_price_in_euros__sum'] or Decimal('0.00')
-    overall_shuttle_income = all_shuttle.aggregate(Sum('price'))['price__sum'] or Decimal('0.00')
-    overall_hotel_income = all_hotels.aggregate(Sum('customer_pays_in_euros'))['customer_pays_in_euros__sum'] or Decimal('0.00')
-    overall_total_income = overall_driving_income + overall_shuttle_income + overall_hotel_income
-
-    # Unpaid is based on booking status flags; paid is handled from payment sums below.
-    unpaid_driving = all_driving.filter(is_paid=False)
-    unpaid_shuttle = all_shuttle.filter(is_paid=False)
-    unpaid_hotels = all_hotels.filter(is_paid=False)
-    overall_unpaid_driving = sum_jobs_open_gmv_unpaid_minus_own_payments(unpaid_driving)
-    overall_unpaid_shuttle = sum_shuttles_open_gmv_unpaid_minus_own_payments(unpaid_shuttle)
-    overall_unpaid_hotels = sum_hotels_open_gmv_unpaid_minus_own_payments(unpaid_hotels)
-
-    # KT margin (subtotal-backed); shuttle == price until model has separate margin
-    overall_driving_margin = sum_jobs_margin(all_driving)
-    overall_shuttle_margin = sum_shuttles_margin(all_shuttle)
-    overall_hotel_margin = sum_hotels_margin(all_hotels)
-    overall_total_margin = overall_driving_margin + overall_shuttle_margin + overall_hotel_margin
-
-    overall_unpaid_driving_margin = sum_jobs_open_margin_unpaid_minus_own_payments(unpaid_driving)
-    overall_unpaid_shuttle_margin = sum_shuttles_open_margin_unpaid_minus_own_payments(unpaid_shuttle)
-    overall_unpaid_hotels_margin = sum_hotels_open_margin_unpaid_minus_own_payments(unpaid_hotels)
-    overall_unpaid_margin_total = (
-        overall_unpaid_driving_margin + overall_unpaid_shuttle_margin + overall_unpaid_hotels_margin
-    )
 
-    # Fees and expenses
-    overall_total_driver_fees = all_driving.aggregate(Sum('driver_fee_in_euros'))['driver_fee_in_euros__sum'] or Decimal('0.00')
-    overall_total_agent_fees = Decimal('0.00')
-    overall_expenses_total = Expense.objects.aggregate(Sum('expense_amount_in_euros'))['expense_amount_in_euros__sum'] or Decimal('0.00')
-
-    # Profits (KT margin; driving/hotel from subtotal logic)
-    overall_driving_profit = Decimal('0.00')
-    overall_shuttle_profit = overall_shuttle_margin
-    overall_hotel_profit = Decimal('0.00')
-
-    # Create all driving job breakdowns
-    all_driving_breakdowns = []
-    for job in all_driving:
-        agent_fee_amount = _job_agent_fee_from_subtotal_or_fallback(job)
-        profit = _job_subtotal_or_fallback(job)
-        overall_total_agent_fees += agent_fee_amount
-        overall_driving_profit += profit
-        all_driving_breakdowns.append({
-            'customer_name': job.customer_name,
-            'job_date': job.job_date,
-            'job_price': job.job_price_in_euros,
-            'driver_fee': job.driver_fee_in_euros or Decimal('0.00'),
-            'agent_name': job.agent_name or '',
-            'agent_fee': job.agent_percentage or '0',
-            'agent_fee_amount': agent_fee_amount,
-            'profit': profit,
-        })
-
-    all_shuttle_breakdowns = []
-    for shuttle in all_shuttle:
-        profit = shuttle.price or Decimal('0.00')
-        all_shuttle_breakdowns.append({
-            'customer_name': shuttle.customer_name,
-            'shuttle_date': shuttle.shuttle_date,
-            'passengers': shuttle.no_of_passengers,
-            'direction': shuttle.get_shuttle_direction_display(),
-            'price': shuttle.price,
-            'profit': profit,
-        })
-
-    all_hotel_breakdowns = []
-    for hotel in all_hotels:
-        agent_fee_amount = _hotel_agent_fee_from_subtotal_or_fallback(hotel)
-        profit = _hotel_subtotal_or_fallback(hotel)
-        overall_total_agent_fees += agent_fee_amount
-        overall_hotel_profit += profit
-        all_hotel_breakdowns.append({
-            'customer_name': hotel.customer_name,
-            'check_in_date': hotel.check_in.date(), 
-            'checkout_date': hotel.check_out.date(), 
-            'customer_pays': hotel.customer_pays_in_euros,
-            'hotel_price': hotel.hotel_price_in_euros,
-            'agent_name': hotel.agent or '',
-            'agent_fee': hotel.agent_percentage,
-            'agent_fee_amount': agent_fee_amount,
-            'profit': profit,
-        })
-
-    # Outstanding (partial or full) vs summed payments — same rules as segments
-    unpaid_driving_breakdowns = []
-    for job in all_driving:
-        if not job_has_outstanding_by_payments(job):
-            continue
-        agent_fee_amount = _job_agent_fee_from_subtotal_or_fallback(job)
-        profit = _job_subtotal_or_fallback(job)
-        unpaid_driving_breakdowns.append({
-            'customer_name': job.customer_name,
-            'job_date': job.job_date,
-            'job_price': job.job_price_in_euros,
-            'driver_fee': job.driver_fee_in_euros or Decimal('0.00'),
-            'agent_name': job.agent_name or '',
-            'agent_fee': job.agent_percentage or '0',
-            'agent_fee_amount': agent_fee_amount,
-            'profit': profit,
-        })
-
-    unpaid_shuttle_breakdowns = []
-    for shuttle in all_shuttle:
-        if not shuttle_has_outstanding_by_payments(shuttle):
-            continue
-        profit = shuttle.price
-        unpaid_shuttle_breakdowns.append({
-            'customer_name': shuttle.customer_name,
-            'shuttle_date': shuttle.shuttle_date,
-            'passengers': shuttle.no_of_passengers,
-            'direction': shuttle.get_shuttle_direction_display(),
-            'price': shuttle.price,
-            'profit': profit,
-        })
-
-    unpaid_hotel_breakdowns = []
-    for hotel in all_hotels:
-        if not hotel_has_outstanding_by_payments(hotel):
-            continue
-        agent_fee_amount = _hotel_agent_fee_from_subtotal_or_fallback(hotel)
-        profit = _hotel_subtotal_or_fallback(hotel)
-        
-        unpaid_hotel_breakdowns.append({
-            'customer_name': hotel.customer_name,
-            'check_in_date': hotel.check_in.date(), 
-            'checkout_date': hotel.check_out.date(), 
-            'customer_pays': hotel.customer_pays_in_euros,
-            'hotel_price': hotel.hotel_price_in_euros,
-            'agent_name': hotel.agent or '',
-            'agent_fee': hotel.agent_percentage,
-            'agent_fee_amount': agent_fee_amount,
-            'profit': profit,
-        })
-
-    # Extract agent totals for driving, shuttles, and hotels
-    driving_agent_totals = []
-    for job in all_driving:
-        agent_fee_amount = _job_agent_fee_from_subtotal_or_fallback(job)
-        if job.agent_name:
-            driving_agent_totals.append({
-                'agent_name': job.agent_name.name,
-                'job_date': job.job_date,
-                'agent_fee_amount': agent_fee_amount,
-                'job_price': job.job_price_in_euros,
-            })
+    # Summary figures: a few dozen pre-computed ledger rows (see billing.ledger)
+    figures = ledger_totals(current_year, current_month)
+    overall = figures['overall']
+    yearly = figures['yearly']
+    monthly = figures['monthly']
 
-    hotel_agent_totals = []
-    for hotel in all_hotels:
-        agent_fee_amount = _hotel_agent_fee_from_subtotal_or_fallback(hotel)
-        if hotel.agent:
-            hotel_agent_totals.append({
-                'agent_name': hotel.agent.name,
-                'check_in_date': hotel.check_in.date(),
-                'agent_fee_amount': agent_fee_amount,
-                'customer_pays': hotel.customer_pays_in_euros,
-            })
+    def window_sum(window, metric):
+        return sum(
+            (window[service][metric] for service in (SERVICE_DRIVING, SERVICE_SHUTTLE, SERVICE_HOTEL)),
+            Decimal('0.00'),
+        )
 
-    overall_unpaid_total = overall_unpaid_driving + overall_unpaid_shuttle + overall_unpaid_hotels
-    overall_total_profit = overall_driving_profit + overall_shuttle_profit + overall_hotel_profit - overall_expenses_total
-    overall_jobs_paid = sum_jobs_recorded_eur(all_driving)
-    overall_shuttles_paid = sum_shuttles_recorded_eur(all_shuttle)
-    overall_hotels_paid = sum_hotels_recorded_eur(all_hotels)
-    overall_all_paid = overall_jobs_paid + overall_shuttles_paid + overall_hotels_paid
+    overall_segments = _service_segments(overall)
+    yearly_segments = _service_segments(yearly)
+    monthly_segments = _service_segments(monthly)
 
-    # Donuts: primary = KT margin; secondary GMV in template uses *_gmv_segment
-    overall_total_margin_segment = paid_unpaid_segment(
-        overall_total_margin, overall_unpaid_margin_total, paid_override=overall_all_paid
-    )
-    overall_total_gmv_segment = paid_unpaid_segment(
-        overall_total_income, overall_unpaid_total, paid_override=overall_all_paid
-    )
-    overall_driving_margin_segment = paid_unpaid_segment(
-        overall_driving_margin, overall_unpaid_driving_margin, paid_override=overall_jobs_paid
-    )
-    overall_driving_gmv_segment = paid_unpaid_segment(
-        overall_driving_income, overall_unpaid_driving, paid_override=overall_jobs_paid
-    )
-    overall_shuttle_margin_segment = paid_unpaid_segment(
-        overall_shuttle_margin, overall_unpaid_shuttle_margin, paid_override=overall_shuttles_paid
-    )
-    overall_shuttle_gmv_segment = paid_unpaid_segment(
-        overall_shuttle_income, overall_unpaid_shuttle, paid_override=overall_shuttles_paid
-    )
-    overall_hotel_margin_segment = paid_unpaid_segment(
-        overall_hotel_margin, overall_unpaid_hotels_margin, paid_override=overall_hotels_paid
-    )
-    overall_hotel_gmv_segment = paid_unpaid_segment(
-        overall_hotel_income, overall_unpaid_hotels, paid_override=overall_hotels_paid
-    )
+    """All jobs totals"""
+    overall_total_margin = window_sum(overall, 'margin')
+    overall_expenses_total = overall['expenses']
+    overall_driving_profit = overall[SERVICE_DRIVING]['margin']
+    overall_shuttle_profit = overall[SERVICE_SHUTTLE]['margin']
+    overall_hotel_profit = overall[SERVICE_HOTEL]['margin']
 
     logger.info(f"Overall Driving Profit: {overall_driving_profit:.2f}")
     logger.info(f"Overall Shuttle Profit: {overall_shuttle_profit:.2f}")
     logger.info(f"Overall Hotel Profit: {overall_hotel_profit:.2f}\n")
 
-
-
-
     """All monthly totals"""
-    # Fetch all jobs and shuttles for the current month (ordered by date descending)
-    monthly_driving = all_driving.filter(job_date__year=current_year, job_date__month=current_month)
-    monthly_shuttles = all_shuttle.filter(shuttle_date__year=current_year, shuttle_date__month=current_month)
-    monthly_hotels = all_hotels.filter(check_in__year=current_year, check_in__month=current_month)
-    monthly_expenses = all_expenses.filter(expense_date__year=current_year, expense_date__month=current_month, expense_type__in=expense_types)
-
-    # Monthly totals
-    monthly_driving_income = monthly_driving.aggregate(Sum('job_price_in_euros'))['job_price_in_euros__sum'] or Decimal('0.00')
-    monthly_shuttle_income = monthly_shuttles.aggregate(Sum('price'))['price__sum'] or Decimal('0.00')
-    monthly_hotel_income = monthly_hotels.aggregate(Sum('customer_pays_in_euros'))['customer_pays_in_euros__sum'] or Decimal('0.00')
-
-    monthly_total_driver_fees = monthly_driving.aggregate(Sum('driver_fee_in_euros'))['driver_fee_in_euros__sum'] or Decimal('0.00')
-    monthly_total_agent_fees = Decimal('0.00')
-    monthly_total_expenses = monthly_expenses.aggregate(Sum('expense_amount_in_euros'))['expense_amount_in_euros__sum'] or Decimal('0.00')
-
-    monthly_driving_profit = Decimal('0.00')
-    monthly_shuttle_profit = Decimal('0.00')
-    monthly_hotel_profit = Decimal('0.00')
-    monthly_total_profit = Decimal('0.00')
-
-    unpaid_monthly_driving = monthly_driving.filter(is_paid=False)
-    unpaid_monthly_shuttle = monthly_shuttles.filter(is_paid=False)
-    unpaid_monthly_hotels = monthly_hotels.filter(is_paid=False)
-    monthly_unpaid_driving_total = sum_jobs_open_gmv_unpaid_minus_own_payments(unpaid_monthly_driving)
-    monthly_unpaid_shuttle_total = sum_shuttles_open_gmv_unpaid_minus_own_payments(unpaid_monthly_shuttle)
-    monthly_unpaid_hotels_total = sum_hotels_open_gmv_unpaid_minus_own_payments(unpaid_monthly_hotels)
-
-    monthly_driving_margin = sum_jobs_margin(monthly_driving)
-    monthly_shuttle_margin = sum_shuttles_margin(monthly_shuttles)
-    monthly_hotel_margin = sum_hotels_margin(monthly_hotels)
-    monthly_total_margin = monthly_driving_margin + monthly_shuttle_margin + monthly_hotel_margin
-    monthly_unpaid_driving_margin = sum_jobs_open_margin_unpaid_minus_own_payments(unpaid_monthly_driving)
-    monthly_unpaid_shuttle_margin = sum_shuttles_open_margin_unpaid_minus_own_payments(unpaid_monthly_shuttle)
-    monthly_unpaid_hotels_margin = sum_hotels_open_margin_unpaid_minus_own_payments(unpaid_monthly_hotels)
-    monthly_unpaid_margin_total = (
-        monthly_unpaid_driving_margin + monthly_unpaid_shuttle_margin + monthly_unpaid_hotels_margin
-    )
-    monthly_shuttle_profit = monthly_shuttle_margin
-
-    monthly_driving_breakdowns = []
-    for job in monthly_driving:
-        agent_fee_amount = _job_agent_fee_from_subtotal_or_fallback(job)
-        profit = _job_subtotal_or_fallback(job)
-        monthly_total_agent_fees += agent_fee_amount
-        monthly_driving_profit += profit
-        monthly_driving_breakdowns.append({
-            'customer_name': job.customer_name,
-            'job_date': job.job_date,
-            'job_price': job.job_price_in_euros,
-            'driver_fee': job.driver_fee_in_euros,
-            'agent_name': job.agent_name or '',
-            'agent_fee': job.agent_percentage,
-            'agent_fee_amount': agent_fee_amount,
-            'profit': profit,
-        })
-
-    # Create the unpaid shuttle job breakdowns
-    monthly_shuttle_breakdowns = []
-    for shuttle in monthly_shuttles:
-        profit = shuttle.price or Decimal('0.00')
-        monthly_shuttle_breakdowns.append({
-            'customer_name': shuttle.customer_name,
-            'shuttle_date': shuttle.shuttle_date,
-            'passengers': shuttle.no_of_passengers,
-            'direction': shuttle.get_shuttle_direction_display(),
-            'price': shuttle.price,
-            'profit': profit,
-        })
-
-    monthly_hotel_breakdowns = []
-    for hotel in monthly_hotels:
-        agent_fee_amount = _hotel_agent_fee_from_subtotal_or_fallback(hotel)
-        profit = _hotel_subtotal_or_fallback(hotel)
-        monthly_total_agent_fees += agent_fee_amount
-        monthly_hotel_profit += profit
-        
-        monthly_hotel_breakdowns.append({
-            'customer_name': hotel.customer_name,
-            'check_in_date': hotel.check_in.date(), 
-            'checkout_date': hotel.check_out.date(), 
-            'customer_pays': hotel.customer_pays_in_euros,
-            'hotel_price': hotel.hotel_price_in_euros,
-            'agent_name': hotel.agent or '',
-            'agent_fee': hotel.agent_percentage,
-            'agent_fee_amount': agent_fee_amount,
-            'profit': profit,
-        })
-
-    # Total monthly income and profit
-    monthly_total_profit = monthly_driving_profit + monthly_shuttle_profit + monthly_hotel_profit
-    monthly_unpaid_total = monthly_unpaid_driving_total + monthly_unpaid_shuttle_total + monthly_unpaid_hotels_total
-    monthly_total_income = monthly_driving_income + monthly_shuttle_income + monthly_hotel_income
-    monthly_jobs_paid = sum_jobs_recorded_eur(monthly_driving)
-    monthly_shuttles_paid = sum_shuttles_recorded_eur(monthly_shuttles)
-    monthly_hotels_paid = sum_hotels_recorded_eur(monthly_hotels)
-    monthly_all_paid = monthly_jobs_paid + monthly_shuttles_paid + monthly_hotels_paid
-    monthly_total_margin_segment = paid_unpaid_segment(
-        monthly_total_margin, monthly_unpaid_margin_total, paid_override=monthly_all_paid
-    )
-    monthly_total_gmv_segment = paid_unpaid_segment(
-        monthly_total_income, monthly_unpaid_total, paid_override=monthly_all_paid
-    )
-    monthly_driving_margin_segment = paid_unpaid_segment(
-        monthly_driving_margin, monthly_unpaid_driving_margin, paid_override=monthly_jobs_paid
-    )
-    monthly_driving_gmv_segment = paid_unpaid_segment(
-        monthly_driving_income, monthly_unpaid_driving_total, paid_override=monthly_jobs_paid
-    )
-    monthly_shuttle_margin_segment = paid_unpaid_segment(
-        monthly_shuttle_margin, monthly_unpaid_shuttle_margin, paid_override=monthly_shuttles_paid
-    )
-    monthly_shuttle_gmv_segment = paid_unpaid_segment(
-        monthly_shuttle_income, monthly_unpaid_shuttle_total, paid_override=monthly_shuttles_paid
-    )
-    monthly_hotel_margin_segment = paid_unpaid_segment(
-        monthly_hotel_margin, monthly_unpaid_hotels_margin, paid_override=monthly_hotels_paid
-    )
-    monthly_hotel_gmv_segment = paid_unpaid_segment(
-        monthly_hotel_income, monthly_unpaid_hotels_total, paid_override=monthly_hotels_paid
-    )
-    monthly_overall_profit = monthly_driving_profit + monthly_shuttle_profit + monthly_hotel_profit - monthly_total_expenses
+    monthly_total_margin = window_sum(monthly, 'margin')
+    monthly_total_expenses = monthly['expenses']
+    monthly_driving_profit = monthly[SERVICE_DRIVING]['margin']
+    monthly_shuttle_profit = monthly[SERVICE_SHUTTLE]['margin']
+    monthly_hotel_profit = monthly[SERVICE_HOTEL]['margin']
 
     logger.info(f"Monthly Driving Profit: {monthly_driving_profit:.2f}")
     logger.info(f"Monthly Shuttle Profit: {monthly_shuttle_profit:.2f}")
     logger.info(f"Monthly Hotel Profit: {monthly_hotel_profit:.2f}\n")
 
-
-
-
     """All yearly totals"""
-    yearly_driving = all_driving.filter(job_date__year=current_year)
-    yearly_shuttles = all_shuttle.filter(shuttle_date__year=current_year)
-    yearly_hotels = all_hotels.filter(check_in__year=current_year)
-    yearly_expenses = Expense.objects.filter(expense_date__year=current_year, expense_type__in=expense_types)
-
-    # Yearly totals
-    yearly_driving_income = yearly_driving.aggregate(Sum('job_price_in_euros'))['job_price_in_euros__sum'] or Decimal('0.00')
-    yearly_shuttle_income = yearly_shuttles.aggregate(Sum('price'))['price__sum'] or Decimal('0.00')
-    yearly_hotel_income = yearly_hotels.aggregate(Sum('customer_pays_in_euros'))['customer_pays_in_euros__sum'] or Decimal('0.00')
-
-    yearly_total_driver_fees = yearly_driving.aggregate(Sum('driver_fee_in_euros'))['driver_fee_in_euros__sum'] or Decimal('0.00')
-    yearly_total_expenses = yearly_expenses.aggregate(Sum('expense_amount_in_euros'))['expense_amount_in_euros__sum'] or Decimal('0.00')
-    yearly_total_agent_fees = Decimal('0.00')
-
-    unpaid_yearly_driving = yearly_driving.filter(is_paid=False)
-    unpaid_yearly_shuttle = yearly_shuttles.filter(is_paid=False)
-    unpaid_yearly_hotels = yearly_hotels.filter(is_paid=False)
-    yearly_unpaid_driving_total = sum_jobs_open_gmv_unpaid_minus_own_payments(unpaid_yearly_driving)
-    yearly_unpaid_shuttle_total = sum_shuttles_open_gmv_unpaid_minus_own_payments(unpaid_yearly_shuttle)
-    yearly_unpaid_hotels_total = sum_hotels_open_gmv_unpaid_minus_own_payments(unpaid_yearly_hotels)
-
-    yearly_driving_margin = sum_jobs_margin(yearly_driving)
-    yearly_shuttle_margin = sum_shuttles_margin(yearly_shuttles)
-    yearly_hotel_margin = sum_hotels_margin(yearly_hotels)
-    yearly_total_margin = yearly_driving_margin + yearly_shuttle_margin + yearly_hotel_margin
-    yearly_unpaid_driving_margin = sum_jobs_open_margin_unpaid_minus_own_payments(unpaid_yearly_driving)
-    yearly_unpaid_shuttle_margin = sum_shuttles_open_margin_unpaid_minus_own_payments(unpaid_yearly_shuttle)
-    yearly_unpaid_hotels_margin = sum_hotels_open_margin_unpaid_minus_own_payments(unpaid_yearly_hotels)
-    yearly_unpaid_margin_total = (
-        yearly_unpaid_driving_margin + yearly_unpaid_shuttle_margin + yearly_unpaid_hotels_margin
-    )
-
-    yearly_driving_profit = Decimal('0.00')
-    yearly_shuttle_profit = yearly_shuttle_margin
-    yearly_hotel_profit = Decimal('0.00')
-
-    # Calculate profits 
-    for job in yearly_driving:
-        agent_fee_amount = _job_agent_fee_from_subtotal_or_fallback(job)
-        profit = _job_subtotal_or_fallback(job)
-        yearly_total_agent_fees += agent_fee_amount
-        yearly_driving_profit += profit
-
-    for hotel in yearly_hotels:
-        agent_fee_amount = _hotel_agent_fee_from_subtotal_or_fallback(hotel)
-        profit = _hotel_subtotal_or_fallback(hotel)
-        yearly_total_agent_fees += agent_fee_amount
-        yearly_hotel_profit += profit
-
-    # Total yearly income and profit
-    yearly_unpaid_total = yearly_unpaid_driving_total + yearly_unpaid_shuttle_total + yearly_unpaid_hotels_total
-    yearly_total_income = yearly_driving_income + yearly_shuttle_income + yearly_hotel_income
-    yearly_jobs_paid = sum_jobs_recorded_eur(yearly_driving)
-    yearly_shuttles_paid = sum_shuttles_recorded_eur(yearly_shuttles)
-    yearly_hotels_paid = sum_hotels_recorded_eur(yearly_hotels)
-    yearly_all_paid = yearly_jobs_paid + yearly_shuttles_paid + yearly_hotels_paid
-    yearly_total_margin_segment = paid_unpaid_segment(
-        yearly_total_margin, yearly_unpaid_margin_total, paid_override=yearly_all_paid
-    )
-    yearly_total_gmv_segment = paid_unpaid_segment(
-        yearly_total_income, yearly_unpaid_total, paid_override=yearly_all_paid
-    )
-    yearly_driving_margin_segment = paid_unpaid_segment(
-        yearly_driving_margin, yearly_unpaid_driving_margin, paid_override=yearly_jobs_paid
-    )
-    yearly_driving_gmv_segment = paid_unpaid_segment(
-        yearly_driving_income, yearly_unpaid_driving_total, paid_override=yearly_jobs_paid
-    )
-    yearly_shuttle_margin_segment = paid_unpaid_segment(
-        yearly_shuttle_margin, yearly_unpaid_shuttle_margin, paid_override=yearly_shuttles_paid
-    )
-    yearly_shuttle_gmv_segment = paid_unpaid_segment(
-        yearly_shuttle_income, yearly_unpaid_shuttle_total, paid_override=yearly_shuttles_paid
-    )
-    yearly_hotel_margin_segment = paid_unpaid_segment(
-        yearly_hotel_margin, yearly_unpaid_hotels_margin, paid_override=yearly_hotels_paid
-    )
-    yearly_hotel_gmv_segment = paid_unpaid_segment(
-        yearly_hotel_income, yearly_unpaid_hotels_total, paid_override=yearly_hotels_paid
-    )
-    yearly_total_profit = yearly_driving_profit + yearly_shuttle_profit + yearly_hotel_profit
-    yearly_overall_profit = yearly_driving_profit + yearly_shuttle_profit + yearly_hotel_profit - yearly_total_expenses
+    yearly_total_margin = window_sum(yearly, 'margin')
+    yearly_total_expenses = yearly['expenses']
+    yearly_driving_profit = yearly[SERVICE_DRIVING]['margin']
+    yearly_shuttle_profit = yearly[SERVICE_SHUTTLE]['margin']
+    yearly_hotel_profit = yearly[SERVICE_HOTEL]['margin']
 
     logger.info(f"Yearly Driving Profit: {yearly_driving_profit:.2f}")
     logger.info(f"Yearly Shuttle Profit: {yearly_shuttle_profit:.2f}")
     logger.info(f"Yearly Hotel Profit: {yearly_hotel_profit:.2f}\n")
 
-
-
-
-
-    """Render all totals"""
-    # Render the template with context
-    context = {
+    return {
         'now': now,
-        'show_totals': show_totals,
 
         'overall_total_margin': overall_total_margin,
-        'overall_unpaid_margin_total': overall_unpaid_margin_total,
-        'overall_total_margin_segment': overall_total_margin_segment,
-        'overall_total_gmv_segment': overall_total_gmv_segment,
-        'overall_driving_margin_segment': overall_driving_margin_segment,
-        'overall_driving_gmv_segment': overall_driving_gmv_segment,
-        'overall_shuttle_margin_segment': overall_shuttle_margin_segment,
-        'overall_shuttle_gmv_segment': overall_shuttle_gmv_segment,
-        'overall_hotel_margin_segment': overall_hotel_margin_segment,
-        'overall_hotel_gmv_segment': overall_hotel_gmv_segment,
+        'overall_unpaid_margin_total': window_sum(overall, 'open_margin'),
+        'overall_total_margin_segment': overall_segments['total']['margin'],
+        'overall_total_gmv_segment': overall_segments['total']['gmv'],
+        'overall_driving_margin_segment': overall_segments[SERVICE_DRIVING]['margin'],
+        'overall_driving_gmv_segment': overall_segments[SERVICE_DRIVING]['gmv'],
+        'overall_shuttle_margin_segment': overall_segments[SERVICE_SHUTTLE]['margin'],
+        'overall_shuttle_gmv_segment': overall_segments[SERVICE_SHUTTLE]['gmv'],
+        'overall_hotel_margin_segment': overall_segments[SERVICE_HOTEL]['margin'],
+        'overall_hotel_gmv_segment': overall_segments[SERVICE_HOTEL]['gmv'],
 
         'monthly_total_margin': monthly_total_margin,
-        'monthly_unpaid_margin_total': monthly_unpaid_margin_total,
-        'monthly_total_income': monthly_total_income,
-        'monthly_hotel_income': monthly_hotel_income,
-        'monthly_shuttle_income': monthly_shuttle_income,
-        'monthly_driving_income': monthly_driving_income,
-        'monthly_total_agent_fees': monthly_total_agent_fees,
-        'monthly_total_driver_fees': monthly_total_driver_fees,
+        'monthly_unpaid_margin_total': window_sum(monthly, 'open_margin'),
+        'monthly_total_income': window_sum(monthly, 'gmv'),
+        'monthly_hotel_income': monthly[SERVICE_HOTEL]['gmv'],
+        'monthly_shuttle_income': monthly[SERVICE_SHUTTLE]['gmv'],
+        'monthly_driving_income': monthly[SERVICE_DRIVING]['gmv'],
+        'monthly_total_agent_fees': window_sum(monthly, 'agent_fees'),
+        'monthly_total_driver_fees': window_sum(monthly, 'driver_fees'),
         'monthly_total_expenses': monthly_total_expenses,
-        'monthly_unpaid_driving_total': monthly_unpaid_driving_total,
-        'monthly_unpaid_shuttle_total': monthly_unpaid_shuttle_total,
-        'monthly_unpaid_hotels_total': monthly_unpaid_hotels_total,
-        'monthly_unpaid_total': monthly_unpaid_total,
-        'monthly_total_margin_segment': monthly_total_margin_segment,
-        'monthly_total_gmv_segment': monthly_total_gmv_segment,
-        'monthly_driving_margin_segment': monthly_driving_margin_segment,
-        'monthly_driving_gmv_segment': monthly_driving_gmv_segment,
-        'monthly_shuttle_margin_segment': monthly_shuttle_margin_segment,
-        'monthly_shuttle_gmv_segment': monthly_shuttle_gmv_segment,
-        'monthly_hotel_margin_segment': monthly_hotel_margin_segment,
-        'monthly_hotel_gmv_segment': monthly_hotel_gmv_segment,
+        'monthly_unpaid_driving_total': monthly[SERVICE_DRIVING]['open_gmv'],
+        'monthly_unpaid_shuttle_total': monthly[SERVICE_SHUTTLE]['open_gmv'],
+        'monthly_unpaid_hotels_total': monthly[SERVICE_HOTEL]['open_gmv'],
+        'monthly_unpaid_total': window_sum(monthly, 'open_gmv'),
+        'monthly_total_margin_segment': monthly_segments['total']['margin'],
+        'monthly_total_gmv_segment': monthly_segments['total']['gmv'],
+        'monthly_driving_margin_segment': monthly_segments[SERVICE_DRIVING]['margin'],
+        'monthly_driving_gmv_segment': monthly_segments[SERVICE_DRIVING]['gmv'],
+        'monthly_shuttle_margin_segment': monthly_segments[SERVICE_SHUTTLE]['margin'],
+        'monthly_shuttle_gmv_segment': monthly_segments[SERVICE_SHUTTLE]['gmv'],
+        'monthly_hotel_margin_segment': monthly_segments[SERVICE_HOTEL]['margin'],
+        'monthly_hotel_gmv_segment': monthly_segments[SERVICE_HOTEL]['gmv'],
         'monthly_driving_profit': monthly_driving_profit,
         'monthly_hotel_profit': monthly_hotel_profit,
-        'monthly_total_profit': monthly_total_profit,
-        'monthly_overall_profit': monthly_overall_profit,
-        'monthly_driving_breakdowns': monthly_driving_breakdowns,
-        'monthly_shuttle_breakdowns': monthly_shuttle_breakdowns,
-        'monthly_hotel_breakdowns': monthly_hotel_breakdowns,
-
-        'yearly_total_income': yearly_total_income,
-        'yearly_total_agent_fees': yearly_total_agent_fees,
-        'yearly_total_driver_fees': yearly_total_driver_fees,
+        'monthly_total_profit': monthly_total_margin,
+        'monthly_overall_profit': monthly_total_margin - monthly_total_expenses,
+
+        'yearly_total_income': window_sum(yearly, 'gmv'),
+        'yearly_total_agent_fees': window_sum(yearly, 'agent_fees'),
+        'yearly_total_driver_fees': window_sum(yearly, 'driver_fees'),
         'yearly_total_expenses': yearly_total_expenses,
-        'yearly_shuttle_income': yearly_shuttle_income,
-        'yearly_driving_income': yearly_driving_income,
-        'yearly_unpaid_total': yearly_unpaid_total,
+        'yearly_shuttle_income': yearly[SERVICE_SHUTTLE]['gmv'],
+        'yearly_driving_income': yearly[SERVICE_DRIVING]['gmv'],
+        'yearly_unpaid_total': window_sum(yearly, 'open_gmv'),
         'yearly_total_margin': yearly_total_margin,
-        'yearly_unpaid_margin_total': yearly_unpaid_margin_total,
-        'yearly_total_margin_segment': yearly_total_margin_segment,
-        'yearly_total_gmv_segment': yearly_total_gmv_segment,
-        'yearly_driving_margin_segment': yearly_driving_margin_segment,
-        'yearly_driving_gmv_segment': yearly_driving_gmv_segment,
-        'yearly_shuttle_margin_segment': yearly_shuttle_margin_segment,
-        'yearly_shuttle_gmv_segment': yearly_shuttle_gmv_segment,
-        'yearly_hotel_margin_segment': yearly_hotel_margin_segment,
-        'yearly_hotel_gmv_segment': yearly_hotel_gmv_segment,
-        'yearly_hotel_income': yearly_hotel_income,
-        'yearly_total_profit': yearly_total_profit,
-        'yearly_overall_profit': yearly_overall_profit, 
-
-        'overall_total_income': overall_total_income,
-        'overall_driving_income': overall_driving_income,
-        'overall_shuttle_income': overall_shuttle_income,
-        'overall_hotel_income': overall_hotel_income,
-        'overall_total_agent_fees': overall_total_agent_fees,
-        'overall_total_driver_fees': overall_total_driver_fees,
+        'yearly_unpaid_margin_total': window_sum(yearly, 'open_margin'),
+        'yearly_total_margin_segment': yearly_segments['total']['margin'],
+        'yearly_total_gmv_segment': yearly_segments['total']['gmv'],
+        'yearly_driving_margin_segment': yearly_segments[SERVICE_DRIVING]['margin'],
+        'yearly_driving_gmv_segment': yearly_segments[SERVICE_DRIVING]['gmv'],
+        'yearly_shuttle_margin_segment': yearly_segments[SERVICE_SHUTTLE]['margin'],
+        'yearly_shuttle_gmv_segment': yearly_segments[SERVICE_SHUTTLE]['gmv'],
+        'yearly_hotel_margin_segment': yearly_segments[SERVICE_HOTEL]['margin'],
+        'yearly_hotel_gmv_segment': yearly_segments[SERVICE_HOTEL]['gmv'],
+        'yearly_hotel_income': yearly[SERVICE_HOTEL]['gmv'],
+        'yearly_total_profit': yearly_total_margin,
+        'yearly_overall_profit': yearly_total_margin - yearly_total_expenses,
+
+        'overall_total_income': window_sum(overall, 'gmv'),
+        'overall_driving_income': overall[SERVICE_DRIVING]['gmv'],
+        'overall_shuttle_income': overall[SERVICE_SHUTTLE]['gmv'],
+        'overall_hotel_income': overall[SERVICE_HOTEL]['gmv'],
+        'overall_total_agent_fees': window_sum(overall, 'agent_fees'),
+        'overall_total_driver_fees': window_sum(overall, 'driver_fees'),
         'overall_driving_profit': overall_driving_profit,
         'overall_shuttle_profit': overall_shuttle_profit,
         'overall_hotel_profit': overall_hotel_profit,
-        'overall_total_profit': overall_total_profit,
-        'overall_unpaid_driving': overall_unpaid_driving,
-        'overall_unpaid_shuttle': overall_unpaid_shuttle,
-        'overall_unpaid_hotels': overall_unpaid_hotels,
-        'overall_unpaid_driving_margin': overall_unpaid_driving_margin,
-        'overall_unpaid_shuttle_margin': overall_unpaid_shuttle_margin,
-        'overall_unpaid_hotels_margin': overall_unpaid_hotels_margin,
-        'overall_unpaid_total': overall_unpaid_total,
+        'overall_total_profit': overall_total_margin - overall_expenses_total,
+        'overall_unpaid_driving': overall[SERVICE_DRIVING]['open_gmv'],
+        'overall_unpaid_shuttle': overall[SERVICE_SHUTTLE]['open_gmv'],
+        'overall_unpaid_hotels': overall[SERVICE_HOTEL]['open_gmv'],
+        'overall_unpaid_driving_margin': overall[SERVICE_DRIVING]['open_margin'],
+        'overall_unpaid_shuttle_margin': overall[SERVICE_SHUTTLE]['open_margin'],
+        'overall_unpaid_hotels_margin': overall[SERVICE_HOTEL]['open_margin'],
+        'overall_unpaid_total': window_sum(overall, 'open_gmv'),
         'overall_expenses_total': overall_expenses_total,
+    }
 
-        'unpaid_driving_breakdowns': unpaid_driving_breakdowns,
-        'unpaid_shuttle_breakdowns': unpaid_shuttle_breakdowns,
-        'unpaid_hotel_breakdowns': unpaid_hotel_breakdowns,
 
-        'driving_breakdowns': all_driving_breakdowns,
-        'shuttle_breakdowns': all_shuttle_breakdowns,
-        'hotel_breakdowns': all_hotel_breakdowns,
+def _cached_totals_section(request, name, params, build_context, template):
+    """
+    Render one Totals section to HTML, cached per data generation so edits show up on
+    the next fetch (see common.cache_versions).
+    """
+    cache_key = f"billing:totals:section:v1:{name}:{params}:{data_version()}"
+    html = cache.get(cache_key)
+    if html is None:
+        html = render_to_string(template, build_context(), request=request)
+        cache.set(cache_key, html, totals_cache_ttl())
+    return HttpResponse(html)
 
-        'driving_agent_totals': driving_agent_totals,
-        'hotel_agent_totals': hotel_agent_totals,
-        'agent_totals': get_agent_totals(all_driving, all_hotels),
-    }
-    cache.set(totals_cache_key, context, TOTALS_CACHE_TTL_SECONDS)
+
+def _int_param(request, name, default):
+    try:
+        return int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@login_required
+def totals(request):
+
+    show_totals = True  # Set to True when ready to show totals
+    if not show_totals:
+        return render(request, 'billing/totals.html', {'show_totals': show_totals})
+
+    # Only the summary cards are built here; the larger sections are fetched on demand
+    # from the totals_* partial endpoints below.
+    now = _totals_now()
+    totals_cache_key = f"billing:totals:v4:{now.year}:{now.month}:{data_version()}"
+    context = cache.get(totals_cache_key)
+    if context is None:
+        context = _totals_summary_context(now)
+        context['show_totals'] = show_totals
+        cache.set(totals_cache_key, context, totals_cache_ttl())
     return render(request, 'billing/totals.html', context)
 
-    
+
+@login_required
+def totals_summary(request):
+    now = _totals_now()
+    return _cached_totals_section(
+        request,
+        'summary',
+        f'{now.year}:{now.month}',
+        lambda: _totals_summary_context(now),
+        'billing/totals_partials/totals_summary.html',
+    )
+
+
+@login_required
+def totals_monthly(request):
+    year = _int_param(request, 'year', _totals_now().year)
+
+    def build():
+        return {
+            'year': year,
+            'rows': ledger_month_rows(year),
+            'previous_year': year - 1,
+            'next_year': year + 1,
+        }
+
+    return _cached_totals_section(
+        request, 'monthly', str(year), build, 'billing/totals_partials/totals_monthly.html'
+    )
+
+
+@login_required
+def totals_yearly(request):
+    return _cached_totals_section(
+        request, 'yearly', '', lambda: {'rows': ledger_year_rows()},
+        'billing/totals_partials/totals_yearly.html',
+    )
+
+
+@login_required
+def totals_agents(request):
+    now = _totals_now()
+
+    def build():
+        agent_totals = get_agent_totals(now.year, now.month)
+        return {
+            'now': now,
+            'agent_rows': [
+                {'name': name, **agent_totals[name]}
+                for name in sorted(agent_totals, key=lambda name: (name == 'None', name.lower()))
+            ],
+        }
+
+    return _cached_totals_section(
+        request, 'agents', f'{now.year}:{now.month}', build,
+        'billing/totals_partials/totals_agents.html',
+    )
+
+
+def _date_param(request, name):
+    try:
+        return parse_date(request.GET.get(name) or '')
+    except ValueError:
+        return None
+
+
+@login_required
+def totals_bookings(request):
+    """
+    Per-booking breakdown for one service, keyset-paginated (``after`` / ``before``
+    cursors) with ``sort``, ``date_from``, ``date_to``, ``agent`` and ``status`` filters.
+    """
+    service = request.GET.get('service', SERVICE_DRIVING)
+    if service not in SERVICES:
+        service = SERVICE_DRIVING
+    sort = request.GET.get('sort', DEFAULT_SORT)
+    if sort not in BREAKDOWN_SORTS:
+        sort = DEFAULT_SORT
+    status = request.GET.get('status', '')
+    if status not in BREAKDOWN_STATUSES:
+        status = ''
+    filters = {
+        'date_from': _date_param(request, 'date_from'),
+        'date_to': _date_param(request, 'date_to'),
+        'agent_id': _int_param(request, 'agent', None) if service_agent_field(service) else None,
+        'status': status,
+    }
+    after = request.GET.get('after') or None
+    before = None if after else (request.GET.get('before') or None)
+
+    # Normalised filters, reused for the cache key and the pagination links
+    filter_query = urlencode({
+        'service': service,
+        'sort': sort,
+        **{key: value for key, value in (
+            ('date_from', filters['date_from'] and filters['date_from'].isoformat()),
+            ('date_to', filters['date_to'] and filters['date_to'].isoformat()),
+            ('agent', filters['agent_id']),
+            ('status', status),
+        ) if value},
+    })
+
+    def build():
+        page = breakdown_page(service, sort=sort, after=after, before=before, **filters)
+        return {
+            'service': service,
+            'services': SERVICES,
+            'sort': sort,
+            'status': status,
+            'filters': filters,
+            'agents': Agent.objects.order_by('name').values('pk', 'name') if service_agent_field(service) else (),
+            'filter_query': filter_query,
+            'breakdowns': page['rows'],
+            'next_cursor': page['next_cursor'],
+            'prev_cursor': page['prev_cursor'],
+        }
+
+    return _cached_totals_section(
+        request,
+        'bookings',
+        f'{filter_query}:{after or ""}:{before or ""}',
+        build,
+        'billing/totals_partials/totals_bookings.html',
+    )
+
 
 @login_required
 def balances(request):
@@ -7,6 +7,13 @@ class CommonConfig(AppConfig):
     label = 'common'
 
     def ready(self):
+        from common import checks  # registers the system checks
+        from common.cache_versions import register_cache_version_signals
+        from common.customers import register_customer_signals
+        from common.search import register_search_signals
         from common.signals import register_audit_signals
 
         register_audit_signals()
+        register_cache_version_signals()
+        register_search_signals()
+        register_customer_signals()
@@ -4,6 +4,7 @@ from django.apps import apps
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 
+from common.commit_batch import defer_to_commit
 from common.models import AuditLogEntry
 from common.utils import format_budapest_datetime, now_budapest
 
@@ -40,14 +41,23 @@ def format_audit_datetime(dt):
     return format_budapest_datetime(dt, fmt='j M Y, H:i')
 
 
+def _flush_audit_entries(entries):
+    AuditLogEntry.objects.bulk_create(entries)
+
+
 def log_audit(instance, action, user, timestamp=None, changes=None):
-    """Persist an audit row. action is 'created' or 'updated'. *changes*: list of dicts for UI."""
+    """
+    Record an audit row. action is 'created' or 'updated'. *changes*: list of dicts for UI.
+
+    Rows are inserted together when the surrounding transaction commits (one INSERT for
+    every save in it); outside a transaction they are written immediately.
+    """
     if action not in (AuditLogEntry.ACTION_CREATED, AuditLogEntry.ACTION_UPDATED):
         return
     if not instance.pk:
         return
     ts = timestamp if timestamp is not None else now_budapest()
-    AuditLogEntry.objects.create(
+    entry = AuditLogEntry(
         content_type=ContentType.objects.get_for_model(instance.__class__),
         object_id=instance.pk,
         action=action,
@@ -55,6 +65,7 @@ def log_audit(instance, action, user, timestamp=None, changes=None):
         timestamp=ts,
         changes=changes if changes else None,
     )
+    defer_to_commit('audit-entries', entry, _flush_audit_entries)
 
 
 def build_audit_payload(instance):
@@ -4,6 +4,7 @@ from decimal import Decimal
 
 from django.db import models
 
+from common.save_state import previous_instance
 from common.utils import format_budapest_datetime
 
 # (field_name, human label) — exclude derived / audit-only fields that change every save
@@ -117,9 +118,10 @@ _register_specs()
 
 def _canonical_field(instance, field_name):
     field = instance._meta.get_field(field_name)
-    raw = getattr(instance, field_name)
     if field.many_to_one or field.one_to_one:
-        return raw.pk if raw is not None else None
+        # The FK column itself: comparing ids needs no related-object fetch
+        return getattr(instance, field.attname)
+    raw = getattr(instance, field_name)
     if isinstance(field, models.BooleanField):
         return bool(raw) if raw is not None else None
     if isinstance(field, models.IntegerField):
@@ -236,8 +238,5 @@ def attach_pre_save_snapshot(instance):
     if model not in AUDIT_TRACKED_FIELDS:
         instance._audit_field_snapshot_before = None
         return
-    try:
-        prev = model.objects.get(pk=instance.pk)
-        instance._audit_field_snapshot_before = take_field_snapshot(prev)
-    except model.DoesNotExist:
-        instance._audit_field_snapshot_before = None
+    prev = previous_instance(instance)
+    instance._audit_field_snapshot_before = take_field_snapshot(prev) if prev is not None else None
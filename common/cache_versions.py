@@ -0,0 +1,116 @@
+"""
+Generation counters for cache invalidation.
+
+Every save / delete of a tracked model bumps that model's version key; cached payloads
+(Totals context and partials) embed the versions they were built from in their cache
+key. Reading a key costs one cache round-trip and no DB queries, and any edit —
+including ones that leave row counts unchanged — makes the old entries unreachable.
+Stored export files outlive the cache, so ``export_queue`` keys them on versions read
+from the database instead.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+VERSION_KEY_PREFIX = 'kt:data-version:'
+
+# Models whose writes change booking / money figures.
+TRACKED_MODELS = (
+    'jobs.Job',
+    'shuttle.Shuttle',
+    'hotels.HotelBooking',
+    'common.Payment',
+    'expenses.Expense',
+)
+
+
+# Backends whose entries live in one process only
+_PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared(alias='default'):
+    """
+    Whether all processes use the same *alias* cache (``file`` / ``db``). With ``locmem``
+    every gunicorn worker and management command bumps its own counters, so writes made
+    elsewhere never reach this process's keys.
+    """
+    return settings.CACHES[alias]['BACKEND'] not in _PROCESS_LOCAL_BACKENDS
+
+
+def _version_key(label):
+    return f'{VERSION_KEY_PREFIX}{label.lower()}'
+
+
+def _initial_version():
+    # Time-based seed so a cache that lost its counters never reuses an old generation.
+    return int(time.time() * 1000)
+
+
+def bump_model_version(label):
+    key = _version_key(label)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), timeout=None)
+
+
+def model_versions(labels=TRACKED_MODELS):
+    """``{label: version}`` for *labels*, seeding any counter the cache does not hold."""
+    keys = {label: _version_key(label) for label in labels}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for label, key in keys.items():
+        version = found.get(key)
+        if version is None:
+            cache.add(key, _initial_version(), timeout=None)
+            version = cache.get(key)
+        versions[label] = version
+    return versions
+
+
+def data_version(labels=TRACKED_MODELS):
+    """Compact string of the current generations, for use inside cache keys."""
+    versions = model_versions(labels)
+    return '.'.join(str(versions[label]) for label in labels)
+
+
+def _on_tracked_write(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    label = sender._meta.label
+    bump_model_version(label)
+    # Bump again once the write is visible to other connections, so a payload built
+    # from pre-commit data in the meantime is not served under the new generation.
+    transaction.on_commit(lambda: bump_model_version(label))
+
+
+_registered = False
+
+
+def register_cache_version_signals():
+    global _registered
+    if _registered:
+        return
+    _registered = True
+
+    from django.apps import apps
+
+    for label in TRACKED_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(
+            _on_tracked_write,
+            sender=model,
+            dispatch_uid=f'kt-cache-version-save-{label}',
+        )
+        post_delete.connect(
+            _on_tracked_write,
+            sender=model,
+            dispatch_uid=f'kt-cache-version-delete-{label}',
+        )
@@ -0,0 +1,26 @@
+"""
+System checks for deployment settings, run by ``manage.py check``, ``migrate`` (and so
+the Docker entrypoint) and ``runserver``.
+"""
+
+import os
+
+from django.core.checks import Tags, Warning, register
+
+from common.cache_versions import cache_is_shared
+
+
+@register(Tags.caches)
+def check_cache_shared_by_workers(app_configs, **kwargs):
+    """A per-process cache with several gunicorn workers leaves each worker's copy stale."""
+    workers = int(os.getenv('WEB_CONCURRENCY') or 1)
+    if workers <= 1 or cache_is_shared():
+        return []
+    return [Warning(
+        f'The cache is per process, but WEB_CONCURRENCY={workers} runs {workers} gunicorn workers.',
+        hint=(
+            'Totals, settings and exchange-rate invalidations only reach the worker that made '
+            'the change. Set CACHE_BACKEND=file or CACHE_BACKEND=db.'
+        ),
+        id='common.W001',
+    )]
@@ -0,0 +1,49 @@
+"""
+Collect side-effect writes until the surrounding transaction commits, then flush them
+together.
+
+Booking saves feed analytics counters and audit rows; doing those writes inline costs
+a ``select_for_update`` / insert per save and holds the summary row lock for the rest
+of the transaction. ``defer_to_commit(key, item, flush)`` appends *item* to a per-key
+batch on the current connection and registers one ``on_commit`` callback that hands
+the whole batch to *flush*. Outside an atomic block *flush* runs straight away.
+"""
+
+from django.db import transaction
+
+
+class _Batch:
+    def __init__(self, key, flush, registry):
+        self.key = key
+        self.flush = flush
+        self.registry = registry
+        self.items = []
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        if self.registry.get(self.key) is self:
+            del self.registry[self.key]
+        if self.items:
+            self.flush(self.items)
+
+
+def _still_pending(connection, batch):
+    # A rollback drops the callback from ``run_on_commit``; start a fresh batch then.
+    if batch.done:
+        return False
+    return any(entry[1] is batch for entry in connection.run_on_commit)
+
+
+def defer_to_commit(key, item, flush, using=None):
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        flush([item])
+        return
+    registry = connection.__dict__.setdefault('_kt_commit_batches', {})
+    batch = registry.get(key)
+    if batch is None or not _still_pending(connection, batch):
+        batch = _Batch(key, flush, registry)
+        registry[key] = batch
+        transaction.on_commit(batch, using=using)
+    batch.items.append(item)
@@ -0,0 +1,32 @@
+from django.db import models
+
+
+class Customer(models.Model):
+    """
+    Deduplicated customer directory built from job, shuttle and hotel bookings: one row
+    per lower-cased name / number / lower-cased email, with how many bookings use it and
+    when the latest of them was made. Kept current from booking saves by
+    ``common.customers``; ``rebuild_customer_directory`` recreates it from the bookings.
+    """
+
+    name = models.CharField(max_length=255)
+    number = models.CharField(max_length=30, blank=True, default='')
+    email = models.CharField(max_length=255, blank=True, default='')
+    # Lower-cased copies: the dedupe key and the autocomplete prefix lookups
+    name_key = models.CharField(max_length=255)
+    email_key = models.CharField(max_length=255, blank=True, default='')
+    usage_count = models.PositiveIntegerField(default=0)
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name_key', 'number', 'email_key'], name='customer_identity'),
+        ]
+        indexes = [
+            # text_pattern_ops lets PostgreSQL serve LIKE 'term%' from the index (ignored elsewhere)
+            models.Index(fields=['name_key'], name='customer_name_prefix_idx', opclasses=['text_pattern_ops']),
+            models.Index(fields=['number'], name='customer_number_prefix_idx', opclasses=['text_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,243 @@
+"""
+Customer directory upkeep and the autocomplete lookups that read it.
+
+Booking saves and deletes queue ``(identity, delta)`` items on the surrounding
+transaction (``common.commit_batch``). On commit they are merged per customer and written
+with one ``INSERT ... ON CONFLICT DO UPDATE`` for the customers that gained bookings, plus
+one decrement per customer that lost them. Rows whose count drops to zero are removed.
+Saves that leave name, number and email unchanged queue nothing.
+
+Autocomplete is then a single prefix query on the directory, ranked by how often and
+how recently the customer booked, instead of three ``icontains`` scans merged in Python.
+"""
+
+from collections import namedtuple
+
+from django.db import connections, router
+from django.db.models import F, Max, Sum
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from common.commit_batch import defer_to_commit
+from common.customer_models import Customer
+from common.save_state import previous_instance
+
+CUSTOMER_SOURCES = ('jobs.Job', 'shuttle.Shuttle', 'hotels.HotelBooking')
+SUGGESTION_LIMIT = 10
+
+Identity = namedtuple('Identity', 'name_key number email_key')
+
+_PREVIOUS_ATTR = '_kt_customer_identity_before'
+
+
+def _clean(value):
+    return str(value or '').strip()
+
+
+def customer_fields(name, number, email):
+    """Directory columns for a booking's customer, or ``None`` when it has no name."""
+    name = _clean(name)
+    if not name:
+        return None
+    number = _clean(number)
+    email = _clean(email)
+    return {
+        'name': name,
+        'number': number,
+        'email': email,
+        'name_key': name.lower(),
+        'email_key': email.lower(),
+    }
+
+
+def booking_customer(booking):
+    # HotelBooking has no customer_email
+    return customer_fields(
+        booking.customer_name, booking.customer_number, getattr(booking, 'customer_email', None)
+    )
+
+
+def identity(fields):
+    return Identity(fields['name_key'], fields['number'], fields['email_key'])
+
+
+def _merge(items):
+    """``{identity: (fields, delta, last_seen)}`` for a batch of queued items."""
+    merged = {}
+    for fields, delta, seen in items:
+        key = identity(fields)
+        previous = merged.get(key)
+        if previous is None:
+            merged[key] = (fields, delta, seen if delta > 0 else None)
+            continue
+        _fields, total, last_seen = previous
+        if delta > 0 and (last_seen is None or seen > last_seen):
+            # Display the spelling of the most recent booking
+            fields, last_seen = fields, seen
+        else:
+            fields = _fields
+        merged[key] = (fields, total + delta, last_seen)
+    return merged
+
+
+def _upsert_sql(connection, count):
+    table = connection.ops.quote_name(Customer._meta.db_table)
+    columns = ('name', 'number', 'email', 'name_key', 'email_key', 'usage_count', 'last_seen')
+    row = '(%s)' % ', '.join(['%s'] * len(columns))
+    # Same syntax on SQLite (3.24+) and PostgreSQL; the counter is added to, not replaced.
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join([row] * count)} "
+        f"ON CONFLICT (name_key, number, email_key) DO UPDATE SET "
+        f"usage_count = {table}.usage_count + excluded.usage_count, "
+        f"name = CASE WHEN excluded.last_seen >= {table}.last_seen THEN excluded.name ELSE {table}.name END, "
+        f"email = CASE WHEN excluded.last_seen >= {table}.last_seen THEN excluded.email ELSE {table}.email END, "
+        f"last_seen = CASE WHEN excluded.last_seen > {table}.last_seen "
+        f"THEN excluded.last_seen ELSE {table}.last_seen END"
+    )
+
+
+def apply_customer_deltas(items, using=None):
+    """Write queued ``(fields, delta, seen_at)`` items to the directory."""
+    using = using or router.db_for_write(Customer)
+    connection = connections[using]
+    gained = []
+    lost = []
+    for key, (fields, delta, seen) in _merge(items).items():
+        if delta > 0:
+            gained.append((fields, delta, seen))
+        elif delta < 0:
+            lost.append((key, -delta))
+
+    if gained:
+        params = []
+        for fields, delta, seen in gained:
+            params.extend([
+                fields['name'], fields['number'], fields['email'], fields['name_key'], fields['email_key'],
+                delta, connection.ops.adapt_datetimefield_value(seen),
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute(_upsert_sql(connection, len(gained)), params)
+
+    for key, delta in lost:
+        customers = Customer.objects.using(using).filter(**key._asdict())
+        customers.update(usage_count=Greatest(F('usage_count') - delta, 0))
+        customers.filter(usage_count=0).delete()
+
+
+def _queue(fields, delta, seen=None):
+    defer_to_commit('customer-directory', (fields, delta, seen or timezone.now()), apply_customer_deltas)
+
+
+def _capture_previous_customer(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    prev = previous_instance(instance)
+    instance.__dict__[_PREVIOUS_ATTR] = booking_customer(prev) if prev is not None else None
+
+
+def _on_booking_saved(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    before = instance.__dict__.pop(_PREVIOUS_ATTR, None)
+    after = booking_customer(instance)
+    if not created and (before and identity(before)) == (after and identity(after)):
+        return
+    if before and not created:
+        _queue(before, -1)
+    if after:
+        _queue(after, 1, instance.created_at)
+
+
+def _on_booking_deleted(sender, instance, **kwargs):
+    fields = booking_customer(instance)
+    if fields:
+        _queue(fields, -1)
+
+
+def collect_customers(querysets):
+    """Directory rows (unsaved ``Customer`` objects) for every booking in *querysets*."""
+    fallback_seen = timezone.now()
+    items = []
+    for qs in querysets:
+        has_email = any(field.name == 'customer_email' for field in qs.model._meta.get_fields())
+        columns = ['customer_name', 'customer_number', 'created_at']
+        if has_email:
+            columns.append('customer_email')
+        for row in qs.values(*columns).iterator(chunk_size=2000):
+            fields = customer_fields(row['customer_name'], row['customer_number'], row.get('customer_email'))
+            if fields:
+                items.append((fields, 1, row['created_at'] or fallback_seen))
+    return [
+        Customer(usage_count=delta, last_seen=seen, **fields)
+        for fields, delta, seen in _merge(items).values()
+    ]
+
+
+def rebuild_customer_directory(batch_size=1000):
+    """Replace the directory with one recomputed from all bookings; returns the row count."""
+    from django.apps import apps
+
+    customers = collect_customers(apps.get_model(label).objects.all() for label in CUSTOMER_SOURCES)
+    Customer.objects.all().delete()
+    Customer.objects.bulk_create(customers, batch_size=batch_size)
+    return len(customers)
+
+
+def prefix_filter(field, term):
+    """Lookup kwargs for ``field`` starting with *term*, in a form the field's index can serve."""
+    if connections[router.db_for_read(Customer)].vendor == 'postgresql':
+        # LIKE 'term%' through the text_pattern_ops index
+        return {f'{field}__startswith': term}
+    # Plain b-tree range; SQLite's LIKE is case-insensitive and cannot use the index
+    return {f'{field}__gte': term, f'{field}__lt': term + '\U0010ffff'}
+
+
+def name_suggestions(term, limit=SUGGESTION_LIMIT):
+    """Customers whose name starts with *term*, most used and most recent first."""
+    return list(
+        Customer.objects.filter(**prefix_filter('name_key', _clean(term).lower()))
+        .order_by('-usage_count', '-last_seen', 'name_key')
+        .values('name', 'number', 'email')[:limit]
+    )
+
+
+def number_suggestions(term, limit=SUGGESTION_LIMIT):
+    """Distinct customer numbers starting with *term*, most used and most recent first."""
+    return list(
+        Customer.objects.filter(**prefix_filter('number', _clean(term)))
+        .values('number')
+        .annotate(uses=Sum('usage_count'), latest=Max('last_seen'))
+        .order_by('-uses', '-latest', 'number')
+        .values_list('number', flat=True)[:limit]
+    )
+
+
+_registered = False
+
+
+def register_customer_signals():
+    global _registered
+    if _registered:
+        return
+    _registered = True
+
+    from django.apps import apps
+
+    for label in CUSTOMER_SOURCES:
+        model = apps.get_model(label)
+        pre_save.connect(
+            _capture_previous_customer,
+            sender=model,
+            dispatch_uid=f'kt-customers-pre-{label}',
+        )
+        post_save.connect(
+            _on_booking_saved,
+            sender=model,
+            dispatch_uid=f'kt-customers-{label}',
+        )
+        post_delete.connect(
+            _on_booking_deleted,
+            sender=model,
+            dispatch_uid=f'kt-customers-delete-{label}',
+        )
@@ -7,4 +7,19 @@ class ExchangeRate(models.Model):
     last_updated = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.currency}: {self.rate}"
\ No newline at end of file
+        return f"{self.currency}: {self.rate}"
+
+class ExchangeRateHistory(models.Model):
+    """One rate per currency per day (EUR per unit), for converting amounts as of a date."""
+    currency = models.CharField(max_length=3)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=10, decimal_places=4)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'date'], name='exchange_rate_history_currency_date'),
+        ]
+        ordering = ['currency', 'date']
+
+    def __str__(self):
+        return f"{self.currency} {self.date}: {self.rate}"
@@ -0,0 +1,303 @@
+"""
+Exchange-rate service: EUR per one unit of each ``CURRENCY_CHOICES`` currency.
+
+Reads never touch the network. ``get_exchange_rate`` serves the cached rate, else the
+``ExchangeRate`` row whatever its age; a row older than ``RATE_MAX_AGE`` is still served
+(stale-while-revalidate) and schedules one background refresh per worker.
+
+``refresh_exchange_rates`` fetches every currency in a single ``latest/EUR`` call through
+a pooled ``requests.Session`` with a timeout. Run it from the ``refresh_exchange_rates``
+management command (entrypoint / cron); the API base URL is a setting so tests can point
+it at a local stub server.
+
+Each refresh also records the day's rate in ``ExchangeRateHistory`` (one row per currency
+per day). ``RateIndex`` loads that history in one query and answers "rate on date D" with a
+bisect, so ``convert_many`` converts thousands of amounts as of their own dates without a
+lookup per row.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+import pytz
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from common import money
+from common.exchange_rate_models import ExchangeRate, ExchangeRateHistory
+
+logger = logging.getLogger('kt')
+
+BASE_CURRENCY = 'EUR'
+RATE_MAX_AGE = timedelta(hours=24)
+RATE_CACHE_SECONDS = 3600
+# A stale rate is cached briefly so saves do not re-read the row while a refresh runs.
+STALE_RATE_CACHE_SECONDS = 300
+REVALIDATE_LOCK_KEY = 'kt:exchange-rates:revalidating'
+RATES_VERSION_KEY = 'kt:exchange-rates:version'
+REVALIDATE_LOCK_SECONDS = 300
+# store_rates only clears the version in its own process's cache (a locmem cache is not
+# shared), so other workers re-read the stamps at least this often.
+RATES_VERSION_CACHE_SECONDS = 60
+
+# How long a worker reuses its loaded history before reading the table again.
+RATE_INDEX_TTL_SECONDS = 300
+
+BUDAPEST_TZ = pytz.timezone('Europe/Budapest')
+_RATEQ = Decimal('0.0001')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def rate_cache_key(currency):
+    return f'exchange_rate_{currency}'
+
+
+def rate_currencies():
+    from common.utils import CURRENCY_CHOICES
+
+    return [code for code, _ in CURRENCY_CHOICES if code != BASE_CURRENCY]
+
+
+def _http_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def _rates_url():
+    base = settings.EXCHANGE_RATE_API_URL.rstrip('/')
+    return f'{base}/{settings.EXCHANGE_RATE_API_KEY}/latest/{BASE_CURRENCY}'
+
+
+def fetch_rates(currencies=None):
+    """
+    ``{currency: EUR per unit}`` for *currencies* (default: all) from one API call.
+
+    Raises ``ValueError`` when the request fails or the response lacks a currency.
+    """
+    currencies = list(currencies or rate_currencies())
+    try:
+        response = _http_session().get(_rates_url(), timeout=settings.EXCHANGE_RATE_TIMEOUT_SECONDS)
+        logger.info(f"Exchange rate API response status code: {response.status_code}")
+        response.raise_for_status()
+        data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f'Error fetching exchange rates: {e}')
+        raise ValueError('Error fetching exchange rates') from e
+
+    per_eur = data.get('conversion_rates') if isinstance(data, dict) else None
+    if not per_eur:
+        raise ValueError('Invalid response structure: missing conversion_rates')
+    rates = {}
+    for currency in currencies:
+        try:
+            units = Decimal(str(per_eur[currency]))
+            rates[currency] = (Decimal('1') / units).quantize(_RATEQ, rounding=ROUND_HALF_UP)
+        except (KeyError, InvalidOperation, ZeroDivisionError):
+            raise ValueError(f'Invalid response structure or missing rate for {currency}')
+    return rates
+
+
+def store_rates(rates, day=None):
+    """Write *rates* to ``ExchangeRate``, the history row of *day* (default today) and the cache."""
+    day = day or rate_date(timezone.now())
+    for currency, rate in rates.items():
+        ExchangeRate.objects.update_or_create(currency=currency, defaults={'rate': rate})
+        ExchangeRateHistory.objects.update_or_create(currency=currency, date=day, defaults={'rate': rate})
+    cache.set_many({rate_cache_key(currency): rate for currency, rate in rates.items()}, RATE_CACHE_SECONDS)
+    cache.delete(RATES_VERSION_KEY)
+    forget_rate_index()
+
+
+def refresh_exchange_rates(currencies=None):
+    """Fetch and store every rate in one call; returns ``{currency: rate}``."""
+    rates = fetch_rates(currencies)
+    store_rates(rates)
+    logger.info('Exchange rates refreshed: ' + ', '.join(f'{c} {r}' for c, r in rates.items()))
+    return rates
+
+
+def rates_version():
+    """
+    Fingerprint of the stored rates (their ``last_updated`` stamps) for cache keys.
+
+    Cleared by ``store_rates`` and otherwise rebuilt from one query every
+    ``RATES_VERSION_CACHE_SECONDS``, so rates written by another process show within that.
+    """
+    version = cache.get(RATES_VERSION_KEY)
+    if version is None:
+        stamps = ExchangeRate.objects.order_by('currency').values_list('currency', 'last_updated')
+        version = '.'.join(f'{currency}{updated.timestamp():.6f}' for currency, updated in stamps) or 'none'
+        cache.set(RATES_VERSION_KEY, version, RATES_VERSION_CACHE_SECONDS)
+    return version
+
+
+def rates_are_stale(currencies=None):
+    """True when a currency has no row or its row is older than ``RATE_MAX_AGE``."""
+    currencies = list(currencies or rate_currencies())
+    cutoff = timezone.now() - RATE_MAX_AGE
+    fresh = ExchangeRate.objects.filter(currency__in=currencies, last_updated__gte=cutoff).count()
+    return fresh < len(currencies)
+
+
+def _revalidate():
+    try:
+        refresh_exchange_rates()
+    except ValueError as e:
+        logger.warning(f'Background exchange rate refresh failed, serving stored rates: {e}')
+    finally:
+        connection.close()
+
+
+def request_revalidation():
+    """Start one background refresh unless disabled, unconfigured or already running."""
+    if not settings.EXCHANGE_RATE_BACKGROUND_REFRESH or not settings.EXCHANGE_RATE_API_KEY:
+        return
+    if not cache.add(REVALIDATE_LOCK_KEY, True, REVALIDATE_LOCK_SECONDS):
+        return
+    threading.Thread(target=_revalidate, name='kt-fx-revalidate', daemon=True).start()
+
+
+def get_exchange_rate(currency):
+    """
+    EUR per one unit of *currency* from the cache or ``ExchangeRate`` — never the network.
+
+    Raises ``ValueError`` when no rate has been stored for *currency* yet.
+    """
+    if currency == BASE_CURRENCY:
+        return Decimal('1.00')
+
+    rate = cache.get(rate_cache_key(currency))
+    if rate is not None:
+        return rate
+
+    row = ExchangeRate.objects.filter(currency=currency).values_list('rate', 'last_updated').first()
+    if row is None:
+        request_revalidation()
+        raise ValueError(f'No exchange rate stored for {currency}; run refresh_exchange_rates')
+
+    rate, last_updated = row
+    if last_updated < timezone.now() - RATE_MAX_AGE:
+        logger.info(f"Exchange rate for {currency} is older than 24 hours; serving it and refreshing in the background.")
+        cache.set(rate_cache_key(currency), rate, STALE_RATE_CACHE_SECONDS)
+        request_revalidation()
+    else:
+        cache.set(rate_cache_key(currency), rate, RATE_CACHE_SECONDS)
+    return rate
+
+
+def rate_date(value):
+    """Calendar day (Budapest) a date / datetime is converted at."""
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            return timezone.localtime(value, BUDAPEST_TZ).date()
+        return value.date()
+    return value
+
+
+class RateIndex:
+    """
+    As-of lookups over ``ExchangeRateHistory``: the rate of a currency on a day is the
+    latest history row on or before it. Days before a currency's first row use that first
+    row; a currency with no history falls back to its ``ExchangeRate`` row.
+    """
+
+    def __init__(self, history, latest):
+        # currency -> (sorted dates, rates in the same order)
+        self._series = {}
+        for currency, day, rate in history:
+            dates, rates = self._series.setdefault(currency, ([], []))
+            dates.append(day)
+            rates.append(rate)
+        self._latest = dict(latest)
+
+    @classmethod
+    def load(cls, currencies=None):
+        history = ExchangeRateHistory.objects.order_by('currency', 'date')
+        latest = ExchangeRate.objects.all()
+        if currencies is not None:
+            history = history.filter(currency__in=currencies)
+            latest = latest.filter(currency__in=currencies)
+        return cls(
+            history.values_list('currency', 'date', 'rate'),
+            latest.values_list('currency', 'rate'),
+        )
+
+    def rate_on(self, currency, day):
+        """EUR per unit of *currency* on *day*; raises ``ValueError`` when none is known."""
+        if currency == BASE_CURRENCY:
+            return Decimal('1.00')
+        series = self._series.get(currency)
+        if series is None:
+            rate = self._latest.get(currency)
+            if rate is None:
+                raise ValueError(f'No exchange rate stored for {currency}')
+            return rate
+        dates, rates = series
+        position = bisect_right(dates, rate_date(day))
+        return rates[max(position - 1, 0)]
+
+    def first_rate_date(self, currency):
+        """Day of *currency*'s first history row, or ``None`` when it has no history."""
+        series = self._series.get(currency)
+        return series[0][0] if series else None
+
+
+_index = None  # (RateIndex, monotonic expiry)
+_index_lock = threading.Lock()
+
+
+def rate_index():
+    """Worker-wide ``RateIndex`` over every currency, reloaded every ``RATE_INDEX_TTL_SECONDS``."""
+    global _index
+    now = time.monotonic()
+    with _index_lock:
+        if _index is None or now >= _index[1]:
+            _index = (RateIndex.load(), now + RATE_INDEX_TTL_SECONDS)
+        return _index[0]
+
+
+def forget_rate_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def rate_on(currency, day):
+    return rate_index().rate_on(currency, day)
+
+
+def convert_many(amounts, currencies, dates, index=None):
+    """
+    EUR value of each ``(amount, currency, date)`` at that date's rate, rounded to cents.
+
+    The three sequences are zipped; ``None`` amounts stay ``None``. One history read at
+    most (none while the worker's index is warm), whatever the number of rows. Pass
+    *index* to reuse a ``RateIndex`` across calls.
+    """
+    index = index or rate_index()
+    converted = []
+    for amount, currency, day in zip(amounts, currencies, dates):
+        if amount is None:
+            converted.append(None)
+        elif not currency or currency == BASE_CURRENCY:
+            converted.append(amount)
+        else:
+            converted.append(money.to_eur(amount, index.rate_on(currency, day)))
+    return converted
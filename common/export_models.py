@@ -0,0 +1,84 @@
+import os
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class ExportJob(models.Model):
+    """
+    A queued CSV / XLSX export: what to export (kind, format and the normalised filter
+    parameters), the data version it was requested at, and how far ``run_export_worker``
+    got with it. Finished files are stored in ``settings.EXPORT_ROOT`` under
+    ``cache_key``, so a later request for the same parameters and data is served from disk.
+    """
+
+    KIND_JOBS = 'jobs'
+    KIND_SHUTTLES = 'shuttles'
+    KIND_HOTELS = 'hotels'
+    KIND_CHOICES = [
+        (KIND_JOBS, 'Driving jobs'),
+        (KIND_SHUTTLES, 'Shuttles'),
+        (KIND_HOTELS, 'Hotel bookings'),
+    ]
+
+    FORMAT_CSV = 'csv'
+    FORMAT_XLSX = 'xlsx'
+    FORMAT_NDJSON = 'ndjson'
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, 'CSV'),
+        (FORMAT_XLSX, 'Excel'),
+        (FORMAT_NDJSON, 'NDJSON (gzip)'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    file_format = models.CharField(max_length=8, choices=FORMAT_CHOICES)
+    params = models.JSONField(default=dict)
+    data_version = models.CharField(max_length=512)
+    # sha256 of kind, format, params and data version; also the stored file name
+    cache_key = models.CharField(max_length=64, db_index=True)
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    error = models.TextField(blank=True, default='')
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='export_jobs',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Moved forward whenever a request reuses the job; old files are purged by this
+    last_requested_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's "oldest queued job" poll
+            models.Index(fields=['status', 'created_at'], name='export_job_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.filename} ({self.get_status_display()})'
+
+    @property
+    def file_path(self):
+        return os.path.join(settings.EXPORT_ROOT, f'{self.cache_key}.{self.file_format}')
+
+    @property
+    def is_pending(self):
+        return self.status in (self.STATUS_QUEUED, self.STATUS_RUNNING)
@@ -0,0 +1,154 @@
+"""
+Background exports.
+
+With ``EXPORTS_IN_BACKGROUND`` on, an export request does not build the file itself.
+``request_export`` looks up an ``ExportJob`` with the same cache key, made from the kind,
+format, parameters and the data version of the exported months. If none exists, it
+queues a new one. ``run_export_worker`` claims queued jobs one at a time
+(``claim_next_export``) and writes each file to ``EXPORT_ROOT`` (``run_export``). The
+request is sent to ``common:export_status``, which serves the file once it is ready.
+
+The data version (``exports.export_data_version``) is read from the database: the
+``MonthlyLedgerLock`` versions of the months covered plus a digest of the payee / agent
+names. The web workers, management commands and the export worker therefore all agree
+on it, whatever the cache backend. An edit in April leaves a March export's key, and its
+file, valid, so repeat downloads of a closed month are served straight from disk.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from common.export_models import ExportJob
+from common.exports import EXPORT_LAYOUT_VERSION, export_data_version, export_filename, write_export
+
+logger = logging.getLogger('kt')
+
+# A running job whose worker has not finished it by then is handed out again
+STALE_AFTER = timedelta(minutes=15)
+MAX_ATTEMPTS = 3
+
+
+def export_cache_key(kind, file_format, params, version):
+    payload = json.dumps(
+        [EXPORT_LAYOUT_VERSION, kind, file_format, params, version], sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _requeue(job):
+    ExportJob.objects.filter(pk=job.pk).update(
+        status=ExportJob.STATUS_QUEUED, error='', file_size=None, attempts=0, started_at=None, finished_at=None
+    )
+    job.refresh_from_db()
+
+
+def request_export(kind, file_format, params, user=None):
+    """
+    The export job for these parameters at the current data version: a finished one whose
+    file is still on disk, one already queued or running, or else a newly queued one.
+    """
+    version = export_data_version(kind, params)
+    cache_key = export_cache_key(kind, file_format, params, version)
+    job = (
+        ExportJob.objects.filter(cache_key=cache_key)
+        .exclude(status=ExportJob.STATUS_FAILED)
+        .order_by('-created_at')
+        .first()
+    )
+    if job is None:
+        return ExportJob.objects.create(
+            kind=kind,
+            file_format=file_format,
+            params=params,
+            data_version=version,
+            cache_key=cache_key,
+            filename=export_filename(kind, file_format, params),
+            requested_by=user if user is not None and user.is_authenticated else None,
+        )
+    ExportJob.objects.filter(pk=job.pk).update(last_requested_at=timezone.now())
+    if job.status == ExportJob.STATUS_DONE and not os.path.exists(job.file_path):
+        # Purged or lost with the volume: build it again under the same job
+        _requeue(job)
+    return job
+
+
+def open_export_file(job):
+    """The finished file of *job* opened for reading, or ``None`` (and the job queued again) when it is gone."""
+    try:
+        return open(job.file_path, 'rb')
+    except FileNotFoundError:
+        _requeue(job)
+        return None
+
+
+def claim_next_export(stale_after=STALE_AFTER):
+    """
+    Mark the oldest queued job running and return it, or ``None`` when the queue is empty.
+    The claim is a conditional UPDATE, so two workers never take the same job.
+    """
+    now = timezone.now()
+    stale = ExportJob.objects.filter(status=ExportJob.STATUS_RUNNING, started_at__lt=now - stale_after)
+    stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=ExportJob.STATUS_FAILED, error='The export worker stopped before finishing.', finished_at=now
+    )
+    stale.update(status=ExportJob.STATUS_QUEUED)
+
+    queued = ExportJob.objects.filter(status=ExportJob.STATUS_QUEUED).order_by('created_at')
+    for pk in queued.values_list('pk', flat=True)[:10]:
+        claimed = ExportJob.objects.filter(pk=pk, status=ExportJob.STATUS_QUEUED).update(
+            status=ExportJob.STATUS_RUNNING, started_at=now, attempts=F('attempts') + 1
+        )
+        if claimed:
+            return ExportJob.objects.get(pk=pk)
+    return None
+
+
+def run_export(job):
+    """Build *job*'s file in ``EXPORT_ROOT`` and record the outcome on the job."""
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    # Written under a temporary name and renamed, so a download never sees half a file
+    fd, part_path = tempfile.mkstemp(dir=settings.EXPORT_ROOT, prefix=f'{job.cache_key}.', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            write_export(job.kind, job.file_format, job.params, target)
+        os.replace(part_path, job.file_path)
+    except Exception as exc:
+        logger.exception('Export %s (%s) failed', job.pk, job.filename)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        job.status = ExportJob.STATUS_FAILED
+        job.error = str(exc) or exc.__class__.__name__
+    else:
+        job.status = ExportJob.STATUS_DONE
+        job.error = ''
+        job.file_size = os.path.getsize(job.file_path)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'file_size', 'finished_at'])
+    return job
+
+
+def purge_old_exports(retention_days=None):
+    """
+    Delete jobs nobody has requested for ``EXPORT_RETENTION_DAYS`` and their files;
+    returns the number of jobs removed.
+    """
+    if retention_days is None:
+        retention_days = settings.EXPORT_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    old = ExportJob.objects.filter(last_requested_at__lt=cutoff).exclude(status=ExportJob.STATUS_RUNNING)
+    kept_keys = set(
+        ExportJob.objects.filter(last_requested_at__gte=cutoff).values_list('cache_key', flat=True)
+    )
+    for job in old.filter(status=ExportJob.STATUS_DONE):
+        if job.cache_key not in kept_keys and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+    deleted, _ = old.delete()
+    return deleted
@@ -0,0 +1,135 @@
+import datetime
+import os
+import random
+import resource
+import tempfile
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from openpyxl import Workbook
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+from common.exports import JOB_EXPORT_COLUMNS, JOB_EXPORT_HEADERS, export_row, write_xlsx
+from common.models import Payment
+from jobs.models import Job
+from people.models import Agent, Driver
+
+
+def _synthetic_jobs(count, seed=20261018):
+    """Unsaved jobs with drivers, agents and payments attached, as the export prefetch leaves them."""
+    rng = random.Random(seed)
+    drivers = [Driver(pk=i, name=f'Driver {i}') for i in range(1, 21)]
+    agents = [Agent(pk=i, name=f'Agent {i}') for i in range(1, 6)]
+    start = datetime.date(2026, 1, 1)
+    for pk in range(1, count + 1):
+        driver = rng.choice(drivers)
+        job = Job(
+            pk=pk,
+            customer_name=f'Customer {rng.randint(1, count // 3 or 1)}',
+            customer_number=f'+36{rng.randint(200000000, 709999999)}',
+            job_date=start + datetime.timedelta(days=rng.randint(0, 364)),
+            job_time=datetime.time(rng.randint(0, 23), rng.choice((0, 15, 30, 45))),
+            no_of_passengers=rng.randint(1, 8),
+            vehicle_type='Car',
+            kilometers=Decimal(rng.randint(5, 400)),
+            pick_up_location='Budapest Airport Terminal 2',
+            drop_off_location=f'Hotel {rng.randint(1, 300)}, Budapest',
+            flight_number=f'FR{rng.randint(100, 9999)}',
+            job_price=Decimal(rng.randint(3000, 60000)) / 100,
+            job_currency='EUR',
+            payment_type='Card',
+            is_confirmed=True,
+            is_paid=rng.random() < 0.7,
+            driver=driver,
+            number_plate='ABC-123',
+            agent_name=rng.choice(agents) if rng.random() < 0.3 else None,
+            agent_percentage='10',
+        )
+        payments = Payment.objects.none()
+        payments._result_cache = [
+            Payment(
+                payment_amount=Decimal(rng.randint(1000, 30000)) / 100,
+                payment_currency='EUR',
+                payment_type='Cash',
+                paid_to_driver=driver,
+            )
+            for _ in range(rng.randint(0, 2))
+        ]
+        job._prefetched_objects_cache = {'payments': payments}
+        yield job
+
+
+def _write_legacy(path, sheet_title, headers, rows):
+    """The in-memory workbook the export views used before write_xlsx, for comparison."""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = sheet_title[:31]
+    ws.append(headers)
+    for cell in ws[1]:
+        cell.font = Font(bold=True)
+        cell.fill = PatternFill(start_color='FFA500', end_color='FFA500', fill_type='solid')
+    ws.freeze_panes = 'A2'
+    ws.auto_filter.ref = f'A1:{get_column_letter(len(headers))}1'
+    for row in rows:
+        ws.append(row)
+    for col_num, column_title in enumerate(headers, 1):
+        max_length = len(column_title)
+        for row in ws.iter_rows(min_col=col_num, max_col=col_num):
+            for cell in row:
+                if cell.value:
+                    max_length = max(max_length, len(str(cell.value)))
+        ws.column_dimensions[get_column_letter(col_num)].width = max_length + 2
+    wb.save(path)
+
+
+ENGINES = {
+    'write-only': write_xlsx,
+    'legacy': _write_legacy,
+}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Export synthetic driving jobs to XLSX without touching the database and report wall '
+        'time and peak RSS. Run once per --engine: peak RSS is per process.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='Number of synthetic jobs (default: 50000).')
+        parser.add_argument(
+            '--engine',
+            choices=sorted(ENGINES),
+            default='write-only',
+            help='write-only: the export engine; legacy: the former in-memory workbook.',
+        )
+        parser.add_argument('--output', help='Keep the workbook at this path (default: a deleted temp file).')
+
+    def handle(self, *args, **options):
+        rows = (export_row(JOB_EXPORT_COLUMNS, job, 'xlsx') for job in _synthetic_jobs(options['rows']))
+        path = options['output']
+        if not path:
+            with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
+                path = tmp.name
+        rss_before = _peak_rss_mb()
+        started = time.perf_counter()
+        try:
+            ENGINES[options['engine']](path, 'KT Driving Jobs Benchmark', JOB_EXPORT_HEADERS, rows)
+            elapsed = time.perf_counter() - started
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+        finally:
+            if not options['output'] and os.path.exists(path):
+                os.remove(path)
+        rss_after = _peak_rss_mb()
+
+        self.stdout.write(
+            f"{options['engine']}: {options['rows']} jobs in {elapsed:.2f}s, "
+            f"peak RSS {rss_after:.1f} MB (+{rss_after - rss_before:.1f} MB during the export), "
+            f"file {size_mb:.1f} MB"
+        )
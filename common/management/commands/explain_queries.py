@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from common.query_plans import CANONICAL_QUERIES, audit_query_plans, supports_plan_audit
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the canonical home / past jobs / totals / balances / export queries and '
+        'flag unexpected sequential scans (use -v 2 to print every plan).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--query',
+            action='append',
+            choices=sorted(CANONICAL_QUERIES),
+            help='Only explain this query (repeatable; default: all).',
+        )
+        parser.add_argument(
+            '--fail-on-seq-scan',
+            action='store_true',
+            help='Exit with an error when any query has an unexpected sequential scan.',
+        )
+        parser.add_argument(
+            '--keep-seqscan',
+            action='store_true',
+            help='PostgreSQL: plan with the default enable_seqscan instead of turning it off.',
+        )
+
+    def handle(self, *args, **options):
+        if not supports_plan_audit():
+            raise CommandError(f'Query-plan audit is not supported on {connection.vendor}.')
+
+        report = audit_query_plans(options['query'], disable_seqscan=not options['keep_seqscan'])
+        flagged = []
+        for entry in report:
+            if entry['flagged']:
+                flagged.append(entry['name'])
+                self.stdout.write(self.style.ERROR(
+                    f"{entry['name']}: sequential scan on {', '.join(entry['flagged'])}"
+                ))
+            elif entry['seq_scans']:
+                self.stdout.write(f"{entry['name']}: ok (expected full scan of {', '.join(entry['seq_scans'])})")
+            else:
+                self.stdout.write(f"{entry['name']}: ok")
+            if options['verbosity'] >= 2 or entry['flagged']:
+                for line in entry['plan'].splitlines():
+                    self.stdout.write(f'    {line}')
+
+        if flagged and options['fail_on_seq_scan']:
+            raise CommandError(f"Unexpected sequential scans in: {', '.join(flagged)}")
+        summary = f'{len(report)} queries explained, {len(flagged)} with unexpected sequential scans.'
+        self.stdout.write(self.style.WARNING(summary) if flagged else self.style.SUCCESS(summary))
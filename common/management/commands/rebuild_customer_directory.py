@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from common.customers import rebuild_customer_directory
+
+
+class Command(BaseCommand):
+    help = (
+        'Recreate the customer directory used by autocomplete from all job, shuttle and hotel '
+        'bookings (needed after bulk updates that bypass save signals).'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_customer_directory()
+        self.stdout.write(self.style.SUCCESS(f'Customer directory rebuilt ({count} customers).'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from common.search import SEARCH_SOURCES, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Recreate the booking search rows used by past jobs search and customer autocomplete '
+        '(needed after bulk updates that bypass save signals).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            action='append',
+            choices=sorted(SEARCH_SOURCES),
+            help='Only rebuild this booking type (repeatable; default: all).',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = rebuild_search_index(options['kind'])
+        for kind, count in counts.items():
+            self.stdout.write(f'{kind}: {count} rows indexed')
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt ({sum(counts.values())} rows).'))
@@ -0,0 +1,49 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from common.payment_paid_sync import reconcile_is_paid
+
+MODEL_CHOICES = {
+    'jobs': 'jobs.Job',
+    'shuttle': 'shuttle.Shuttle',
+    'hotels': 'hotels.HotelBooking',
+}
+
+
+class Command(BaseCommand):
+    help = 'Recompute is_paid for bookings from their complete payments (set-based, all rows at once).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=sorted(MODEL_CHOICES),
+            help='Only reconcile one booking type (default: all).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the rows that would change without writing anything.',
+        )
+
+    def handle(self, *args, **options):
+        qs = None
+        if options['model']:
+            qs = apps.get_model(MODEL_CHOICES[options['model']]).objects.all()
+        dry_run = options['dry_run']
+        results = reconcile_is_paid(qs, dry_run=dry_run)
+
+        total = 0
+        for label, changes in results.items():
+            for change in changes:
+                before = 'paid' if change['was_paid'] else 'unpaid'
+                after = 'paid' if change['now_paid'] else 'unpaid'
+                self.stdout.write(
+                    f"{label} #{change['pk']}: {before} -> {after} "
+                    f"(paid €{change['paid_eur']:.2f} of €{change['target_eur']:.2f})"
+                )
+            total += len(changes)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Dry run: {total} bookings would change.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'is_paid reconciled: {total} bookings changed.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from common.exchange_rates import rates_are_stale, refresh_exchange_rates
+
+
+class Command(BaseCommand):
+    help = 'Fetch every exchange rate in one API call and store it (run from the entrypoint or cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--if-stale',
+            action='store_true',
+            help='Skip the API call while every stored rate is younger than 24 hours.',
+        )
+
+    def handle(self, *args, **options):
+        if options['if_stale'] and not rates_are_stale():
+            self.stdout.write('Exchange rates are fresh; nothing to do.')
+            return
+        try:
+            rates = refresh_exchange_rates()
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+        for currency, rate in rates.items():
+            self.stdout.write(f'{currency}: {rate}')
+        self.stdout.write(self.style.SUCCESS(f'Exchange rates refreshed: {len(rates)} currencies.'))
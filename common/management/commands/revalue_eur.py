@@ -0,0 +1,130 @@
+from datetime import date
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from common.payment_paid_sync import reconcile_is_paid
+from common.revaluation import (
+    RATE_SOURCES,
+    RATES_HISTORY,
+    REVALUE_BATCH_SIZE,
+    REVALUE_MODELS,
+    rate_index_for,
+    revalue_model,
+)
+
+MODEL_CHOICES = {
+    'jobs': 'jobs.Job',
+    'hotels': 'hotels.HotelBooking',
+    'payments': 'common.Payment',
+    'expenses': 'expenses.Expense',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute stored EUR amounts (prices, fees, subtotals, payments, expenses) in '
+        'bulk, then realign is_paid in one pass. With --rates history (the default) rows '
+        "dated before a currency's first ExchangeRateHistory row are skipped; the history "
+        'only starts when rates were first recorded, so older bookings need --rates current.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=sorted(MODEL_CHOICES),
+            help='Only revalue one model (default: all).',
+        )
+        parser.add_argument(
+            '--rates',
+            choices=RATE_SOURCES,
+            default=RATES_HISTORY,
+            help=(
+                "'history' converts at each row's own date and skips rows dated before the "
+                "currency's rate history starts; 'current' converts every row at today's "
+                'rates (default: history).'
+            ),
+        )
+        parser.add_argument(
+            '--currency',
+            action='append',
+            type=str.upper,
+            help='Only revalue rows with an amount in this currency (repeatable; default: all).',
+        )
+        parser.add_argument(
+            '--since',
+            type=date.fromisoformat,
+            help='Only revalue rows dated on or after this day (YYYY-MM-DD).',
+        )
+        parser.add_argument(
+            '--until',
+            type=date.fromisoformat,
+            help='Only revalue rows dated on or before this day (YYYY-MM-DD).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=REVALUE_BATCH_SIZE,
+            help=f'Rows read and written per chunk (default: {REVALUE_BATCH_SIZE}).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the values that would change without writing anything.',
+        )
+
+    def handle(self, *args, **options):
+        if options['since'] and options['until'] and options['since'] > options['until']:
+            raise CommandError('--since must not be after --until.')
+        labels = [MODEL_CHOICES[options['model']]] if options['model'] else list(REVALUE_MODELS)
+        dry_run = options['dry_run']
+        index = rate_index_for(options['rates'])
+
+        total = 0
+        counts = {}  # label -> (rows checked, rows skipped)
+        for label in labels:
+            model = apps.get_model(label)
+
+            def progress(checked, changed, skipped, label=label):
+                counts[label] = (checked, skipped)
+                line = f'{label}: {checked} rows checked, {changed} changed'
+                if skipped:
+                    line += f', {skipped} skipped (dated before the rate history)'
+                self.stdout.write(line)
+
+            with transaction.atomic():
+                diffs = revalue_model(
+                    model,
+                    index,
+                    currencies=options['currency'],
+                    since=options['since'],
+                    until=options['until'],
+                    skip_before_history=options['rates'] == RATES_HISTORY,
+                    dry_run=dry_run,
+                    batch_size=options['batch_size'],
+                    progress=progress,
+                )
+            for diff in diffs:
+                changes = ', '.join(
+                    f'{field} {old} -> {new}' for field, (old, new) in diff['changes'].items()
+                )
+                self.stdout.write(f"{label} #{diff['pk']}: {changes}")
+            total += len(diffs)
+
+        checked = sum(checked for checked, _skipped in counts.values())
+        skipped = sum(skipped for _checked, skipped in counts.values())
+        if skipped * 2 > checked:
+            self.stderr.write(self.style.WARNING(
+                f'Warning: {skipped} of {checked} rows are dated before the rate history starts '
+                'and were left unchanged. Use --rates current to revalue them at today\'s rates.'
+            ))
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Dry run: {total} rows would change.'))
+            return
+
+        paid_changes = sum(len(changes) for changes in reconcile_is_paid().values()) if total else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'EUR amounts revalued: {total} rows changed, {paid_changes} paid flags updated.'
+        ))
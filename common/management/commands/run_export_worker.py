@@ -0,0 +1,64 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from common.cache_versions import cache_is_shared
+from common.export_queue import STALE_AFTER, claim_next_export, purge_old_exports, run_export
+
+# Seconds between purges of exports nobody has asked for lately
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        'Build queued CSV / XLSX exports into EXPORT_ROOT, oldest first, and purge exports '
+        'not requested for EXPORT_RETENTION_DAYS. Runs until stopped unless --once is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Build every queued export, then exit.')
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait when the queue is empty (default: 2).',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=int(STALE_AFTER.total_seconds() // 60),
+            help='Minutes after which a running export is assumed lost and queued again (default: 15).',
+        )
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            # Settings and rates the exports read stay as this process first cached them
+            self.stderr.write(
+                'Warning: the cache is per process (CACHE_BACKEND=locmem), so changes saved by the '
+                'web workers reach this worker late. Set CACHE_BACKEND=file or db.'
+            )
+        stale_after = timedelta(minutes=options['stale_after'])
+        last_purge = None
+        while True:
+            # The worker lives for days; drop connections the database has closed meanwhile
+            close_old_connections()
+            if last_purge is None or time.monotonic() - last_purge >= PURGE_INTERVAL:
+                purged = purge_old_exports()
+                if purged:
+                    self.stdout.write(f'Purged {purged} old exports.')
+                last_purge = time.monotonic()
+
+            job = claim_next_export(stale_after=stale_after)
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            run_export(job)
+            if job.status == job.STATUS_DONE:
+                self.stdout.write(self.style.SUCCESS(f'Built {job.filename} ({job.file_size} bytes).'))
+            else:
+                self.stderr.write(f'Export {job.pk} ({job.filename}) failed: {job.error}')
@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-18 16:08
+
+from django.db import migrations, models
+import pytz
+from django.utils import timezone
+
+
+def seed_history_from_latest_rates(apps, schema_editor):
+    """Start the history with each stored rate, dated the day it was fetched."""
+    ExchangeRate = apps.get_model('common', 'ExchangeRate')
+    ExchangeRateHistory = apps.get_model('common', 'ExchangeRateHistory')
+    ExchangeRateHistory.objects.bulk_create([
+        ExchangeRateHistory(
+            currency=row.currency,
+            date=timezone.localdate(row.last_updated, pytz.timezone('Europe/Budapest')),
+            rate=row.rate,
+        )
+        for row in ExchangeRate.objects.all()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0015_backfill_is_paid_from_payments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRateHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=10)),
+            ],
+            options={
+                'ordering': ['currency', 'date'],
+                'constraints': [models.UniqueConstraint(fields=('currency', 'date'), name='exchange_rate_history_currency_date')],
+            },
+        ),
+        migrations.RunPython(seed_history_from_latest_rates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0016_exchangeratehistory'),
+        ('hotels', '0031_public_id_upper_unique'),
+        ('jobs', '0055_public_id_upper_unique'),
+        ('people', '0009_delete_freelancer_delete_freelanceragent'),
+        ('shuttle', '0020_public_id_upper_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('payment_amount__isnull', False), ('payment_amount_in_euros__isnull', False), ('payment_currency__isnull', False), ('payment_type__isnull', False), models.Q(('paid_to_agent', None), ('paid_to_driver', None), ('paid_to_staff', None), _negated=True)), fields=['job', 'payment_amount_in_euros'], name='payment_job_complete_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('payment_amount__isnull', False), ('payment_amount_in_euros__isnull', False), ('payment_currency__isnull', False), ('payment_type__isnull', False), models.Q(('paid_to_agent', None), ('paid_to_driver', None), ('paid_to_staff', None), _negated=True)), fields=['shuttle', 'payment_amount_in_euros'], name='payment_shuttle_complete_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('payment_amount__isnull', False), ('payment_amount_in_euros__isnull', False), ('payment_currency__isnull', False), ('payment_type__isnull', False), models.Q(('paid_to_agent', None), ('paid_to_driver', None), ('paid_to_staff', None), _negated=True)), fields=['hotel_booking', 'payment_amount_in_euros'], name='payment_hotel_complete_idx'),
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 5.1 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+FTS_TABLE = 'booking_search_fts'
+SEARCH_COLUMNS = ('document', 'name_key', 'number_key')
+
+# kind -> (app label, model name, fields that make up the search document)
+SEARCH_SOURCES = {
+    'job': ('jobs', 'Job', ('customer_name', 'customer_number', 'job_description', 'pick_up_location', 'public_id')),
+    'shuttle': ('shuttle', 'Shuttle', ('customer_name', 'customer_number')),
+    'hotel': ('hotels', 'HotelBooking', ('customer_name', 'customer_number')),
+}
+
+# SQLite: external-content FTS5 table over the search rows, kept in step by triggers.
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        document, name_key, number_key,
+        content='common_bookingsearchentry', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON common_bookingsearchentry BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, document, name_key, number_key)
+        VALUES (new.id, new.document, new.name_key, new.number_key);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON common_bookingsearchentry BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document, name_key, number_key)
+        VALUES ('delete', old.id, old.document, old.name_key, old.number_key);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON common_bookingsearchentry BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document, name_key, number_key)
+        VALUES ('delete', old.id, old.document, old.name_key, old.number_key);
+        INSERT INTO {FTS_TABLE}(rowid, document, name_key, number_key)
+        VALUES (new.id, new.document, new.name_key, new.number_key);
+    END""",
+]
+SQLITE_BACKWARD = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+# PostgreSQL: trigram GIN indexes, which serve LIKE '%term%' on the search columns.
+POSTGRES_FORWARD = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    f'CREATE INDEX booking_search_{column}_trgm ON common_bookingsearchentry '
+    f'USING gin ({column} gin_trgm_ops)'
+    for column in SEARCH_COLUMNS
+]
+POSTGRES_BACKWARD = [f'DROP INDEX IF EXISTS booking_search_{column}_trgm' for column in SEARCH_COLUMNS]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+
+    return run
+
+
+def _key(value):
+    return str(value or '').lower()
+
+
+def backfill_search_entries(apps, schema_editor):
+    BookingSearchEntry = apps.get_model('common', 'BookingSearchEntry')
+    for kind, (app_label, model_name, fields) in SEARCH_SOURCES.items():
+        model = apps.get_model(app_label, model_name)
+        BookingSearchEntry.objects.bulk_create(
+            (
+                BookingSearchEntry(
+                    kind=kind,
+                    booking_id=booking.pk,
+                    name_key=_key(booking.customer_name),
+                    number_key=_key(booking.customer_number),
+                    # One field per line, so a search term never matches across two fields
+                    document='\n'.join(_key(getattr(booking, field)) for field in fields),
+                )
+                for booking in model.objects.order_by('pk').iterator(chunk_size=1000)
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0017_payment_payment_job_complete_idx_and_more'),
+        ('jobs', '0056_job_job_confirmed_date_idx_job_job_open_unpaid_idx'),
+        ('shuttle', '0021_shuttle_shuttle_confirmed_date_idx_and_more'),
+        ('hotels', '0032_hotelbooking_hotel_confirmed_checkin_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('job', 'Driving job'), ('shuttle', 'Shuttle'), ('hotel', 'Hotel booking')], max_length=8)),
+                ('booking_id', models.PositiveBigIntegerField()),
+                ('name_key', models.TextField(blank=True, default='')),
+                ('number_key', models.TextField(blank=True, default='')),
+                ('document', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'booking_id'), name='booking_search_kind_booking')],
+            },
+        ),
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+        migrations.RunPython(backfill_search_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.1 on 2026-10-18 16:57
+
+from django.db import migrations, models
+from django.utils import timezone
+
+CUSTOMER_SOURCES = (('jobs', 'Job'), ('shuttle', 'Shuttle'), ('hotels', 'HotelBooking'))
+
+
+def _clean(value):
+    return str(value or '').strip()
+
+
+def backfill_customers(apps, schema_editor):
+    """One directory row per (name, number, email) identity, ignoring case in name and email."""
+    Customer = apps.get_model('common', 'Customer')
+    fallback_seen = timezone.now()
+    customers = {}  # identity -> [fields, booking count, latest created_at]
+    for app_label, model_name in CUSTOMER_SOURCES:
+        model = apps.get_model(app_label, model_name)
+        # HotelBooking has no customer_email
+        has_email = any(field.name == 'customer_email' for field in model._meta.get_fields())
+        columns = ['customer_name', 'customer_number', 'created_at']
+        if has_email:
+            columns.append('customer_email')
+        for row in model.objects.values(*columns).iterator(chunk_size=2000):
+            name = _clean(row['customer_name'])
+            if not name:
+                continue
+            number = _clean(row['customer_number'])
+            email = _clean(row.get('customer_email'))
+            fields = {
+                'name': name,
+                'number': number,
+                'email': email,
+                'name_key': name.lower(),
+                'email_key': email.lower(),
+            }
+            seen = row['created_at'] or fallback_seen
+            key = (fields['name_key'], number, fields['email_key'])
+            current = customers.get(key)
+            if current is None:
+                customers[key] = [fields, 1, seen]
+                continue
+            current[1] += 1
+            if seen > current[2]:
+                # Display the spelling of the most recent booking
+                current[0], current[2] = fields, seen
+    Customer.objects.bulk_create(
+        (Customer(usage_count=count, last_seen=seen, **fields) for fields, count, seen in customers.values()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0018_booking_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('number', models.CharField(blank=True, default='', max_length=30)),
+                ('email', models.CharField(blank=True, default='', max_length=255)),
+                ('name_key', models.CharField(max_length=255)),
+                ('email_key', models.CharField(blank=True, default='', max_length=255)),
+                ('usage_count', models.PositiveIntegerField(default=0)),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name_key'], name='customer_name_prefix_idx', opclasses=['text_pattern_ops']), models.Index(fields=['number'], name='customer_number_prefix_idx', opclasses=['text_pattern_ops'])],
+                'constraints': [models.UniqueConstraint(fields=('name_key', 'number', 'email_key'), name='customer_identity')],
+            },
+        ),
+        migrations.RunPython(backfill_customers, migrations.RunPython.noop),
+    ]
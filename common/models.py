@@ -3,6 +3,7 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
 from common.payment_paid_sync import (
+    COMPLETE_PAYMENT_Q,
     sync_hotel_is_paid_from_payments,
     sync_job_is_paid_from_payments,
     sync_parent_is_paid_after_payment_change,
@@ -11,8 +12,12 @@ from common.payment_paid_sync import (
 from common.utils import get_exchange_rate, CURRENCY_CHOICES, AGENT_FEE_CHOICES, PAYMENT_TYPE_CHOICES
 from people.models import Agent, Driver, Staff
 from decimal import Decimal
+from common import money
 from common.utils import calculate_cc_fee
-from common.payment_settings import PaymentSettings
+from common.payment_settings import PaymentSettings, current_cc_fee_percentage
+from common.customer_models import Customer  # registers the customer directory model
+from common.search_models import BookingSearchEntry  # registers the search index model
+from common.export_models import ExportJob  # registers the export queue model
 import logging
 from django.utils.timezone import now
 import pytz
@@ -35,13 +40,27 @@ class Payment(models.Model):
     paid_to_driver = models.ForeignKey(Driver, on_delete=models.PROTECT, null=True, blank=True)
     paid_to_staff = models.ForeignKey(Staff, on_delete=models.PROTECT, null=True, blank=True)
 
+    class Meta:
+        # Partial per-booking indexes covering the complete-payments sums
+        # (``payment_paid_sync.complete_payments_eur_subquery``).
+        indexes = [
+            models.Index(
+                fields=[parent, 'payment_amount_in_euros'],
+                condition=COMPLETE_PAYMENT_Q,
+                name=name,
+            )
+            for parent, name in (
+                ('job', 'payment_job_complete_idx'),
+                ('shuttle', 'payment_shuttle_complete_idx'),
+                ('hotel_booking', 'payment_hotel_complete_idx'),
+            )
+        ]
+
     @property
     def cc_fee(self):
         """Calculate credit card fee based on the payment amount and type."""
         if self.payment_type == 'Card':
-            payment_settings = PaymentSettings.objects.first()
-            cc_fee_percentage = payment_settings.cc_fee_percentage if payment_settings else Decimal('7.00')
-            return calculate_cc_fee(self.payment_amount, self.payment_type, cc_fee_percentage)
+            return calculate_cc_fee(self.payment_amount, self.payment_type, current_cc_fee_percentage())
         return Decimal('0.00')
 
     @property
@@ -52,6 +71,7 @@ class Payment(models.Model):
     def save(self, *args, **kwargs):
         was_adding = self._state.adding
         old_summary = None
+        prev = None
         if not was_adding and self.pk:
             from common.payment_audit import payment_audit_summary
 
@@ -71,6 +91,10 @@ class Payment(models.Model):
         log_payment_saved_for_parent(self, was_adding, old_summary)
         sync_parent_is_paid_after_payment_change(self)
 
+        from billing.ledger import refresh_ledger_for_payment
+
+        refresh_ledger_for_payment(self, previous=prev)
+
     def delete(self, *args, **kwargs):
         from common.payment_audit import log_payment_deleted_for_parent
 
@@ -86,6 +110,10 @@ class Payment(models.Model):
         if hotel_booking_id:
             sync_hotel_is_paid_from_payments(hotel_booking_id)
 
+        from billing.ledger import refresh_ledger_for_payment
+
+        refresh_ledger_for_payment(self)
+
     def convert_to_euros(self):
         """Convert the payment amount to euros."""
         logger.debug(f"Converting payment amount: {self.payment_amount} {self.payment_currency}")
@@ -100,7 +128,7 @@ class Payment(models.Model):
             exchange_rate = get_exchange_rate(self.payment_currency)
             if exchange_rate is None:
                 raise ValueError(f"Exchange rate for {self.payment_currency} is not available.")
-            self.payment_amount_in_euros = (self.payment_amount * exchange_rate).quantize(Decimal('0.01'))
+            self.payment_amount_in_euros = money.to_eur(self.payment_amount, exchange_rate)
 
     def __str__(self):
         paid_to_name = (
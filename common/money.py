@@ -0,0 +1,163 @@
+"""
+Booking money rules — agent fee, KT margin (subtotal), card fee and EUR conversion — in
+one place, for a single booking or a batch of rows.
+
+Scalar functions take plain values; the ``*_figures`` batch helpers take ``values()``
+dicts or tuples in ``JOB_FIELDS`` / ``HOTEL_FIELDS`` order, so Totals, exports and
+revaluation can price thousands of rows without building model instances. Everything is
+exact ``Decimal`` arithmetic; only stored subtotals, card fees and conversions are rounded
+to the cent, as the model saves always did.
+
+Agent fee rules (``AGENT_FEE_CHOICES``):
+
+- ``'5'`` / ``'10'``: that share of the booking amount.
+- ``'50'``: half of ``amount − cost`` (driver fee for jobs, nothing for hotels), only when
+  the amount is positive.
+- anything else: no fee.
+"""
+
+from collections.abc import Mapping
+from decimal import Decimal
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+DEFAULT_CC_FEE_PERCENTAGE = Decimal('7.00')
+
+_TURNOVER_SHARES = {'5': Decimal('0.05'), '10': Decimal('0.10')}
+_PROFIT_SHARE = Decimal('0.50')
+
+JOB_FIELDS = ('job_price_in_euros', 'driver_fee_in_euros', 'agent_percentage', 'subtotal')
+HOTEL_FIELDS = ('customer_pays_in_euros', 'agent_percentage', 'subtotal')
+
+
+def agent_fee(amount, agent_percentage, cost=None) -> Decimal:
+    """Agent commission on *amount* (EUR); *cost* only matters for the 50% profit share."""
+    amount = amount or ZERO
+    share = _TURNOVER_SHARES.get(agent_percentage)
+    if share is not None:
+        return amount * share
+    if agent_percentage == '50':
+        if amount <= ZERO:
+            return ZERO
+        return (amount - cost if cost is not None else amount) * _PROFIT_SHARE
+    return ZERO
+
+
+def job_agent_fee(job_price_eur, driver_fee_eur, agent_percentage) -> Decimal:
+    return agent_fee(job_price_eur, agent_percentage, driver_fee_eur)
+
+
+def job_profit(job_price_eur, driver_fee_eur, agent_percentage) -> Decimal:
+    """Price − driver fee − agent fee, unrounded."""
+    price = job_price_eur or ZERO
+    driver_fee = driver_fee_eur or ZERO
+    return price - driver_fee - job_agent_fee(price, driver_fee, agent_percentage)
+
+
+def job_subtotal(job_price_eur, driver_fee_eur, agent_percentage) -> Decimal:
+    """``Job.subtotal`` as stored on save."""
+    return job_profit(job_price_eur, driver_fee_eur, agent_percentage).quantize(CENT)
+
+
+def job_margin(job_price_eur, driver_fee_eur, agent_percentage, subtotal) -> Decimal:
+    """KT margin: the stored subtotal, else the computed profit."""
+    if subtotal is not None:
+        return subtotal
+    return job_profit(job_price_eur, driver_fee_eur, agent_percentage)
+
+
+def job_agent_fee_or_fallback(job_price_eur, driver_fee_eur, agent_percentage, subtotal) -> Decimal:
+    """Agent fee implied by a stored subtotal (never negative), else the percentage rule."""
+    price = job_price_eur or ZERO
+    driver_fee = driver_fee_eur or ZERO
+    if subtotal is not None:
+        fee = price - driver_fee - subtotal
+        return fee if fee > ZERO else ZERO
+    return job_agent_fee(price, driver_fee, agent_percentage)
+
+
+def hotel_agent_fee(customer_pays_eur, agent_percentage) -> Decimal:
+    return agent_fee(customer_pays_eur, agent_percentage)
+
+
+def hotel_profit(customer_pays_eur, agent_percentage) -> Decimal:
+    """Customer pays − agent fee, unrounded."""
+    customer_pays = customer_pays_eur or ZERO
+    return customer_pays - hotel_agent_fee(customer_pays, agent_percentage)
+
+
+def hotel_subtotal(customer_pays_eur, agent_percentage) -> Decimal:
+    """``HotelBooking.subtotal`` as stored on save."""
+    return hotel_profit(customer_pays_eur, agent_percentage).quantize(CENT)
+
+
+def hotel_margin(customer_pays_eur, agent_percentage, subtotal) -> Decimal:
+    if subtotal is not None:
+        return subtotal
+    return hotel_profit(customer_pays_eur, agent_percentage)
+
+
+def hotel_agent_fee_or_fallback(customer_pays_eur, agent_percentage, subtotal) -> Decimal:
+    customer_pays = customer_pays_eur or ZERO
+    if subtotal is not None:
+        fee = customer_pays - subtotal
+        return fee if fee > ZERO else ZERO
+    return hotel_agent_fee(customer_pays, agent_percentage)
+
+
+def cc_fee(amount, payment_type, cc_fee_percentage) -> Decimal:
+    """Card surcharge on *amount* for card payments (percentage defaults to 7%)."""
+    if payment_type != 'Card':
+        return ZERO
+    percentage = cc_fee_percentage or DEFAULT_CC_FEE_PERCENTAGE
+    return (amount * percentage / Decimal('100')).quantize(CENT)
+
+
+def to_eur(amount, rate):
+    """*amount* at *rate* (EUR per unit), to the cent; ``None`` stays ``None``."""
+    if amount is None:
+        return None
+    return (amount * rate).quantize(CENT)
+
+
+def _columns(row, fields):
+    if isinstance(row, Mapping):
+        return tuple(row[field] for field in fields)
+    return tuple(row)
+
+
+def job_figures(rows):
+    """``[(agent_fee, margin), ...]`` for job rows (dicts or tuples in ``JOB_FIELDS`` order)."""
+    figures = []
+    for row in rows:
+        price, driver_fee, agent_percentage, subtotal = _columns(row, JOB_FIELDS)
+        figures.append((
+            job_agent_fee_or_fallback(price, driver_fee, agent_percentage, subtotal),
+            job_margin(price, driver_fee, agent_percentage, subtotal),
+        ))
+    return figures
+
+
+def hotel_figures(rows):
+    """``[(agent_fee, margin), ...]`` for hotel rows (dicts or tuples in ``HOTEL_FIELDS`` order)."""
+    figures = []
+    for row in rows:
+        customer_pays, agent_percentage, subtotal = _columns(row, HOTEL_FIELDS)
+        figures.append((
+            hotel_agent_fee_or_fallback(customer_pays, agent_percentage, subtotal),
+            hotel_margin(customer_pays, agent_percentage, subtotal),
+        ))
+    return figures
+
+
+def job_subtotals(rows):
+    """Stored-subtotal values for job rows (the ``subtotal`` column is ignored)."""
+    return [job_subtotal(*_columns(row, JOB_FIELDS)[:3]) for row in rows]
+
+
+def hotel_subtotals(rows):
+    return [hotel_subtotal(*_columns(row, HOTEL_FIELDS)[:2]) for row in rows]
+
+
+def cc_fees(amounts, payment_types, cc_fee_percentage):
+    return [cc_fee(amount, payment_type, cc_fee_percentage) for amount, payment_type in zip(amounts, payment_types)]
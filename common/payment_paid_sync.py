@@ -7,82 +7,198 @@ Overpay also counts as paid. Same tolerance is enforced when manually marking pa
 
 Also re-run when job/hotel (or shuttle) price fields are saved so a higher target clears is_paid
 without needing a new payment row.
+
+``reconcile_is_paid`` applies the same rule to whole querysets at once (after a tolerance
+change or an exchange-rate fix): one annotated SELECT per model finds the rows whose flag
+is wrong, then batched UPDATEs flip them.
 """
 from decimal import Decimal
 
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    DecimalField,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
 
 PAID_AMOUNT_TOLERANCE_EUR = Decimal('5.00')
 
+# Attribute names set by ``annotate_complete_payments_eur``
+COMPLETE_PAYMENTS_EUR = 'complete_payments_eur'
+COMPLETE_PAYMENTS_COUNT = 'complete_payments_count'
+
+# Booking model label -> Payment FK pointing at it
+_PAYMENT_PARENT_FIELDS = {
+    'jobs.job': 'job',
+    'shuttle.shuttle': 'shuttle',
+    'hotels.hotelbooking': 'hotel_booking',
+}
+
+# Booking model label -> EUR amount the payments must cover (rows with NULL are skipped,
+# as in the per-row sync functions)
+_PAID_TARGET_FIELDS = {
+    'jobs.job': 'job_price_in_euros',
+    'shuttle.shuttle': 'price',
+    'hotels.hotelbooking': 'customer_pays_in_euros',
+}
+
+RECONCILE_BATCH_SIZE = 500
+
+
+# Complete payment rows, aligned with the jobs/shuttle/hotels Payment checks. Also the
+# condition of the partial per-booking indexes on Payment, so keep the two in step.
+COMPLETE_PAYMENT_Q = Q(
+    payment_amount__isnull=False,
+    payment_currency__isnull=False,
+    payment_type__isnull=False,
+    payment_amount_in_euros__isnull=False,
+) & ~Q(
+    paid_to_driver=None,
+    paid_to_agent=None,
+    paid_to_staff=None,
+)
+
 
 def _complete_payments_base_qs(qs):
     """Aligned with jobs/shuttle/hotels Payment checks for completed payment rows."""
-    return qs.filter(
-        payment_amount__isnull=False,
-        payment_currency__isnull=False,
-        payment_type__isnull=False,
-        payment_amount_in_euros__isnull=False,
-    ).exclude(
-        paid_to_driver=None,
-        paid_to_agent=None,
-        paid_to_staff=None,
-    )
+    return qs.filter(COMPLETE_PAYMENT_Q)
 
 
 def sum_complete_payments_eur(payments_related_manager) -> Decimal:
+    """
+    EUR sum of complete payments behind a booking's ``payments`` manager.
+
+    Reads the value attached by ``annotate_complete_payments_eur`` when the booking was
+    loaded through it, so loops over an annotated queryset issue no per-row query.
+    """
+    annotated = getattr(getattr(payments_related_manager, 'instance', None), COMPLETE_PAYMENTS_EUR, None)
+    if annotated is not None:
+        return annotated
     total = _complete_payments_base_qs(payments_related_manager.all()).aggregate(
         s=Sum('payment_amount_in_euros'),
     )['s']
     return total if total is not None else Decimal('0')
 
 
+def complete_payments_eur_subquery(parent_field: str) -> Subquery:
+    """
+    Correlated subquery: EUR sum of complete payments for the outer booking row.
+
+    *parent_field* is the Payment FK pointing at the booking (``job``, ``shuttle`` or
+    ``hotel_booking``). Evaluates to NULL when there are no complete payments, so wrap
+    it in ``Coalesce`` before doing arithmetic with it.
+    """
+    from common.models import Payment
+
+    payments = _complete_payments_base_qs(Payment.objects.filter(**{parent_field: OuterRef('pk')}))
+    return Subquery(
+        payments.order_by()
+        .values(parent_field)
+        .annotate(s=Sum('payment_amount_in_euros'))
+        .values('s')[:1]
+    )
+
+
+def complete_payments_count_subquery(parent_field: str) -> Subquery:
+    """Correlated subquery: number of complete payments for the outer booking row."""
+    from common.models import Payment
+
+    payments = _complete_payments_base_qs(Payment.objects.filter(**{parent_field: OuterRef('pk')}))
+    return Subquery(
+        payments.order_by()
+        .values(parent_field)
+        .annotate(n=Count('pk'))
+        .values('n')[:1]
+    )
+
+
+def annotate_complete_payments_eur(qs):
+    """
+    Attach ``complete_payments_eur`` (EUR sum, 0 when none) and ``complete_payments_count``
+    to a Job, Shuttle or HotelBooking queryset, computed in the same query.
+
+    ``sum_complete_payments_eur`` and the ``billing.totals_reporting`` helpers use the
+    annotation when present instead of aggregating each booking's payments.
+    """
+    if COMPLETE_PAYMENTS_EUR in qs.query.annotations:
+        return qs
+    parent_field = _PAYMENT_PARENT_FIELDS[qs.model._meta.label_lower]
+    return qs.annotate(**{
+        COMPLETE_PAYMENTS_EUR: Coalesce(
+            complete_payments_eur_subquery(parent_field),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+        COMPLETE_PAYMENTS_COUNT: Coalesce(
+            complete_payments_count_subquery(parent_field),
+            Value(0),
+            output_field=IntegerField(),
+        ),
+    })
+
+
 def payments_meet_target_eur(total_eur: Decimal, target_eur: Decimal) -> bool:
     """True if total is within tolerance of target (underpay up to PAID_AMOUNT_TOLERANCE_EUR) or meets/exceeds target."""
     threshold = target_eur - PAID_AMOUNT_TOLERANCE_EUR
     return total_eur >= threshold
 
 
+def sync_booking_is_paid(booking, *, created: bool = False) -> bool:
+    """
+    Bring ``booking.is_paid`` (a Job, Shuttle or HotelBooking already in memory) in line
+    with its complete payments and return the new value.
+
+    One aggregate reads the payment count and sum — none when *created*, since a row
+    that was just inserted has no payments yet — and the flag is written with a single
+    UPDATE only when it changes. The in-memory instance is updated too, so callers need
+    no ``refresh_from_db``.
+    """
+    label = booking._meta.label_lower
+    target = getattr(booking, _PAID_TARGET_FIELDS[label])
+    if target is None:
+        return booking.is_paid
+    if created:
+        count, total = 0, Decimal('0')
+    else:
+        from common.models import Payment
+
+        row = _complete_payments_base_qs(
+            Payment.objects.filter(**{_PAYMENT_PARENT_FIELDS[label]: booking.pk})
+        ).aggregate(n=Count('pk'), s=Sum('payment_amount_in_euros'))
+        count, total = row['n'], row['s'] or Decimal('0')
+    should_pay = count > 0 and payments_meet_target_eur(total, target)
+    if booking.is_paid != should_pay:
+        type(booking).objects.filter(pk=booking.pk).update(is_paid=should_pay)
+        booking.is_paid = should_pay
+    return should_pay
+
+
 def sync_job_is_paid_from_payments(job_id: int) -> None:
     from jobs.models import Job
 
-    job = Job.objects.get(pk=job_id)
-    target = job.job_price_in_euros
-    if target is None:
-        return
-    complete_payments = _complete_payments_base_qs(job.payments.all())
-    has_recorded_payment = complete_payments.exists()
-    total = complete_payments.aggregate(s=Sum('payment_amount_in_euros'))['s'] or Decimal('0')
-    should_pay = has_recorded_payment and payments_meet_target_eur(total, target)
-    if job.is_paid != should_pay:
-        Job.objects.filter(pk=job_id).update(is_paid=should_pay)
+    sync_booking_is_paid(Job.objects.only('is_paid', 'job_price_in_euros').get(pk=job_id))
 
 
 def sync_shuttle_is_paid_from_payments(shuttle_id: int) -> None:
     from shuttle.models import Shuttle
 
-    shuttle = Shuttle.objects.get(pk=shuttle_id)
-    target = shuttle.price
-    complete_payments = _complete_payments_base_qs(shuttle.payments.all())
-    has_recorded_payment = complete_payments.exists()
-    total = complete_payments.aggregate(s=Sum('payment_amount_in_euros'))['s'] or Decimal('0')
-    should_pay = has_recorded_payment and payments_meet_target_eur(total, target)
-    if shuttle.is_paid != should_pay:
-        Shuttle.objects.filter(pk=shuttle_id).update(is_paid=should_pay)
+    sync_booking_is_paid(Shuttle.objects.only('is_paid', 'price').get(pk=shuttle_id))
 
 
 def sync_hotel_is_paid_from_payments(booking_id: int) -> None:
     from hotels.models import HotelBooking
 
-    guest = HotelBooking.objects.get(pk=booking_id)
-    target = guest.customer_pays_in_euros
-    if target is None:
-        return
-    complete_payments = _complete_payments_base_qs(guest.payments.all())
-    has_recorded_payment = complete_payments.exists()
-    total = complete_payments.aggregate(s=Sum('payment_amount_in_euros'))['s'] or Decimal('0')
-    should_pay = has_recorded_payment and payments_meet_target_eur(total, target)
-    if guest.is_paid != should_pay:
-        HotelBooking.objects.filter(pk=booking_id).update(is_paid=should_pay)
+    sync_booking_is_paid(HotelBooking.objects.only('is_paid', 'customer_pays_in_euros').get(pk=booking_id))
 
 
 def sync_parent_is_paid_after_payment_change(payment) -> None:
@@ -93,3 +209,86 @@ def sync_parent_is_paid_after_payment_change(payment) -> None:
         sync_shuttle_is_paid_from_payments(payment.shuttle_id)
     if payment.hotel_booking_id:
         sync_hotel_is_paid_from_payments(payment.hotel_booking_id)
+
+
+def _reconcile_models():
+    from hotels.models import HotelBooking
+    from jobs.models import Job
+    from shuttle.models import Shuttle
+
+    return (Job, Shuttle, HotelBooking)
+
+
+def is_paid_mismatches(qs):
+    """
+    Rows of a Job / Shuttle / HotelBooking queryset whose ``is_paid`` disagrees with their
+    complete payments, found in one query.
+
+    Returns dicts with ``pk``, ``was_paid``, ``now_paid``, ``target_eur`` and ``paid_eur``.
+    """
+    target = _PAID_TARGET_FIELDS[qs.model._meta.label_lower]
+    should_pay = Case(
+        When(
+            Q(**{
+                f'{COMPLETE_PAYMENTS_COUNT}__gt': 0,
+                f'{COMPLETE_PAYMENTS_EUR}__gte': F(target) - Value(PAID_AMOUNT_TOLERANCE_EUR),
+            }),
+            then=Value(True),
+        ),
+        default=Value(False),
+        output_field=BooleanField(),
+    )
+    rows = (
+        annotate_complete_payments_eur(qs.filter(**{f'{target}__isnull': False}))
+        .annotate(should_be_paid=should_pay)
+        .exclude(is_paid=F('should_be_paid'))
+        .order_by('pk')
+        .values('pk', 'is_paid', 'should_be_paid', target, COMPLETE_PAYMENTS_EUR)
+    )
+    return [
+        {
+            'pk': row['pk'],
+            'was_paid': row['is_paid'],
+            'now_paid': row['should_be_paid'],
+            'target_eur': row[target],
+            'paid_eur': row[COMPLETE_PAYMENTS_EUR],
+        }
+        for row in rows
+    ]
+
+
+def _apply_is_paid_changes(model, changes):
+    from analytics.services import bulk_paid_toggled
+    from billing.ledger import refresh_ledger_for_rows
+    from common.cache_versions import bump_model_version
+
+    with transaction.atomic():
+        for now_paid in (True, False):
+            pks = [change['pk'] for change in changes if change['now_paid'] is now_paid]
+            for start in range(0, len(pks), RECONCILE_BATCH_SIZE):
+                model.objects.filter(pk__in=pks[start:start + RECONCILE_BATCH_SIZE]).update(is_paid=now_paid)
+        # QuerySet.update() sends no signals: keep the derived tables and cache keys in step.
+        became_paid = sum(1 for change in changes if change['now_paid'])
+        bulk_paid_toggled(model, became_paid, len(changes) - became_paid)
+        refresh_ledger_for_rows(model, [change['pk'] for change in changes])
+    label = model._meta.label
+    bump_model_version(label)
+    transaction.on_commit(lambda: bump_model_version(label))
+
+
+def reconcile_is_paid(qs=None, *, dry_run: bool = False) -> dict:
+    """
+    Recompute ``is_paid`` for *qs* (a Job, Shuttle or HotelBooking queryset) or, when
+    omitted, for every booking of all three models.
+
+    Returns ``{model label: [change, ...]}`` as produced by ``is_paid_mismatches``; with
+    *dry_run* nothing is written.
+    """
+    querysets = [qs] if qs is not None else [model.objects.all() for model in _reconcile_models()]
+    results = {}
+    for queryset in querysets:
+        changes = is_paid_mismatches(queryset)
+        results[queryset.model._meta.label] = changes
+        if changes and not dry_run:
+            _apply_is_paid_changes(queryset.model, changes)
+    return results
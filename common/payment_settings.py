@@ -1,10 +1,40 @@
+from decimal import Decimal
+
 from django.db import models
 
+from common.money import DEFAULT_CC_FEE_PERCENTAGE  # used when no PaymentSettings row exists yet
+from common.singletons import CachedSingleton
+
 class PaymentSettings(models.Model):
     cc_fee_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=7.00)  # Default to 7%
 
     def __str__(self):
         return f"Credit Card Fee: {self.cc_fee_percentage}%"
-    
+
     class Meta:
-        verbose_name_plural = "Payment Settings"
\ No newline at end of file
+        verbose_name_plural = "Payment Settings"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        PAYMENT_SETTINGS.invalidate()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        PAYMENT_SETTINGS.invalidate()
+        return result
+
+
+def _load_payment_settings():
+    return PaymentSettings.objects.first() or PaymentSettings(cc_fee_percentage=DEFAULT_CC_FEE_PERCENTAGE)
+
+
+PAYMENT_SETTINGS = CachedSingleton('payment-settings', _load_payment_settings)
+
+
+def payment_settings() -> PaymentSettings:
+    """The PaymentSettings row (an unsaved default when none exists), cached until it is saved."""
+    return PAYMENT_SETTINGS.get()
+
+
+def current_cc_fee_percentage() -> Decimal:
+    return Decimal(payment_settings().cc_fee_percentage)
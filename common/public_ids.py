@@ -0,0 +1,76 @@
+"""
+Public booking ids (the code in client links) for jobs, hotel bookings and shuttles.
+
+Uniqueness is enforced by a unique index on ``UPPER(public_id)`` per table
+(``public_id_constraint``) instead of a case-insensitive existence query before each
+insert: ``save_with_public_id`` draws a random id, inserts inside a savepoint and draws
+again only if that index reports a collision. ``get_by_public_id`` filters on the same
+``UPPER(public_id)`` expression, so client-link lookups are index point reads and still
+accept lower-case links.
+"""
+
+import secrets
+import string
+
+from django.db import IntegrityError, models, router, transaction
+from django.db.models.functions import Upper
+
+PUBLIC_ID_LENGTH = 8
+PUBLIC_ID_ALPHABET = string.ascii_uppercase + string.digits
+# 36**8 ids: a second draw is already unlikely; running out of attempts means something else is wrong.
+PUBLIC_ID_ATTEMPTS = 5
+
+
+def generate_public_id(length=PUBLIC_ID_LENGTH):
+    return ''.join(secrets.choice(PUBLIC_ID_ALPHABET) for _ in range(length))
+
+
+def public_id_constraint_name(db_table):
+    return f'{db_table}_public_id_upper_uniq'
+
+
+def public_id_constraint(db_table):
+    """Case-insensitive unique index for a model's ``public_id`` (add to ``Meta.constraints``)."""
+    return models.UniqueConstraint(Upper('public_id'), name=public_id_constraint_name(db_table))
+
+
+def _is_public_id_collision(exc, model):
+    return public_id_constraint_name(model._meta.db_table) in str(exc)
+
+
+def save_with_public_id(instance, save, *args, **kwargs):
+    """
+    Call ``save(*args, **kwargs)`` (the model's ``super().save``), first giving *instance*
+    a fresh public id when it has none. Collisions on the public id index are retried
+    with a new id; any other integrity error propagates unchanged.
+    """
+    if instance.public_id:
+        instance.public_id = instance.public_id.upper()
+        return save(*args, **kwargs)
+
+    using = kwargs.get('using') or router.db_for_write(type(instance), instance=instance)
+    for attempt in range(1, PUBLIC_ID_ATTEMPTS + 1):
+        instance.public_id = generate_public_id()
+        try:
+            # Inside an outer transaction a failed INSERT must roll back to a savepoint;
+            # in autocommit it leaves nothing behind and can simply be retried.
+            if transaction.get_connection(using).in_atomic_block:
+                with transaction.atomic(using=using):
+                    return save(*args, **kwargs)
+            return save(*args, **kwargs)
+        except IntegrityError as exc:
+            if attempt == PUBLIC_ID_ATTEMPTS or not _is_public_id_collision(exc, type(instance)):
+                instance.public_id = ''
+                raise
+
+
+def get_by_public_id(queryset, public_id):
+    """The row whose public id matches *public_id* case-insensitively, or ``None``."""
+    if not public_id:
+        return None
+    return (
+        queryset.alias(public_id_upper=Upper('public_id'))
+        .filter(public_id_upper=public_id.upper())
+        .first()
+    )
+
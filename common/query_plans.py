@@ -0,0 +1,241 @@
+"""
+Query-plan audit for the app's hot queries.
+
+``CANONICAL_QUERIES`` rebuilds the querysets behind the home page, past jobs, Totals,
+balances and exports. ``audit_query_plans`` runs ``EXPLAIN`` on each and reports the
+tables read with a sequential scan. Some full scans are deliberate, e.g. balances walk
+all history and the ledger is a small summary table. Those tables are listed per query
+and not flagged. The ``explain_queries`` command prints the report and can fail on a
+flagged scan, so a dropped or unusable index shows up before it reaches production.
+
+Supported on SQLite (``EXPLAIN QUERY PLAN``: ``SCAN <table>`` without ``USING INDEX``)
+and PostgreSQL (``Seq Scan on <table>``). On PostgreSQL the audit runs with
+``enable_seqscan`` off by default, because on a small database the planner prefers a
+sequential scan even where a usable index exists. With it off, a remaining Seq Scan
+means no index fits the query.
+"""
+
+from __future__ import annotations
+
+import datetime
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+import pytz
+
+budapest_tz = pytz.timezone('Europe/Budapest')
+
+_SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\S+)(.*)$')
+# FTS5 MATCH lookups show up as "SCAN <fts table> VIRTUAL TABLE INDEX 0:M<column>"
+_SQLITE_VIRTUAL_MATCH = re.compile(r'VIRTUAL TABLE INDEX \d+:\S')
+_POSTGRES_SEQ_SCAN = re.compile(r'Seq Scan on (\S+)')
+
+
+def _home_jobs(now):
+    from jobs.models import Job
+    from jobs.views import upcoming_job_filter
+
+    return Job.objects.filter(upcoming_job_filter(now) & Q(is_confirmed=True)).order_by('job_date', 'job_time')
+
+
+def _home_shuttles(now):
+    from shuttle.models import Shuttle
+
+    return Shuttle.objects.filter(shuttle_date__gte=now.date(), is_confirmed=True).order_by('shuttle_date')
+
+
+def _home_hotels(now):
+    from hotels.models import HotelBooking
+
+    return HotelBooking.objects.filter(check_in__gte=now, is_confirmed=True).order_by('check_in')
+
+
+def _past_jobs(now):
+    from jobs.models import Job
+    from jobs.views import past_job_filter
+
+    return Job.objects.filter(past_job_filter(now), is_confirmed=True)
+
+
+def _past_shuttles(now):
+    from shuttle.models import Shuttle
+
+    return Shuttle.objects.filter(shuttle_date__lt=now.date(), is_confirmed=True)
+
+
+def _past_hotels(now):
+    from hotels.models import HotelBooking
+
+    return HotelBooking.objects.filter(check_in__lt=now, is_confirmed=True)
+
+
+def _past_feed(next_page):
+    def build(now):
+        from jobs.past_feed import feed_queryset
+
+        querysets = {'job': _past_jobs(now), 'shuttle': _past_shuttles(now), 'hotel': _past_hotels(now)}
+        cursor = (now.date() - datetime.timedelta(days=30), datetime.time(12, 0), 3, 1) if next_page else None
+        return feed_queryset(querysets, cursor)
+
+    return build
+
+
+def _past_jobs_search(now):
+    from common.search import matching_booking_ids
+
+    return _past_jobs(now).filter(pk__in=matching_booking_ids('job', 'smith'))
+
+
+def _customer_name_suggestions(now):
+    from common.customer_models import Customer
+    from common.customers import prefix_filter
+
+    return Customer.objects.filter(**prefix_filter('name_key', 'smith')).order_by('-usage_count', '-last_seen')
+
+
+def _customer_number_suggestions(now):
+    from common.customer_models import Customer
+    from common.customers import prefix_filter
+
+    return Customer.objects.filter(**prefix_filter('number', '+3620')).values('number')
+
+
+def _totals_ledger(now):
+    from billing.models import MonthlyLedger
+
+    return MonthlyLedger.objects.order_by().values('service')
+
+
+def _totals_breakdown(service, *, this_year=False, status=''):
+    def build(now):
+        from billing.totals_aggregation import service_date_field
+        from billing.totals_breakdowns import breakdown_queryset
+
+        date_from = datetime.date(now.year, 1, 1) if this_year else None
+        qs = breakdown_queryset(service, date_from=date_from, status=status)
+        return qs.order_by(f'-{service_date_field(service)}', '-pk')
+
+    return build
+
+
+def _totals_expenses(now):
+    from expenses.models import Expense
+
+    expense_types = [expense_type[0] for expense_type in Expense.EXPENSE_TYPES]
+    return Expense.objects.filter(expense_date__year=now.year, expense_type__in=expense_types)
+
+
+def _balances_payments(now):
+    from common.models import Payment
+
+    return Payment.objects.select_related('job', 'paid_to_agent', 'paid_to_driver', 'paid_to_staff')
+
+
+def _balances_jobs(now):
+    from jobs.models import Job
+
+    return Job.objects.select_related('agent_name')
+
+
+def _balances_driver_expenses(now):
+    from expenses.models import Expense
+
+    return Expense.objects.filter(driver_id=1, expense_date__year=now.year).order_by('expense_date')
+
+
+def _export(kind):
+    def build(now):
+        from common.exports import EXPORT_KINDS, export_queryset, with_export_relations
+
+        queryset = export_queryset(kind, {'year': now.year, 'month': 0})
+        return with_export_relations(queryset, EXPORT_KINDS[kind].columns)
+
+    return build
+
+
+def _export_queue(now):
+    from common.export_models import ExportJob
+
+    return ExportJob.objects.filter(status=ExportJob.STATUS_QUEUED).order_by('created_at')
+
+
+def _export_cached_file(now):
+    from common.export_models import ExportJob
+
+    return ExportJob.objects.filter(cache_key='0' * 64).exclude(status=ExportJob.STATUS_FAILED).order_by('-created_at')
+
+
+# name -> (queryset builder taking the Budapest "now", tables a full scan is expected on)
+CANONICAL_QUERIES = {
+    'home.jobs': (_home_jobs, ()),
+    'home.shuttles': (_home_shuttles, ()),
+    'home.hotels': (_home_hotels, ()),
+    'past_jobs.jobs': (_past_jobs, ()),
+    'past_jobs.shuttles': (_past_shuttles, ()),
+    'past_jobs.hotels': (_past_hotels, ()),
+    'past_jobs.search': (_past_jobs_search, ()),
+    'past_jobs.feed': (_past_feed(next_page=False), ()),
+    'past_jobs.feed_next_page': (_past_feed(next_page=True), ()),
+    'autocomplete.customer_name': (_customer_name_suggestions, ()),
+    'autocomplete.customer_number': (_customer_number_suggestions, ()),
+    'totals.ledger': (_totals_ledger, ('billing_monthlyledger',)),
+    'totals.driving_this_year': (_totals_breakdown('driving', this_year=True), ()),
+    'totals.driving_unpaid': (_totals_breakdown('driving', status='unpaid'), ()),
+    'totals.shuttle_unpaid': (_totals_breakdown('shuttle', status='unpaid'), ()),
+    'totals.hotel_unpaid': (_totals_breakdown('hotel', status='unpaid'), ()),
+    'totals.expenses': (_totals_expenses, ()),
+    'balances.payments': (_balances_payments, ('common_payment',)),
+    'balances.jobs': (_balances_jobs, ('jobs_job',)),
+    'balances.driver_expenses': (_balances_driver_expenses, ()),
+    'exports.jobs': (_export('jobs'), ()),
+    'exports.shuttles': (_export('shuttles'), ()),
+    'exports.hotels': (_export('hotels'), ()),
+    'exports.queue': (_export_queue, ()),
+    'exports.cached_file': (_export_cached_file, ()),
+}
+
+
+def sequential_scans(plan, vendor):
+    """Tables read with a sequential scan in *plan* (``QuerySet.explain()`` output)."""
+    tables = []
+    for line in plan.splitlines():
+        if vendor == 'sqlite':
+            match = _SQLITE_SCAN.search(line)
+            if match and 'USING' not in match.group(2) and not _SQLITE_VIRTUAL_MATCH.search(match.group(2)):
+                tables.append(match.group(1))
+        elif vendor == 'postgresql':
+            tables.extend(_POSTGRES_SEQ_SCAN.findall(line))
+    return [table.strip('"') for table in tables]
+
+
+def supports_plan_audit(vendor=None):
+    return (vendor or connection.vendor) in ('sqlite', 'postgresql')
+
+
+def audit_query_plans(names=None, *, now=None, disable_seqscan=True):
+    """
+    ``[{'name', 'plan', 'seq_scans', 'flagged'}, ...]`` for the canonical queries (or
+    just *names*). ``flagged`` are the sequential scans not expected for that query.
+    """
+    now = now or timezone.now().astimezone(budapest_tz)
+    vendor = connection.vendor
+    report = []
+    with transaction.atomic():
+        if vendor == 'postgresql' and disable_seqscan:
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, (build, expected_scans) in CANONICAL_QUERIES.items():
+            if names and name not in names:
+                continue
+            plan = build(now).explain()
+            seq_scans = sequential_scans(plan, vendor)
+            report.append({
+                'name': name,
+                'plan': plan,
+                'seq_scans': seq_scans,
+                'flagged': [table for table in seq_scans if table not in expected_scans],
+            })
+    return report
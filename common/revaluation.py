@@ -0,0 +1,294 @@
+"""
+Bulk EUR revaluation of stored money fields.
+
+``revalue_eur`` recomputes the ``*_in_euros`` columns (and the card fee / subtotal derived
+from them) for jobs, hotel bookings, payments and expenses without going through their
+``save()`` overrides. Rows are read in pk-ordered chunks, converted with
+``exchange_rates.convert_many`` against one ``RateIndex`` and written back with
+``bulk_update``. Rows dated before their currency's rate history starts are skipped
+rather than converted at the oldest known rate. The ledger buckets of changed rows are
+refreshed afterwards, and ``reconcile_is_paid`` then realigns paid flags in one
+set-based pass — so audit, per-row paid sync and analytics signals are not replayed.
+"""
+
+from __future__ import annotations
+
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from functools import reduce
+from operator import attrgetter, or_
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from common.exchange_rates import BASE_CURRENCY, BUDAPEST_TZ, RateIndex, convert_many, rate_date
+from common.payment_settings import current_cc_fee_percentage
+from common.utils import calculate_cc_fee
+
+REVALUE_BATCH_SIZE = 500
+
+RATES_HISTORY = 'history'
+RATES_CURRENT = 'current'
+RATE_SOURCES = (RATES_HISTORY, RATES_CURRENT)
+
+
+def _revalue_jobs(rows, index):
+    days = [row.job_date for row in rows]
+    prices = convert_many([row.job_price for row in rows], [row.job_currency for row in rows], days, index)
+    fees = convert_many([row.driver_fee for row in rows], [row.driver_currency for row in rows], days, index)
+    cc_fee_percentage = current_cc_fee_percentage()
+    for row, price, fee in zip(rows, prices, fees):
+        row.job_price_in_euros = price
+        row.driver_fee_in_euros = fee
+        row.cc_fee = calculate_cc_fee(row.job_price, row.payment_type, cc_fee_percentage)
+        row.subtotal = row.calculate_subtotal()
+
+
+def _revalue_hotel_bookings(rows, index):
+    days = [row.check_in for row in rows]
+    hotel_prices = convert_many(
+        [row.hotel_price for row in rows], [row.hotel_price_currency for row in rows], days, index
+    )
+    customer_pays = convert_many(
+        [row.customer_pays for row in rows], [row.customer_pays_currency for row in rows], days, index
+    )
+    cc_fee_percentage = current_cc_fee_percentage()
+    for row, hotel_price, pays in zip(rows, hotel_prices, customer_pays):
+        row.hotel_price_in_euros = hotel_price
+        row.customer_pays_in_euros = pays
+        row.cc_fee = calculate_cc_fee(row.hotel_price, row.payment_type, cc_fee_percentage)
+        row.subtotal = row.calculate_subtotal()
+
+
+def _revalue_payments(rows, index):
+    # Payments carry no date of their own: convert as of their booking's date.
+    days = [_payment_day(row) for row in rows]
+    amounts = [row.payment_amount if row.payment_currency else None for row in rows]
+    for row, amount in zip(rows, convert_many(amounts, [row.payment_currency for row in rows], days, index)):
+        row.payment_amount_in_euros = amount
+
+
+def _revalue_expenses(rows, index):
+    rows = [row for row in rows if row.expense_amount and row.expense_currency]
+    amounts = convert_many(
+        [row.expense_amount for row in rows],
+        [row.expense_currency for row in rows],
+        [row.expense_date for row in rows],
+        index,
+    )
+    for row, amount in zip(rows, amounts):
+        row.expense_amount_in_euros = amount
+
+
+def _payment_queryset(model):
+    return model.objects.annotate(
+        job_day=F('job__job_date'),
+        shuttle_day=F('shuttle__shuttle_date'),
+        hotel_day=F('hotel_booking__check_in'),
+    )
+
+
+def _start_of_day(day):
+    return BUDAPEST_TZ.localize(datetime.combine(day, time.min))
+
+
+def _date_range(path, since, until):
+    q = Q()
+    if since:
+        q &= Q(**{f'{path}__gte': since})
+    if until:
+        q &= Q(**{f'{path}__lte': until})
+    return q
+
+
+def _instant_range(path, since, until):
+    # Compared as instants, so a check-in belongs to its Budapest calendar day
+    q = Q()
+    if since:
+        q &= Q(**{f'{path}__gte': _start_of_day(since)})
+    if until:
+        q &= Q(**{f'{path}__lt': _start_of_day(until + timedelta(days=1))})
+    return q
+
+
+def _payment_range(path, since, until):
+    return (
+        _date_range('job__job_date', since, until)
+        | _date_range('shuttle__shuttle_date', since, until)
+        | _instant_range('hotel_booking__check_in', since, until)
+    )
+
+
+def _payment_day(row):
+    return row.job_day or row.shuttle_day or row.hotel_day or timezone.now()
+
+
+# reads / writes: fields read and written; money: (amount, currency) field pairs that are
+# converted; day: the date field a row is converted at, with in_range building the Q for
+# a since / until period on it and row_day reading it off a loaded row
+RevalueSpec = namedtuple('RevalueSpec', 'reads writes money day in_range row_day queryset recompute')
+
+_SPECS = {
+    'jobs.Job': RevalueSpec(
+        ('job_date', 'job_price', 'job_currency', 'driver_fee', 'driver_currency',
+         'payment_type', 'agent_percentage'),
+        ('job_price_in_euros', 'driver_fee_in_euros', 'cc_fee', 'subtotal'),
+        (('job_price', 'job_currency'), ('driver_fee', 'driver_currency')),
+        'job_date',
+        _date_range,
+        attrgetter('job_date'),
+        None,
+        _revalue_jobs,
+    ),
+    'hotels.HotelBooking': RevalueSpec(
+        ('check_in', 'hotel_price', 'hotel_price_currency', 'customer_pays',
+         'customer_pays_currency', 'payment_type', 'agent_percentage'),
+        ('hotel_price_in_euros', 'customer_pays_in_euros', 'cc_fee', 'subtotal'),
+        (('hotel_price', 'hotel_price_currency'), ('customer_pays', 'customer_pays_currency')),
+        'check_in',
+        _instant_range,
+        attrgetter('check_in'),
+        None,
+        _revalue_hotel_bookings,
+    ),
+    'common.Payment': RevalueSpec(
+        ('payment_amount', 'payment_currency'),
+        ('payment_amount_in_euros',),
+        (('payment_amount', 'payment_currency'),),
+        None,
+        _payment_range,
+        _payment_day,
+        _payment_queryset,
+        _revalue_payments,
+    ),
+    'expenses.Expense': RevalueSpec(
+        ('expense_date', 'expense_amount', 'expense_currency'),
+        ('expense_amount_in_euros',),
+        (('expense_amount', 'expense_currency'),),
+        'expense_date',
+        _date_range,
+        attrgetter('expense_date'),
+        None,
+        _revalue_expenses,
+    ),
+}
+REVALUE_MODELS = tuple(_SPECS)
+
+
+def _selection(spec, currencies, since, until):
+    q = Q()
+    if currencies:
+        q &= reduce(or_, (Q(**{f'{currency}__in': currencies}) for _, currency in spec.money))
+    if since or until:
+        q &= spec.in_range(spec.day, since, until)
+    return q
+
+
+def _chunks(model, spec, selection, batch_size):
+    qs = spec.queryset(model) if spec.queryset else model.objects.all()
+    qs = qs.filter(selection).only('pk', *spec.reads, *spec.writes).order_by('pk')
+    last_pk = 0
+    while True:
+        rows = list(qs.filter(pk__gt=last_pk)[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1].pk
+
+
+def _predates_history(spec, row, index):
+    """Whether a converted amount of *row* falls before its currency's first history row."""
+    day = rate_date(spec.row_day(row))
+    for amount_field, currency_field in spec.money:
+        currency = getattr(row, currency_field)
+        if getattr(row, amount_field) is None or not currency or currency == BASE_CURRENCY:
+            continue
+        first = index.first_rate_date(currency)
+        if first is None or day < first:
+            return True
+    return False
+
+
+def _refresh_derived(model, pks):
+    from billing.ledger import refresh_ledger_for_rows
+    from common.cache_versions import bump_model_version
+
+    if model._meta.label == 'common.Payment':
+        parents = model.objects.filter(pk__in=pks).values_list('job_id', 'shuttle_id', 'hotel_booking_id')
+        by_parent = {'job': set(), 'shuttle': set(), 'hotel_booking': set()}
+        for job_id, shuttle_id, hotel_booking_id in parents:
+            for name, parent_id in zip(by_parent, (job_id, shuttle_id, hotel_booking_id)):
+                if parent_id:
+                    by_parent[name].add(parent_id)
+        for name, parent_ids in by_parent.items():
+            if parent_ids:
+                refresh_ledger_for_rows(model._meta.get_field(name).related_model, parent_ids)
+    else:
+        refresh_ledger_for_rows(model, pks)
+    label = model._meta.label
+    bump_model_version(label)
+    transaction.on_commit(lambda: bump_model_version(label))
+
+
+def revalue_model(
+    model,
+    index,
+    *,
+    currencies=None,
+    since=None,
+    until=None,
+    skip_before_history=True,
+    dry_run=False,
+    batch_size=REVALUE_BATCH_SIZE,
+    progress=None,
+):
+    """
+    Recompute the EUR columns of *model* rows against *index*.
+
+    Only rows with an amount in one of *currencies* and dated within *since* .. *until*
+    (inclusive) are read when those are given. With *skip_before_history* rows dated
+    before a converted currency's first history row are left as they are: the history
+    has no rate of their day. Returns ``[{'pk', 'changes': {field: (old, new)}}, ...]``
+    for rows whose stored values differ; without *dry_run* those rows are written with
+    ``bulk_update``. *progress* is called as ``progress(checked, changed, skipped)``
+    after each chunk.
+    """
+    spec = _SPECS[model._meta.label]
+    selection = _selection(spec, currencies, since, until)
+    diffs = []
+    checked = skipped = 0
+    for rows in _chunks(model, spec, selection, batch_size):
+        checked += len(rows)
+        if skip_before_history:
+            dated = [row for row in rows if not _predates_history(spec, row, index)]
+            skipped += len(rows) - len(dated)
+            rows = dated
+        before = [{field: getattr(row, field) for field in spec.writes} for row in rows]
+        spec.recompute(rows, index)
+        changed = []
+        for row, old in zip(rows, before):
+            changes = {
+                field: (old[field], getattr(row, field))
+                for field in spec.writes
+                if old[field] != getattr(row, field)
+            }
+            if changes:
+                changed.append(row)
+                diffs.append({'pk': row.pk, 'changes': changes})
+        if changed and not dry_run:
+            model.objects.bulk_update(changed, spec.writes)
+        if progress:
+            progress(checked, len(diffs), skipped)
+    if diffs and not dry_run:
+        _refresh_derived(model, [diff['pk'] for diff in diffs])
+    return diffs
+
+
+def rate_index_for(source):
+    """``RateIndex`` over the dated history, or over today's rates only (*source* ``current``)."""
+    if source == RATES_CURRENT:
+        from common.exchange_rate_models import ExchangeRate
+
+        return RateIndex([], ExchangeRate.objects.values_list('currency', 'rate'))
+    return RateIndex.load()
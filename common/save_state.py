@@ -0,0 +1,26 @@
+"""
+One read of a row's stored state per save.
+
+Audit diffs, analytics paid counters and the billing ledger all need the values a
+booking had before the current save. Their pre_save receivers call
+``previous_instance``, which loads the row the first time it is asked for and reuses
+it for the others; a post_save receiver (``common.signals``) drops it again.
+"""
+
+_ATTR = '_kt_previous_instance'
+_MISSING = object()
+
+
+def previous_instance(instance):
+    """The stored row *instance* is about to overwrite, or ``None`` when it is new."""
+    if not instance.pk:
+        return None
+    cached = instance.__dict__.get(_ATTR, _MISSING)
+    if cached is _MISSING:
+        cached = type(instance)._default_manager.filter(pk=instance.pk).first()
+        instance.__dict__[_ATTR] = cached
+    return cached
+
+
+def forget_previous_instance(instance):
+    instance.__dict__.pop(_ATTR, None)
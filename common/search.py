@@ -0,0 +1,195 @@
+"""
+Substring search over bookings through the ``BookingSearchEntry`` index table.
+
+Past jobs live search and customer autocomplete used to run ``icontains`` over several
+columns of the jobs, shuttles and hotel bookings tables, which is a full scan of all
+three on every keystroke. Each booking now has one narrow search row holding its
+searchable text lower-cased. The row is written on save, only when that text changed,
+and removed on delete.
+
+The row is matched through an index:
+- PostgreSQL: ``LIKE '%term%'`` backed by ``pg_trgm`` GIN indexes.
+- SQLite: a MATCH on the ``booking_search_fts`` FTS5 trigram table, kept in step with
+  the search table by triggers.
+- Terms shorter than a trigram fall back to a LIKE on the search table itself, which is
+  still far narrower than the booking tables.
+
+Both backends keep the ``icontains`` behaviour: any substring, any case. Word-based
+full-text search (``SearchVector``) would only find whole words. ``rebuild_search_index``
+recreates every row, e.g. after bulk ``update()`` calls, which bypass the signals.
+"""
+
+from django.db import connections, router
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from common.save_state import previous_instance
+from common.search_models import BookingSearchEntry
+
+FTS_TABLE = 'booking_search_fts'
+TRIGRAM = 3
+
+# kind -> (model label, fields that make up the search document)
+SEARCH_SOURCES = {
+    BookingSearchEntry.KIND_JOB: (
+        'jobs.Job',
+        ('customer_name', 'customer_number', 'job_description', 'pick_up_location', 'public_id'),
+    ),
+    BookingSearchEntry.KIND_SHUTTLE: ('shuttle.Shuttle', ('customer_name', 'customer_number')),
+    BookingSearchEntry.KIND_HOTEL: ('hotels.HotelBooking', ('customer_name', 'customer_number')),
+}
+
+SEARCH_FIELDS = {'document': 'document', 'name': 'name_key', 'number': 'number_key'}
+
+_STALE_ATTR = '_kt_search_stale'
+
+
+def _key(value):
+    return str(value or '').lower()
+
+
+def _kind_for(model):
+    label = model._meta.label
+    for kind, (source_label, _fields) in SEARCH_SOURCES.items():
+        if source_label == label:
+            return kind
+    return None
+
+
+def search_values(instance, kind=None):
+    """The search row columns for a booking, as ``{column: value}``."""
+    kind = kind or _kind_for(type(instance))
+    fields = SEARCH_SOURCES[kind][1]
+    return {
+        'name_key': _key(instance.customer_name),
+        'number_key': _key(instance.customer_number),
+        # One field per line, so a search term never matches across two fields
+        'document': '\n'.join(_key(getattr(instance, field)) for field in fields),
+    }
+
+
+def build_entries(instances, kind):
+    return [
+        BookingSearchEntry(kind=kind, booking_id=instance.pk, **search_values(instance, kind))
+        for instance in instances
+    ]
+
+
+def upsert_entries(entries, using=None):
+    """Insert or overwrite search rows in one statement."""
+    if not entries:
+        return
+    BookingSearchEntry.objects.using(using).bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=['kind', 'booking_id'],
+        update_fields=['name_key', 'number_key', 'document'],
+    )
+
+
+def _uses_fts(using, term):
+    return connections[using].vendor == 'sqlite' and len(term) >= TRIGRAM
+
+
+def _fts_query(column, term):
+    # A quoted FTS5 string is matched as a substring by the trigram tokenizer.
+    return '%s : "%s"' % (column, term.replace('"', '""'))
+
+
+def matching_booking_ids(kind, term, field='document'):
+    """
+    ``booking_id`` values (a subquery, use with ``pk__in``) of *kind* bookings whose
+    *field* (``document``, ``name`` or ``number``) contains *term*, ignoring case.
+    """
+    column = SEARCH_FIELDS[field]
+    term = _key(term)
+    using = router.db_for_read(BookingSearchEntry)
+    entries = BookingSearchEntry.objects.using(using).filter(kind=kind)
+    if _uses_fts(using, term):
+        entries = entries.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [_fts_query(column, term)],
+        ))
+    else:
+        entries = entries.filter(**{f'{column}__contains': term})
+    return entries.values('booking_id')
+
+
+def rebuild_search_index(kinds=None, batch_size=1000):
+    """Recreate the search rows of *kinds* (default: all) from the bookings; returns counts."""
+    from django.apps import apps
+
+    counts = {}
+    for kind, (label, fields) in SEARCH_SOURCES.items():
+        if kinds and kind not in kinds:
+            continue
+        model = apps.get_model(label)
+        BookingSearchEntry.objects.filter(kind=kind).delete()
+        rows = model.objects.order_by('pk').only('pk', 'customer_name', 'customer_number', *fields)
+        batch = []
+        count = 0
+        for instance in rows.iterator(chunk_size=batch_size):
+            batch.append(instance)
+            if len(batch) >= batch_size:
+                BookingSearchEntry.objects.bulk_create(build_entries(batch, kind))
+                count += len(batch)
+                batch = []
+        if batch:
+            BookingSearchEntry.objects.bulk_create(build_entries(batch, kind))
+            count += len(batch)
+        counts[kind] = count
+    return counts
+
+
+def _flag_search_change(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    kind = _kind_for(sender)
+    prev = previous_instance(instance)
+    instance.__dict__[_STALE_ATTR] = (
+        prev is None or search_values(prev, kind) != search_values(instance, kind)
+    )
+
+
+def _store_search_entry(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    stale = instance.__dict__.pop(_STALE_ATTR, True)
+    if created or stale:
+        upsert_entries(build_entries([instance], _kind_for(sender)), using=using)
+
+
+def _drop_search_entry(sender, instance, using, **kwargs):
+    BookingSearchEntry.objects.using(using).filter(
+        kind=_kind_for(sender), booking_id=instance.pk
+    ).delete()
+
+
+_registered = False
+
+
+def register_search_signals():
+    global _registered
+    if _registered:
+        return
+    _registered = True
+
+    from django.apps import apps
+
+    for label, _fields in SEARCH_SOURCES.values():
+        model = apps.get_model(label)
+        pre_save.connect(
+            _flag_search_change,
+            sender=model,
+            dispatch_uid=f'kt-search-pre-{label}',
+        )
+        post_save.connect(
+            _store_search_entry,
+            sender=model,
+            dispatch_uid=f'kt-search-{label}',
+        )
+        post_delete.connect(
+            _drop_search_entry,
+            sender=model,
+            dispatch_uid=f'kt-search-delete-{label}',
+        )
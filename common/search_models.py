@@ -0,0 +1,35 @@
+from django.db import models
+
+
+class BookingSearchEntry(models.Model):
+    """
+    One row per job / shuttle / hotel booking with its searchable text lower-cased,
+    kept in step on save by ``common.search``. Substring search runs against this narrow
+    table: through trigram GIN indexes on PostgreSQL, or the ``booking_search_fts``
+    FTS5 table on SQLite (both created by migration 0018, outside the model state).
+    """
+
+    KIND_JOB = 'job'
+    KIND_SHUTTLE = 'shuttle'
+    KIND_HOTEL = 'hotel'
+    KIND_CHOICES = [
+        (KIND_JOB, 'Driving job'),
+        (KIND_SHUTTLE, 'Shuttle'),
+        (KIND_HOTEL, 'Hotel booking'),
+    ]
+
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    booking_id = models.PositiveBigIntegerField()
+    # Lower-cased search keys
+    name_key = models.TextField(blank=True, default='')
+    number_key = models.TextField(blank=True, default='')
+    # Everything the past-bookings search looks at, one field per line
+    document = models.TextField(blank=True, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'booking_id'], name='booking_search_kind_booking'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.booking_id}'
@@ -5,6 +5,7 @@ from django.db.models.signals import post_save, pre_save
 from common.audit import log_audit
 from common.audit_diff import attach_pre_save_snapshot, compute_field_changes
 from common.middleware.audit_user import get_audit_request_user
+from common.save_state import forget_previous_instance
 from common.utils import now_budapest
 
 
@@ -36,6 +37,10 @@ def _on_audited_save(sender, instance, created, raw, **kwargs):
     _store_audit(instance, created, raw)
 
 
+def _forget_previous_instance(sender, instance, **kwargs):
+    forget_previous_instance(instance)
+
+
 _registered = False
 
 
@@ -61,3 +66,8 @@ def register_audit_signals():
             sender=model,
             dispatch_uid=f'kt-audit-{model._meta.label}',
         )
+        post_save.connect(
+            _forget_previous_instance,
+            sender=model,
+            dispatch_uid=f'kt-save-state-{model._meta.label}',
+        )
@@ -0,0 +1,52 @@
+"""
+Cached reads of the settings singletons (``PaymentSettings``, ``ShuttleConfig``).
+
+Booking saves and payment listings need the card-fee percentage and the shuttle
+price on every row. ``CachedSingleton`` keeps the loaded row in the worker for
+``PROCESS_TTL_SECONDS`` and in the cache for ``CACHE_TTL_SECONDS``, so the hot path
+costs no queries. ``invalidate()`` is called from the models' ``save`` / ``delete``
+(the dashboard and admin forms go through those) and drops both copies in the saving
+process. With a shared cache (``file`` / ``db``) other workers reload the row once
+their process copy expires. With ``locmem`` each worker has its own cache entry,
+which the save cannot reach; it expires after ``CACHE_TTL_SECONDS``. So every worker
+sees a change within ``PROCESS_TTL_SECONDS + CACHE_TTL_SECONDS``.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+SINGLETON_CACHE_PREFIX = 'kt:singleton:'
+PROCESS_TTL_SECONDS = 30
+# Bounds staleness where the save's invalidation cannot reach the entry (per-process caches)
+CACHE_TTL_SECONDS = 30
+
+
+class CachedSingleton:
+    def __init__(self, name, loader):
+        self.cache_key = f'{SINGLETON_CACHE_PREFIX}{name}'
+        self._loader = loader
+        self._local = None  # (value, monotonic expiry)
+
+    def get(self):
+        now = time.monotonic()
+        local = self._local
+        if local is not None and now < local[1]:
+            return local[0]
+        value = cache.get(self.cache_key)
+        if value is None:
+            value = self._loader()
+            cache.set(self.cache_key, value, timeout=CACHE_TTL_SECONDS)
+        self._local = (value, now + PROCESS_TTL_SECONDS)
+        return value
+
+    def invalidate(self):
+        self._drop()
+        # Drop again once the write is visible, in case another request re-read the
+        # old row before the transaction committed.
+        transaction.on_commit(self._drop)
+
+    def _drop(self):
+        self._local = None
+        cache.delete(self.cache_key)
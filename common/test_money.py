@@ -0,0 +1,170 @@
+"""
+Property checks for ``common.money``: seeded random bookings run through the scalar
+functions, the batch helpers, the model / Totals per-instance methods and a verbatim
+copy of the formulas the models used before the module existed.
+"""
+import random
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from billing import totals_reporting
+from common import money
+from hotels.models import HotelBooking
+from jobs.models import Job
+
+SAMPLES = 500
+AGENT_PERCENTAGES = ('5', '10', '50', None, '', '0')
+PAYMENT_TYPES = ('Card', 'Cash', 'Transfer', 'Quick Pay', None)
+
+
+def _amount(rng, low=-500, high=50000, none_share=0.1):
+    if rng.random() < none_share:
+        return None
+    return Decimal(rng.randint(low * 100, high * 100)) / 100
+
+
+def _legacy_job_subtotal(job_price, driver_fee, agent_percentage):
+    job_price = job_price or Decimal('0.00')
+    driver_fee = driver_fee or Decimal('0.00')
+    if agent_percentage == '5':
+        agent_fee = job_price * Decimal('0.05')
+    elif agent_percentage == '10':
+        agent_fee = job_price * Decimal('0.10')
+    elif agent_percentage == '50':
+        agent_fee = (job_price - driver_fee) * Decimal('0.50') if job_price > Decimal('0.00') else Decimal('0.00')
+    else:
+        agent_fee = Decimal('0.00')
+    return agent_fee, (job_price - driver_fee - agent_fee)
+
+
+def _legacy_hotel_subtotal(customer, agent_percentage):
+    customer = customer or Decimal('0.00')
+    if agent_percentage == '5':
+        agent_fee = customer * Decimal('0.05')
+    elif agent_percentage == '10':
+        agent_fee = customer * Decimal('0.10')
+    elif agent_percentage == '50':
+        agent_fee = customer * Decimal('0.50') if customer > Decimal('0.00') else Decimal('0.00')
+    else:
+        agent_fee = Decimal('0.00')
+    return agent_fee, (customer - agent_fee)
+
+
+def _legacy_cc_fee(job_price, payment_type, cc_fee_percentage):
+    if payment_type == 'Card':
+        fee_percentage = cc_fee_percentage if cc_fee_percentage else Decimal('7.00')
+        return (job_price * fee_percentage / Decimal('100')).quantize(Decimal('0.01'))
+    return Decimal('0.00')
+
+
+def _exact(value):
+    # Same number *and* same exponent (Decimal('1.0') != Decimal('1.00') here).
+    return (value, value.as_tuple().exponent) if value is not None else None
+
+
+class MoneyPropertyTests(SimpleTestCase):
+    def setUp(self):
+        self.rng = random.Random(20260418)
+
+    def job_rows(self):
+        for _ in range(SAMPLES):
+            yield {
+                'job_price_in_euros': _amount(self.rng),
+                'driver_fee_in_euros': _amount(self.rng, low=0, high=20000),
+                'agent_percentage': self.rng.choice(AGENT_PERCENTAGES),
+                'subtotal': _amount(self.rng, none_share=0.5),
+            }
+
+    def hotel_rows(self):
+        for _ in range(SAMPLES):
+            yield {
+                'customer_pays_in_euros': _amount(self.rng),
+                'agent_percentage': self.rng.choice(AGENT_PERCENTAGES),
+                'subtotal': _amount(self.rng, none_share=0.5),
+            }
+
+    def test_job_subtotal_matches_legacy_save_formula(self):
+        for row in self.job_rows():
+            args = (row['job_price_in_euros'], row['driver_fee_in_euros'], row['agent_percentage'])
+            with self.subTest(**row):
+                legacy_fee, legacy_profit = _legacy_job_subtotal(*args)
+                self.assertEqual(_exact(money.job_subtotal(*args)), _exact(legacy_profit.quantize(Decimal('0.01'))))
+                self.assertEqual(_exact(money.job_agent_fee(*args)), _exact(legacy_fee))
+                self.assertEqual(_exact(Job(**row).calculate_subtotal()), _exact(money.job_subtotal(*args)))
+
+    def test_hotel_subtotal_matches_legacy_save_formula(self):
+        for row in self.hotel_rows():
+            args = (row['customer_pays_in_euros'], row['agent_percentage'])
+            with self.subTest(**row):
+                legacy_fee, legacy_profit = _legacy_hotel_subtotal(*args)
+                self.assertEqual(_exact(money.hotel_subtotal(*args)), _exact(legacy_profit.quantize(Decimal('0.01'))))
+                self.assertEqual(_exact(money.hotel_agent_fee(*args)), _exact(legacy_fee))
+                self.assertEqual(_exact(HotelBooking(**row).calculate_subtotal()), _exact(money.hotel_subtotal(*args)))
+
+    def test_job_batch_matches_per_instance_totals_helpers(self):
+        rows = list(self.job_rows())
+        as_tuples = [tuple(row[field] for field in money.JOB_FIELDS) for row in rows]
+        figures = money.job_figures(rows)
+        self.assertEqual(money.job_figures(as_tuples), figures)
+        for row, (fee, margin) in zip(rows, figures):
+            job = Job(**row)
+            with self.subTest(**row):
+                self.assertEqual(_exact(fee), _exact(totals_reporting._job_agent_fee_from_subtotal_or_fallback(job)))
+                self.assertEqual(_exact(margin), _exact(totals_reporting.job_kt_margin_eur(job)))
+
+    def test_hotel_batch_matches_per_instance_totals_helpers(self):
+        rows = list(self.hotel_rows())
+        as_tuples = [tuple(row[field] for field in money.HOTEL_FIELDS) for row in rows]
+        figures = money.hotel_figures(rows)
+        self.assertEqual(money.hotel_figures(as_tuples), figures)
+        for row, (fee, margin) in zip(rows, figures):
+            hotel = HotelBooking(**row)
+            with self.subTest(**row):
+                self.assertEqual(_exact(fee), _exact(totals_reporting._hotel_agent_fee_from_subtotal_or_fallback(hotel)))
+                self.assertEqual(_exact(margin), _exact(totals_reporting.hotel_kt_margin_eur(hotel)))
+
+    def test_batch_subtotals_match_scalar(self):
+        jobs = list(self.job_rows())
+        self.assertEqual(
+            money.job_subtotals(jobs),
+            [money.job_subtotal(r['job_price_in_euros'], r['driver_fee_in_euros'], r['agent_percentage']) for r in jobs],
+        )
+        hotels = list(self.hotel_rows())
+        self.assertEqual(
+            money.hotel_subtotals(hotels),
+            [money.hotel_subtotal(r['customer_pays_in_euros'], r['agent_percentage']) for r in hotels],
+        )
+
+    def test_computed_margin_and_fees_add_up_to_price(self):
+        for row in self.job_rows():
+            price = row['job_price_in_euros'] or Decimal('0.00')
+            driver_fee = row['driver_fee_in_euros'] or Decimal('0.00')
+            fee, margin = money.job_figures([{**row, 'subtotal': None}])[0]
+            with self.subTest(**row):
+                self.assertEqual(margin + fee + driver_fee, price)
+
+    def test_stored_subtotal_never_yields_negative_agent_fee(self):
+        for row in self.job_rows():
+            if row['subtotal'] is None:
+                continue
+            fee, _margin = money.job_figures([row])[0]
+            self.assertGreaterEqual(fee, Decimal('0.00'))
+
+    def test_cc_fee_matches_legacy(self):
+        percentages = (None, Decimal('0'), Decimal('7.00'), Decimal('2.50'), Decimal('12.75'))
+        for percentage in percentages:
+            amounts = [_amount(self.rng, none_share=0) for _ in range(SAMPLES)]
+            types = [self.rng.choice(PAYMENT_TYPES) for _ in range(SAMPLES)]
+            expected = [_legacy_cc_fee(a, t, percentage) for a, t in zip(amounts, types)]
+            self.assertEqual(
+                [_exact(fee) for fee in money.cc_fees(amounts, types, percentage)],
+                [_exact(fee) for fee in expected],
+            )
+
+    def test_to_eur_rounds_to_the_cent(self):
+        for _ in range(SAMPLES):
+            amount = _amount(self.rng)
+            rate = Decimal(self.rng.randint(1, 2000000)) / 10000
+            expected = None if amount is None else (amount * rate).quantize(Decimal('0.01'))
+            self.assertEqual(_exact(money.to_eur(amount, rate)), _exact(expected))
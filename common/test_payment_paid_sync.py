@@ -1,13 +1,21 @@
+from datetime import time
 from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
 
 import pytz
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
+from analytics.models import JobAnalyticsSummary
+from analytics.services import rebuild_analytics
+from billing.models import MonthlyLedger
 from common.models import Payment
-from common.payment_paid_sync import PAID_AMOUNT_TOLERANCE_EUR, payments_meet_target_eur
+from common.payment_paid_sync import PAID_AMOUNT_TOLERANCE_EUR, payments_meet_target_eur, reconcile_is_paid
 from hotels.models import HotelBooking
 from jobs.models import Job
 from people.models import Agent, Driver, Staff
@@ -419,3 +427,81 @@ class AutoIsPaidHotelTests(TestCase):
         )
         booking.refresh_from_db()
         self.assertFalse(booking.is_paid)
+
+
+class ReconcileIsPaidTests(TestCase):
+    def setUp(self):
+        self.staff = Staff.objects.create(name='Desk')
+        self.job_date = timezone.now().date()
+
+    def mk_job(self, idx, paid=None):
+        with patch('jobs.models.get_exchange_rate', return_value=Decimal('1')):
+            job = Job.objects.create(
+                customer_name=f'Reconcile {idx}',
+                customer_number=f'+36780000{idx:02d}',
+                job_date=self.job_date,
+                job_time=time(9, 0),
+                no_of_passengers=1,
+                job_price=Decimal('100.00'),
+                job_currency='EUR',
+                driver_fee=Decimal('0.00'),
+                driver_currency='EUR',
+                is_confirmed=True,
+            )
+        if paid is not None:
+            Payment.objects.create(
+                job=job,
+                payment_amount=paid,
+                payment_currency='EUR',
+                payment_type='Cash',
+                paid_to_staff=self.staff,
+            )
+        return job
+
+    def test_already_consistent_rows_are_left_alone(self):
+        self.mk_job(1, paid=Decimal('100.00'))
+        self.mk_job(2)
+        self.assertEqual(reconcile_is_paid(Job.objects.all()), {'jobs.Job': []})
+
+    def test_tolerance_change_flips_rows_in_one_select(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            within = self.mk_job(1, paid=Decimal('97.00'))
+            full = self.mk_job(2, paid=Decimal('100.00'))
+            self.mk_job(3)
+        rebuild_analytics()
+        self.assertTrue(Job.objects.get(pk=within.pk).is_paid)
+
+        with patch('common.payment_paid_sync.PAID_AMOUNT_TOLERANCE_EUR', Decimal('0.00')):
+            with CaptureQueriesContext(connection) as ctx:
+                preview = reconcile_is_paid(Job.objects.all(), dry_run=True)
+            self.assertEqual(len(ctx), 1)
+            self.assertEqual(
+                [(c['pk'], c['was_paid'], c['now_paid']) for c in preview['jobs.Job']],
+                [(within.pk, True, False)],
+            )
+            self.assertTrue(Job.objects.get(pk=within.pk).is_paid)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                reconcile_is_paid(Job.objects.all())
+
+        self.assertFalse(Job.objects.get(pk=within.pk).is_paid)
+        self.assertTrue(Job.objects.get(pk=full.pk).is_paid)
+        summary = JobAnalyticsSummary.objects.get(pk=1)
+        self.assertEqual((summary.driving_paid, summary.driving_unpaid), (1, 2))
+        ledger = MonthlyLedger.objects.get(service=MonthlyLedger.SERVICE_DRIVING)
+        self.assertEqual(ledger.open_gmv, Decimal('103.00'))
+
+    def test_command_prints_dry_run_diff_then_fixes_drift(self):
+        job = self.mk_job(1, paid=Decimal('100.00'))
+        Job.objects.filter(pk=job.pk).update(is_paid=False)
+
+        out = StringIO()
+        call_command('reconcile_is_paid', '--dry-run', '--model', 'jobs', stdout=out)
+        self.assertIn(f'jobs.Job #{job.pk}: unpaid -> paid (paid €100.00 of €100.00)', out.getvalue())
+        self.assertIn('Dry run: 1 bookings would change.', out.getvalue())
+        self.assertFalse(Job.objects.get(pk=job.pk).is_paid)
+
+        out = StringIO()
+        call_command('reconcile_is_paid', stdout=out)
+        self.assertIn('is_paid reconciled: 1 bookings changed.', out.getvalue())
+        self.assertTrue(Job.objects.get(pk=job.pk).is_paid)
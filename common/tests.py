@@ -1,253 +1,1065 @@
-from datetime import datetime, timedelta, timezone as datetime_timezone
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as datetime_timezone
 from decimal import Decimal
-from unittest.mock import MagicMock, patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest.mock import patch
 
-import requests
+import openpyxl
+
+from django.conf import settings
 from django.core.cache import cache
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
-from requests.exceptions import RequestException
 
-from common.exchange_rate_models import ExchangeRate
-from common.utils import fetch_and_cache_exchange_rate, get_exchange_rate
+from billing.models import MonthlyLedger
+from common.exchange_rate_models import ExchangeRate, ExchangeRateHistory
+from common.exchange_rates import (
+    REVALIDATE_LOCK_KEY,
+    RateIndex,
+    convert_many,
+    forget_rate_index,
+    rate_on,
+    refresh_exchange_rates,
+    request_revalidation,
+)
+from common.checks import check_cache_shared_by_workers
+from common.customer_models import Customer
+from common.export_models import ExportJob
+from common.export_queue import claim_next_export, purge_old_exports, run_export
+from common.exports import (
+    EXPORT_KINDS,
+    JOB_EXPORT_COLUMNS,
+    JOB_EXPORT_HEADERS,
+    XLSX_CONTENT_TYPE,
+    export_queryset,
+    iter_rows,
+    write_export,
+    write_xlsx,
+)
+from common.models import Payment
+from common.query_plans import CANONICAL_QUERIES, sequential_scans
+from common.search import matching_booking_ids
+from common.search_models import BookingSearchEntry
+from common.utils import get_exchange_rate
+from django.contrib.auth import get_user_model
+from expenses.models import Expense
+from hotels.models import HotelBooking
+from jobs.models import Job
+from people.models import Driver, Staff
+from shuttle.models import Shuttle
 
-class ExchangeRateTests(TestCase):
+PER_EUR = {'EUR': 1, 'GBP': 0.8, 'HUF': 400, 'USD': 1.25}
 
-    def setUp(self):
-        # Don't clear cache globally - only clear in specific tests that need it
-        pass
 
-    @patch('common.utils.requests.get')
-    def test_fetch_and_cache_exchange_rate_success(self, mock_get):
-        # Clear cache for this specific test
-        cache.clear()
-        """Test fetching and caching the exchange rate successfully."""
-        mock_response = {
-            'conversion_rates': {
-                'EUR': '1.20'
-            }
-        }
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = mock_response
+class StubRateServer:
+    """
+    Local stand-in for the rate API: answers every GET with *payload* (or *status*),
+    recording request paths and client ports. Use as a context manager and point
+    ``EXCHANGE_RATE_API_URL`` at ``.url``.
+    """
 
-        # Test for USD to EUR
-        rate = fetch_and_cache_exchange_rate('USD')
+    def __init__(self, payload=None, status=200, delay=0):
+        self.payload = {'result': 'success', 'conversion_rates': PER_EUR} if payload is None else payload
+        self.status = status
+        self.delay = delay
+        self.requests = []
 
-        # Ensure the correct rate is returned
-        self.assertEqual(rate, Decimal('1.20'))
+    def __enter__(self):
+        stub = self
 
-        # Ensure the rate is cached
-        cached_rate = cache.get('exchange_rate_USD')
-        self.assertEqual(cached_rate, Decimal('1.20'))
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.requests.append((self.path, self.client_address[1]))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                body = json.dumps(stub.payload).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/v6'
+        self.settings = override_settings(
+            EXCHANGE_RATE_API_URL=self.url,
+            EXCHANGE_RATE_API_KEY='test-key',
+            EXCHANGE_RATE_TIMEOUT_SECONDS=0.5,
+        )
+        self.settings.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.settings.disable()
+        self.server.shutdown()
+        self.server.server_close()
 
-    @patch('common.utils.requests.get')
-    def test_fetch_and_cache_exchange_rate_failure(self, mock_get):
-        # Clear cache for this specific test
-        cache.clear()
-        """Test handling of API request failure."""
-        mock_get.side_effect = RequestException("API request failed")
 
-        with self.assertRaises(ValueError) as context:
-            fetch_and_cache_exchange_rate('USD')
+def _age_row(currency, rate, age):
+    row = ExchangeRate.objects.create(currency=currency, rate=rate)
+    ExchangeRate.objects.filter(pk=row.pk).update(last_updated=timezone.now() - age)
 
-        self.assertEqual(str(context.exception), "Error fetching exchange rate for USD")
 
-    @patch('common.utils.requests.get')
-    def test_fetch_and_cache_invalid_response(self, mock_get):
-        # Clear cache for this specific test
+class ExchangeRateRefreshTests(TestCase):
+    def setUp(self):
         cache.clear()
-        """Test handling of invalid API response structure."""
-        mock_response = {'unexpected_key': 'some_value'}
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = mock_response
 
-        with self.assertRaises(ValueError) as context:
-            fetch_and_cache_exchange_rate('USD')
+    def test_refresh_fetches_every_currency_in_one_request(self):
+        with StubRateServer() as stub:
+            rates = refresh_exchange_rates()
 
-        self.assertEqual(str(context.exception), "Invalid response structure or missing EUR rate for USD")
+        self.assertEqual(rates, {
+            'GBP': Decimal('1.2500'),
+            'HUF': Decimal('0.0025'),
+            'USD': Decimal('0.8000'),
+        })
+        self.assertEqual([path for path, _ in stub.requests], ['/v6/test-key/latest/EUR'])
+        self.assertEqual(ExchangeRate.objects.get(currency='USD').rate, Decimal('0.8000'))
+        self.assertEqual(cache.get('exchange_rate_GBP'), Decimal('1.2500'))
+        self.assertEqual(
+            list(ExchangeRateHistory.objects.values_list('currency', 'rate')),
+            [('GBP', Decimal('1.2500')), ('HUF', Decimal('0.0025')), ('USD', Decimal('0.8000'))],
+        )
 
-    @patch('common.utils.requests.get')
-    def test_get_exchange_rate_from_cache(self, mock_get):
-        """Test fetching exchange rate from cache."""
-        # Manually cache the rate
-        cache.set('exchange_rate_USD', Decimal('1.15'))
+    def test_refresh_twice_a_day_keeps_one_history_row_per_currency(self):
+        with StubRateServer() as stub:
+            refresh_exchange_rates()
+            stub.payload = {'conversion_rates': {**PER_EUR, 'USD': 1.0}}
+            refresh_exchange_rates()
 
-        # Call get_exchange_rate and ensure API is not called
-        rate = get_exchange_rate('USD')
-        self.assertEqual(rate, Decimal('1.15'))
-        mock_get.assert_not_called()
+        self.assertEqual(ExchangeRateHistory.objects.filter(currency='USD').count(), 1)
+        self.assertEqual(ExchangeRateHistory.objects.get(currency='USD').rate, Decimal('1.0000'))
 
-    @patch('common.utils.requests.get')
-    def test_get_exchange_rate_not_cached(self, mock_get):
-        # Clear cache for this specific test
-        cache.clear()
-        """Test fetching exchange rate when it's not cached (API call happens)."""
-        mock_response = {
-            'conversion_rates': {
-                'EUR': '1.20'
-            }
-        }
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = mock_response
+    def test_refreshes_reuse_the_pooled_connection(self):
+        with StubRateServer() as stub:
+            refresh_exchange_rates()
+            refresh_exchange_rates()
 
-        # Call get_exchange_rate when it's not cached
-        rate = get_exchange_rate('USD')
-        self.assertEqual(rate, Decimal('1.20'))
+        self.assertEqual(len(stub.requests), 2)
+        self.assertEqual(len({port for _, port in stub.requests}), 1)
 
-        # Ensure the rate is now cached
-        cached_rate = cache.get('exchange_rate_USD')
-        self.assertEqual(cached_rate, Decimal('1.20'))
+    def test_http_error_keeps_stored_rates(self):
+        ExchangeRate.objects.create(currency='USD', rate=Decimal('0.9100'))
+        with StubRateServer(status=500):
+            with self.assertRaises(ValueError) as ctx:
+                refresh_exchange_rates()
 
-    @patch('common.utils.requests.get')
-    @patch('common.exchange_rate_models.ExchangeRate.objects')
-    def test_cache_expiration(self, mock_exchange_rate_objects, mock_get):
-        # Clear cache for this specific test
-        cache.clear()
-        """Test that cache expires and fetches new rate after expiration."""
-        # Mock database to raise DoesNotExist
-        mock_exchange_rate_objects.get.side_effect = ExchangeRate.DoesNotExist
+        self.assertEqual(str(ctx.exception), 'Error fetching exchange rates')
+        self.assertEqual(ExchangeRate.objects.get(currency='USD').rate, Decimal('0.9100'))
 
-        # Cache the rate manually
-        cache.set('exchange_rate_USD', Decimal('1.15'), timeout=1)  # 1 second timeout
+    def test_slow_api_times_out(self):
+        with StubRateServer(delay=2):
+            with self.assertRaises(ValueError):
+                refresh_exchange_rates()
+        self.assertFalse(ExchangeRate.objects.exists())
 
-        # Wait for cache to expire
-        import time
-        time.sleep(3)
+    def test_invalid_response_structure(self):
+        with StubRateServer(payload={'unexpected_key': 'some_value'}):
+            with self.assertRaises(ValueError) as ctx:
+                refresh_exchange_rates()
+        self.assertEqual(str(ctx.exception), 'Invalid response structure: missing conversion_rates')
 
-        mock_exchange_rate = MagicMock()
-        mock_exchange_rate.rate = Decimal('1.22')
-        mock_exchange_rate_objects.update_or_create.return_value = (mock_exchange_rate, True)
+    def test_missing_currency_in_response(self):
+        with StubRateServer(payload={'conversion_rates': {'USD': 1.25}}):
+            with self.assertRaises(ValueError) as ctx:
+                refresh_exchange_rates()
+        self.assertIn('missing rate for GBP', str(ctx.exception))
 
-        mock_response = {
-            'conversion_rates': {
-                'EUR': '1.22'
-            }
-        }
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = mock_response
-
-        # Now the cache should be expired, and it should fetch a new rate
-        rate = get_exchange_rate('USD')
-        self.assertEqual(rate, Decimal('1.22'))
-
-        # Ensure the new rate is cached
-        cached_rate = cache.get('exchange_rate_USD')
-        self.assertEqual(cached_rate, Decimal('1.22'))
-
-    @patch('common.utils.requests.get')
-    def test_refetch_after_cache_cleared_when_db_older_than_24h(self, mock_get):
-        """
-        After in-process cache is cleared, a row whose last_updated is >24h behind
-        'now' must trigger a new HTTP fetch (covers the main production refresh path).
-        """
-        cache.clear()
-        base = timezone.now()
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {'conversion_rates': {'EUR': '1.2000'}}
+    def test_command_prints_rates(self):
+        out = StringIO()
+        with StubRateServer():
+            call_command('refresh_exchange_rates', stdout=out)
+        self.assertIn('USD: 0.8000', out.getvalue())
+        self.assertIn('Exchange rates refreshed: 3 currencies.', out.getvalue())
+
+    def test_command_if_stale_skips_fresh_rates(self):
+        for currency in ('GBP', 'HUF', 'USD'):
+            ExchangeRate.objects.create(currency=currency, rate=Decimal('1.0000'))
+        out = StringIO()
+        with StubRateServer() as stub:
+            call_command('refresh_exchange_rates', '--if-stale', stdout=out)
+        self.assertEqual(stub.requests, [])
+        self.assertIn('fresh', out.getvalue())
 
-        rate1 = get_exchange_rate('USD')
-        self.assertEqual(rate1, Decimal('1.2000'))
-        self.assertEqual(mock_get.call_count, 1)
+    def test_command_if_stale_refreshes_old_rates(self):
+        for currency in ('GBP', 'HUF'):
+            ExchangeRate.objects.create(currency=currency, rate=Decimal('1.0000'))
+        _age_row('USD', Decimal('1.0000'), timedelta(hours=25))
+        with StubRateServer() as stub:
+            call_command('refresh_exchange_rates', '--if-stale', stdout=StringIO())
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual(ExchangeRate.objects.get(currency='USD').rate, Decimal('0.8000'))
 
-        mock_get.return_value.json.return_value = {'conversion_rates': {'EUR': '1.2500'}}
-        cache.delete('exchange_rate_USD')
+    def test_command_failure_is_a_command_error(self):
+        with StubRateServer(status=503):
+            with self.assertRaises(CommandError):
+                call_command('refresh_exchange_rates', stdout=StringIO())
 
-        with patch('django.utils.timezone.now', return_value=base + timedelta(hours=25)):
-            rate2 = get_exchange_rate('USD')
 
-        self.assertEqual(rate2, Decimal('1.2500'))
-        self.assertEqual(mock_get.call_count, 2)
+@patch('common.exchange_rates._http_session')
+class ExchangeRateReadTests(TestCase):
+    """``get_exchange_rate`` never calls the API, whatever the state of cache and DB."""
 
-    @patch('common.utils.requests.get')
-    def test_uses_db_without_api_when_row_newer_than_24h(self, mock_get):
-        """Cache miss but DB row 'fresh' (< 24h old): return stored rate, no HTTP."""
+    def setUp(self):
         cache.clear()
-        base = timezone.now()
-        er = ExchangeRate.objects.create(currency='USD', rate=Decimal('0.9100'))
-        ExchangeRate.objects.filter(pk=er.pk).update(last_updated=base - timedelta(hours=3))
 
-        with patch('django.utils.timezone.now', return_value=base):
-            rate = get_exchange_rate('USD')
+    def test_get_exchange_rate_eur(self, mock_session):
+        self.assertEqual(get_exchange_rate('EUR'), Decimal('1.00'))
+        mock_session.assert_not_called()
 
-        self.assertEqual(rate, Decimal('0.9100'))
-        mock_get.assert_not_called()
+    def test_get_exchange_rate_from_cache(self, mock_session):
+        cache.set('exchange_rate_USD', Decimal('1.15'))
+        self.assertEqual(get_exchange_rate('USD'), Decimal('1.15'))
+        mock_session.assert_not_called()
 
-    @patch('common.utils.requests.get')
-    def test_refetch_when_row_age_just_over_24h_even_if_cache_empty(self, mock_get):
-        """Stale DB row (>=24h) with empty cache forces API (no MagicMock / real ORM)."""
-        cache.clear()
-        base = timezone.now()
-        er = ExchangeRate.objects.create(currency='GBP', rate=Decimal('0.8800'))
-        ExchangeRate.objects.filter(pk=er.pk).update(last_updated=base - timedelta(hours=25))
+    def test_cache_wins_even_if_db_row_is_stale(self, mock_session):
+        _age_row('USD', Decimal('0.1000'), timedelta(days=400))
+        cache.set('exchange_rate_USD', Decimal('0.9200'), timeout=3600)
+        self.assertEqual(get_exchange_rate('USD'), Decimal('0.9200'))
+        mock_session.assert_not_called()
 
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {'conversion_rates': {'EUR': '0.9000'}}
+    @patch('common.exchange_rates.request_revalidation')
+    def test_fresh_db_row_is_served_and_cached(self, mock_revalidate, mock_session):
+        _age_row('USD', Decimal('0.9100'), timedelta(hours=3))
 
-        with patch('django.utils.timezone.now', return_value=base):
-            rate = get_exchange_rate('GBP')
+        self.assertEqual(get_exchange_rate('USD'), Decimal('0.9100'))
+        self.assertEqual(cache.get('exchange_rate_USD'), Decimal('0.9100'))
+        mock_revalidate.assert_not_called()
+        mock_session.assert_not_called()
 
-        self.assertEqual(rate, Decimal('0.9000'))
-        mock_get.assert_called_once()
+    @patch('common.exchange_rates.request_revalidation')
+    def test_stale_db_row_is_served_while_revalidating(self, mock_revalidate, mock_session):
+        _age_row('GBP', Decimal('0.8800'), timedelta(hours=25))
 
-    @patch('common.utils.requests.get')
-    def test_boundary_exactly_24h_old_row_still_considered_fresh(self, mock_get):
-        """
-        Condition is strict < (older than 24h). A row exactly 24h behind 'now'
-        still uses DB without calling the API.
-        """
-        cache.clear()
+        self.assertEqual(get_exchange_rate('GBP'), Decimal('0.8800'))
+        mock_revalidate.assert_called_once_with()
+        mock_session.assert_not_called()
+
+    @patch('common.exchange_rates.request_revalidation')
+    def test_boundary_exactly_24h_old_row_still_considered_fresh(self, mock_revalidate, mock_session):
         base = timezone.now()
-        er = ExchangeRate.objects.create(currency='HUF', rate=Decimal('0.0026'))
-        ExchangeRate.objects.filter(pk=er.pk).update(last_updated=base - timedelta(hours=24))
+        row = ExchangeRate.objects.create(currency='HUF', rate=Decimal('0.0026'))
+        ExchangeRate.objects.filter(pk=row.pk).update(last_updated=base - timedelta(hours=24))
 
         with patch('django.utils.timezone.now', return_value=base):
-            rate = get_exchange_rate('HUF')
+            self.assertEqual(get_exchange_rate('HUF'), Decimal('0.0026'))
+        mock_revalidate.assert_not_called()
+
+    @patch('common.exchange_rates.request_revalidation')
+    def test_staleness_uses_rolling_24h_not_calendar_midnight_budapest(self, mock_revalidate, mock_session):
+        t0 = datetime(2024, 6, 15, 20, 0, 0, tzinfo=datetime_timezone.utc)
+        row = ExchangeRate.objects.create(currency='USD', rate=Decimal('1.1000'))
+        ExchangeRate.objects.filter(pk=row.pk).update(last_updated=t0 - timedelta(hours=23))
+
+        with patch('django.utils.timezone.now', return_value=t0):
+            self.assertEqual(get_exchange_rate('USD'), Decimal('1.1000'))
+        mock_revalidate.assert_not_called()
 
-        self.assertEqual(rate, Decimal('0.0026'))
-        mock_get.assert_not_called()
+    @patch('common.exchange_rates.request_revalidation')
+    def test_missing_rate_raises_without_network(self, mock_revalidate, mock_session):
+        with self.assertRaises(ValueError) as ctx:
+            get_exchange_rate('USD')
+        self.assertIn('No exchange rate stored for USD', str(ctx.exception))
+        mock_revalidate.assert_called_once_with()
+        mock_session.assert_not_called()
 
-    @patch('common.utils.requests.get')
-    def test_cache_wins_even_if_db_row_is_stale(self, mock_get):
-        """Documented behaviour: while cache key exists, DB age is ignored."""
+
+class RevalidationTests(TestCase):
+    def setUp(self):
         cache.clear()
-        base = timezone.now()
-        er = ExchangeRate.objects.create(currency='USD', rate=Decimal('0.1000'))
-        ExchangeRate.objects.filter(pk=er.pk).update(last_updated=base - timedelta(days=400))
-        cache.set('exchange_rate_USD', Decimal('0.9200'), timeout=3600)
 
-        with patch('django.utils.timezone.now', return_value=base):
-            rate = get_exchange_rate('USD')
+    @override_settings(EXCHANGE_RATE_API_KEY='test-key', EXCHANGE_RATE_BACKGROUND_REFRESH=True)
+    @patch('common.exchange_rates.threading.Thread')
+    def test_one_background_refresh_at_a_time(self, mock_thread):
+        request_revalidation()
+        request_revalidation()
+        mock_thread.return_value.start.assert_called_once_with()
+        self.assertTrue(cache.get(REVALIDATE_LOCK_KEY))
+
+    @override_settings(EXCHANGE_RATE_API_KEY=None, EXCHANGE_RATE_BACKGROUND_REFRESH=True)
+    @patch('common.exchange_rates.threading.Thread')
+    def test_no_refresh_without_api_key(self, mock_thread):
+        request_revalidation()
+        mock_thread.assert_not_called()
+
+    @override_settings(EXCHANGE_RATE_API_KEY='test-key', EXCHANGE_RATE_BACKGROUND_REFRESH=False)
+    @patch('common.exchange_rates.threading.Thread')
+    def test_no_refresh_when_disabled(self, mock_thread):
+        request_revalidation()
+        mock_thread.assert_not_called()
+
+
+class RateHistoryTests(TestCase):
+    def setUp(self):
+        forget_rate_index()
+        self.addCleanup(forget_rate_index)
+        for day, rate in ((date(2024, 1, 1), '0.9000'), (date(2024, 3, 1), '0.9500'), (date(2024, 6, 1), '0.9300')):
+            ExchangeRateHistory.objects.create(currency='USD', date=day, rate=Decimal(rate))
+        ExchangeRateHistory.objects.create(currency='GBP', date=date(2024, 1, 1), rate=Decimal('1.1500'))
+        ExchangeRate.objects.create(currency='HUF', rate=Decimal('0.0025'))
+
+    def test_rate_on_uses_latest_row_on_or_before_the_day(self):
+        self.assertEqual(rate_on('USD', date(2024, 2, 29)), Decimal('0.9000'))
+        self.assertEqual(rate_on('USD', date(2024, 3, 1)), Decimal('0.9500'))
+        self.assertEqual(rate_on('USD', date(2025, 1, 1)), Decimal('0.9300'))
+
+    def test_days_before_history_use_the_first_row(self):
+        self.assertEqual(rate_on('USD', date(2020, 5, 5)), Decimal('0.9000'))
+
+    def test_currency_without_history_falls_back_to_latest_rate(self):
+        self.assertEqual(rate_on('HUF', date(2024, 2, 1)), Decimal('0.0025'))
+
+    def test_unknown_currency_raises(self):
+        with self.assertRaises(ValueError):
+            RateIndex.load().rate_on('CHF', date(2024, 2, 1))
+
+    def test_datetimes_convert_at_their_budapest_day(self):
+        # 23:30 UTC on 29 Feb is already 1 March in Budapest
+        late = datetime(2024, 2, 29, 23, 30, tzinfo=datetime_timezone.utc)
+        self.assertEqual(rate_on('USD', late), Decimal('0.9500'))
+
+    def test_convert_many_reads_history_once(self):
+        amounts = [Decimal('100.00'), None, Decimal('10.00'), Decimal('200.00'), Decimal('1000')] * 400
+        currencies = ['USD', 'USD', 'EUR', 'GBP', 'HUF'] * 400
+        dates = [date(2024, 4, 1), date(2024, 4, 1), date(2024, 4, 1), date(2024, 4, 1), date(2024, 4, 1)] * 400
+
+        with CaptureQueriesContext(connection) as ctx:
+            converted = convert_many(amounts, currencies, dates)
+        self.assertEqual(len(ctx), 2)  # history + latest rates
+        self.assertEqual(
+            converted[:5],
+            [Decimal('95.00'), None, Decimal('10.00'), Decimal('230.00'), Decimal('2.50')],
+        )
+        self.assertEqual(len(converted), 2000)
+
+        with CaptureQueriesContext(connection) as ctx:
+            convert_many([Decimal('1.00')], ['USD'], [date(2024, 1, 2)])
+        self.assertEqual(len(ctx), 0)
+
+
+class RevalueEurTests(TestCase):
+    """Rows saved at a bad USD rate (1.0) revalued against the stored 0.9."""
+
+    def setUp(self):
+        forget_rate_index()
+        self.addCleanup(forget_rate_index)
+        self.day = date(2025, 3, 10)
+        ExchangeRate.objects.create(currency='USD', rate=Decimal('0.9000'))
+        ExchangeRateHistory.objects.create(currency='USD', date=date(2025, 1, 1), rate=Decimal('0.9000'))
+        staff = Staff.objects.create(name='Desk')
+        with patch('jobs.models.get_exchange_rate', return_value=Decimal('1.0')), \
+                patch('common.models.get_exchange_rate', return_value=Decimal('1.0')), \
+                patch('expenses.models.get_exchange_rate', return_value=Decimal('1.0')):
+            self.job = Job.objects.create(
+                customer_name='Revalue',
+                customer_number='+3670000000',
+                job_date=self.day,
+                job_time=datetime(2025, 3, 10, 9, 0).time(),
+                no_of_passengers=1,
+                job_price=Decimal('100.00'),
+                job_currency='EUR',
+                driver_fee=Decimal('50.00'),
+                driver_currency='USD',
+                is_confirmed=True,
+            )
+            self.payment = Payment.objects.create(
+                job=self.job,
+                payment_amount=Decimal('100.00'),
+                payment_currency='USD',
+                payment_type='Cash',
+                paid_to_staff=staff,
+            )
+            self.expense = Expense.objects.create(
+                expense_type='fuel',
+                expense_amount=Decimal('20.00'),
+                expense_currency='USD',
+                expense_date=self.day,
+                expense_time=datetime(2025, 3, 10, 9, 0).time(),
+            )
+        self.job.refresh_from_db()
+        self.assertTrue(self.job.is_paid)
+        self.assertEqual(self.job.subtotal, Decimal('50.00'))
+
+    def test_dry_run_lists_changes_without_writing(self):
+        out = StringIO()
+        call_command('revalue_eur', '--dry-run', stdout=out)
+        output = out.getvalue()
+
+        self.assertIn(f'jobs.Job #{self.job.pk}: driver_fee_in_euros 50.00 -> 45.00, subtotal 50.00 -> 55.00', output)
+        self.assertIn(f'common.Payment #{self.payment.pk}: payment_amount_in_euros 100.00 -> 90.00', output)
+        self.assertIn(f'expenses.Expense #{self.expense.pk}: expense_amount_in_euros 20.00 -> 18.00', output)
+        self.assertIn('Dry run: 3 rows would change.', output)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.driver_fee_in_euros, Decimal('50.00'))
+
+    def test_revalue_writes_rows_ledger_and_paid_flags(self):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('revalue_eur', '--batch-size', '1', stdout=out)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.driver_fee_in_euros, Decimal('45.00'))
+        self.assertEqual(self.job.subtotal, Decimal('55.00'))
+        self.assertFalse(self.job.is_paid)  # 90 EUR paid of 100
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_amount_in_euros, Decimal('90.00'))
+        self.expense.refresh_from_db()
+        self.assertEqual(self.expense.expense_amount_in_euros, Decimal('18.00'))
+
+        ledger = MonthlyLedger.objects.get(service=MonthlyLedger.SERVICE_DRIVING)
+        self.assertEqual((ledger.kt_margin, ledger.paid, ledger.open_gmv), (Decimal('55.00'), Decimal('90.00'), Decimal('10.00')))
+        self.assertEqual(
+            MonthlyLedger.objects.get(service=MonthlyLedger.SERVICE_EXPENSES).expenses, Decimal('18.00')
+        )
+        self.assertIn('jobs.Job: 1 rows checked, 1 changed', out.getvalue())
+        self.assertIn('EUR amounts revalued: 3 rows changed, 1 paid flags updated.', out.getvalue())
+
+    def test_second_run_changes_nothing(self):
+        call_command('revalue_eur', stdout=StringIO())
+        out = StringIO()
+        call_command('revalue_eur', '--model', 'jobs', stdout=out)
+        self.assertIn('EUR amounts revalued: 0 rows changed, 0 paid flags updated.', out.getvalue())
+
+    def test_rows_before_the_rate_history_are_left_unchanged(self):
+        with patch('jobs.models.get_exchange_rate', return_value=Decimal('1.0')):
+            early = Job.objects.create(
+                customer_name='Before history',
+                customer_number='+3670000001',
+                job_date=date(2024, 12, 31),
+                job_time=datetime(2024, 12, 31, 9, 0).time(),
+                no_of_passengers=1,
+                job_price=Decimal('100.00'),
+                job_currency='EUR',
+                driver_fee=Decimal('50.00'),
+                driver_currency='USD',
+            )
+        out = StringIO()
+        call_command('revalue_eur', '--model', 'jobs', stdout=out)
+
+        early.refresh_from_db()
+        self.assertEqual(early.driver_fee_in_euros, Decimal('50.00'))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.driver_fee_in_euros, Decimal('45.00'))
+        self.assertIn('jobs.Job: 2 rows checked, 1 changed, 1 skipped (dated before the rate history)', out.getvalue())
+
+    def test_warns_when_most_rows_predate_the_history(self):
+        ExchangeRateHistory.objects.update(date=date(2025, 6, 1))
+        out, err = StringIO(), StringIO()
+        call_command('revalue_eur', stdout=out, stderr=err)
+
+        self.assertIn('3 of 3 rows are dated before the rate history starts', err.getvalue())
+        self.assertIn('EUR amounts revalued: 0 rows changed', out.getvalue())
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.driver_fee_in_euros, Decimal('50.00'))
+
+        err = StringIO()
+        call_command('revalue_eur', '--rates', 'current', stdout=StringIO(), stderr=err)
+        self.assertEqual(err.getvalue(), '')
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.driver_fee_in_euros, Decimal('45.00'))
+
+    def test_currency_and_period_options_limit_the_rows(self):
+        for options in (['--currency', 'GBP'], ['--since', '2025-03-11'], ['--until', '2025-03-09']):
+            out = StringIO()
+            call_command('revalue_eur', '--dry-run', *options, stdout=out)
+            self.assertIn('Dry run: 0 rows would change.', out.getvalue(), options)
+
+        out = StringIO()
+        call_command(
+            'revalue_eur', '--dry-run', '--currency', 'usd', '--since', '2025-03-10', '--until', '2025-03-10',
+            stdout=out,
+        )
+        self.assertIn('Dry run: 3 rows would change.', out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('revalue_eur', '--since', '2025-03-11', '--until', '2025-03-10', stdout=StringIO())
+
+    def test_chunk_reads_do_not_grow_with_rows(self):
+        for _ in range(20):
+            Payment.objects.create(job=self.job, payment_amount=Decimal('1.00'), payment_currency='EUR')
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('revalue_eur', '--model', 'payments', '--dry-run', stdout=StringIO())
+        payment_reads = [q for q in ctx.captured_queries if 'FROM "common_payment"' in q['sql']]
+        self.assertEqual(len(payment_reads), 2)  # one chunk of 21 rows, then the empty tail
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+DB_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'kt_cache_table'}}
 
-        self.assertEqual(rate, Decimal('0.9200'))
-        mock_get.assert_not_called()
 
-    @patch('common.utils.requests.get')
-    def test_staleness_uses_rolling_24h_not_calendar_midnight_budapest(self, mock_get):
-        """
-        Refresh policy is a rolling 24h window vs last_updated (timezone-aware),
-        not local calendar midnight. Uses a fixed UTC instant so the test is deterministic.
-        """
+class CacheBackendCheckTests(TestCase):
+    def test_warns_about_locmem_with_several_workers(self):
+        for caches, workers, expected in (
+            (LOCMEM_CACHE, '3', ['common.W001']),
+            (LOCMEM_CACHE, '1', []),
+            (LOCMEM_CACHE, '', []),
+            (DB_CACHE, '3', []),
+        ):
+            with self.subTest(caches=caches['default']['BACKEND'], workers=workers), \
+                    override_settings(CACHES=caches), patch.dict(os.environ, {'WEB_CONCURRENCY': workers}):
+                self.assertEqual([message.id for message in check_cache_shared_by_workers(None)], expected)
+
+    def test_production_settings_default_to_the_db_cache(self):
+        with patch.dict(os.environ):
+            os.environ.pop('CACHE_BACKEND', None)
+            production = importlib.reload(importlib.import_module('config.settings.production'))
+        self.assertEqual(production.CACHES['default']['BACKEND'], 'django.core.cache.backends.db.DatabaseCache')
+
+    def test_export_worker_warns_on_a_per_process_cache(self):
+        err = StringIO()
+        with override_settings(CACHES=LOCMEM_CACHE):
+            call_command('run_export_worker', '--once', stdout=StringIO(), stderr=err)
+        self.assertIn('CACHE_BACKEND=locmem', err.getvalue())
+
+
+class QueryPlanAuditTests(TestCase):
+    def test_canonical_queries_use_indexes(self):
+        out = StringIO()
+        call_command('explain_queries', '--fail-on-seq-scan', stdout=out)
+        self.assertIn(f'{len(CANONICAL_QUERIES)} queries explained, 0 with unexpected', out.getvalue())
+        self.assertIn('balances.payments: ok (expected full scan of common_payment)', out.getvalue())
+
+    def test_unindexed_filter_is_flagged(self):
+        unindexed = (lambda now: Job.objects.filter(customer_name='Nobody'), ())
+        out = StringIO()
+        with patch.dict(CANONICAL_QUERIES, {'jobs.by_customer_name': unindexed}), \
+                self.assertRaisesMessage(CommandError, 'jobs.by_customer_name'):
+            call_command('explain_queries', '--fail-on-seq-scan', stdout=out)
+        self.assertIn('jobs.by_customer_name: sequential scan on jobs_job', out.getvalue())
+
+    def test_sequential_scans_parses_sqlite_and_postgres_plans(self):
+        sqlite_plan = (
+            '3 0 216 SCAN jobs_job\n'
+            '5 0 45 SEARCH people_agent USING INTEGER PRIMARY KEY (rowid=?)\n'
+            '7 0 0 SCAN billing_monthlyledger USING COVERING INDEX billing_ledger_year_month'
+        )
+        self.assertEqual(sequential_scans(sqlite_plan, 'sqlite'), ['jobs_job'])
+        postgres_plan = (
+            'Nested Loop  (cost=0.00..1.00 rows=1 width=8)\n'
+            '  ->  Seq Scan on common_payment  (cost=0.00..1.00 rows=1 width=8)\n'
+            '  ->  Index Scan using job_confirmed_date_idx on jobs_job  (cost=0.00..1.00 rows=1 width=8)'
+        )
+        self.assertEqual(sequential_scans(postgres_plan, 'postgresql'), ['common_payment'])
+
+
+class BookingFixturesMixin:
+    def setUp(self):
+        self.driver = Driver.objects.create(name='Search Driver')
+        self.yesterday = timezone.now() - timedelta(days=1)
+        user = get_user_model().objects.create_user(username='searcher', password='password')
+        self.client.force_login(user)
+
+    def make_job(self, **fields):
+        values = {
+            'customer_name': 'Anna Kovács',
+            'customer_number': '+36201234567',
+            'job_date': self.yesterday.date(),
+            'job_time': self.yesterday.time(),
+            'job_price': Decimal('100.00'),
+            'job_currency': 'EUR',
+            'pick_up_location': 'Ferihegy Terminal 2',
+            'no_of_passengers': 1,
+            'driver': self.driver,
+            'is_confirmed': True,
+        }
+        values.update(fields)
+        return Job.objects.create(**values)
+
+    def make_shuttle(self, **fields):
+        values = {
+            'customer_name': 'Bence Nagy',
+            'customer_number': '+36309876543',
+            'shuttle_date': self.yesterday.date(),
+            'shuttle_direction': 'buda_keres',
+            'no_of_passengers': 2,
+            'driver': self.driver,
+            'is_confirmed': True,
+        }
+        values.update(fields)
+        return Shuttle.objects.create(**values)
+
+    def make_hotel(self, **fields):
+        values = {
+            'customer_name': 'Clara Smithson',
+            'customer_number': '+447700900123',
+            'check_in': self.yesterday,
+            'check_out': self.yesterday + timedelta(days=2),
+            'hotel_name': 'Hilton Budapest',
+            'no_of_people': 1,
+            'rooms': 1,
+            'hotel_price': Decimal('100.00'),
+            'hotel_price_currency': 'EUR',
+            'customer_pays': Decimal('120.00'),
+            'customer_pays_currency': 'EUR',
+            'is_confirmed': True,
+        }
+        values.update(fields)
+        return HotelBooking.objects.create(**values)
+
+
+@patch('hotels.models.get_exchange_rate', return_value=Decimal('1.00'))
+@patch('jobs.models.get_exchange_rate', return_value=Decimal('1.00'))
+class BookingSearchTests(BookingFixturesMixin, TestCase):
+    def matches(self, kind, term, field='document'):
+        return set(matching_booking_ids(kind, term, field).values_list('booking_id', flat=True))
+
+    def past_results(self, query):
+        response = self.client.get(reverse('jobs:past_jobs'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return {(item.type, item.pk) for item in response.context['past_jobs']}
+
+    def test_search_matches_icontains_semantics(self, *_mocks):
+        job = self.make_job(job_description='Wheelchair access', public_id='AB12CD34')
+        other = self.make_job(customer_name='Dóra Fekete', pick_up_location='Keleti')
+        shuttle = self.make_shuttle()
+        hotel = self.make_hotel()
+        for term, expected in (
+            ('kovács', {('job', job.pk)}),
+            ('CHAIR', {('job', job.pk)}),
+            ('ab12cd', {('job', job.pk)}),
+            ('terminal', {('job', job.pk)}),
+            ('eleti', {('job', other.pk)}),
+            ('+36', {('job', job.pk), ('job', other.pk), ('shuttle', shuttle.pk)}),
+            ('smith', {('hotel', hotel.pk)}),
+            ('na', {('job', job.pk), ('shuttle', shuttle.pk)}),
+            ('nobody', set()),
+        ):
+            with self.subTest(term=term):
+                self.assertEqual(self.past_results(term), expected)
+
+    def test_term_does_not_match_across_fields(self, *_mocks):
+        self.make_job(customer_name='Anna', customer_number='555')
+        self.assertEqual(self.matches('job', 'anna 555'), set())
+
+    def test_index_follows_updates_and_deletes(self, *_mocks):
+        job = self.make_job()
+        job.customer_name = 'Renamed Customer'
+        job.save()
+        self.assertEqual(self.matches('job', 'renamed', 'name'), {job.pk})
+        self.assertEqual(self.matches('job', 'kovács', 'name'), set())
+        pk = job.pk
+        job.delete()
+        self.assertEqual(self.matches('job', 'renamed'), set())
+        self.assertFalse(BookingSearchEntry.objects.filter(kind='job', booking_id=pk).exists())
+
+    def test_save_without_search_changes_skips_index_write(self, *_mocks):
+        job = self.make_job()
+        job = Job.objects.get(pk=job.pk)
+        job.job_notes = 'Gate B'
+        with CaptureQueriesContext(connection) as ctx:
+            job.save()
+        self.assertFalse(any('common_bookingsearchentry' in q['sql'] for q in ctx.captured_queries))
+
+    def test_rebuild_command_restores_rows_after_bulk_update(self, *_mocks):
+        job = self.make_job()
+        hotel = self.make_hotel()
+        Job.objects.filter(pk=job.pk).update(customer_name='Bulk Updated')
+        self.assertEqual(self.matches('job', 'bulk'), set())
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Search index rebuilt (2 rows).', out.getvalue())
+        self.assertEqual(self.matches('job', 'bulk'), {job.pk})
+        self.assertEqual(self.matches('hotel', 'smith'), {hotel.pk})
+
+
+@patch('hotels.models.get_exchange_rate', return_value=Decimal('1.00'))
+@patch('jobs.models.get_exchange_rate', return_value=Decimal('1.00'))
+class CustomerDirectoryTests(BookingFixturesMixin, TestCase):
+    def directory(self):
+        return {
+            (c.name, c.number, c.email): c.usage_count
+            for c in Customer.objects.all()
+        }
+
+    def test_bookings_are_deduplicated_across_tables(self, *_mocks):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_job(customer_email='Anna@Example.com')
+            self.make_job(customer_name='anna kovács ', customer_email='anna@example.com')
+            self.make_shuttle(customer_name='Anna Kovács', customer_number='+36201234567')
+            self.make_hotel()
+        self.assertEqual(self.directory(), {
+            ('anna kovács', '+36201234567', 'anna@example.com'): 2,
+            ('Anna Kovács', '+36201234567', ''): 1,
+            ('Clara Smithson', '+447700900123', ''): 1,
+        })
+
+    def test_one_directory_write_per_transaction(self, *_mocks):
+        with self.captureOnCommitCallbacks() as callbacks:
+            for _ in range(3):
+                self.make_shuttle()
+        self.assertEqual(Customer.objects.count(), 0)
+        with CaptureQueriesContext(connection) as ctx:
+            for callback in callbacks:
+                callback()
+        writes = [q for q in ctx.captured_queries if 'common_customer' in q['sql']]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(self.directory(), {('Bence Nagy', '+36309876543', ''): 3})
+
+    def test_renames_and_deletes_move_the_counts(self, *_mocks):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.make_shuttle()
+            second = self.make_shuttle()
+        with self.captureOnCommitCallbacks(execute=True):
+            second.customer_name = 'Bence Nagy-Tóth'
+            second.save()
+        self.assertEqual(self.directory(), {
+            ('Bence Nagy', '+36309876543', ''): 1,
+            ('Bence Nagy-Tóth', '+36309876543', ''): 1,
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.directory(), {('Bence Nagy-Tóth', '+36309876543', ''): 1})
+
+    def test_unrelated_edits_queue_nothing(self, *_mocks):
+        with self.captureOnCommitCallbacks(execute=True):
+            shuttle = self.make_shuttle()
+        shuttle.no_of_passengers = 5
+        with self.captureOnCommitCallbacks() as callbacks:
+            shuttle.save()
+        with CaptureQueriesContext(connection) as ctx:
+            for callback in callbacks:
+                callback()
+        self.assertFalse(any('common_customer' in q['sql'] for q in ctx.captured_queries))
+
+    def test_autocomplete_is_prefix_ranked_by_use_then_recency(self, *_mocks):
+        old = timezone.now() - timedelta(days=30)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_job(customer_name='Anna Kovács', customer_email='anna@example.com', created_at=old)
+            self.make_shuttle(customer_name='Anna Kovács', customer_number='+36201234567', created_at=old)
+            self.make_shuttle(customer_name='Anna Kovács', customer_number='+36201234567')
+            self.make_hotel(customer_name='Annabel Lee', customer_number='+36201234999')
+            self.make_hotel(customer_name='Joanna Kiss', customer_number='+36209999999')
+        url = reverse('common:customer_suggestions')
+
+        with CaptureQueriesContext(connection) as ctx:
+            names = self.client.get(url, {'field': 'name', 'term': 'ANNA'}).json()
+        self.assertEqual(len([q for q in ctx.captured_queries if 'common_customer' in q['sql']]), 1)
+        self.assertEqual(names, [
+            {'name': 'Anna Kovács', 'number': '+36201234567', 'email': ''},
+            {'name': 'Annabel Lee', 'number': '+36201234999', 'email': ''},
+            {'name': 'Anna Kovács', 'number': '+36201234567', 'email': 'anna@example.com'},
+        ])
+        numbers = self.client.get(url, {'field': 'number', 'term': '+3620123'}).json()
+        self.assertEqual(numbers, ['+36201234567', '+36201234999'])
+
+    def test_rebuild_command_matches_incremental_upkeep(self, *_mocks):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_job(customer_email='anna@example.com')
+            self.make_shuttle(created_at=timezone.now() - timedelta(days=2))
+            self.make_shuttle(customer_name=' bence nagy', created_at=timezone.now() - timedelta(days=1))
+            self.make_hotel()
+        incremental = self.directory()
+        Customer.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_customer_directory', stdout=out)
+        self.assertIn('Customer directory rebuilt (3 customers).', out.getvalue())
+        self.assertEqual(self.directory(), incremental)
+
+
+@override_settings(EXPORTS_IN_BACKGROUND=False)
+@patch('hotels.models.get_exchange_rate', return_value=Decimal('1.00'))
+@patch('jobs.models.get_exchange_rate', return_value=Decimal('1.00'))
+class CsvExportTests(BookingFixturesMixin, TestCase):
+    def pay(self, **booking):
+        return Payment.objects.create(
+            payment_amount=Decimal('50.00'),
+            payment_currency='EUR',
+            payment_type='Cash',
+            paid_to_driver=self.driver,
+            **booking,
+        )
+
+    def export(self, name, **params):
+        response = self.client.get(
+            reverse(f'common:{name}'), {'format': 'csv', 'year': self.yesterday.year, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response
+
+    def read(self, response):
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_rows_include_payees_and_payment_summary(self, *_mocks):
+        job = self.make_job()
+        self.pay(job=job)
+        shuttle = self.make_shuttle()
+        self.pay(shuttle=shuttle)
+        hotel = self.make_hotel()
+        self.pay(hotel_booking=hotel)
+        summary = 'Payment 1: EUR50.00 (Cash, to Driver: Search Driver)'
+
+        jobs = self.read(self.export('export_jobs'))
+        self.assertEqual(jobs[0][:2], ['Customer Name', 'Customer Number'])
+        self.assertEqual(jobs[1][0], 'Anna Kovács')
+        self.assertEqual(jobs[1][15], 'Search Driver')
+        self.assertEqual(jobs[1][-1], summary)
+        shuttles = self.read(self.export('export_shuttles'))
+        self.assertEqual(shuttles[1][-2:], ['Search Driver', summary])
+        hotels = self.read(self.export('export_hotels'))
+        self.assertEqual((hotels[1][2], hotels[1][-1]), ('Hilton Budapest', summary))
+
+    def test_query_count_does_not_grow_with_rows(self, *_mocks):
+        def export_queries():
+            response = self.export('export_jobs')
+            with CaptureQueriesContext(connection) as ctx:
+                rows = self.read(response)
+            return len(rows) - 1, len(ctx.captured_queries)
+
+        self.pay(job=self.make_job())
+        one_row, few = export_queries()
+        for _ in range(20):
+            self.pay(job=self.make_job(customer_name='Other Customer'))
+        many_rows, many = export_queries()
+        self.assertEqual((one_row, many_rows), (1, 21))
+        # The job rows (drivers and agents joined) and one payments-with-payees query per chunk
+        self.assertEqual(few, 2)
+        self.assertEqual(many, few)
+        with patch('common.exports.EXPORT_CHUNK_SIZE', 10):
+            self.assertEqual(export_queries(), (21, 4))
+
+
+@override_settings(EXPORTS_IN_BACKGROUND=False)
+@patch('hotels.models.get_exchange_rate', return_value=Decimal('1.00'))
+@patch('jobs.models.get_exchange_rate', return_value=Decimal('1.00'))
+class XlsxExportTests(BookingFixturesMixin, TestCase):
+    def export(self, name):
+        response = self.client.get(reverse(f'common:{name}'), {'format': 'xlsx', 'year': self.yesterday.year})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        return openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+
+    def test_views_write_typed_rows_with_styled_header(self, *_mocks):
+        job = self.make_job(kilometers=Decimal('25.5'))
+        Payment.objects.create(
+            job=job, payment_amount=Decimal('50.00'), payment_currency='EUR',
+            payment_type='Cash', paid_to_driver=self.driver,
+        )
+        self.make_shuttle()
+        self.make_hotel()
+
+        jobs = self.export('export_jobs')
+        self.assertEqual([cell.value for cell in jobs[1]], JOB_EXPORT_HEADERS)
+        self.assertTrue(jobs['A1'].font.b)
+        self.assertEqual(jobs['A1'].fill.start_color.rgb, '00FFA500')
+        self.assertEqual((jobs.freeze_panes, jobs.auto_filter.ref), ('A2', 'A1:T1'))
+        self.assertEqual(jobs['D2'].value, job.job_time.strftime('%H:%M'))
+        self.assertEqual((jobs['G2'].value, jobs['K2'].value), (25.5, 100.0))
+        self.assertEqual(jobs['T2'].value, 'Payment 1: EUR50.00 (Cash, to Driver: Search Driver)')
+
+        self.assertEqual(self.export('export_shuttles')['A2'].value, 'Bence Nagy')
+        hotels = self.export('export_hotels')
+        self.assertIsInstance(hotels['F2'].value, datetime)
+        self.assertEqual(hotels['N2'].value, 120.0)
+
+    def test_column_widths_come_from_header_and_first_rows(self, *_mocks):
+        rows = [['short', 1], ['a much longer value', 2], ['x' * 60, 3]]
+        out = io.BytesIO()
+        write_xlsx(out, 'Widths', ['Name', 'Number'], rows, width_sample=2)
+        sheet = openpyxl.load_workbook(io.BytesIO(out.getvalue())).active
+        self.assertEqual(sheet.column_dimensions['A'].width, len('a much longer value') + 2)
+        self.assertEqual(sheet.column_dimensions['B'].width, len('Number') + 2)
+        self.assertEqual(sheet.max_row, 4)
+        self.assertEqual(sheet['A4'].value, 'x' * 60)
+
+    def test_benchmark_command_reports_time_and_rss(self, *_mocks):
+        out = StringIO()
+        call_command('benchmark_xlsx_export', '--rows', '200', stdout=out)
+        self.assertRegex(out.getvalue(), r'write-only: 200 jobs in [\d.]+s, peak RSS [\d.]+ MB')
+
+
+
+@override_settings(EXPORTS_IN_BACKGROUND=False)
+@patch('hotels.models.get_exchange_rate', return_value=Decimal('1.00'))
+@patch('jobs.models.get_exchange_rate', return_value=Decimal('1.00'))
+class ExportColumnRegistryTests(BookingFixturesMixin, TestCase):
+    def test_columns_read_only_the_fields_they_declare(self, *_mocks):
+        for booking in (self.make_job(), self.make_shuttle(), self.make_hotel()):
+            Payment.objects.create(
+                payment_amount=Decimal('50.00'), payment_currency='EUR', payment_type='Cash',
+                paid_to_driver=self.driver, **{booking._meta.get_field('payments').field.name: booking},
+            )
+        for kind, spec in EXPORT_KINDS.items():
+            for file_format in ('csv', 'xlsx', 'ndjson'):
+                queryset = export_queryset(kind, {'year': self.yesterday.year, 'month': 0})
+                # Any column reading an undeclared field would load it row by row
+                with self.assertNumQueries(2), CaptureQueriesContext(connection) as ctx:
+                    rows = list(iter_rows(queryset, spec.columns, file_format))
+                self.assertEqual((len(rows), len(rows[0])), (1, len(spec.columns)))
+
+        bookings_sql, payments_sql = (query['sql'] for query in ctx.captured_queries)
+        self.assertIn('"hotels_hotelbooking"."special_requests"', bookings_sql)
+        self.assertNotIn('customer_pays_in_euros', bookings_sql)
+        self.assertIn('"common_payment"."hotel_booking_id"', payments_sql)
+        self.assertNotIn('payment_amount_in_euros', payments_sql)
+
+    def test_ndjson_export_is_gzipped_json_lines_keyed_by_column(self, *_mocks):
+        job = self.make_job()
+        Payment.objects.create(
+            job=job, payment_amount=Decimal('50.00'), payment_currency='EUR',
+            payment_type='Cash', paid_to_driver=self.driver,
+        )
+        response = self.client.get(
+            reverse('common:export_jobs'), {'format': 'ndjson', 'year': self.yesterday.year}
+        )
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn(f'KT Driving Jobs {self.yesterday.year}.ndjson.gz', response['Content-Disposition'])
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(list(record), [col.key for col in JOB_EXPORT_COLUMNS])
+        self.assertEqual(
+            (record['customer_name'], record['job_date'], record['job_price'], record['is_confirmed']),
+            ('Anna Kovács', job.job_date.isoformat(), '100.00', True),
+        )
+        self.assertEqual(record['payments'], [{
+            'amount': '50.00', 'currency': 'EUR', 'type': 'Cash', 'payee_type': 'driver', 'payee': 'Search Driver',
+        }])
+
+        # The background worker writes the same lines
+        target = io.BytesIO()
+        write_export('jobs', 'ndjson', {'year': self.yesterday.year, 'month': 0}, target)
+        self.assertEqual(gzip.decompress(target.getvalue()).decode().splitlines(), lines)
+
+@patch('hotels.models.get_exchange_rate', return_value=Decimal('1.00'))
+@patch('jobs.models.get_exchange_rate', return_value=Decimal('1.00'))
+class BackgroundExportTests(BookingFixturesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_root, ignore_errors=True)
+        settings_override = override_settings(EXPORTS_IN_BACKGROUND=True, EXPORT_ROOT=export_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
         cache.clear()
-        t0 = datetime(2024, 6, 15, 20, 0, 0, tzinfo=datetime_timezone.utc)
 
-        er = ExchangeRate.objects.create(currency='USD', rate=Decimal('1.1000'))
-        ExchangeRate.objects.filter(pk=er.pk).update(last_updated=t0 - timedelta(hours=26))
+    def request_export(self, **params):
+        return self.client.get(
+            reverse('common:export_jobs'),
+            {'format': 'csv', 'year': self.yesterday.year, 'month': self.yesterday.month, **params},
+        )
 
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {'conversion_rates': {'EUR': '1.3333'}}
+    def run_worker(self):
+        out = StringIO()
+        call_command('run_export_worker', '--once', stdout=out, stderr=StringIO())
+        return out.getvalue()
 
-        with patch('django.utils.timezone.now', return_value=t0):
-            rate = get_exchange_rate('USD')
-
-        self.assertEqual(rate, Decimal('1.3333'))
-        mock_get.assert_called_once()
-
-    @patch('common.utils.requests.get')
-    def test_get_exchange_rate_eur(self, mock_get):
-        """Test that get_exchange_rate for EUR always returns 1.00 without API call."""
-        # Call the function
-        rate = get_exchange_rate('EUR')
-        self.assertEqual(rate, Decimal('1.00'))
-        
-        # Verify that no API call was made
-        mock_get.assert_not_called()
\ No newline at end of file
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_export_is_queued_built_by_the_worker_and_then_served_from_disk(self, *_mocks):
+        self.make_job()
+        response = self.request_export()
+        job = ExportJob.objects.get()
+        self.assertRedirects(response, reverse('common:export_status', args=[job.pk]), fetch_redirect_response=False)
+        status = self.client.get(reverse('common:export_status', args=[job.pk]), {'format': 'json'}).json()
+        self.assertEqual(status['status'], 'queued')
+        self.assertContains(self.client.get(response.url), 'The export is queued.')
+
+        self.assertIn(f'Built {job.filename}', self.run_worker())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ExportJob.STATUS_DONE, 1))
+        self.assertEqual(job.file_size, os.path.getsize(job.file_path))
+        rows = self.read(self.client.get(response.url))
+        self.assertEqual((rows[0][0], rows[1][0]), ('Customer Name', 'Anna Kovács'))
+
+        # Same parameters, unchanged month: the stored file, without a new job
+        repeat = self.request_export()
+        self.assertEqual(self.read(repeat), rows)
+        self.assertIn(job.filename, repeat['Content-Disposition'])
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+    def test_only_changes_to_the_exported_month_invalidate_the_file(self, *_mocks):
+        job = self.make_job()
+        self.request_export()
+        self.run_worker()
+
+        self.make_job(job_date=(self.yesterday - timedelta(days=40)).date())
+        self.assertEqual(self.request_export().status_code, 200)
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+        Payment.objects.create(
+            job=job, payment_amount=Decimal('50.00'), payment_currency='EUR',
+            payment_type='Cash', paid_to_driver=self.driver,
+        )
+        self.assertEqual(self.request_export().status_code, 302)
+        self.assertEqual(ExportJob.objects.count(), 2)
+        self.run_worker()
+        self.assertEqual(self.read(self.request_export())[1][-1], 'Payment 1: EUR50.00 (Cash, to Driver: Search Driver)')
+
+        self.driver.name = 'Renamed Driver'
+        self.driver.save()
+        self.assertEqual(self.request_export().status_code, 302)
+        self.assertEqual(ExportJob.objects.count(), 3)
+
+    def test_edits_whose_cache_bumps_never_arrive_still_invalidate_the_file(self, *_mocks):
+        job = self.make_job()
+        self.request_export()
+        self.run_worker()
+
+        # As if saved by another process with its own locmem cache: no counter moves here
+        with patch('common.cache_versions.bump_model_version'):
+            job.customer_name = 'Renamed Customer'
+            job.save()
+        self.assertEqual(self.request_export().status_code, 302)
+        self.assertEqual(ExportJob.objects.count(), 2)
+        self.run_worker()
+        self.assertEqual(self.read(self.request_export())[1][0], 'Renamed Customer')
+
+    def test_failed_and_lost_exports(self, *_mocks):
+        self.make_job()
+        self.request_export()
+        with patch('common.export_queue.write_export', side_effect=RuntimeError('disk full')), \
+                self.assertLogs('kt', 'ERROR'):
+            self.run_worker()
+        failed = ExportJob.objects.get()
+        self.assertEqual((failed.status, failed.error), (ExportJob.STATUS_FAILED, 'disk full'))
+        self.assertContains(self.client.get(reverse('common:export_status', args=[failed.pk])), 'disk full')
+        self.assertEqual(os.listdir(settings.EXPORT_ROOT), [])
+
+        # A failed job is not reused; a removed file is built again under the same job
+        self.request_export()
+        self.run_worker()
+        job = ExportJob.objects.get(status=ExportJob.STATUS_DONE)
+        os.remove(job.file_path)
+        response = self.client.get(reverse('common:export_status', args=[job.pk]))
+        self.assertContains(response, 'The export is queued.')
+        self.run_worker()
+        self.assertEqual(len(self.read(self.client.get(reverse('common:export_status', args=[job.pk])))), 2)
+
+    def test_stale_jobs_are_claimed_again_and_old_exports_purged(self, *_mocks):
+        self.make_job()
+        self.request_export()
+        job = claim_next_export()
+        self.assertIsNone(claim_next_export())
+        ExportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        job = claim_next_export()
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(run_export(job).status, ExportJob.STATUS_DONE)
+
+        ExportJob.objects.update(last_requested_at=timezone.now() - timedelta(days=settings.EXPORT_RETENTION_DAYS + 1))
+        self.assertEqual(purge_old_exports(), 1)
+        self.assertFalse(os.path.exists(job.file_path))
@@ -10,6 +10,7 @@ urlpatterns = [
     path('export-jobs/', views.export_jobs, name='export_jobs'),
     path('export-shuttles/', views.export_shuttles, name='export_shuttles'),
     path('export-hotels/', views.export_hotels, name='export_hotels'),
+    path('exports/<int:pk>/', views.export_status, name='export_status'),
     path(
         'audit/<slug:app_label>/<slug:model_name>/<int:pk>/',
         views.audit_detail,
@@ -1,8 +1,8 @@
 from django.core.cache import cache
-from django.conf import settings
 from decimal import Decimal, ROUND_HALF_UP
-import requests
+from common import money
 from common.exchange_rate_models import ExchangeRate
+from common.exchange_rates import RATES_VERSION_CACHE_SECONDS, get_exchange_rate, rates_version  # get_exchange_rate is imported from here by the models
 from django.utils import timezone
 from datetime import timedelta
 from people.models import Agent, Driver, Staff
@@ -46,75 +46,25 @@ VEHICLE_CHOICES = [
     ('Bus', 'Bus')
 ]
 
-def fetch_and_cache_exchange_rate(currency):
-    """Fetch the exchange rate from the API and store it in the database."""
-    api_key = settings.EXCHANGE_RATE_API_KEY
-    url = f'https://v6.exchangerate-api.com/v6/{api_key}/latest/{currency}'
-
-    try:
-        logger.info(f"Making API call to fetch exchange rate for {currency}")
-        response = requests.get(url)
-        logger.info(f"API response status code: {response.status_code}")
-        response.raise_for_status()
-        data = response.json()
-
-        if 'conversion_rates' in data and 'EUR' in data['conversion_rates']:
-            rate = Decimal(data['conversion_rates']['EUR'])
-            logger.info(f"Successfully fetched exchange rate for {currency}: {rate}")
-
-            # Update or create the exchange rate in the database
-            exchange_rate, created = ExchangeRate.objects.update_or_create(
-                currency=currency,
-                defaults={'rate': rate},
-            )
-            if created:
-                logger.info(f"Created new exchange rate for {currency}: {rate}")
-            else:
-                logger.info(f"Updated exchange rate for {currency}: {rate}")
-
-            # Cache the rate for 24 hours
-            cache_key = f'exchange_rate_{currency}'
-            cache.set(cache_key, rate, timeout=86400)  # 24 hours in seconds
-            
-            return rate
-        else:
-            logger.error(f'Invalid response structure or missing EUR rate for {currency}')
-            raise ValueError(f'Invalid response structure or missing EUR rate for {currency}')
-
-    except requests.RequestException as e:
-        logger.error(f'Error fetching exchange rate for {currency}: {e}')
-        raise ValueError(f'Error fetching exchange rate for {currency}') from e
-
-def get_exchange_rate(currency):
-    """Retrieve the exchange rate for the given currency from the cache, database, or API."""
-    if currency == 'EUR':
-        return Decimal('1.00')
-
-    # Try retrieving the rate from the cache first
-    cache_key = f'exchange_rate_{currency}'
-    rate = cache.get(cache_key)
-
-    if rate is not None:
-        logger.debug(f"Using cached exchange rate for {currency}: {rate}")
-        return rate
-
-    # Try retrieving the rate from the database
-    try:
-        exchange_rate = ExchangeRate.objects.get(currency=currency)
-        if exchange_rate.last_updated < timezone.now() - timedelta(hours=24):
-            logger.info(f"Exchange rate for {currency} is older than 24 hours. Fetching new rate.")
-            return fetch_and_cache_exchange_rate(currency)
-        logger.debug(f"Using database exchange rate for {currency}: {exchange_rate.rate}")
-        return exchange_rate.rate
-    except ExchangeRate.DoesNotExist:
-        logger.debug(f"No database exchange rate found for {currency}.")
-
-    logger.debug(f"No cached or database exchange rate found for {currency}. Fetching from API.")
-    # Fetch and cache if not found
-    return fetch_and_cache_exchange_rate(currency)
+FX_BANNER_CACHE_PREFIX = 'kt:fx-banner:'
+# A banner outlives its rates version by at most this long.
+FX_BANNER_CACHE_SECONDS = RATES_VERSION_CACHE_SECONDS
 
 
 def get_home_exchange_rate_banner_context():
+    """
+    Home page rate banner, cached per ``exchange_rates.rates_version()`` so it is
+    rebuilt once a refresh writes new rates, in any process.
+    """
+    cache_key = f'{FX_BANNER_CACHE_PREFIX}{rates_version()}'
+    context = cache.get(cache_key)
+    if context is None:
+        context = build_home_exchange_rate_banner_context()
+        cache.set(cache_key, context, FX_BANNER_CACHE_SECONDS)
+    return context
+
+
+def build_home_exchange_rate_banner_context():
     """
     Snapshot of USD/GBP/HUF rates for the home page (DB only, no API).
 
@@ -234,12 +184,7 @@ def assign_job_color(job, now):
 
 def calculate_cc_fee(job_price, payment_type, cc_fee_percentage):
     """Calculate the credit card fee based on the job price and payment type."""
-    if payment_type == 'Card':
-        fee_percentage = cc_fee_percentage if cc_fee_percentage else Decimal('7.00')  # Default to 7%
-        cc_fee = (job_price * fee_percentage / Decimal('100')).quantize(Decimal('0.01'))
-        # logger.debug(f"Applying CC Fee: {cc_fee} on {job_price} with rate {fee_percentage}%")
-        return cc_fee
-    return Decimal('0.00')
+    return money.cc_fee(job_price, payment_type, cc_fee_percentage)
 
 
 def get_ordered_people():
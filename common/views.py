@@ -1,25 +1,26 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import FileResponse, JsonResponse
 from django.views.decorators.http import require_GET
 
 from common.audit import build_audit_payload, get_audit_model
-from common.utils import format_budapest_datetime
+from common.customers import name_suggestions, number_suggestions
+from common.export_models import ExportJob
+from common.export_queue import open_export_file, request_export
+from common.exports import EXPORT_CONTENT_TYPES, export_params, export_response
 from shuttle.models import Shuttle
 from hotels.models import HotelBooking
 from django.shortcuts import redirect
+from django.urls import reverse
 from jobs.models import Job
 from django.utils import timezone
 from shuttle.forms import DriverAssignmentForm
 import pytz
-import csv
 from people.models import Driver
 import datetime
 from django.http import HttpResponse
-import openpyxl
-from openpyxl.utils import get_column_letter
 from shuttle.models import Shuttle
-from openpyxl.styles import Font, PatternFill
 
 @login_required
 def admin_page(request):
@@ -60,6 +61,36 @@ def services_page(request):
     return render(request, 'services.html', context)
 
 
+def _export_response(request, kind, file_format, params):
+    """
+    The export itself, or with EXPORTS_IN_BACKGROUND its stored file when one matches the
+    current data, else a redirect to the status page of the queued job.
+    """
+    if file_format not in EXPORT_CONTENT_TYPES:
+        return HttpResponse("Invalid format", status=400)
+    if not settings.EXPORTS_IN_BACKGROUND:
+        return export_response(kind, file_format, params)
+
+    job = request_export(kind, file_format, params, user=request.user)
+    if job.status == ExportJob.STATUS_DONE:
+        response = _export_download(job)
+        if response is not None:
+            return response
+    return redirect('common:export_status', pk=job.pk)
+
+
+def _export_download(job):
+    export_file = open_export_file(job)
+    if export_file is None:
+        return None
+    return FileResponse(
+        export_file,
+        as_attachment=True,
+        filename=job.filename,
+        content_type=EXPORT_CONTENT_TYPES[job.file_format],
+    )
+
+
 # Export_page view
 @login_required
 def export_jobs(request):
@@ -98,205 +129,24 @@ def export_jobs(request):
             'error_message': error_message
         })
 
-    if file_format == 'csv':
-        jobs = Job.objects.filter(is_confirmed=True).order_by('-job_date', '-job_time')
-    else:
-        jobs = Job.objects.filter(is_confirmed=True).order_by('-job_date', '-job_time')
-
     try:
-        year_int = int(year)
-        jobs = jobs.filter(job_date__year=year_int).order_by('-job_date', '-job_time')
-        if month and month != "0":
-            month_int = int(month)
-            jobs = jobs.filter(job_date__month=month_int)
-            sheet_title = f"KT Driving Jobs {datetime.date(year_int, month_int, 1).strftime('%B %Y')}"
-        else:
-            sheet_title = f"KT Driving Jobs {year_int}"
+        params = export_params('jobs', request.GET)
     except ValueError:
         return HttpResponse("Invalid year or month", status=400)
 
-    if file_format == 'csv':
-        filename = sheet_title + ".csv"
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        writer = csv.writer(response)
-        writer.writerow([
-            'Customer Name', 'Customer Number', 'Job Date', 'Job Time',
-            'No. of Passengers', 'Vehicle Type', 'Kilometers', 'Pickup',
-            'Drop-off', 'Flight Number', 'Price', 'Currency', 'Payment Type',
-            'Confirmed', 'Paid', 'Driver', 'Number Plate',
-            'Agent Name', 'Agent Fee', 'Payments Summary'
-        ])
-        for job in jobs:
-            payments = list(job.payments.all())
-            payments_summary = ''
-            if payments:
-                payment_strs = []
-                for idx, p in enumerate(payments, 1):
-                    paid_to_name = (
-                        p.paid_to_driver.name if p.paid_to_driver else
-                        p.paid_to_agent.name if p.paid_to_agent else
-                        p.paid_to_staff.name if p.paid_to_staff else
-                        'Not specified'
-                    )
-                    amt = f"{p.payment_amount}" if p.payment_amount is not None else ''
-                    curr = p.payment_currency if p.payment_currency else ''
-                    paytype = p.payment_type if p.payment_type else ''
-                    # Format: Payment 1: €50 (Card, to Driver: John)
-                    payment_str = f"Payment {idx}: {curr}{amt} ({paytype}, to "
-                    if p.paid_to_driver:
-                        payment_str += f"Driver: {p.paid_to_driver.name}"
-                    elif p.paid_to_agent:
-                        payment_str += f"Agent: {p.paid_to_agent.name}"
-                    elif p.paid_to_staff:
-                        payment_str += f"Staff: {p.paid_to_staff.name}"
-                    else:
-                        payment_str += "Not specified"
-                    payment_str += ")"
-                    payment_strs.append(payment_str)
-                payments_summary = ' | '.join(payment_strs)
-            writer.writerow([
-                job.customer_name,
-                job.customer_number,
-                job.job_date,
-                job.job_time,
-                job.no_of_passengers,
-                job.vehicle_type,
-                job.kilometers,
-                job.pick_up_location,
-                job.drop_off_location,
-                job.flight_number,
-                job.job_price,
-                job.job_currency,
-                job.payment_type,
-                job.is_confirmed,
-                job.is_paid,
-                job.driver.name if job.driver else '',
-                job.number_plate,
-                job.agent_name.name if job.agent_name else '',
-                f"{job.agent_percentage}%" if job.agent_percentage else '',
-                payments_summary
-            ])
-        return response
-
-    elif file_format == 'xlsx':
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = sheet_title[:31]
-        headers = [
-            'Customer Name', 'Customer Number', 'Job Date', 'Job Time',
-            'No. of Passengers', 'Vehicle Type', 'Kilometers', 'Pickup',
-            'Drop-off', 'Flight Number', 'Price', 'Currency', 'Payment Type',
-            'Confirmed', 'Paid', 'Driver', 'Number Plate',
-            'Agent Name', 'Agent Fee', 'Payments Summary'
-        ]
-        ws.append(headers)
-
-        # Style header row
-        header_font = Font(bold=True)
-        header_fill = PatternFill(start_color="FFA500", end_color="FFA500", fill_type="solid")  # Orange
-        for cell in ws[1]:
-            cell.font = header_font
-            cell.fill = header_fill
-
-        # Freeze top row
-        ws.freeze_panes = "A2"
-
-        # Apply auto-filter to the full header row (A1:R1) as openpyxl only supports a contiguous range.
-        
-        last_column = get_column_letter(len(headers))
-        ws.auto_filter.ref = f"A1:{last_column}1"
-
-        for job in jobs:
-            payments = list(job.payments.all())
-            payments_summary = ''
-            if payments:
-                payment_strs = []
-                for idx, p in enumerate(payments, 1):
-                    paid_to_name = (
-                        p.paid_to_driver.name if p.paid_to_driver else
-                        p.paid_to_agent.name if p.paid_to_agent else
-                        p.paid_to_staff.name if p.paid_to_staff else
-                        'Not specified'
-                    )
-                    amt = f"{p.payment_amount}" if p.payment_amount is not None else ''
-                    curr = p.payment_currency if p.payment_currency else ''
-                    paytype = p.payment_type if p.payment_type else ''
-                    payment_str = f"Payment {idx}: {curr}{amt} ({paytype}, to "
-                    if p.paid_to_driver:
-                        payment_str += f"Driver: {p.paid_to_driver.name}"
-                    elif p.paid_to_agent:
-                        payment_str += f"Agent: {p.paid_to_agent.name}"
-                    elif p.paid_to_staff:
-                        payment_str += f"Staff: {p.paid_to_staff.name}"
-                    else:
-                        payment_str += "Not specified"
-                    payment_str += ")"
-                    payment_strs.append(payment_str)
-                payments_summary = ' | '.join(payment_strs)
-            ws.append([
-                job.customer_name,
-                job.customer_number,
-                job.job_date,
-                job.job_time.strftime('%H:%M'),
-                job.no_of_passengers,
-                job.vehicle_type,
-                float(job.kilometers or 0),
-                job.pick_up_location,
-                job.drop_off_location,
-                job.flight_number,
-                float(job.job_price or 0),
-                job.job_currency,
-                job.payment_type,
-                job.is_confirmed,
-                job.is_paid,
-                job.driver.name if job.driver else '',
-                job.number_plate,
-                job.agent_name.name if job.agent_name else '',
-                f"{job.agent_percentage}%" if job.agent_percentage else '',
-                payments_summary
-            ])
-
-        # Auto-size columns based on max content width
-        for col_num, column_title in enumerate(headers, 1):
-            column_letter = get_column_letter(col_num)
-            max_length = len(column_title)
-            for row in ws.iter_rows(min_col=col_num, max_col=col_num):
-                for cell in row:
-                    if cell.value:
-                        max_length = max(max_length, len(str(cell.value)))
-            ws.column_dimensions[column_letter].width = max_length + 2
-
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        filename = sheet_title + ".xlsx"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        wb.save(response)
-        return response
-
-    return HttpResponse("Invalid format", status=400)
+    return _export_response(request, 'jobs', file_format, params)
 
 
 
 @login_required
 def export_shuttles(request):
-    import csv
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill
-    from openpyxl.utils import get_column_letter
-    from django.http import HttpResponse
-
     month_range = [(0, 'All')] + [(i, datetime.date(1900, i, 1).strftime('%B')) for i in range(1, 13)]
     now = timezone.now()
     current_year = now.year
     current_month = now.month
 
-    # Filters from GET params
     file_format = request.GET.get('format', 'xlsx')
     year = request.GET.get('year')
-    month = request.GET.get('month')
-    filter_driver_id = request.GET.get('filter_driver')
-    filter_direction = request.GET.get('filter_direction')
-    filter_is_paid = request.GET.get('filter_is_paid')
 
     if request.method == 'GET' and not request.GET.get('format'):
         drivers = Driver.objects.order_by('name')
@@ -315,180 +165,13 @@ def export_shuttles(request):
             'error_message': 'Please select a year for export.'
         })
 
-    shuttles = Shuttle.objects.filter(is_confirmed=True).order_by('-shuttle_date')
-
+    # export_params also reads the filter_driver / filter_direction / filter_is_paid filters
     try:
-        year_int = int(year)
-        shuttles = shuttles.filter(shuttle_date__year=year_int)
-        if month and month != "0":
-            month_int = int(month)
-            shuttles = shuttles.filter(shuttle_date__month=month_int)
-            sheet_title = f"KT Shuttles {datetime.date(year_int, month_int, 1).strftime('%B %Y')}"
-        else:
-            sheet_title = f"KT Shuttles {year_int}"
+        params = export_params('shuttles', request.GET)
     except ValueError:
         return HttpResponse("Invalid year or month", status=400)
 
-    if filter_driver_id:
-        shuttles = shuttles.filter(driver_id=filter_driver_id)
-    if filter_direction:
-        shuttles = shuttles.filter(shuttle_direction=filter_direction)
-    if filter_is_paid:
-        if filter_is_paid == '1':
-            shuttles = shuttles.filter(is_paid=True)
-        elif filter_is_paid == '0':
-            shuttles = shuttles.filter(is_paid=False)
-
-    if file_format == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{sheet_title}.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['Customer Name', 'Customer Number', 'Date', 'Direction', 'No. of Passengers', 'Price', 'Currency', 'Confirmed', 'Paid', 'Completed', 'Driver', 'Payments Summary'])
-
-        for shuttle in shuttles:
-            payments = list(shuttle.payments.all())
-            payments_summary = ''
-            if payments:
-                payment_strs = []
-                for idx, p in enumerate(payments, 1):
-                    paid_to_name = (
-                        p.paid_to_driver.name if p.paid_to_driver else
-                        p.paid_to_agent.name if p.paid_to_agent else
-                        p.paid_to_staff.name if p.paid_to_staff else
-                        'Not specified'
-                    )
-                    amt = f"{p.payment_amount}" if p.payment_amount is not None else ''
-                    curr = p.payment_currency if p.payment_currency else ''
-                    paytype = p.payment_type if p.payment_type else ''
-                    payment_str = f"Payment {idx}: {curr}{amt} ({paytype}, to "
-                    if p.paid_to_driver:
-                        payment_str += f"Driver: {p.paid_to_driver.name}"
-                    elif p.paid_to_agent:
-                        payment_str += f"Agent: {p.paid_to_agent.name}"
-                    elif p.paid_to_staff:
-                        payment_str += f"Staff: {p.paid_to_staff.name}"
-                    else:
-                        payment_str += "Not specified"
-                    payment_str += ")"
-                    payment_strs.append(payment_str)
-                payments_summary = ' | '.join(payment_strs)
-
-            writer.writerow([
-                shuttle.customer_name,
-                shuttle.customer_number,
-                shuttle.shuttle_date,
-                shuttle.get_shuttle_direction_display(),
-                shuttle.no_of_passengers,
-                shuttle.price,
-                shuttle.price_currency if hasattr(shuttle, 'price_currency') else 'EUR',
-                shuttle.is_confirmed,
-                shuttle.is_paid,
-                shuttle.is_completed,
-                shuttle.driver.name if shuttle.driver else '',
-                payments_summary
-            ])
-        return response
-
-    elif file_format == 'xlsx':
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = sheet_title[:31]
-        headers = ['Customer Name', 'Customer Number', 'Date', 'Direction', 'No. of Passengers', 'Price', 'Currency', 'Confirmed', 'Paid', 'Completed', 'Driver', 'Payments Summary']
-        ws.append(headers)
-
-        header_font = Font(bold=True)
-        header_fill = PatternFill(start_color="FFA500", end_color="FFA500", fill_type="solid")
-        for cell in ws[1]:
-            cell.font = header_font
-            cell.fill = header_fill
-        ws.freeze_panes = "A2"
-        last_column = get_column_letter(len(headers))
-        ws.auto_filter.ref = f"A1:{last_column}1"
-
-        for shuttle in shuttles:
-            payments = list(shuttle.payments.all())
-            payments_summary = ''
-            if payments:
-                payment_strs = []
-                for idx, p in enumerate(payments, 1):
-                    amt = f"{p.payment_amount}" if p.payment_amount is not None else ''
-                    curr = p.payment_currency if p.payment_currency else ''
-                    paytype = p.payment_type if p.payment_type else ''
-                    payment_str = f"Payment {idx}: {curr}{amt} ({paytype}, to "
-                    if p.paid_to_driver:
-                        payment_str += f"Driver: {p.paid_to_driver.name}"
-                    elif p.paid_to_agent:
-                        payment_str += f"Agent: {p.paid_to_agent.name}"
-                    elif p.paid_to_staff:
-                        payment_str += f"Staff: {p.paid_to_staff.name}"
-                    else:
-                        payment_str += "Not specified"
-                    payment_str += ")"
-                    payment_strs.append(payment_str)
-                payments_summary = ' | '.join(payment_strs)
-
-            ws.append([
-                shuttle.customer_name,
-                shuttle.customer_number,
-                shuttle.shuttle_date,
-                shuttle.get_shuttle_direction_display(),
-                shuttle.no_of_passengers,
-                shuttle.price,
-                shuttle.price_currency if hasattr(shuttle, 'price_currency') else 'EUR',
-                shuttle.is_confirmed,
-                shuttle.is_paid,
-                shuttle.is_completed,
-                shuttle.driver.name if shuttle.driver else '',
-                payments_summary
-            ])
-
-        for col_num, column_title in enumerate(headers, 1):
-            column_letter = get_column_letter(col_num)
-            max_length = len(column_title)
-            for row in ws.iter_rows(min_col=col_num, max_col=col_num):
-                for cell in row:
-                    if cell.value:
-                        max_length = max(max_length, len(str(cell.value)))
-            ws.column_dimensions[column_letter].width = max_length + 2
-
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = f'attachment; filename="{sheet_title}.xlsx"'
-        wb.save(response)
-        return response
-
-    return HttpResponse("Invalid format", status=400)
-
-
-def _payments_summary_lines(payments):
-    """Build the same human-readable payment summary string used in job/shuttle exports."""
-    if not payments:
-        return ''
-    payment_strs = []
-    for idx, p in enumerate(payments, 1):
-        amt = f"{p.payment_amount}" if p.payment_amount is not None else ''
-        curr = p.payment_currency if p.payment_currency else ''
-        paytype = p.payment_type if p.payment_type else ''
-        payment_str = f"Payment {idx}: {curr}{amt} ({paytype}, to "
-        if p.paid_to_driver:
-            payment_str += f"Driver: {p.paid_to_driver.name}"
-        elif p.paid_to_agent:
-            payment_str += f"Agent: {p.paid_to_agent.name}"
-        elif p.paid_to_staff:
-            payment_str += f"Staff: {p.paid_to_staff.name}"
-        else:
-            payment_str += "Not specified"
-        payment_str += ")"
-        payment_strs.append(payment_str)
-    return ' | '.join(payment_strs)
-
-
-def _naive_datetime_for_excel(dt):
-    """openpyxl cannot write timezone-aware datetimes; Excel has no tz."""
-    if dt is None:
-        return None
-    if timezone.is_aware(dt):
-        return timezone.make_naive(dt, timezone.get_current_timezone())
-    return dt
+    return _export_response(request, 'shuttles', file_format, params)
 
 
 @login_required
@@ -500,7 +183,6 @@ def export_hotels(request):
 
     file_format = request.GET.get('format', 'xlsx')
     year = request.GET.get('year')
-    month = request.GET.get('month')
 
     if request.method == 'GET' and not request.GET.get('format'):
         drivers = Driver.objects.order_by('name')
@@ -521,179 +203,55 @@ def export_hotels(request):
             'error_message': 'Please select a year for export.',
         })
 
-    bookings = (
-        HotelBooking.objects.filter(is_confirmed=True)
-        .select_related('agent')
-        .prefetch_related('payments')
-        .order_by('-check_in')
-    )
-
     try:
-        year_int = int(year)
-        bookings = bookings.filter(check_in__year=year_int)
-        if month and month != '0':
-            month_int = int(month)
-            bookings = bookings.filter(check_in__month=month_int)
-            sheet_title = f"KT Hotel Bookings {datetime.date(year_int, month_int, 1).strftime('%B %Y')}"
-        else:
-            sheet_title = f"KT Hotel Bookings {year_int}"
+        params = export_params('hotels', request.GET)
     except ValueError:
         return HttpResponse('Invalid year or month', status=400)
 
-    headers = [
-        'Customer Name', 'Customer Number', 'Hotel', 'Branch', 'Booking Ref',
-        'Check-in', 'Check-out', 'Guests', 'Rooms', 'Beds', 'Tier',
-        'Hotel Price', 'Hotel Currency', 'Customer Pays',
-        'Customer Pays Currency', 'Confirmed', 'Freelancer', 'Paid', 'Completed',
-        'Agent', 'Agent Fee', 'Special Requests',
-        'Payments Summary',
-    ]
-
-    if file_format == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{sheet_title}.csv"'
-        writer = csv.writer(response)
-        writer.writerow(headers)
-        for b in bookings:
-            payments_summary = _payments_summary_lines(list(b.payments.all()))
-            writer.writerow([
-                b.customer_name,
-                b.customer_number,
-                b.hotel_name,
-                b.hotel_branch or '',
-                b.booking_ref or '',
-                format_budapest_datetime(b.check_in, fmt='l, j F Y, H:i') or '',
-                format_budapest_datetime(b.check_out, fmt='l, j F Y, H:i') or '',
-                b.no_of_people,
-                b.rooms,
-                b.no_of_beds if b.no_of_beds is not None else '',
-                b.get_hotel_tier_display() if b.hotel_tier is not None else '',
-                b.hotel_price,
-                b.hotel_price_currency,
-                b.customer_pays,
-                b.customer_pays_currency,
-                b.is_confirmed,
-                b.is_freelancer,
-                b.is_paid,
-                b.is_completed,
-                b.agent.name if b.agent else '',
-                f'{b.agent_percentage}%' if b.agent_percentage else '',
-                b.special_requests or '',
-                payments_summary,
-            ])
-        return response
-
-    if file_format == 'xlsx':
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = sheet_title[:31]
-        ws.append(headers)
-        header_font = Font(bold=True)
-        header_fill = PatternFill(start_color='FFA500', end_color='FFA500', fill_type='solid')
-        for cell in ws[1]:
-            cell.font = header_font
-            cell.fill = header_fill
-        ws.freeze_panes = 'A2'
-        last_column = get_column_letter(len(headers))
-        ws.auto_filter.ref = f'A1:{last_column}1'
-
-        for b in bookings:
-            payments_summary = _payments_summary_lines(list(b.payments.all()))
-            ws.append([
-                b.customer_name,
-                b.customer_number,
-                b.hotel_name,
-                b.hotel_branch or '',
-                b.booking_ref or '',
-                _naive_datetime_for_excel(b.check_in),
-                _naive_datetime_for_excel(b.check_out),
-                b.no_of_people,
-                b.rooms,
-                b.no_of_beds if b.no_of_beds is not None else '',
-                b.get_hotel_tier_display() if b.hotel_tier is not None else '',
-                float(b.hotel_price or 0),
-                b.hotel_price_currency,
-                float(b.customer_pays or 0),
-                b.customer_pays_currency,
-                b.is_confirmed,
-                b.is_freelancer,
-                b.is_paid,
-                b.is_completed,
-                b.agent.name if b.agent else '',
-                f'{b.agent_percentage}%' if b.agent_percentage else '',
-                b.special_requests or '',
-                payments_summary,
-            ])
-
-        for col_num, column_title in enumerate(headers, 1):
-            column_letter = get_column_letter(col_num)
-            max_length = len(column_title)
-            for row in ws.iter_rows(min_col=col_num, max_col=col_num):
-                for cell in row:
-                    if cell.value:
-                        max_length = max(max_length, len(str(cell.value)))
-            ws.column_dimensions[column_letter].width = max_length + 2
-
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename="{sheet_title}.xlsx"'
-        wb.save(response)
-        return response
+    return _export_response(request, 'hotels', file_format, params)
+
+
+@login_required
+@require_GET
+def export_status(request, pk):
+    """
+    Progress of a background export: JSON with ``?format=json``, the file once it is
+    built, otherwise a page that reloads itself until then.
+    """
+    job = get_object_or_404(ExportJob, pk=pk)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'id': job.pk,
+            'status': job.status,
+            'filename': job.filename,
+            'file_size': job.file_size,
+            'error': job.error,
+            'download_url': reverse('common:export_status', args=[job.pk]),
+        })
 
-    return HttpResponse('Invalid format', status=400)
+    if job.status == ExportJob.STATUS_DONE:
+        response = _export_download(job)
+        if response is not None:
+            return response
+    return render(request, 'export_status.html', {'job': job})
 
 
 @login_required
 @require_GET
 def customer_suggestions(request):
     """
-    Autocomplete for customer name/number across jobs, shuttles, and hotel bookings.
+    Autocomplete for customer name/number from the customer directory (every job, shuttle
+    and hotel booking), by name / number prefix, most used and most recent first.
     Pickup/dropoff suggestions still come from driving jobs only.
     """
     field = request.GET.get('field')
     term = (request.GET.get('term') or '').strip()
 
     if field == 'name' and len(term) >= 3:
-        seen = set()
-        rows = []
-        querysets = [
-            Job.objects.filter(customer_name__icontains=term).values(
-                'customer_name', 'customer_number', 'customer_email'
-            ),
-            Shuttle.objects.filter(customer_name__icontains=term).values(
-                'customer_name', 'customer_number', 'customer_email'
-            ),
-            HotelBooking.objects.filter(customer_name__icontains=term).values(
-                'customer_name', 'customer_number'
-            ),
-        ]
-        for qs in querysets:
-            for r in qs[:40]:
-                name = (r.get('customer_name') or '').strip()
-                if not name:
-                    continue
-                num = str(r.get('customer_number') or '').strip()
-                em = str(r.get('customer_email') or '').strip()
-                key = (name.lower(), num, em.lower())
-                if key in seen:
-                    continue
-                seen.add(key)
-                rows.append({'name': name, 'number': num, 'email': em})
-        rows.sort(key=lambda x: (x['name'].lower(), x['number'], x['email'].lower()))
-        return JsonResponse(rows[:10], safe=False)
+        return JsonResponse(name_suggestions(term), safe=False)
 
     if field == 'number' and len(term) >= 5:
-        nums = set()
-        for model in (Job, Shuttle, HotelBooking):
-            for n in model.objects.filter(customer_number__icontains=term).values_list(
-                'customer_number', flat=True
-            )[:25]:
-                if n:
-                    s = str(n).strip()
-                    if s:
-                        nums.add(s)
-        return JsonResponse(sorted(nums)[:10], safe=False)
+        return JsonResponse(number_suggestions(term), safe=False)
 
     if field == 'pickup' and len(term) >= 3:
         results = list(
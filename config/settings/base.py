@@ -96,19 +96,46 @@ DATABASES = {
     }
 }
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'OPTIONS': {
-            # Keep cache memory bounded on low-RAM hosts.
-            'MAX_ENTRIES': 50,
-            'CULL_FREQUENCY': 3,
-        },
-    }
+# Cache backend, picked with CACHE_BACKEND:
+#   locmem (default here) - per-process memory; every gunicorn worker keeps its own copy.
+#   file                  - shared directory (CACHE_LOCATION, default <BASE_DIR>/cache).
+#   db (production)       - shared table (CACHE_LOCATION, default kt_cache_table); created by
+#                           `python manage.py createcachetable`, which the web entrypoint runs.
+# Invalidation of Totals, settings singletons and exchange rates only reaches the process
+# that wrote unless the cache is shared, so run file or db with more than one process
+# (common.checks warns about locmem with WEB_CONCURRENCY above 1).
+# CACHE_MAX_ENTRIES caps the number of entries (default 50 for locmem, 1000 for the shared
+# backends); once reached, 1/CULL_FREQUENCY of them are evicted on the next write.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem').strip().lower()
+
+_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'unique-snowflake', 50),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache'), 1000),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'kt_cache_table', 1000),
 }
 
 
+def cache_config(backend):
+    """``CACHES`` for one of the ``_CACHE_BACKENDS`` names."""
+    if backend not in _CACHE_BACKENDS:
+        raise ValueError(f"CACHE_BACKEND must be one of {', '.join(_CACHE_BACKENDS)}, got {backend!r}")
+    cache_class, cache_location, cache_max_entries = _CACHE_BACKENDS[backend]
+    return {
+        'default': {
+            'BACKEND': cache_class,
+            'LOCATION': os.getenv('CACHE_LOCATION', cache_location),
+            'OPTIONS': {
+                # Keep cache memory / disk bounded on low-RAM hosts.
+                'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', cache_max_entries)),
+                'CULL_FREQUENCY': 3,
+            },
+        }
+    }
+
+
+CACHES = cache_config(CACHE_BACKEND)
+
+
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -187,6 +214,17 @@ LOGGING = {
 
 # API Keys
 EXCHANGE_RATE_API_KEY = os.getenv('EXCHANGE_RATE_API_KEY')
+EXCHANGE_RATE_API_URL = os.getenv('EXCHANGE_RATE_API_URL', 'https://v6.exchangerate-api.com/v6')
+EXCHANGE_RATE_TIMEOUT_SECONDS = float(os.getenv('EXCHANGE_RATE_TIMEOUT_SECONDS', '5'))
+# Refresh stale rates in a background thread when a save reads one (no network I/O on the save itself)
+EXCHANGE_RATE_BACKGROUND_REFRESH = os.getenv('EXCHANGE_RATE_BACKGROUND_REFRESH', '1') == '1'
+
+# Exports
+# Queue exports for `python manage.py run_export_worker` instead of building them inside the request
+EXPORTS_IN_BACKGROUND = os.getenv('EXPORTS_IN_BACKGROUND', '1') == '1'
+# Finished export files, reused for identical requests while the data is unchanged
+EXPORT_ROOT = os.getenv('EXPORT_ROOT', os.path.join(BASE_DIR, 'exports'))
+EXPORT_RETENTION_DAYS = int(os.getenv('EXPORT_RETENTION_DAYS', '30'))
 
 import ssl
 
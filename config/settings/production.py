@@ -13,6 +13,11 @@ DATABASES = {
     }
 }
 
+# Gunicorn workers, the export worker and cron commands all write; a shared cache lets
+# every one of them see the others' invalidations
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'db').strip().lower()
+CACHES = cache_config(CACHE_BACKEND)
+
 STATIC_ROOT = BASE_DIR / "staticfiles"
 LOG_FILE_PATH = os.path.join(BASE_DIR, 'django_logs.log')
 
@@ -1,3 +1,72 @@
+import time
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from common.models import Payment
+from common.payment_settings import PAYMENT_SETTINGS, PaymentSettings, current_cc_fee_percentage
+from common.singletons import CACHE_TTL_SECONDS, PROCESS_TTL_SECONDS
+from shuttle.models import SHUTTLE_CONFIG, ShuttleConfig
+
+
+class CachedSettingsTests(TestCase):
+    def setUp(self):
+        PAYMENT_SETTINGS.invalidate()
+        SHUTTLE_CONFIG.invalidate()
+        self.addCleanup(PAYMENT_SETTINGS.invalidate)
+        self.addCleanup(SHUTTLE_CONFIG.invalidate)
+        admin = get_user_model().objects.create_superuser(username='admin', password='adminpass')
+        self.client.force_login(admin)
+
+    def test_card_fee_of_payment_rows_costs_no_queries_once_warm(self):
+        payments = [
+            Payment(payment_amount=Decimal('100.00'), payment_type='Card'),
+            Payment(payment_amount=Decimal('50.00'), payment_type='Card'),
+        ]
+        current_cc_fee_percentage()
+        with CaptureQueriesContext(connection) as ctx:
+            fees = [payment.cc_fee for payment in payments]
+        self.assertEqual(len(ctx), 0)
+        self.assertEqual(fees, [Decimal('7.00'), Decimal('3.50')])
+
+    def test_shuttle_config_load_is_cached(self):
+        ShuttleConfig.load()
+        with CaptureQueriesContext(connection) as ctx:
+            config = ShuttleConfig.load()
+        self.assertEqual(len(ctx), 0)
+        self.assertEqual(config.price_per_passenger, Decimal('60.00'))
+
+    def test_dashboard_forms_invalidate_the_cached_rows(self):
+        self.assertEqual(current_cc_fee_percentage(), Decimal('7.00'))
+        self.assertEqual(ShuttleConfig.load().price_per_passenger, Decimal('60.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('dashboard:home'), {
+                'update_payment': '1',
+                'cc_fee_percentage': '5.50',
+            })
+            self.client.post(reverse('dashboard:home'), {
+                'update_shuttle': '1',
+                'price_per_passenger': '75.00',
+            })
+
+        self.assertEqual(current_cc_fee_percentage(), Decimal('5.50'))
+        self.assertEqual(ShuttleConfig.load().price_per_passenger, Decimal('75.00'))
+        self.assertEqual(Payment(payment_amount=Decimal('100.00'), payment_type='Card').cc_fee, Decimal('5.50'))
+
+    def test_change_saved_by_another_worker_shows_up_after_the_ttls(self):
+        PaymentSettings.objects.create(cc_fee_percentage=Decimal('7.00'))
+        self.assertEqual(current_cc_fee_percentage(), Decimal('7.00'))
+        # A queryset update skips save(), like a save in another worker: nothing here is invalidated
+        PaymentSettings.objects.update(cc_fee_percentage=Decimal('5.00'))
+        self.assertEqual(current_cc_fee_percentage(), Decimal('7.00'))
 
-# Create your tests here.
+        later = PROCESS_TTL_SECONDS + CACHE_TTL_SECONDS + 1
+        with patch('time.monotonic', return_value=time.monotonic() + later), \
+                patch('time.time', return_value=time.time() + later):
+            self.assertEqual(current_cc_fee_percentage(), Decimal('5.00'))
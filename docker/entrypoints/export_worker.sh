@@ -0,0 +1,8 @@
+#!/bin/bash
+
+set -e
+
+python "/app/docker/scripts/wait_for_postgres.py"
+
+echo "Starting export worker"
+exec python manage.py run_export_worker --settings "${DJANGO_SETTINGS_MODULE}"
@@ -8,5 +8,12 @@ python "/app/docker/scripts/wait_for_postgres.py"
 
 echo "Running migrations"
 python manage.py migrate --settings "${DJANGO_SETTINGS_MODULE}"
+python manage.py createcachetable --settings "${DJANGO_SETTINGS_MODULE}"
+
+echo "Rebuilding monthly ledger"
+python manage.py rebuild_ledger --settings "${DJANGO_SETTINGS_MODULE}"
+
+echo "Refreshing exchange rates"
+python manage.py refresh_exchange_rates --if-stale --settings "${DJANGO_SETTINGS_MODULE}" || echo "Exchange rate refresh failed; serving stored rates"
 
 gunicorn config.wsgi:application --preload --bind "0.0.0.0:8000" -n "kt_app" --workers="${WEB_CONCURRENCY:-1}"
\ No newline at end of file
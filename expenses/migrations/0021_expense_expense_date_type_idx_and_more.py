@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 16:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0020_audit_and_created_at'),
+        ('people', '0009_delete_freelancer_delete_freelanceragent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['expense_date', 'expense_type'], name='expense_date_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['driver', 'expense_date'], name='expense_driver_date_idx'),
+        ),
+    ]
@@ -3,7 +3,7 @@ from people.models import Driver
 from django.utils import timezone
 from django.contrib.auth.models import User
 import pytz
-from decimal import Decimal
+from common import money
 from common.utils import get_exchange_rate, CURRENCY_CHOICES
 # Additional imports for ExpenseImage validation and compression
 from django.core.exceptions import ValidationError
@@ -39,6 +39,13 @@ class Expense(models.Model):
     last_modified_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='expenses_modified')
     last_modified_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Totals / exports filter by date and type; balances by driver and date
+            models.Index(fields=['expense_date', 'expense_type'], name='expense_date_type_idx'),
+            models.Index(fields=['driver', 'expense_date'], name='expense_driver_date_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         # Convert current time to Budapest timezone if not set
         budapest_tz = pytz.timezone('Europe/Budapest')
@@ -52,6 +59,10 @@ class Expense(models.Model):
 
         super().save(*args, **kwargs)
 
+        from billing.ledger import refresh_ledger_after_save
+
+        refresh_ledger_after_save(self)
+
     def convert_to_euros(self):
         """Convert the expense amount to Euros based on the current exchange rate."""
         if self.expense_currency == 'EUR':
@@ -60,7 +71,7 @@ class Expense(models.Model):
             rate = get_exchange_rate(self.expense_currency)
             if rate is None:
                 raise ValueError(f"Exchange rate for {self.expense_currency} is not available.")
-            self.expense_amount_in_euros = (self.expense_amount * rate).quantize(Decimal('0.01'))
+            self.expense_amount_in_euros = money.to_eur(self.expense_amount, rate)
 
 
 class ExpenseImage(models.Model):
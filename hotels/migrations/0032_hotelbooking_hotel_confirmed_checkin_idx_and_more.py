@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 16:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotels', '0031_public_id_upper_unique'),
+        ('people', '0009_delete_freelancer_delete_freelanceragent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hotelbooking',
+            index=models.Index(condition=models.Q(('is_confirmed', True)), fields=['check_in'], name='hotel_confirmed_checkin_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hotelbooking',
+            index=models.Index(condition=models.Q(('is_confirmed', True), ('is_paid', False)), fields=['check_in'], name='hotel_open_unpaid_idx'),
+        ),
+    ]
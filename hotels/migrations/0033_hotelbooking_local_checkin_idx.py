@@ -0,0 +1,38 @@
+# Generated by Django 5.1 on 2026-10-18 18:12
+
+from django.db import migrations
+
+# The past bookings feed orders hotels on the local date and time of check_in, as Django
+# renders TruncDate / TruncTime with the Budapest zone. A model index can't carry the zone
+# (migrations can't serialize it), so PostgreSQL gets the expression index directly.
+# SQLite can't match bound zone parameters to an index expression and keeps using
+# hotel_confirmed_checkin_idx for the range.
+LOCAL_CHECK_IN = "(check_in AT TIME ZONE 'Europe/Budapest')"
+
+POSTGRES_FORWARD = [
+    'CREATE INDEX hotel_confirmed_local_checkin_idx ON hotels_hotelbooking '
+    f'(({LOCAL_CHECK_IN}::date), ({LOCAL_CHECK_IN}::time), id) WHERE is_confirmed',
+]
+POSTGRES_BACKWARD = ['DROP INDEX IF EXISTS hotel_confirmed_local_checkin_idx']
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotels', '0032_hotelbooking_hotel_confirmed_checkin_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD}),
+            _run({'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -3,18 +3,14 @@ from django.core.validators import MinValueValidator
 from decimal import Decimal
 from people.models import Agent, Staff
 from common.utils import get_exchange_rate, CURRENCY_CHOICES, AGENT_FEE_CHOICES, PAYMENT_TYPE_CHOICES, calculate_cc_fee
-from common.payment_paid_sync import sync_hotel_is_paid_from_payments
-from common.payment_settings import PaymentSettings
-import secrets
-import string
+from common import money
+from common.payment_paid_sync import sync_booking_is_paid
+from common.payment_settings import current_cc_fee_percentage
+from common.public_ids import public_id_constraint, save_with_public_id
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-def generate_random_id(length=8):
-    alphabet = string.ascii_uppercase + string.digits
-    return ''.join(secrets.choice(alphabet) for _ in range(length))
-
 
 class HotelBooking(models.Model):
     TIER_CHOICES = [
@@ -80,24 +76,23 @@ class HotelBooking(models.Model):
     last_modified_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='hotels_modified')
     last_modified_at = models.DateTimeField(null=True, blank=True)
 
-    def save(self, *args, **kwargs):
-        if not self.public_id:
-            while True:
-                new_id = generate_random_id()
-                # Check case-insensitively
-                if not HotelBooking.objects.filter(public_id__iexact=new_id).exists():
-                    self.public_id = new_id.upper()
-                    break
-        else:
-            # Always store as uppercase
-            self.public_id = self.public_id.upper()
+    class Meta:
+        constraints = [public_id_constraint('hotels_hotelbooking')]
+        indexes = [
+            models.Index(fields=['check_in'], condition=models.Q(is_confirmed=True), name='hotel_confirmed_checkin_idx'),
+            models.Index(
+                fields=['check_in'],
+                condition=models.Q(is_confirmed=True, is_paid=False),
+                name='hotel_open_unpaid_idx',
+            ),
+        ]
 
+    def save(self, *args, **kwargs):
         # Convert to euros
         self.convert_to_euros()
 
-        # Get the credit card fee percentage from PaymentSettings
-        payment_settings = PaymentSettings.objects.first()
-        cc_fee_percentage = payment_settings.cc_fee_percentage if payment_settings else Decimal('7.00')  # Fallback to 7%
+        # Get the credit card fee percentage from PaymentSettings (cached)
+        cc_fee_percentage = current_cc_fee_percentage()
 
         # Calculate credit card fee using the utility function
         self.cc_fee = calculate_cc_fee(self.hotel_price, self.payment_type, cc_fee_percentage)
@@ -106,47 +101,35 @@ class HotelBooking(models.Model):
 
         # Save the booking
         was_adding = self._state.adding
-        super().save(*args, **kwargs)
-        sync_hotel_is_paid_from_payments(self.pk)
-        self.refresh_from_db(fields=['is_paid'])
+        # Assigns public_id for new bookings (retried on collision), always stored uppercase
+        save_with_public_id(self, super().save, *args, **kwargs)
+        sync_booking_is_paid(self, created=was_adding)
         from analytics.services import apply_hotel_analytics_after_save
 
         apply_hotel_analytics_after_save(was_adding, self)
 
+        from billing.ledger import refresh_ledger_after_save
+
+        refresh_ledger_after_save(self)
+
     def convert_to_euros(self):
         """Convert both hotel price and customer pays to EUR if they are in another currency."""
         if self.hotel_price_currency == 'EUR':
             self.hotel_price_in_euros = self.hotel_price
         else:
-            rate = get_exchange_rate(self.hotel_price_currency)
-            self.hotel_price_in_euros = (self.hotel_price * rate).quantize(Decimal('0.01'))
+            self.hotel_price_in_euros = money.to_eur(self.hotel_price, get_exchange_rate(self.hotel_price_currency))
 
         if self.customer_pays_currency == 'EUR':
             self.customer_pays_in_euros = self.customer_pays
         else:
-            rate = get_exchange_rate(self.customer_pays_currency)
-            self.customer_pays_in_euros = (self.customer_pays * rate).quantize(Decimal('0.01'))
+            self.customer_pays_in_euros = money.to_eur(self.customer_pays, get_exchange_rate(self.customer_pays_currency))
 
     def calculate_subtotal(self):
         """
         Same agent % rules as driving jobs, but base amount is customer_pays_in_euros
         and there is no driver fee on hotel bookings.
         """
-        customer = self.customer_pays_in_euros or Decimal('0.00')
-        driver_fee = Decimal('0.00')
-        if self.agent_percentage == '5':
-            agent_fee = customer * Decimal('0.05')
-        elif self.agent_percentage == '10':
-            agent_fee = customer * Decimal('0.10')
-        elif self.agent_percentage == '50':
-            agent_fee = (
-                (customer - driver_fee) * Decimal('0.50')
-                if customer > Decimal('0.00')
-                else Decimal('0.00')
-            )
-        else:
-            agent_fee = Decimal('0.00')
-        return (customer - agent_fee).quantize(Decimal('0.01'))
+        return money.hotel_subtotal(self.customer_pays_in_euros, self.agent_percentage)
 
     def __str__(self):
         return f"Booking for {self.customer_name} in {self.hotel_tier} star hotel"
@@ -11,6 +11,8 @@ from hotels.forms import HotelBookingForm
 from django.core.exceptions import ValidationError
 from people.models import Staff
 from django.db import transaction
+from django.contrib.contenttypes.models import ContentType
+from common.payment_settings import current_cc_fee_percentage
 
 
 class HotelBookingTests(TestCase):
@@ -861,4 +863,48 @@ class HotelBookingAdditionalTests(TestCase):
         response = self.client.post(reverse('hotels:add_guests'), data=form_data)
         self.assertEqual(response.status_code, 302)
         booking = HotelBooking.objects.get(customer_name='Multiple Payments')
-        self.assertEqual(booking.payments.count(), 2)
\ No newline at end of file
+        self.assertEqual(booking.payments.count(), 2)
+
+class HotelBookingSaveQueryCountTests(TestCase):
+    def setUp(self):
+        self.agent = Agent.objects.create(name="Query Agent")
+        # Warm the settings and content-type caches, as any running server has
+        current_cc_fee_percentage()
+        ContentType.objects.get_for_model(HotelBooking)
+
+    def build_booking(self):
+        check_in = timezone.now() + timezone.timedelta(days=1)
+        return HotelBooking(
+            customer_name="Query Budget",
+            customer_number="123456789",
+            check_in=check_in,
+            check_out=check_in + timezone.timedelta(days=1),
+            no_of_people=2,
+            hotel_name="Hilton Budapest",
+            rooms=1,
+            hotel_price=Decimal('100.00'),
+            hotel_price_currency='EUR',
+            customer_pays=Decimal('120.00'),
+            customer_pays_currency='EUR',
+            agent=self.agent,
+            agent_percentage='10',
+            is_confirmed=True,
+        )
+
+    def test_create_query_count(self):
+        booking = self.build_booking()
+        # Includes the SAVEPOINT / RELEASE pair around the INSERT that lets a public_id collision be retried,
+        # the upsert of the booking's search row, and the first ledger refresh of the month creating
+        # the bucket's lock row (UPDATE, SELECT, SAVEPOINT, INSERT, RELEASE). The commit then flushes the
+        # batched audit row, customer directory upsert and analytics counters, one query each.
+        with self.assertNumQueries(17), self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+
+    def test_update_query_count(self):
+        booking = self.build_booking()
+        booking.save()
+        booking = HotelBooking.objects.get(pk=booking.pk)
+        booking.customer_pays = Decimal('150.00')
+        # Includes locking the ledger bucket row before its refresh
+        with self.assertNumQueries(9), self.captureOnCommitCallbacks(execute=True):
+            booking.save()
@@ -16,6 +16,7 @@ import logging
 import pytz
 from django.core.exceptions import ValidationError
 from common.payment_paid_sync import sum_complete_payments_eur
+from common.public_ids import get_by_public_id
 logger = logging.getLogger('kt')
 
 # Set the timezone to Hungary
@@ -345,9 +346,8 @@ def client_view_guest(request, public_id):
     if public_id.isdigit():
         return render(request, "errors/404.html", status=404)
 
-    try:
-        guest = HotelBooking.objects.get(public_id=public_id)
-    except HotelBooking.DoesNotExist:
+    guest = get_by_public_id(HotelBooking.objects.all(), public_id)
+    if guest is None:
         return render(request, "errors/404.html", status=404)
 
     recorded_payments_eur = sum_complete_payments_eur(guest.payments)
@@ -365,9 +365,8 @@ def client_view_guest_tefilas_rabim(request, public_id):
     if public_id.isdigit():
         return render(request, "errors/404.html", status=404)
 
-    try:
-        guest = HotelBooking.objects.get(public_id=public_id)
-    except HotelBooking.DoesNotExist:
+    guest = get_by_public_id(HotelBooking.objects.all(), public_id)
+    if guest is None:
         return render(request, "errors/404.html", status=404)
 
     return render(request, 'hotels/client_view_guest_tefilas_rabim.html', {'guest': guest})
\ No newline at end of file
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Job, PaymentSettings
+from .models import Job
+from common.payment_settings import PaymentSettings
 from people.models import Driver, Agent
 
 @admin.register(Job)
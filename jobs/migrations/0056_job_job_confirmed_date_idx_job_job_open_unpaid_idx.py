@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 16:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0055_public_id_upper_unique'),
+        ('people', '0009_delete_freelancer_delete_freelanceragent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('is_confirmed', True)), fields=['job_date', 'job_time'], name='job_confirmed_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('is_confirmed', True), ('is_paid', False)), fields=['job_date'], name='job_open_unpaid_idx'),
+        ),
+    ]
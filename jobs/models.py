@@ -1,21 +1,17 @@
 from django.db import models
 from decimal import Decimal
 from common.utils import get_exchange_rate, CURRENCY_CHOICES, AGENT_FEE_CHOICES, PAYMENT_TYPE_CHOICES, VEHICLE_CHOICES, calculate_cc_fee
-from common.payment_paid_sync import sync_job_is_paid_from_payments
-from common.payment_settings import PaymentSettings
+from common import money
+from common.payment_paid_sync import sync_booking_is_paid
+from common.payment_settings import current_cc_fee_percentage
+from common.public_ids import public_id_constraint, save_with_public_id
 from people.models import Agent, Driver
 import logging
 from django.contrib.auth.models import User
-import secrets
-import string
 
 logger = logging.getLogger('kt')
 
 
-def generate_random_id(length=8):
-    alphabet = string.ascii_uppercase + string.digits
-    return ''.join(secrets.choice(alphabet) for _ in range(length))
-
 class Job(models.Model):
 
     # Job IDs
@@ -84,25 +80,30 @@ class Job(models.Model):
     # Total profit after all calculations
     subtotal = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
 
-    def save(self, *args, **kwargs):
-        # Only generate public_id for new jobs
-        if not self.public_id:
-            while True:
-                new_id = generate_random_id()
-                # Use iexact for case-insensitive check
-                if not Job.objects.filter(public_id__iexact=new_id).exists():
-                    self.public_id = new_id.upper()
-                    break
-        else:
-            # Always ensure stored as uppercase
-            self.public_id = self.public_id.upper()
+    class Meta:
+        constraints = [public_id_constraint('jobs_job')]
+        indexes = [
+            # Home / past jobs / exports / totals: confirmed jobs by date and time. Partial
+            # rather than leading on is_confirmed, which SQLite cannot seek on.
+            models.Index(
+                fields=['job_date', 'job_time'],
+                condition=models.Q(is_confirmed=True),
+                name='job_confirmed_date_idx',
+            ),
+            # Open (confirmed, unpaid) jobs for the unpaid totals and paid reconciliation
+            models.Index(
+                fields=['job_date'],
+                condition=models.Q(is_confirmed=True, is_paid=False),
+                name='job_open_unpaid_idx',
+            ),
+        ]
 
+    def save(self, *args, **kwargs):
         # Currency conversion
         self.convert_to_euros()
 
-        # Get the credit card fee percentage from PaymentSettings
-        payment_settings = PaymentSettings.objects.first()
-        cc_fee_percentage = payment_settings.cc_fee_percentage if payment_settings else Decimal('7.00')  # Fallback
+        # Get the credit card fee percentage from PaymentSettings (cached)
+        cc_fee_percentage = current_cc_fee_percentage()
 
         # Calculate credit card fee using the utility function
         self.cc_fee = calculate_cc_fee(self.job_price, self.payment_type, cc_fee_percentage)
@@ -112,13 +113,17 @@ class Job(models.Model):
 
         # Finally, save the job
         was_adding = self._state.adding
-        super().save(*args, **kwargs)
-        sync_job_is_paid_from_payments(self.pk)
-        self.refresh_from_db(fields=['is_paid'])
+        # Assigns public_id for new jobs (retried on collision), always stored uppercase
+        save_with_public_id(self, super().save, *args, **kwargs)
+        sync_booking_is_paid(self, created=was_adding)
         from analytics.services import apply_job_analytics_after_save
 
         apply_job_analytics_after_save(was_adding, self)
 
+        from billing.ledger import refresh_ledger_after_save
+
+        refresh_ledger_after_save(self)
+
     def convert_to_euros(self):
         logger.debug(f"Converting job price: {self.job_price} {self.job_currency}")
 
@@ -137,28 +142,14 @@ class Job(models.Model):
                 return None
             if currency == 'EUR':
                 return value
-            rate = get_conversion_rate(currency)
-            return (value * rate).quantize(Decimal('0.01'))
+            return money.to_eur(value, get_conversion_rate(currency))
 
         # Convert job price, and driver fee to Euros
         self.job_price_in_euros = convert_field(self.job_price, self.job_currency)
         self.driver_fee_in_euros = convert_field(self.driver_fee, self.driver_currency)
 
     def calculate_subtotal(self):
-        job_price = self.job_price_in_euros or Decimal('0.00')
-        driver_fee = self.driver_fee_in_euros or Decimal('0.00')
-
-        if self.agent_percentage == '5':
-            agent_fee = job_price * Decimal('0.05')
-        elif self.agent_percentage == '10':
-            agent_fee = job_price * Decimal('0.10')
-        elif self.agent_percentage == '50':
-            agent_fee = (job_price - driver_fee) * Decimal('0.50') if job_price > Decimal('0.00') else Decimal('0.00')
-        else:
-            agent_fee = Decimal('0.00')
-
-        subtotal = job_price - driver_fee - agent_fee
-        return subtotal.quantize(Decimal('0.01'))
+        return money.job_subtotal(self.job_price_in_euros, self.driver_fee_in_euros, self.agent_percentage)
 
     def __str__(self):
         """String representation of the Job."""
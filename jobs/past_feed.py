@@ -0,0 +1,217 @@
+"""
+Past bookings feed.
+
+The past jobs page lists confirmed driving jobs, shuttles and hotel bookings together,
+newest first. ``past_bookings_page`` merges them in the database. Each booking type is a
+``values()`` projection of the same sort key: the local date and time, a type rank that
+orders bookings at the same minute (job, then shuttle, then hotel) and the pk. The
+projections are combined with ``UNION ALL`` and ordered on that key.
+
+Pages are keyset paginated. A page link carries the sort key of the row it continues
+from (a cursor), and the query resumes right after it. The page reads its ten rows from
+the date indexes however much history there is, where an offset would read every row
+before it. Only the rows on the page are then loaded as model instances and colored.
+"""
+
+import datetime
+import operator
+from collections import defaultdict, namedtuple
+
+import pytz
+from django.db import connection
+from django.db.models import F, Q, TimeField, Value
+from django.db.models.functions import TruncDate, TruncTime
+
+from common.utils import assign_job_color
+
+budapest_tz = pytz.timezone('Europe/Budapest')
+
+PAGE_SIZE = 10
+FEED_FIELDS = ('sort_date', 'sort_time', 'kind_rank', 'booking_id')
+
+_NOTHING = Q(pk__in=[])
+_STRICT = {'lt': 'lt', 'lte': 'lt', 'gt': 'gt', 'gte': 'gt'}
+_COMPARE = {'lt': operator.lt, 'lte': operator.le, 'gt': operator.gt, 'gte': operator.ge}
+
+
+def _job_position(lookup, date, time):
+    if lookup == 'exact':
+        return Q(job_date=date, job_time=time)
+    return Q(**{f'job_date__{_STRICT[lookup]}': date}) | Q(job_date=date, **{f'job_time__{lookup}': time})
+
+
+def _shuttle_position(lookup, date, time):
+    # Shuttles have no time and sort at the start of their day
+    if lookup == 'exact':
+        return Q(shuttle_date=date) if time == datetime.time.min else _NOTHING
+    same_day = Q(shuttle_date=date) if _COMPARE[lookup](datetime.time.min, time) else _NOTHING
+    return Q(**{f'shuttle_date__{_STRICT[lookup]}': date}) | same_day
+
+
+def _hotel_position(lookup, date, time):
+    # Compared on the projected local key, not on check_in: local time runs twice through
+    # the hour the clocks go back, and there the instants are not in the key's order
+    if lookup == 'exact':
+        return Q(sort_date=date, sort_time=time)
+    return Q(**{f'sort_date__{_STRICT[lookup]}': date}) | Q(sort_date=date, **{f'sort_time__{lookup}': time})
+
+
+# rank: tie-break between types (higher first); sort_date / sort_time: the projected
+# key; ordering: the indexed columns (or key) in the same order; position: Q for a comparison of
+# the key with a cursor's date and time; related: what the page rows render or color by
+FeedSource = namedtuple('FeedSource', 'rank sort_date sort_time ordering position related')
+
+FEED_SOURCES = {
+    'job': FeedSource(
+        3,
+        F('job_date'),
+        F('job_time'),
+        ('job_date', 'job_time'),
+        _job_position,
+        ('driver', 'driver_agent', 'created_by', 'last_modified_by'),
+    ),
+    'shuttle': FeedSource(
+        2,
+        F('shuttle_date'),
+        Value(datetime.time.min, output_field=TimeField()),
+        ('shuttle_date',),
+        _shuttle_position,
+        # assign_job_color probes ``driver`` on every booking
+        ('driver', 'created_by', 'last_modified_by'),
+    ),
+    'hotel': FeedSource(
+        1,
+        TruncDate('check_in', tzinfo=budapest_tz),
+        TruncTime('check_in', tzinfo=budapest_tz),
+        # Served on PostgreSQL by hotel_confirmed_local_checkin_idx
+        ('sort_date', 'sort_time'),
+        _hotel_position,
+        ('created_by', 'last_modified_by'),
+    ),
+}
+KIND_BY_RANK = {source.rank: kind for kind, source in FEED_SOURCES.items()}
+
+PastBookingsPage = namedtuple(
+    'PastBookingsPage', 'items has_next has_previous next_cursor previous_cursor'
+)
+
+
+def encode_cursor(row):
+    return f"{row['sort_date'].isoformat()}_{row['sort_time'].isoformat()}_{row['kind_rank']}_{row['booking_id']}"
+
+
+def parse_cursor(value):
+    """``(date, time, rank, pk)`` from a cursor string, or ``None`` when it is malformed."""
+    try:
+        date, time, rank, pk = (value or '').split('_')
+        cursor = (datetime.date.fromisoformat(date), datetime.time.fromisoformat(time), int(rank), int(pk))
+    except ValueError:
+        return None
+    return cursor if cursor[2] in KIND_BY_RANK else None
+
+
+def _keyset_filter(source, cursor, newer):
+    """Rows of *source* strictly older (or, with *newer*, newer) than *cursor* in feed order."""
+    date, time, rank, pk = cursor
+    strict, loose = ('gt', 'gte') if newer else ('lt', 'lte')
+    if source.rank == rank:
+        return source.position(strict, date, time) | (
+            source.position('exact', date, time) & Q(**{f'pk__{strict}': pk})
+        )
+    # At the cursor's date and time, lower ranks come after the cursor row and higher ones before it
+    includes_same_time = source.rank > rank if newer else source.rank < rank
+    return source.position(loose if includes_same_time else strict, date, time)
+
+
+def _branch_ordering(source, ascending):
+    prefix = '' if ascending else '-'
+    return [f'{prefix}{name}' for name in source.ordering + ('pk',)]
+
+
+def feed_queryset(querysets, cursor=None, newer=False, limit=PAGE_SIZE + 1):
+    """
+    The ``UNION ALL`` of *querysets* projected to ``FEED_FIELDS``, past *cursor* in feed
+    order (towards the newer rows with *newer*) and ordered away from it, up to *limit* rows.
+    """
+    per_branch_limit = connection.features.supports_slicing_ordering_in_compound
+    branches = []
+    for kind, queryset in querysets.items():
+        source = FEED_SOURCES[kind]
+        branch = queryset.values(
+            sort_date=source.sort_date,
+            sort_time=source.sort_time,
+            kind_rank=Value(source.rank),
+            booking_id=F('pk'),
+        )
+        if cursor is not None:
+            branch = branch.filter(_keyset_filter(source, cursor, newer))
+        if len(querysets) == 1 or per_branch_limit:
+            # Each branch reads at most a page from its index before the merge
+            branch = branch.order_by(*_branch_ordering(source, ascending=newer))[:limit]
+        branches.append(branch)
+
+    if len(branches) == 1:
+        return branches[0]
+    prefix = '' if newer else '-'
+    feed = branches[0].union(*branches[1:], all=True)
+    return feed.order_by(*(f'{prefix}{name}' for name in FEED_FIELDS))[:limit]
+
+
+def past_bookings_page(querysets, now, after=None, before=None, last=False, page_size=PAGE_SIZE):
+    """
+    One page of the merged feed over *querysets* (``{'job': ..., 'shuttle': ..., 'hotel': ...}``,
+    each already filtered to the bookings to list), newest first.
+
+    *after* continues with the rows older than that cursor and *before* goes back to the
+    rows newer than it; *last* is the page of the oldest rows. Otherwise, and for a
+    malformed cursor, the first page.
+    """
+    if not querysets:
+        return PastBookingsPage([], False, False, None, None)
+    cursor = parse_cursor(before or after)
+    last = last and cursor is None
+    backwards = last or (bool(before) and cursor is not None)
+    rows = list(feed_queryset(querysets, cursor, newer=backwards, limit=page_size + 1))
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        if not has_more and not last:
+            # Went back past the newest rows: show a full first page instead
+            return past_bookings_page(querysets, now, page_size=page_size)
+        rows.reverse()
+        has_next, has_previous = not last, has_more
+    else:
+        has_next, has_previous = has_more, cursor is not None
+
+    return PastBookingsPage(
+        items=_load_page_items(querysets, rows, now),
+        has_next=has_next and bool(rows),
+        has_previous=has_previous and bool(rows),
+        next_cursor=encode_cursor(rows[-1]) if rows else None,
+        previous_cursor=encode_cursor(rows[0]) if rows else None,
+    )
+
+
+def _load_page_items(querysets, rows, now):
+    """The bookings behind *rows*, in order, with ``type``, ``date_sort`` and ``color`` set."""
+    pks_by_kind = defaultdict(list)
+    for row in rows:
+        pks_by_kind[KIND_BY_RANK[row['kind_rank']]].append(row['booking_id'])
+    loaded = {
+        kind: querysets[kind].model.objects.select_related(*FEED_SOURCES[kind].related).in_bulk(pks)
+        for kind, pks in pks_by_kind.items()
+    }
+
+    items = []
+    for row in rows:
+        kind = KIND_BY_RANK[row['kind_rank']]
+        booking = loaded[kind].get(row['booking_id'])
+        if booking is None:
+            # Deleted between the two queries
+            continue
+        booking.type = kind
+        booking.date_sort = budapest_tz.localize(datetime.datetime.combine(row['sort_date'], row['sort_time']))
+        booking.color = assign_job_color(booking, now)
+        items.append(booking)
+    return items
@@ -1,6 +1,11 @@
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from jobs.forms import JobForm
 from jobs.models import Job
+from jobs.past_feed import past_bookings_page
+from hotels.models import HotelBooking
+from shuttle.models import Shuttle
 from common.models import Payment
 from unittest.mock import patch
 from decimal import Decimal
@@ -10,14 +15,19 @@ from django.urls import reverse
 from unittest.mock import patch, ANY
 from django.core.cache import cache
 from common.utils import assign_job_color
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta
 from django.utils.timezone import now, timedelta
 from unittest import mock
-from common.utils import fetch_and_cache_exchange_rate
+from common.exchange_rate_models import ExchangeRate
 import pytz
 from common.utils import get_exchange_rate
 from django.contrib.auth import get_user_model
 from people.models import Driver, Agent
+from analytics.models import JobAnalyticsSummary
+from common.models import AuditLogEntry
+from common.commit_batch import _Batch
+from django.contrib.contenttypes.models import ContentType
+from common.payment_settings import current_cc_fee_percentage
 from django.contrib.auth.models import User
 from decimal import Decimal, ROUND_HALF_UP
 
@@ -494,13 +504,13 @@ class JobColorAssignmentTest(TestCase):
 
 
 class ExchangeRateCacheTest(TestCase):
-    @patch('common.utils.fetch_and_cache_exchange_rate')
-    def test_rates_read_from_cache(self, mock_fetch_and_cache_exchange_rate):
+    @patch('common.exchange_rates.fetch_rates')
+    def test_rates_read_from_cache(self, mock_fetch_rates):
         cache.clear()
         cache.set('exchange_rate_GBP', Decimal('1.20'), timeout=3600)
         rate = get_exchange_rate('GBP')
         self.assertEqual(rate, Decimal('1.20'))
-        mock_fetch_and_cache_exchange_rate.assert_not_called()
+        mock_fetch_rates.assert_not_called()
 
     @override_settings(CACHES={
         'default': {
@@ -508,18 +518,18 @@ class ExchangeRateCacheTest(TestCase):
             'LOCATION': 'exchange_rate_cache_test',
         }
     })
-    @patch('common.utils.fetch_and_cache_exchange_rate')
-    def test_rates_fetched_and_cached(self, mock_fetch_and_cache_exchange_rate):
+    @patch('common.exchange_rates.fetch_rates')
+    def test_rates_read_from_db_and_cached(self, mock_fetch_rates):
         """
-        When cache is cold and DB has no row, get_exchange_rate delegates to
-        fetch_and_cache_exchange_rate. (Mocking fetch skips real cache.set;
-        caching is covered in common.tests.ExchangeRateTests.)
+        When the cache is cold, get_exchange_rate reads the stored row and caches it;
+        refreshing from the API is left to the refresh_exchange_rates command.
         """
         cache.clear()
-        mock_fetch_and_cache_exchange_rate.return_value = Decimal('1.19')
+        ExchangeRate.objects.create(currency='GBP', rate=Decimal('1.1900'))
         rate = get_exchange_rate('GBP')
-        mock_fetch_and_cache_exchange_rate.assert_called_once_with('GBP')
-        self.assertEqual(rate, Decimal('1.19'))
+        self.assertEqual(rate, Decimal('1.1900'))
+        self.assertEqual(cache.get('exchange_rate_GBP'), Decimal('1.1900'))
+        mock_fetch_rates.assert_not_called()
 
 
 class EnquiriesViewTests(TestCase):
@@ -788,3 +798,299 @@ class AddJobWithPaymentsTest(TestCase):
         self.assertEqual(payment2.payment_currency, 'USD')
         self.assertEqual(payment2.payment_type, 'Cash')
 
+
+
+class JobSaveQueryCountTests(TestCase):
+    """Per-save query budget: cached settings, in-memory paid sync, batched side effects."""
+
+    def setUp(self):
+        self.driver = Driver.objects.create(name='Query Driver')
+        # Warm the settings and content-type caches, as any running server has
+        current_cc_fee_percentage()
+        ContentType.objects.get_for_model(Job)
+
+    def build_job(self):
+        return Job(
+            customer_name='Query Budget',
+            customer_number='+3611111111',
+            job_date=timezone.now().date(),
+            job_time=timezone.now().time(),
+            job_price=Decimal('100.00'),
+            job_currency='EUR',
+            pick_up_location='Airport',
+            no_of_passengers=1,
+            driver=self.driver,
+        )
+
+    def test_create_query_count(self):
+        job = self.build_job()
+        # Includes the SAVEPOINT / RELEASE pair around the INSERT that lets a public_id collision be retried,
+        # the upsert of the booking's search row, and the first ledger refresh of the month creating
+        # the bucket's lock row (UPDATE, SELECT, SAVEPOINT, INSERT, RELEASE). The commit then flushes the
+        # batched audit row, customer directory upsert and analytics counters, one query each.
+        with self.assertNumQueries(16), self.captureOnCommitCallbacks(execute=True):
+            job.save()
+
+    def test_update_query_count(self):
+        job = self.build_job()
+        job.save()
+        job = Job.objects.get(pk=job.pk)
+        job.customer_name = 'Query Budget Renamed'
+        # The rename also rewrites the job's search row; the ledger refresh locks its bucket row by bumping its version
+        with self.assertNumQueries(9), self.captureOnCommitCallbacks(execute=True):
+            job.save()
+
+    def test_side_effects_flush_once_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for _ in range(3):
+                self.build_job().save()
+        # One batch per side effect for all three saves
+        batches = [callback for callback in callbacks if isinstance(callback, _Batch)]
+        self.assertEqual(
+            sorted((batch.key, len(batch.items)) for batch in batches),
+            [('analytics-deltas', 3), ('audit-entries', 3), ('customer-directory', 3)],
+        )
+        self.assertEqual(Job.objects.count(), 3)
+        self.assertEqual(JobAnalyticsSummary.objects.get(pk=1).driving_total, 3)
+        self.assertEqual(AuditLogEntry.objects.filter(action=AuditLogEntry.ACTION_CREATED).count(), 3)
+
+
+@patch('jobs.models.get_exchange_rate', return_value=Decimal('1'))
+class PublicIdAllocationTests(TestCase):
+    def build_job(self, **kwargs):
+        return Job(
+            customer_name='Link Customer',
+            customer_number='+3622222222',
+            job_date=timezone.now().date(),
+            job_time=timezone.now().time(),
+            job_price=Decimal('100.00'),
+            job_currency='EUR',
+            no_of_passengers=1,
+            **kwargs,
+        )
+
+    def build_job_saved(self):
+        job = self.build_job()
+        job.save()
+        return job
+
+    def test_insert_does_not_probe_for_existing_ids(self, _mock_rate):
+        job = self.build_job()
+        with CaptureQueriesContext(connection) as ctx:
+            job.save()
+        self.assertRegex(job.public_id, r'^[A-Z0-9]{8}$')
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT') and 'public_id' in q['sql']])
+
+    def test_collision_is_retried_with_a_new_id(self, _mock_rate):
+        taken = self.build_job()
+        taken.save()
+        with patch('common.public_ids.generate_public_id', side_effect=[taken.public_id.lower(), 'FRESH001']):
+            job = self.build_job()
+            job.save()
+        self.assertEqual(job.public_id, 'FRESH001')
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_explicit_ids_are_upper_cased_and_unique_regardless_of_case(self, _mock_rate):
+        job = self.build_job(public_id='abc12345')
+        job.save()
+        self.assertEqual(Job.objects.get(pk=job.pk).public_id, 'ABC12345')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Job.objects.filter(pk=self.build_job_saved().pk).update(public_id='abc12345')
+
+    def test_client_link_is_case_insensitive(self, _mock_rate):
+        job = self.build_job_saved()
+        response = self.client.get(reverse('jobs:client_job_view', args=[job.public_id.lower()]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['job'], job)
+        response = self.client.get(reverse('jobs:client_job_view', args=['NOSUCHID']))
+        self.assertEqual(response.status_code, 404)
+
+
+@patch('hotels.models.get_exchange_rate', return_value=Decimal('1.00'))
+@patch('jobs.models.get_exchange_rate', return_value=Decimal('1.00'))
+class PastBookingsFeedTests(TestCase):
+    def setUp(self):
+        self.driver = Driver.objects.create(name='Feed Driver')
+        self.client.force_login(get_user_model().objects.create_user(username='feed', password='password'))
+        self.day = timezone.localdate() - timedelta(days=3)
+
+    def make_job(self, **fields):
+        values = {
+            'customer_name': 'Anna Kovács',
+            'customer_number': '+36201234567',
+            'job_price': Decimal('100.00'),
+            'job_currency': 'EUR',
+            'pick_up_location': 'Ferihegy Terminal 2',
+            'no_of_passengers': 1,
+            'driver': self.driver,
+            'is_confirmed': True,
+        }
+        values.update(fields)
+        return Job.objects.create(**values)
+
+    def make_shuttle(self, **fields):
+        values = {
+            'customer_name': 'Bence Nagy',
+            'customer_number': '+36309876543',
+            'shuttle_direction': 'buda_keres',
+            'no_of_passengers': 2,
+            'driver': self.driver,
+            'is_confirmed': True,
+        }
+        values.update(fields)
+        return Shuttle.objects.create(**values)
+
+    def make_hotel(self, **fields):
+        values = {
+            'customer_name': 'Clara Smithson',
+            'customer_number': '+447700900123',
+            'hotel_name': 'Hilton Budapest',
+            'no_of_people': 1,
+            'rooms': 1,
+            'hotel_price': Decimal('100.00'),
+            'hotel_price_currency': 'EUR',
+            'customer_pays': Decimal('120.00'),
+            'customer_pays_currency': 'EUR',
+            'is_confirmed': True,
+        }
+        values.update(fields)
+        values.setdefault('check_out', values['check_in'] + timedelta(days=2))
+        return HotelBooking.objects.create(**values)
+
+    def local(self, day, hour, minute=0):
+        return BUDAPEST_TZ.localize(datetime(day.year, day.month, day.day, hour, minute))
+
+    def make_history(self):
+        """Bookings over four days with equal times across and within types; newest first."""
+        bookings = []
+        for offset in range(4):
+            day = self.day - timedelta(days=offset)
+            for hour in (18, 10):
+                bookings.append(('job', self.make_job(job_date=day, job_time=self.local(day, hour).time()).pk))
+                bookings.append(('job', self.make_job(job_date=day, job_time=self.local(day, hour).time()).pk))
+                bookings.append(('hotel', self.make_hotel(check_in=self.local(day, hour)).pk))
+            bookings.append(('shuttle', self.make_shuttle(shuttle_date=day).pk))
+            bookings.append(('hotel', self.make_hotel(check_in=self.local(day, 0)).pk))
+        expected = []
+        for index in range(0, len(bookings), 8):
+            day_rows = bookings[index:index + 8]
+            # Same time: job before shuttle before hotel, then the higher pk first
+            expected += [day_rows[1], day_rows[0], day_rows[2], day_rows[4], day_rows[3], day_rows[5]]
+            expected += [day_rows[6], day_rows[7]]
+        return expected
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('jobs:past_jobs'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page'], [(item.type, item.pk) for item in response.context['past_jobs']]
+
+    def test_pages_follow_the_merged_order_without_gaps(self, *_mocks):
+        expected = self.make_history()
+        page, rows = self.get_page()
+        self.assertFalse(page.has_previous)
+        seen = list(rows)
+        pages = [rows]
+        while page.has_next:
+            page, rows = self.get_page(after=page.next_cursor)
+            self.assertTrue(page.has_previous)
+            seen += rows
+            pages.append(rows)
+        self.assertEqual(seen, expected)
+        self.assertEqual([len(rows) for rows in pages], [10, 10, 10, 2])
+
+        # Back from the short last page, then the oldest page directly
+        page, rows = self.get_page(before=page.previous_cursor)
+        self.assertEqual(rows, pages[2])
+        self.assertEqual(self.get_page(last='1')[1], expected[-10:])
+        self.assertEqual(self.get_page(before=self.get_page()[0].next_cursor)[1], pages[0])
+
+    def test_page_reads_one_feed_query_and_the_page_rows(self, *_mocks):
+        self.make_history()
+        page, _rows = self.get_page()
+        current = timezone.now().astimezone(BUDAPEST_TZ)
+        querysets = {
+            'job': Job.objects.filter(is_confirmed=True, job_date__lt=current.date()),
+            'shuttle': Shuttle.objects.filter(is_confirmed=True, shuttle_date__lt=current.date()),
+            'hotel': HotelBooking.objects.filter(is_confirmed=True, check_in__lt=current),
+        }
+        # The feed, then one query per booking type on the page
+        with self.assertNumQueries(4):
+            page = past_bookings_page(querysets, current, after=page.next_cursor)
+        self.assertTrue(all(item.color for item in page.items))
+        with self.assertNumQueries(0):
+            [(item.created_by, item.last_modified_by, getattr(item, 'driver', None)) for item in page.items]
+
+    def test_type_filter_search_and_bad_cursor(self, *_mocks):
+        expected = self.make_history()
+        self.assertEqual(self.get_page(type='shuttle')[1], [row for row in expected if row[0] == 'shuttle'])
+        self.assertEqual(self.get_page(q='smith')[1], [row for row in expected if row[0] == 'hotel'][:10])
+        self.assertEqual(self.get_page(after='not-a-cursor')[1], expected[:10])
+        self.assertEqual(self.get_page(after='2020-01-01_00:00:00_9_1')[1], expected[:10])
+
+    def confirmed_querysets(self, kinds=('job', 'shuttle', 'hotel')):
+        querysets = {
+            'job': Job.objects.filter(is_confirmed=True),
+            'shuttle': Shuttle.objects.filter(is_confirmed=True),
+            'hotel': HotelBooking.objects.filter(is_confirmed=True),
+        }
+        return {kind: querysets[kind] for kind in kinds}
+
+    def walk(self, querysets, page_size):
+        """Every row of the feed, following the next links and then back again."""
+        current = timezone.now()
+        page = past_bookings_page(querysets, current, page_size=page_size)
+        pages = [[(item.type, item.pk) for item in page.items]]
+        while page.has_next:
+            self.assertLess(len(pages), 20, 'the next links never end')
+            page = past_bookings_page(querysets, current, after=page.next_cursor, page_size=page_size)
+            pages.append([(item.type, item.pk) for item in page.items])
+        back = []
+        while page.has_previous:
+            self.assertLess(len(back), 20, 'the previous links never end')
+            page = past_bookings_page(querysets, current, before=page.previous_cursor, page_size=page_size)
+            back.insert(0, [(item.type, item.pk) for item in page.items])
+        return [row for rows in pages for row in rows], back, pages
+
+    def test_pages_split_ties_between_types_at_the_same_minute(self, *_mocks):
+        midnight = self.local(self.day, 0)
+        jobs = [self.make_job(job_date=self.day, job_time=midnight.time()).pk for _ in range(2)]
+        shuttles = [self.make_shuttle(shuttle_date=self.day).pk for _ in range(2)]
+        hotels = [self.make_hotel(check_in=midnight).pk for _ in range(2)]
+        newer = self.make_job(job_date=self.day, job_time=self.local(self.day, 0, 1).time()).pk
+        older = self.make_hotel(check_in=midnight - timedelta(minutes=1)).pk
+        expected = (
+            [('job', newer)]
+            + [('job', pk) for pk in reversed(jobs)]
+            + [('shuttle', pk) for pk in reversed(shuttles)]
+            + [('hotel', pk) for pk in reversed(hotels)]
+            + [('hotel', older)]
+        )
+        for page_size in (1, 2, 3, 4):
+            with self.subTest(page_size=page_size):
+                rows, back, pages = self.walk(self.confirmed_querysets(), page_size)
+                self.assertEqual(rows, expected)
+                self.assertEqual(back, pages[:-1])
+
+    def test_pages_through_the_hour_repeated_when_the_clocks_go_back(self, *_mocks):
+        # 2025-10-26: Budapest goes from 03:00 CEST back to 02:00 CET, so 02:00-02:59 happens twice
+        day = date(2025, 10, 26)
+        first_pass = lambda hour, minute: BUDAPEST_TZ.localize(datetime(2025, 10, 26, hour, minute), is_dst=True)
+        second_pass = lambda hour, minute: BUDAPEST_TZ.localize(datetime(2025, 10, 26, hour, minute), is_dst=False)
+        before = self.make_hotel(check_in=first_pass(1, 50)).pk
+        early_first = self.make_hotel(check_in=first_pass(2, 30)).pk
+        late_first = self.make_hotel(check_in=first_pass(2, 45)).pk
+        early_second = self.make_hotel(check_in=second_pass(2, 15)).pk
+        late_second = self.make_hotel(check_in=second_pass(2, 30)).pk
+        after = self.make_hotel(check_in=second_pass(3, 10)).pk
+        job = self.make_job(job_date=day, job_time=time(2, 30)).pk
+        # Newest first by local time; both 02:30 hotels tie, after the job at the same minute
+        expected = [
+            ('hotel', after), ('hotel', late_first), ('job', job), ('hotel', late_second),
+            ('hotel', early_first), ('hotel', early_second), ('hotel', before),
+        ]
+        for kinds in (('job', 'shuttle', 'hotel'), ('hotel',)):
+            for page_size in (1, 2, 3):
+                with self.subTest(kinds=kinds, page_size=page_size):
+                    rows, back, pages = self.walk(self.confirmed_querysets(kinds), page_size)
+                    self.assertEqual(rows, [row for row in expected if row[0] in kinds])
+                    self.assertEqual(back, pages[:-1])
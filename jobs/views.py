@@ -11,7 +11,6 @@ from common.models import Payment
 from jobs.forms import JobForm
 from common.forms import PaymentForm
 from datetime import timedelta
-from django.core.paginator import Paginator
 from django.forms import modelformset_factory
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
@@ -28,32 +27,45 @@ from common.utils import (
     get_home_exchange_rate_banner_context,
 )
 from common.payment_paid_sync import sum_complete_payments_eur
+from common.public_ids import get_by_public_id
+from common.search import matching_booking_ids
+from jobs.past_feed import past_bookings_page
 import datetime
 from django.utils.html import escape
-from operator import attrgetter
-from django.utils.timezone import make_aware, is_naive
 logger = logging.getLogger('kt')
 
 # Set the timezone to Hungary
 hungary_tz = pytz.timezone('Europe/Budapest')
 
 
+def upcoming_job_filter(now_hungary):
+    """Jobs after *now_hungary*. The leading ``job_date >=`` bound keeps it an index range."""
+    return Q(job_date__gte=now_hungary.date()) & (
+        Q(job_date__gt=now_hungary.date()) |
+        (Q(job_date=now_hungary.date()) & Q(job_time__gt=now_hungary.time()))
+    )
+
+
+def past_job_filter(now_hungary):
+    """Jobs before *now_hungary* (index range on ``job_date <=``, as above)."""
+    return Q(job_date__lte=now_hungary.date()) & (
+        Q(job_date__lt=now_hungary.date()) |
+        (Q(job_date=now_hungary.date()) & Q(job_time__lt=now_hungary.time()))
+    )
+
+
 def get_filtered_jobs(now_hungary, recent=False):
     two_days_ago = now_hungary - timedelta(days=2)
     
     if recent:
         logger.debug(f"Fetching recent confirmed jobs from {two_days_ago}")
         return Job.objects.filter(
-            (Q(job_date__lt=now_hungary.date()) |
-             (Q(job_date=now_hungary.date()) & Q(job_time__lt=now_hungary.time()))) &
-            Q(is_confirmed=True)
+            past_job_filter(now_hungary) & Q(is_confirmed=True)
         ).filter(job_date__gte=two_days_ago.date()).order_by('-job_date', '-job_time')
     else:
         logger.debug(f"Fetching upcoming confirmed jobs after {now_hungary}")
         return Job.objects.filter(
-            (Q(job_date__gt=now_hungary.date()) |
-             (Q(job_date=now_hungary.date()) & Q(job_time__gt=now_hungary.time()))) &
-            Q(is_confirmed=True)
+            upcoming_job_filter(now_hungary) & Q(is_confirmed=True)
         ).order_by('job_date', 'job_time')
 
 
@@ -85,9 +97,7 @@ def home(request):
 
     # Upcoming driving jobs
     all_upcoming_jobs = Job.objects.filter(
-        (Q(job_date__gt=now_hungary.date()) |
-         (Q(job_date=now_hungary.date()) & Q(job_time__gt=now_hungary.time()))) &
-        Q(is_confirmed=True)
+        upcoming_job_filter(now_hungary) & Q(is_confirmed=True)
     ).order_by('job_date', 'job_time')
 
     for job in all_upcoming_jobs:
@@ -206,10 +216,7 @@ def past_jobs(request):
     else:
         filter_type = raw_type
 
-    job_filter = (
-        Q(job_date__lt=now.date()) |
-        (Q(job_date=now.date()) & Q(job_time__lt=now.time()))
-    )
+    job_filter = past_job_filter(now)
     shuttle_filter = Q(shuttle_date__lt=now.date())
     hotel_filter = Q(check_in__lt=now)
 
@@ -219,58 +226,27 @@ def past_jobs(request):
         hotel_queryset = HotelBooking.objects.filter(hotel_filter, is_confirmed=True)
 
         if query:
-            filters = (
-                Q(customer_name__icontains=query) |
-                Q(customer_number__icontains=query)
-            )
-            job_queryset = job_queryset.filter(
-                filters |
-                Q(job_description__icontains=query) |
-                Q(pick_up_location__icontains=query) |
-                Q(public_id__icontains=query)
-            )
-            shuttle_queryset = shuttle_queryset.filter(filters)
-            hotel_queryset = hotel_queryset.filter(filters)
-
-        include_job = filter_type in ('', 'job')
-        include_shuttle = filter_type in ('', 'shuttle')
-        include_hotel = filter_type in ('', 'hotel')
-
-        combined = []
-        if include_job:
-            for job in job_queryset:
-                job.type = 'job'
-                job.date_sort = make_aware(
-                    datetime.datetime.combine(job.job_date, job.job_time), timezone=hungary_tz
-                )
-                job.color = assign_job_color(job, now)
-                combined.append(job)
-
-        if include_shuttle:
-            for shuttle in shuttle_queryset:
-                shuttle.type = 'shuttle'
-                shuttle.date_sort = make_aware(
-                    datetime.datetime.combine(shuttle.shuttle_date, datetime.time.min),
-                    timezone=hungary_tz,
-                )
-                shuttle.color = assign_job_color(shuttle, now)
-                combined.append(shuttle)
-
-        if include_hotel:
-            for hotel in hotel_queryset:
-                hotel.type = 'hotel'
-                hotel_date = hotel.check_in
-                if is_naive(hotel_date):
-                    hotel_date = make_aware(hotel_date, timezone=hungary_tz)
-                hotel.date_sort = hotel_date
-                hotel.color = assign_job_color(hotel, now)
-                combined.append(hotel)
-
-        combined.sort(key=attrgetter('date_sort'), reverse=True)
-
-        paginator = Paginator(combined, 10)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+            # Substring match through the search index instead of icontains on each table
+            job_queryset = job_queryset.filter(pk__in=matching_booking_ids('job', query))
+            shuttle_queryset = shuttle_queryset.filter(pk__in=matching_booking_ids('shuttle', query))
+            hotel_queryset = hotel_queryset.filter(pk__in=matching_booking_ids('hotel', query))
+
+        querysets = {}
+        if filter_type in ('', 'job'):
+            querysets['job'] = job_queryset
+        if filter_type in ('', 'shuttle'):
+            querysets['shuttle'] = shuttle_queryset
+        if filter_type in ('', 'hotel'):
+            querysets['hotel'] = hotel_queryset
+
+        # Merged, ordered and paginated in the database; only the page's rows are loaded
+        page = past_bookings_page(
+            querysets,
+            now,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            last=request.GET.get('last') == '1',
+        )
 
     except Exception as e:
         logger.error(f"[PAST JOBS ERROR] {e}")
@@ -283,7 +259,8 @@ def past_jobs(request):
         return render(request, 'errors/error_page.html', {'error_message': 'An error occurred fetching past jobs.'})
 
     ctx = {
-        'past_jobs': page_obj,
+        'past_jobs': page.items,
+        'page': page,
         'query': query,
         'filter_type': filter_type,
         'month_range': [(i, datetime.date(1900, i, 1).strftime('%B')) for i in range(1, 13)],
@@ -620,9 +597,8 @@ def client_job_view(request, lookup):
     if lookup.isdigit():
         return render(request, "errors/404.html", status=404)
 
-    try:
-        job = Job.objects.get(public_id=lookup)
-    except Job.DoesNotExist:
+    job = get_by_public_id(Job.objects.all(), lookup)
+    if job is None:
         return render(request, "errors/404.html", status=404)
 
     recorded_payments_eur = sum_complete_payments_eur(job.payments)
@@ -641,9 +617,8 @@ def client_view_job_driver(request, public_id):
     if public_id.isdigit():
         return render(request, "errors/404.html", status=404)
 
-    try:
-        job = Job.objects.get(public_id=public_id)
-    except Job.DoesNotExist:
+    job = get_by_public_id(Job.objects.all(), public_id)
+    if job is None:
         return render(request, "errors/404.html", status=404)
 
     recorded_payments_eur = sum_complete_payments_eur(job.payments)
@@ -0,0 +1,49 @@
+# Case-insensitive unique index on public_id. Existing ids are upper-cased first, and
+# blank or duplicated ones re-issued, so the constraint can be created.
+
+import secrets
+import string
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+ALPHABET = string.ascii_uppercase + string.digits
+
+
+def new_public_id():
+    return ''.join(secrets.choice(ALPHABET) for _ in range(8))
+
+
+def forwards(apps, schema_editor):
+    Shuttle = apps.get_model('shuttle', 'Shuttle')
+    rows = list(Shuttle.objects.order_by('pk').values_list('pk', 'public_id'))
+    taken = {(public_id or '').upper() for _pk, public_id in rows}
+    seen = set()
+    for pk, public_id in rows:
+        normalized = (public_id or '').upper()
+        if not normalized or normalized in seen:
+            # Blank, or a case-insensitive duplicate of an older row's id
+            normalized = new_public_id()
+            while normalized in taken:
+                normalized = new_public_id()
+            taken.add(normalized)
+        seen.add(normalized)
+        if normalized != public_id:
+            Shuttle.objects.filter(pk=pk).update(public_id=normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shuttle', '0019_shuttle_is_freelancer'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='shuttle',
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Upper('public_id'), name='shuttle_shuttle_public_id_upper_uniq'
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 16:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0009_delete_freelancer_delete_freelanceragent'),
+        ('shuttle', '0020_public_id_upper_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shuttle',
+            index=models.Index(condition=models.Q(('is_confirmed', True)), fields=['shuttle_date'], name='shuttle_confirmed_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shuttle',
+            index=models.Index(condition=models.Q(('is_confirmed', True), ('is_paid', False)), fields=['shuttle_date'], name='shuttle_open_unpaid_idx'),
+        ),
+    ]
@@ -1,7 +1,5 @@
 from django.db import models
 from django.contrib.auth.models import User
-import secrets
-import string
 from django.db import models
 import pytz
 from django.utils import timezone
@@ -10,7 +8,9 @@ from people.models import Staff, Driver
 from decimal import Decimal
 from people.models import Driver
 from common.utils import get_exchange_rate, CURRENCY_CHOICES
-from common.payment_paid_sync import sync_shuttle_is_paid_from_payments
+from common.payment_paid_sync import sync_booking_is_paid
+from common.public_ids import public_id_constraint, save_with_public_id
+from common.singletons import CachedSingleton
 from decimal import Decimal, ROUND_HALF_UP
 
 
@@ -22,10 +22,6 @@ class ShuttleDay(models.Model):
         return str(self.date)
 
 
-def generate_random_id(length=8):
-    alphabet = string.ascii_uppercase + string.digits
-    return ''.join(secrets.choice(alphabet) for _ in range(length))
-
 
 class ShuttleConfig(models.Model):
     price_per_passenger = models.DecimalField(max_digits=10, decimal_places=2, default=60.00)
@@ -37,11 +33,26 @@ class ShuttleConfig(models.Model):
         # Enforce singleton pattern
         self.pk = 1
         super(ShuttleConfig, self).save(*args, **kwargs)
+        SHUTTLE_CONFIG.invalidate()
+
+    def delete(self, *args, **kwargs):
+        result = super(ShuttleConfig, self).delete(*args, **kwargs)
+        SHUTTLE_CONFIG.invalidate()
+        return result
 
     @classmethod
     def load(cls):
-        obj, created = cls.objects.get_or_create(pk=1)
-        return obj
+        # Cached until the row is saved (common.singletons)
+        return SHUTTLE_CONFIG.get()
+
+
+def _load_shuttle_config():
+    obj, created = ShuttleConfig.objects.get_or_create(pk=1)
+    return obj
+
+
+SHUTTLE_CONFIG = CachedSingleton('shuttle-config', _load_shuttle_config)
+
 
 class Shuttle(models.Model):
     DIRECTION_CHOICES = [
@@ -78,19 +89,18 @@ class Shuttle(models.Model):
     last_modified_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='shuttles_modified')
     last_modified_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        # Generate public_id if missing
-        if not self.public_id:
-            while True:
-                new_id = generate_random_id()
-                # Case-insensitive uniqueness check
-                if not Shuttle.objects.filter(public_id__iexact=new_id).exists():
-                    self.public_id = new_id.upper()
-                    break
-        else:
-            # Always enforce uppercase
-            self.public_id = self.public_id.upper()
+    class Meta:
+        constraints = [public_id_constraint('shuttle_shuttle')]
+        indexes = [
+            models.Index(fields=['shuttle_date'], condition=models.Q(is_confirmed=True), name='shuttle_confirmed_date_idx'),
+            models.Index(
+                fields=['shuttle_date'],
+                condition=models.Q(is_confirmed=True, is_paid=False),
+                name='shuttle_open_unpaid_idx',
+            ),
+        ]
 
+    def save(self, *args, **kwargs):
         # Set the timezone to Budapest
         budapest_tz = pytz.timezone('Europe/Budapest')
         self.date = timezone.now().astimezone(budapest_tz).date()
@@ -102,19 +112,18 @@ class Shuttle(models.Model):
         # Calculate price: €60 per passenger
         self.price = self.no_of_passengers * price_per_passenger
 
-        # Get the credit card fee percentage from PaymentSettings
-        from common.payment_settings import PaymentSettings  # Avoid circular import
-        payment_settings = PaymentSettings.objects.first()
-        cc_fee_percentage = payment_settings.cc_fee_percentage if payment_settings else Decimal('7.00')
-
         was_adding = self._state.adding
-        super(Shuttle, self).save(*args, **kwargs)
-        sync_shuttle_is_paid_from_payments(self.pk)
-        self.refresh_from_db(fields=['is_paid'])
+        # Assigns public_id if missing (retried on collision), always stored uppercase
+        save_with_public_id(self, super(Shuttle, self).save, *args, **kwargs)
+        sync_booking_is_paid(self, created=was_adding)
         from analytics.services import apply_shuttle_analytics_after_save
 
         apply_shuttle_analytics_after_save(was_adding, self)
 
+        from billing.ledger import refresh_ledger_after_save
+
+        refresh_ledger_after_save(self)
+
 
 # --- ShuttleDailyCost Model ---
 class ShuttleDailyCost(models.Model):
@@ -11,6 +11,13 @@ from unittest.mock import patch
 import datetime
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import date
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from common.export_queue import request_export
+from common.models import Payment
+from common.utils import scramble_date
+from people.models import Staff
+from django.contrib.contenttypes.models import ContentType
 
 class ShuttleModelTest(TestCase):
 
@@ -480,7 +487,7 @@ class ViewDayInfoTests(TestCase):
             price=Decimal('200.00')
         )
 
-    @patch('common.utils.fetch_and_cache_exchange_rate', return_value=1)
+    @patch('common.exchange_rates.fetch_rates', return_value={})
     def test_redirect_if_not_logged_in(self, _):
         response = self.client.get(reverse('shuttle:view_day_info', args=[str(self.date)]))
         self.assertNotEqual(response.status_code, 200)
@@ -538,7 +545,7 @@ class ShuttleDailyCostsViewTests(TestCase):
         self.assertNotEqual(response.status_code, 200)
         self.assertIn('/login/', response.url)
 
-    @patch('common.utils.fetch_and_cache_exchange_rate', return_value=1.2)
+    @patch('common.exchange_rates.fetch_rates', return_value={})
     def test_get_daily_cost_formset_as_logged_in_user(self, _):
         self.client.login(username='testuser', password='testpass')
         response = self.client.get(self.url)
@@ -547,7 +554,7 @@ class ShuttleDailyCostsViewTests(TestCase):
         self.assertIn('formset', response.context)
         self.assertEqual(str(response.context['date']), self.date)
 
-    @patch('common.utils.fetch_and_cache_exchange_rate', return_value=1.2)
+    @patch('common.exchange_rates.fetch_rates', return_value={})
     def test_post_valid_daily_cost(self, _):
         self.client.login(username='testuser', password='testpass')
         parent = ShuttleDay.objects.get_or_create(date=self.date)[0]
@@ -569,7 +576,7 @@ class ShuttleDailyCostsViewTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertTrue(ShuttleDailyCost.objects.filter(parent=parent, driver=self.driver).exists())
 
-    @patch('common.utils.fetch_and_cache_exchange_rate', return_value=1.2)
+    @patch('common.exchange_rates.fetch_rates', return_value={})
     def test_post_invalid_daily_cost(self, _):
         self.client.login(username='testuser', password='testpass')
         ShuttleDay.objects.get_or_create(date=self.date)  # Ensure parent exists
@@ -595,4 +602,109 @@ class ShuttleDailyCostsViewTests(TestCase):
             print("No context or formset found – response likely redirected.")
 
         self.assertEqual(response.status_code, 200)
-        self.assertContains(response, "Please correct the form errors.")
\ No newline at end of file
+        self.assertContains(response, "Please correct the form errors.")
+
+class ShuttleSummaryViewTests(TestCase):
+    def setUp(self):
+        self.date = date(2025, 6, 11)
+        self.staff = Staff.objects.create(name='Desk')
+
+    def mk_shuttle(self, name, paid=None):
+        shuttle = Shuttle.objects.create(
+            customer_name=name,
+            shuttle_date=self.date,
+            is_confirmed=True,
+            no_of_passengers=2,
+        )
+        if paid is not None:
+            Payment.objects.create(
+                shuttle=shuttle,
+                payment_amount=paid,
+                payment_currency='EUR',
+                payment_type='Cash',
+                paid_to_staff=self.staff,
+            )
+        return shuttle
+
+    def get_summary(self):
+        return self.client.get(reverse('shuttle:shuttle_summary', args=[scramble_date(str(self.date))]))
+
+    def test_balances_come_from_one_annotated_query(self):
+        self.mk_shuttle('Alpha', paid=Decimal('30.00'))
+        with CaptureQueriesContext(connection) as one_shuttle:
+            self.get_summary()
+
+        self.mk_shuttle('Bravo')
+        self.mk_shuttle('Charlie', paid=Decimal('500.00'))
+        with CaptureQueriesContext(connection) as three_shuttles:
+            response = self.get_summary()
+
+        self.assertEqual(len(three_shuttles), len(one_shuttle))
+        balances = {s.customer_name: (s.payment_balance, s.has_recorded_payments) for s in response.context['shuttles']}
+        price = Shuttle.objects.get(customer_name='Alpha').price
+        self.assertEqual(balances['Alpha'], (price - Decimal('30.00'), True))
+        self.assertEqual(balances['Bravo'], (price, False))
+        self.assertEqual(balances['Charlie'], (Decimal('0.00'), True))
+
+
+class ShuttleDriverAssignmentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        self.driver = Driver.objects.create(name='Assigned Driver')
+        self.day = date(2025, 6, 11)
+        self.shuttle = Shuttle.objects.create(
+            customer_name='Bulk Assign',
+            customer_number='+3611111111',
+            shuttle_date=self.day,
+            shuttle_direction='both_ways',
+            no_of_passengers=2,
+            is_confirmed=True,
+        )
+        self.export_params = {'year': 2025, 'month': 6, 'driver': None, 'direction': '', 'is_paid': None}
+
+    def test_assigning_a_driver_invalidates_stored_shuttle_exports(self):
+        job = request_export('shuttles', 'csv', self.export_params)
+        self.assertEqual(request_export('shuttles', 'csv', self.export_params).pk, job.pk)
+
+        response = self.client.post(
+            reverse('shuttle:shuttle'),
+            {'assign_driver': '1', 'date': self.day.isoformat(), 'driver': self.driver.pk},
+        )
+        self.assertRedirects(response, reverse('shuttle:shuttle'), fetch_redirect_response=False)
+        self.shuttle.refresh_from_db()
+        self.assertEqual(self.shuttle.driver, self.driver)
+        self.assertNotEqual(request_export('shuttles', 'csv', self.export_params).pk, job.pk)
+
+
+class ShuttleSaveQueryCountTests(TestCase):
+    def setUp(self):
+        ShuttleConfig.load()
+        ContentType.objects.get_for_model(Shuttle)
+
+    def build_shuttle(self):
+        return Shuttle(
+            customer_name='Query Budget',
+            customer_number='+3611111111',
+            shuttle_date=date(2025, 6, 11),
+            shuttle_direction='both_ways',
+            no_of_passengers=2,
+        )
+
+    def test_create_query_count(self):
+        shuttle = self.build_shuttle()
+        # Includes the SAVEPOINT / RELEASE pair around the INSERT that lets a public_id collision be retried,
+        # the upsert of the booking's search row, and the first ledger refresh of the month creating
+        # the bucket's lock row (UPDATE, SELECT, SAVEPOINT, INSERT, RELEASE). The commit then flushes the
+        # batched audit row, customer directory upsert and analytics counters, one query each.
+        with self.assertNumQueries(16), self.captureOnCommitCallbacks(execute=True):
+            shuttle.save()
+
+    def test_update_query_count(self):
+        shuttle = self.build_shuttle()
+        shuttle.save()
+        shuttle = Shuttle.objects.get(pk=shuttle.pk)
+        shuttle.no_of_passengers = 3
+        # Includes locking the ledger bucket row before its refresh
+        with self.assertNumQueries(8), self.captureOnCommitCallbacks(execute=True):
+            shuttle.save()
@@ -25,7 +25,9 @@ import pytz
 import logging
 import re
 from common.utils import scramble_date, now_budapest
-from common.payment_paid_sync import sum_complete_payments_eur
+from common.payment_paid_sync import annotate_complete_payments_eur, sum_complete_payments_eur
+from common.public_ids import get_by_public_id
+from billing.ledger import refresh_ledger_for_rows
 logger = logging.getLogger('kt')
 
 
@@ -46,7 +48,13 @@ def shuttle(request):
         if form.is_valid():
             driver_id = form.cleaned_data['driver']
             shuttle_date = form.cleaned_data['date']
-            Shuttle.objects.filter(shuttle_date=shuttle_date).update(driver_id=driver_id)
+            with transaction.atomic():
+                shuttles = Shuttle.objects.filter(shuttle_date=shuttle_date)
+                pks = list(shuttles.values_list('pk', flat=True))
+                shuttles.update(driver_id=driver_id)
+                # update() skips Shuttle.save: refresh the day's ledger bucket, whose
+                # version keys stored exports, so shuttle exports show the new driver
+                refresh_ledger_for_rows(Shuttle, pks)
             return redirect('shuttle:shuttle')
     else:
         form = DriverAssignmentForm()
@@ -457,7 +465,7 @@ def shuttle_daily_costs(request, date):
     })
 
 def client_view_shuttle(request, lookup):
-    shuttle = Shuttle.objects.filter(public_id=lookup).first()
+    shuttle = get_by_public_id(Shuttle.objects.all(), lookup)
     if not shuttle:
         return render(request, 'errors/404.html', status=404)
     recorded_payments_eur = sum_complete_payments_eur(shuttle.payments)
@@ -484,7 +492,9 @@ def shuttle_summary_view(request, scrambled):
     if not target_date:
         return render(request, "errors/404.html", status=404)
 
-    shuttles = Shuttle.objects.filter(is_confirmed=True, shuttle_date=target_date).order_by('customer_name')
+    shuttles = annotate_complete_payments_eur(
+        Shuttle.objects.filter(is_confirmed=True, shuttle_date=target_date).order_by('customer_name')
+    )
     driver_costs = ShuttleDailyCost.objects.filter(parent__date=target_date)
 
     total_passengers = sum(s.no_of_passengers or 0 for s in shuttles)
@@ -493,9 +503,8 @@ def shuttle_summary_view(request, scrambled):
     total_costs = sum(cost.driver_fee_in_euros or 0 for cost in driver_costs)
 
     for shuttle in shuttles:
-        recorded_payments_eur = sum_complete_payments_eur(shuttle.payments)
-        shuttle.payment_balance = max((shuttle.price or Decimal('0.00')) - recorded_payments_eur, Decimal('0.00'))
-        shuttle.has_recorded_payments = recorded_payments_eur > Decimal('0.00')
+        shuttle.payment_balance = max((shuttle.price or Decimal('0.00')) - shuttle.complete_payments_eur, Decimal('0.00'))
+        shuttle.has_recorded_payments = shuttle.complete_payments_eur > Decimal('0.00')
 
     context = {
         'date': target_date,
@@ -53,7 +53,10 @@
     return el && el.tagName === "A";
   }
 
-  function pushListUrl(q, page) {
+  // Keyset pagination: page links carry a cursor instead of a page number
+  const PAGE_PARAMS = ["after", "before", "last"];
+
+  function pushListUrl(q, pageUrl) {
     const u = new URL(baseUrl, window.location.origin);
     const qTrim = (q || "").trim();
     if (qTrim) u.searchParams.set("q", qTrim);
@@ -61,8 +64,11 @@
     const ft = getFilterType();
     if (ft) u.searchParams.set("type", ft);
     else u.searchParams.delete("type");
-    if (page && page > 1) u.searchParams.set("page", String(page));
-    else u.searchParams.delete("page");
+    PAGE_PARAMS.forEach((name) => {
+      const value = pageUrl ? pageUrl.searchParams.get(name) : null;
+      if (value) u.searchParams.set(name, value);
+      else u.searchParams.delete(name);
+    });
     const next = u.pathname + (u.search ? u.search : "");
     window.history.replaceState(null, "", next);
   }
@@ -74,7 +80,6 @@
     const ft = getFilterType();
     if (ft) u.searchParams.set("type", ft);
     u.searchParams.set("_partial", "1");
-    u.searchParams.set("page", "1");
 
     resultsEl.setAttribute("aria-busy", "true");
     fetch(u.toString(), {
@@ -87,7 +92,7 @@
       })
       .then((html) => {
         resultsEl.innerHTML = html;
-        pushListUrl(qTrim, 1);
+        pushListUrl(qTrim, null);
         syncTypeLinks(qTrim);
       })
       .catch(() => {
@@ -137,8 +142,7 @@
       })
       .then((html) => {
         resultsEl.innerHTML = html;
-        const p = parseInt(u.searchParams.get("page") || "1", 10) || 1;
-        pushListUrl((input.value || "").trim(), p);
+        pushListUrl((input.value || "").trim(), u);
       })
       .catch(() => {
         window.location.href = a.href;
@@ -0,0 +1,60 @@
+(function () {
+  // Totals breakdown sections: each <details data-section-url> fetches its body the first
+  // time it is opened; links and filters inside a section reload only that section.
+  const sections = document.querySelectorAll("details.totals-section[data-section-url]");
+  if (!sections.length) return;
+
+  function load(section, url) {
+    const body = section.querySelector(".totals-section-body");
+    if (!body) return;
+    body.setAttribute("aria-busy", "true");
+    fetch(url, {
+      headers: { "X-Requested-With": "XMLHttpRequest" },
+      credentials: "same-origin",
+    })
+      .then((r) => {
+        if (!r.ok) throw new Error(r.statusText);
+        return r.text();
+      })
+      .then((html) => {
+        body.innerHTML = html;
+        section.dataset.loaded = "1";
+      })
+      .catch(() => {
+        body.innerHTML =
+          '<p class="totals-section-error">Could not load this section. Close and reopen to retry.</p>';
+      })
+      .finally(() => {
+        body.removeAttribute("aria-busy");
+      });
+  }
+
+  sections.forEach((section) => {
+    section.addEventListener("toggle", () => {
+      if (section.open && !section.dataset.loaded) {
+        load(section, section.dataset.sectionUrl);
+      }
+    });
+
+    section.addEventListener("click", (e) => {
+      const a = e.target.closest("a.pagination-btn");
+      if (!a || !a.getAttribute("href")) return;
+      e.preventDefault();
+      load(section, a.href);
+    });
+
+    section.addEventListener("change", (e) => {
+      const form = e.target.closest("form.totals-section-filters");
+      if (!form) return;
+      const u = new URL(form.action, window.location.origin);
+      new FormData(form).forEach((value, key) => {
+        if (value) u.searchParams.set(key, value);
+      });
+      load(section, u.toString());
+    });
+
+    section.addEventListener("submit", (e) => {
+      if (e.target.closest("form.totals-section-filters")) e.preventDefault();
+    });
+  });
+})();